@@ -1,4 +1,4 @@
-from flask import Flask
+from flask import Flask, session
 from flask_cors import CORS
 import os
 import logging
@@ -50,7 +50,103 @@ def create_app(config_class=Config):
     
     # Initialize Services
     from app.services.entity_manager import EntityManager
-    app.entity_manager = EntityManager(entities_folder)
+    app.entity_manager = EntityManager(
+        entities_folder,
+        dossiers_templates=[app.config['UPLOAD_TEMP_FOLDER'], app.config['UPLOAD_FOLDER']]
+    )
+    
+    from app.services.cache_resultats import CacheResultats
+    app.cache_resultats = CacheResultats(
+        chemin_db=os.path.join(app.config['UPLOAD_TEMP_FOLDER'], 'cache_resultats.sqlite3'),
+        ttl=app.config['RESULT_CACHE_TTL'],
+        max_memoire=app.config['RESULT_CACHE_MEMORY_ENTRIES'],
+        max_octets_disque=app.config['RESULT_CACHE_DISK_MAX_BYTES']
+    )
+    
+    app.index_doublons = None
+    if app.config['NEAR_DUPLICATE_INDEX']:
+        from app.services.index_doublons import IndexDoublons
+        app.index_doublons = IndexDoublons(
+            max_entrees=app.config['NEAR_DUPLICATE_MAX_ENTRIES'],
+            seuil=app.config['NEAR_DUPLICATE_THRESHOLD'],
+            seuil_zone=app.config['NEAR_DUPLICATE_ZONE_THRESHOLD']
+        )
+    
+    from app.services.ordonnanceur import OrdonnanceurOCR, SurchargeOCR
+    app.ordonnanceur = OrdonnanceurOCR(
+        capacite=app.config['OCR_MAX_CONCURRENCY'],
+        profondeur_max=app.config['OCR_MAX_QUEUE'],
+        attente_max=app.config['OCR_INTERACTIVE_MAX_WAIT'],
+        reserve_interactive=app.config['OCR_INTERACTIVE_RESERVED']
+    )
+    
+    from app.services.qualite_adaptative import QualiteAdaptative
+    app.qualite_adaptative = QualiteAdaptative(
+        app.ordonnanceur,
+        active=app.config['OCR_ADAPTIVE_QUALITY'],
+        file_rapide=app.config['OCR_DEGRADE_QUEUE'],
+        p95_rapide_ms=app.config['OCR_DEGRADE_P95_MS'],
+        file_economique=app.config['OCR_ECONOMY_QUEUE'],
+        p95_economique_ms=app.config['OCR_ECONOMY_P95_MS']
+    )
+    
+    from app.services.analyses_anticipees import AnalysesAnticipees
+    app.analyses_anticipees = AnalysesAnticipees(
+        ttl=app.config['ANALYSE_ANTICIPEE_TTL'],
+        max_workers=app.config['ANALYSE_ANTICIPEE_WORKERS'],
+        active=app.config['ANALYSE_ANTICIPEE']
+    )
+    
+    @app.errorhandler(SurchargeOCR)
+    def surcharge_ocr(e):
+        return ({'success': False, 'error': str(e), 'retry_after': e.retry_after},
+                e.code, {'Retry-After': str(e.retry_after)})
+    
+    from app.services.job_store import JobStore
+    app.job_store = JobStore(
+        os.path.join(app.config['UPLOAD_TEMP_FOLDER'], 'jobs.sqlite3'),
+        ttl=app.config['JOB_STORE_TTL'],
+        delai_orphelin=app.config['JOB_ORPHAN_DELAY']
+    )
+    
+    from app.services.depot_contenu import DepotContenu
+    app.depot_contenu = DepotContenu(app.config['UPLOAD_TEMP_FOLDER'])
+    
+    from app.services.envois_fragmentes import EnvoisFragmentes
+    app.envois_fragmentes = EnvoisFragmentes(
+        app.config['UPLOAD_TEMP_FOLDER'],
+        app.depot_contenu,
+        max_fichiers=app.config['UPLOAD_SESSION_MAX_FILES'],
+        taille_max_fichier=app.config['UPLOAD_SESSION_MAX_FILE_BYTES']
+    )
+    
+    from app.services.nettoyage_temporaires import NettoyeurTemporaires
+    app.nettoyeur_temporaires = NettoyeurTemporaires(
+        app.config['UPLOAD_TEMP_FOLDER'],
+        dossier_exports=app.config['UPLOAD_FOLDER'],
+        ttl={
+            'upload': app.config['TEMP_TTL_UPLOAD'],
+            'entite': app.config['TEMP_TTL_ENTITE'],
+            'derive': app.config['TEMP_TTL_DERIVE'],
+            'cni': app.config['TEMP_TTL_CNI'],
+            'export': app.config['TEMP_TTL_EXPORT'],
+            'contenu': app.config['TEMP_TTL_UPLOAD'],
+            'envoi': app.config['UPLOAD_SESSION_IDLE_TIMEOUT']
+        },
+        quota_octets=app.config['TEMP_DISK_QUOTA_BYTES'],
+        fenetre_session=app.config['TEMP_SESSION_ACTIVE'],
+        chemins_proteges=app.job_store.chemins_jobs_actifs,
+        chemin_db=os.path.join(app.config['UPLOAD_TEMP_FOLDER'], 'nettoyage.sqlite3')
+    )
+    
+    @app.before_request
+    def marquer_fichiers_session():
+        # Fichiers de la session en cours: protégés du nettoyage tant que la session est active
+        if session:
+            app.nettoyeur_temporaires.marquer_session(session.get('image_path'), session.get('temp_image_path'))
+    
+    if app.config['TEMP_JANITOR_ENABLED']:
+        app.nettoyeur_temporaires.demarrer(app.config['TEMP_JANITOR_INTERVAL'])
     
     # Register Blueprints
     from app.api.ocr_routes import ocr_bp
@@ -65,6 +161,10 @@ def create_app(config_class=Config):
     app.register_blueprint(optimizer_bp)
     app.register_blueprint(invoice_bp)
     
+    if app.config['JOB_RESUME_ON_START']:
+        from app.api.ocr_routes import reprendre_jobs_batch
+        reprendre_jobs_batch(app)
+    
     @app.route('/')
     def index():
         return {
@@ -3,15 +3,33 @@ from werkzeug.utils import secure_filename
 import os
 import uuid
 from PIL import Image
-from easy_core.pdf_utils import convert_pdf_to_image
+from app.utils.pages_pdf import rendre_premiere_page
 from app.services.ocr_engine import ocr_global_avec_positions, detecter_ancres, resoudre_formules_ancres
-from app.services.image_matcher import extract_and_save_template
+from app.services.image_matcher import extract_and_save_template, extraire_template, ImagePreparee
+from app.utils.cache_utils import LRUCache
 
 entity_bp = Blueprint('entity', __name__)
 
+# Images en cours d'édition (detecter-etiquettes est rappelé à chaque ajustement d'étiquette):
+# image décodée + features + mots OCR gardés quelques minutes, clé = fichier + version.
+_images_edition = LRUCache(max_entries=4, ttl=120)
+
 def get_manager():
     return current_app.entity_manager
 
+def _image_edition(image_path):
+    """Retourne l'entrée de cache {'image': ImagePreparee, 'mots_ocr': {lang: (mots, dims)}} d'une image."""
+    stat = os.stat(image_path)
+    cle = (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
+    entree = _images_edition.get(cle)
+    if entree is None:
+        image = ImagePreparee.depuis_source(image_path)
+        if image is None:
+            return None
+        entree = {'image': image, 'mots_ocr': {}}
+        _images_edition.put(cle, entree)
+    return entree
+
 @entity_bp.route('/api/entites', methods=['GET'])
 def lister_entites():
     entites = get_manager().lister_entites()
@@ -48,14 +66,15 @@ def upload_image_entite():
     saved_filename = f"temp_entite_{str(uuid.uuid4())}_{filename}"
     temp_folder = current_app.config['UPLOAD_TEMP_FOLDER']
     filepath = os.path.join(temp_folder, saved_filename)
-    file.save(filepath)
+    stockage = current_app.depot_contenu.enregistrer(file.stream, filepath)  # Stocké par contenu
     
     # Conversion PDF -> Image si nécessaire
     if filename.lower().endswith('.pdf'):
         try:
-            image_filename = f"{os.path.splitext(saved_filename)[0]}.jpg"
+            # PNG sans perte: l'image devient la référence de l'entité (DPI conservé dans le fichier)
+            image_filename = f"{os.path.splitext(saved_filename)[0]}.png"
             image_filepath = os.path.join(temp_folder, image_filename)
-            convert_pdf_to_image(filepath, image_filepath)
+            rendre_premiere_page(current_app.depot_contenu, filepath, stockage['empreinte'], image_filepath)
             
             # On bascule sur l'image pour la suite
             saved_filename = image_filename
@@ -154,9 +173,14 @@ def detecter_etiquettes():
         if isinstance(v, dict):
             current_app.logger.info(f"  Ancre '{k}': labels={v.get('labels')}, has_template_coords={bool(v.get('template_coords'))}")
     
+    # Image décodée une seule fois (et gardée en cache pendant l'édition de l'entité)
+    image_edition = _image_edition(image_path)
+    if image_edition is None:
+        return jsonify({'error': f'Image illisible: {filename}'}), 400
+    image_cible = image_edition['image']
+
     # Construire la config des ancres à partir des étiquettes
     ancres_config = []
-    temp_files_to_cleanup = []
 
     for etiquette_id, config in etiquettes.items():
         # Support both simple list of strings and object with labels/template_coords
@@ -174,24 +198,18 @@ def detecter_etiquettes():
             'labels': labels
         }
         
-        # Templates de détection temporaires -> uploads_temp
-        if template_coords and len(template_coords) == 4 and image_path and os.path.exists(image_path):
+        # Templates de détection découpés en mémoire (aucun fichier temporaire)
+        if template_coords and len(template_coords) == 4:
             try:
-                temp_filename = f"temp_template_{uuid.uuid4()}_{etiquette_id}.png"
-                temp_path = os.path.join(current_app.config['UPLOAD_TEMP_FOLDER'], temp_filename)
-                
-                current_app.logger.info(f"📷 Extraction template pour '{etiquette_id}': coords={template_coords} -> {temp_path}")
-                if extract_and_save_template(image_path, template_coords, temp_path):
-                    anchor_conf['template_path'] = temp_filename
-                    anchor_conf['template_path_abs'] = temp_path
-                    temp_files_to_cleanup.append(temp_path)
-                    current_app.logger.info(f"  ✅ Template temporaire créé pour {etiquette_id}: {temp_path}")
+                current_app.logger.info(f"📷 Extraction template pour '{etiquette_id}': coords={template_coords}")
+                template = extraire_template(image_cible, template_coords)
+                if template is not None:
+                    anchor_conf['template_image'] = template
+                    current_app.logger.info(f"  ✅ Template en mémoire pour {etiquette_id}: {template.shape[1]}x{template.shape[0]}")
                 else:
-                    current_app.logger.error(f"  ❌ extract_and_save_template retourné False pour {etiquette_id}")
+                    current_app.logger.error(f"  ❌ Région de template vide pour {etiquette_id}")
             except Exception as e:
-                current_app.logger.error(f"❌ Erreur extraction template temporaire: {e}")
-        elif template_coords:
-            current_app.logger.warning(f"  ⚠️ Template coords reçus pour '{etiquette_id}' mais image non trouvée: image_exists={os.path.exists(image_path) if image_path else False}")
+                current_app.logger.error(f"❌ Erreur extraction template: {e}")
 
         ancres_config.append(anchor_conf)
     
@@ -199,13 +217,20 @@ def detecter_etiquettes():
         return jsonify({'error': 'Aucune étiquette à détecter'}), 400
     
     try:
-        # OCR global pour obtenir tous les mots avec positions
-        mots_ocr, img_dims = ocr_global_avec_positions(image_path, lang='fra+eng')
+        # OCR global pour obtenir tous les mots avec positions (réutilisé tant que l'image ne change pas)
+        lang_ocr = 'fra+eng'
+        if lang_ocr in image_edition['mots_ocr']:
+            current_app.logger.info(f"♻️ Mots OCR réutilisés depuis le cache pour {filename}")
+            mots_ocr, img_dims = image_edition['mots_ocr'][lang_ocr]
+        else:
+            mots_ocr, img_dims = ocr_global_avec_positions(image_path, lang=lang_ocr)
+            if mots_ocr:
+                image_edition['mots_ocr'][lang_ocr] = (mots_ocr, img_dims)
 
         # NOTE: Si l'OCR échoue (pas de texte), mots_ocr peut être vide. 
         # Mais on doit quand même continuer si on a des templates images OU des formules.
         has_formulas = any(isinstance(c, dict) and c.get('fallback_formula') for c in etiquettes.values())
-        if not mots_ocr and not any('template_path' in a for a in ancres_config) and not has_formulas:
+        if not mots_ocr and not any('template_image' in a for a in ancres_config) and not has_formulas:
              return jsonify({
                 'success': False,
                 'error': 'OCR n\'a détecté aucun texte dans l\'image et aucun template image ni formule défini'
@@ -218,21 +243,13 @@ def detecter_etiquettes():
                  img = Image.open(image_path)
                  img_dims = img.size
 
-        # Détecter les étiquettes (Now passing image_path for template matching)
+        # Détecter les étiquettes (image déjà décodée, features ORB/contours partagées entre ancres)
         etiquettes_detectees, toutes_trouvees = detecter_ancres(
             mots_ocr, 
             ancres_config, 
             img_dims,
-            image_path=image_path 
+            image_path=image_cible
         )
-
-        # Cleanup temp files
-        for f in temp_files_to_cleanup:
-            if os.path.exists(f):
-                try:
-                    os.remove(f)
-                except:
-                    pass
         
         # 🆕 Résoudre les ancres par formule algorithmique
         # Construire un cadre_reference temporaire pour la résolution de formules
@@ -356,18 +373,18 @@ def sauvegarder_entite():
     if not nom: return jsonify({'error': 'Nom manquant'}), 400
     if not zones: return jsonify({'error': 'Aucune zone définie'}), 400
 
-    # Copier l'image de référence dans un emplacement permanent
-    # (pour éviter que les fichiers temp soient supprimés entre sessions)
+    # Lier l'image de référence dans un emplacement permanent
+    # (pour éviter que les fichiers temp soient supprimés entre sessions):
+    # lien physique vers le contenu déjà stocké, copie seulement si impossible
     if image_path and os.path.exists(image_path):
-        import shutil
         ext = os.path.splitext(image_path)[1] or '.png'
         entity_images_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'entities', nom)
         os.makedirs(entity_images_dir, exist_ok=True)
         permanent_image_path = os.path.join(entity_images_dir, f"reference{ext}")
         # Ne copier que si c'est un fichier différent (pas une recopi de lui-même)
         if os.path.abspath(image_path) != os.path.abspath(permanent_image_path):
-            shutil.copy2(image_path, permanent_image_path)
-            current_app.logger.info(f"✅ Image de référence copiée vers: {permanent_image_path}")
+            current_app.depot_contenu.lier(image_path, permanent_image_path)
+            current_app.logger.info(f"✅ Image de référence liée vers: {permanent_image_path}")
         image_path = permanent_image_path
 
     # Extraction du DPI s'il est disponible pour robustesse de mise à l'échelle OCR
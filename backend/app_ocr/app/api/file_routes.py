@@ -1,19 +1,95 @@
-from flask import Blueprint, request, jsonify, session, current_app, send_from_directory, send_file
+from flask import (Blueprint, request, jsonify, session, current_app, send_from_directory, send_file,
+                   Response, stream_with_context)
 from werkzeug.utils import secure_filename
+import io
 import os
 import uuid
 import json
 import logging
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
-from easy_core.pdf_utils import convert_pdf_to_image
 from easy_core.image_utils import crop_image
+from app.utils.pages_pdf import nombre_pages, reference_page, rendre_premiere_page, developper_pages
+from app.utils.normalisation_images import normaliser_upload
+from app.api.ocr_routes import anticiper_analyse
 
 logger = logging.getLogger(__name__)
 
 file_bp = Blueprint('file', __name__)
 
+# Pool des découpes en lot, partagé par toutes les requêtes (plafond CROP_BATCH_WORKERS)
+_pool_crop_executor = None
+_pool_crop_lock = threading.Lock()
+
+
+def _plan_upload():
+    """Plan d'analyse de l'entité nommée dans le formulaire d'upload (champ 'entite'), ou None."""
+    nom = request.form.get('entite')
+    return current_app.entity_manager.charger_plan(nom) if nom else None
+
+
+def _dimensions_reference(plan=None):
+    """
+    image_base_dimensions de l'entité visée par l'upload (champ 'entite' du formulaire,
+    sinon entité active de la session): cale le DPI de rendu des PDF sur la référence.
+    """
+    if request.form.get('entite'):
+        return (plan.cadre_reference or {}).get('image_base_dimensions') if plan else None
+    entite = session.get('entite_active') or {}
+    return (entite.get('cadre_reference') or {}).get('image_base_dimensions')
+
+
+def _normaliser(filepath, empreinte, base_dimensions):
+    """
+    Normalise une image uploadée (orientation EXIF, mode canonique, résolution plafonnée)
+    et précalcule sa version en niveaux de gris. Retourne le résumé, ou None si désactivé,
+    si le fichier n'est pas une image, ou en cas d'échec (l'upload reste utilisable tel quel).
+    """
+    if not current_app.config['INGEST_NORMALIZE']:
+        return None
+    try:
+        return normaliser_upload(current_app.depot_contenu, filepath, empreinte, base_dimensions,
+                                 dpi_max=current_app.config['INGEST_MAX_DPI'],
+                                 pixels_max=current_app.config['INGEST_MAX_PIXELS'])
+    except Exception as e:
+        logger.warning(f"⚠️ Normalisation impossible pour {os.path.basename(filepath)}: {e}")
+        return None
+
+
+def _anticiper(image_path, plan):
+    """Lance l'analyse anticipée d'un upload si l'entité est connue ('mode' du formulaire, 'rapide' par défaut)."""
+    if plan is None:
+        return False
+    try:
+        return anticiper_analyse(image_path, plan, request.form.get('mode', 'rapide'))
+    except Exception as e:
+        logger.warning(f"⚠️ Analyse anticipée impossible pour {os.path.basename(image_path)}: {e}")
+        return False
+
+def _rendre_pdf(filepath, saved_filename, empreinte, base_dimensions):
+    """Rend la première page du PDF en PNG (sans perte) à côté du PDF; retourne le nom du PNG."""
+    image_filename = f"{os.path.splitext(saved_filename)[0]}.png"
+    image_filepath = os.path.join(os.path.dirname(filepath), image_filename)
+    rendre_premiere_page(current_app.depot_contenu, filepath, empreinte, image_filepath, base_dimensions)
+    return image_filename
+
 @file_bp.route('/api/upload', methods=['POST'])
 def upload_file():
+    """
+    Upload d'une image ou d'un PDF pour la session OCR.
+    Un PDF est conservé comme document multi-pages: seule sa première page est rendue
+    (aperçu et analyse par défaut); 'pages' liste les références 'doc.pdf#n' des autres,
+    rendues seulement quand une analyse les demande.
+    Le fichier est stocké par contenu: saved_filename est un alias, et un contenu
+    déjà reçu n'est pas réécrit ('deja_recu').
+    Une image est normalisée à l'upload ('normalisation'): orientation EXIF appliquée,
+    mode canonique, résolution plafonnée pour l'entité visée, niveaux de gris précalculés.
+    Avec 'entite' (et 'mode') dans le formulaire, l'analyse démarre aussitôt en arrière-plan
+    ('analyse_anticipee'): le /api/analyser qui suit, avec la même entité et le même mode,
+    reprend ce calcul au lieu de le relancer.
+    """
     if 'image' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     file = request.files['image']
@@ -25,34 +101,57 @@ def upload_file():
     saved_filename = f"ocr_{unique_id}_{filename}"
     temp_folder = current_app.config['UPLOAD_TEMP_FOLDER']
     filepath = os.path.join(temp_folder, saved_filename)
-    file.save(filepath)
+    stockage = current_app.depot_contenu.enregistrer(file.stream, filepath)
+    plan = _plan_upload()
+    base_dimensions = _dimensions_reference(plan)
+    document = None
+    normalisation = None
     
     # Conversion PDF -> Image si nécessaire
     if filename.lower().endswith('.pdf'):
         try:
-            image_filename = f"{os.path.splitext(saved_filename)[0]}.jpg"
-            image_filepath = os.path.join(temp_folder, image_filename)
-            convert_pdf_to_image(filepath, image_filepath)
+            document = {'saved_filename': saved_filename, 'nombre_pages': nombre_pages(filepath)}
+            image_filename = _rendre_pdf(filepath, saved_filename, stockage['empreinte'], base_dimensions)
             
             # On bascule sur l'image pour la suite du traitement
             saved_filename = image_filename
-            filepath = image_filepath
+            filepath = os.path.join(temp_folder, image_filename)
         except Exception as e:
             return jsonify({'error': f'Erreur lors de la conversion PDF: {str(e)}'}), 500
+    else:
+        normalisation = _normaliser(filepath, stockage['empreinte'], base_dimensions)
     
     session['image_path'] = filepath
     session['filename'] = filename
     session['saved_filename'] = saved_filename
     
-    return jsonify({
+    reponse = {
         'success': True, 
         'filename': filename, 
         'saved_filename': saved_filename,
-        'url': f"/uploads_temp/{saved_filename}"
-    })
+        'url': f"/uploads_temp/{saved_filename}",
+        'empreinte': stockage['empreinte'],
+        'deja_recu': stockage['deja_present'],
+        'analyse_anticipee': _anticiper(filepath, plan)
+    }
+    if normalisation:
+        reponse['normalisation'] = normalisation
+    if document:
+        document['pages'] = [reference_page(document['saved_filename'], n) for n in range(1, document['nombre_pages'] + 1)]
+        reponse['document'] = document
+    return jsonify(reponse)
 
 @file_bp.route('/api/upload-batch', methods=['POST'])
 def upload_batch():
+    """
+    Upload d'un lot de fichiers. Un PDF n'est pas rendu à l'upload: son saved_filename
+    désigne toutes ses pages dans les endpoints batch ('doc.pdf#n' pour une seule),
+    chaque page étant rendue par le worker qui l'analyse.
+    Fichiers stockés par contenu et images normalisées (voir /api/upload).
+    Avec 'entite' (et 'mode'), les images et pages de PDF sont analysées par
+    anticipation (au plus ANALYSE_ANTICIPEE_MAX_PAR_UPLOAD par lot), à reprendre par
+    /api/analyser ou les endpoints batch.
+    """
     if 'images' not in request.files:
         return jsonify({'error': 'No files part'}), 400
     
@@ -61,7 +160,18 @@ def upload_batch():
         return jsonify({'error': 'No selected files'}), 400
     
     temp_folder = current_app.config['UPLOAD_TEMP_FOLDER']
+    plan = _plan_upload()
+    base_dimensions = _dimensions_reference(plan)
     uploaded = []
+    anticipations_restantes = current_app.config['ANALYSE_ANTICIPEE_MAX_PAR_UPLOAD']
+    
+    def anticiper(chemin):
+        nonlocal anticipations_restantes
+        if anticipations_restantes <= 0 or not _anticiper(chemin, plan):
+            return False
+        anticipations_restantes -= 1
+        return True
+    
     for file in files:
         if file.filename == '':
             continue
@@ -69,15 +179,12 @@ def upload_batch():
         unique_id = str(uuid.uuid4())
         saved_filename = f"ocr_{unique_id}_{filename}"
         filepath = os.path.join(temp_folder, saved_filename)
-        file.save(filepath)
+        stockage = current_app.depot_contenu.enregistrer(file.stream, filepath)
         
-        # Conversion PDF -> Image si nécessaire
+        # PDF: document multi-pages, vérifié (nombre de pages) mais rendu seulement à l'analyse
         if filename.lower().endswith('.pdf'):
             try:
-                image_filename = f"{os.path.splitext(saved_filename)[0]}.jpg"
-                image_filepath = os.path.join(temp_folder, image_filename)
-                convert_pdf_to_image(filepath, image_filepath)
-                saved_filename = image_filename
+                pages = nombre_pages(filepath)
             except Exception as e:
                 uploaded.append({
                     'filename': filename,
@@ -85,10 +192,22 @@ def upload_batch():
                     'error': f'Erreur conversion PDF: {str(e)}'
                 })
                 continue
+            anticipees = [anticiper(chemin) for _, chemin in developper_pages(saved_filename, filepath)]
+            uploaded.append({
+                'filename': filename,
+                'saved_filename': saved_filename,
+                'deja_recu': stockage['deja_present'],
+                'nombre_pages': pages,
+                'analyse_anticipee': any(anticipees)
+            })
+            continue
         
+        _normaliser(filepath, stockage['empreinte'], base_dimensions)
         uploaded.append({
             'filename': filename,
-            'saved_filename': saved_filename
+            'saved_filename': saved_filename,
+            'deja_recu': stockage['deja_present'],
+            'analyse_anticipee': anticiper(filepath)
         })
     
     return jsonify({
@@ -104,8 +223,19 @@ def uploaded_file(filename):
 @file_bp.route('/uploads_temp/<path:filename>')
 def uploaded_temp_file(filename):
     """Serve temporary uploaded files (OCR sessions)"""
+    current_app.nettoyeur_temporaires.toucher(os.path.join(current_app.config['UPLOAD_TEMP_FOLDER'], filename))
     return send_from_directory(current_app.config['UPLOAD_TEMP_FOLDER'], filename)
 
+@file_bp.route('/api/fichiers-temporaires', methods=['GET', 'POST'])
+def fichiers_temporaires():
+    """Cycle de vie des fichiers temporaires: octets détenus par classe (dernière passe),
+    octets évincés (TTL / quota), déduplication du dépôt par contenu.
+    POST: lance une passe de nettoyage immédiatement."""
+    nettoyeur = current_app.nettoyeur_temporaires
+    if request.method == 'POST':
+        nettoyeur.passe()
+    return jsonify({**nettoyeur.stats(), 'depot': current_app.depot_contenu.stats()})
+
 @file_bp.route('/api/export-json')
 def export_json():
     resultats = session.get('resultats', {})
@@ -269,13 +399,129 @@ def crop_image_endpoint():
                 pass
 
 
+class _FluxZip(io.RawIOBase):
+    """Sortie non positionnable d'un ZipFile: les octets écrits sont récupérés par vider()."""
+
+    def __init__(self):
+        self._morceaux = []
+
+    def writable(self):
+        return True
+
+    def write(self, octets):
+        self._morceaux.append(bytes(octets))
+        return len(octets)
+
+    def vider(self):
+        octets = b''.join(self._morceaux)
+        self._morceaux.clear()
+        return octets
+
+
+def _pool_crop():
+    """Pool partagé par les découpes en lot (plafond CROP_BATCH_WORKERS pour le process)."""
+    global _pool_crop_executor
+    with _pool_crop_lock:
+        if _pool_crop_executor is None:
+            _pool_crop_executor = ThreadPoolExecutor(max_workers=current_app.config['CROP_BATCH_WORKERS'],
+                                                     thread_name_prefix='crop-batch')
+        return _pool_crop_executor
+
+
+def _decouper_fichier(flux, x, y, w, h, ext, max_size):
+    """Découpe un fichier reçu (lu depuis le flux de l'upload, puis fermé) et l'encode; retourne les octets."""
+    try:
+        flux.seek(0)
+        cropped = crop_image(flux, x, y, w, h, max_size=max_size)
+        cropped.load()
+    finally:
+        flux.close()
+    if ext == 'jpg':
+        if cropped.mode not in ('RGB', 'L', 'CMYK'):
+            cropped = cropped.convert('RGB')
+        options = {'format': 'JPEG', 'quality': 95}
+    else:
+        if cropped.mode == 'CMYK':
+            cropped = cropped.convert('RGB')
+        options = {'format': 'PNG', 'compress_level': 1}
+    sortie = io.BytesIO()
+    cropped.save(sortie, **options)
+    return sortie.getvalue()
+
+
+def _flux_zip_crop(sources, x, y, w, h, ext, max_size, workers):
+    """
+    ZIP des découpes, envoyé au fil de l'eau: chaque image entre dans l'archive dès
+    qu'elle est prête (ordre d'achèvement), au plus `workers` découpes en mémoire.
+    Le résumé ('_resume_crop.json', dans l'ordre des fichiers) termine l'archive.
+
+    Args:
+        sources: [(nom sécurisé, flux de l'upload)]; chaque flux est fermé après sa découpe.
+    """
+    flux = _FluxZip()
+    pool = _pool_crop()
+    results_summary = [None] * len(sources)
+    en_cours = {}
+    fichiers = iter(enumerate(sources))
+
+    def soumettre():
+        suivant = next(fichiers, None)
+        if suivant is None:
+            return False
+        index, (original_name, source) = suivant
+        en_cours[pool.submit(_decouper_fichier, source, x, y, w, h, ext, max_size)] = (index, original_name)
+        return True
+
+    try:
+        with zipfile.ZipFile(flux, 'w') as zf:
+            for _ in range(workers):
+                if not soumettre():
+                    break
+            while en_cours:
+                termines, _ = wait(en_cours, return_when=FIRST_COMPLETED)
+                for futur in termines:
+                    index, original_name = en_cours.pop(futur)
+                    try:
+                        octets = futur.result()
+                        output_name = f"{os.path.splitext(original_name)[0]}_crop.{ext}"
+                        # JPEG/PNG déjà compressés: stockés tels quels
+                        zf.writestr(output_name, octets, compress_type=zipfile.ZIP_STORED)
+                        results_summary[index] = {'filename': original_name, 'output': output_name, 'success': True}
+                    except Exception as e:
+                        logger.warning(f"Erreur crop pour {original_name}: {e}")
+                        results_summary[index] = {'filename': original_name, 'success': False, 'error': str(e)}
+                    soumettre()
+                    yield flux.vider()
+
+            results_summary = [r for r in results_summary if r is not None]
+            summary = json.dumps({
+                'crop_params': {'x': x, 'y': y, 'width': w, 'height': h},
+                'format': ext,
+                'max_size': max_size,
+                'total': len(results_summary),
+                'reussis': sum(1 for r in results_summary if r['success']),
+                'resultats': results_summary
+            }, ensure_ascii=False, indent=2)
+            zf.writestr('_resume_crop.json', summary, compress_type=zipfile.ZIP_DEFLATED)
+        yield flux.vider()
+    finally:
+        # Client déconnecté: les découpes pas encore commencées sont abandonnées
+        for futur in en_cours:
+            futur.cancel()
+        wait(en_cours)
+        for _, source in sources:
+            source.close()
+
+
 @file_bp.route('/api/crop-image-batch', methods=['POST'])
 def crop_image_batch_endpoint():
     """Découpe un lot d'images avec les mêmes coordonnées de cadre.
 
     Accepte plusieurs fichiers images (champ 'images') et les découpe
     tous avec les mêmes paramètres (x, y, width, height).
-    Retourne un ZIP contenant toutes les images découpées.
+    Retourne un ZIP contenant toutes les images découpées, envoyé en flux:
+    les découpes sont faites en parallèle, directement depuis les fichiers
+    reçus, et chacune est ajoutée à l'archive dès qu'elle est prête.
 
     Form data:
         images (files): Fichiers images à découper.
@@ -284,13 +530,12 @@ def crop_image_batch_endpoint():
         width (int): Largeur du cadre.
         height (int): Hauteur du cadre.
         format (str, optional): Format de sortie ('jpg' ou 'png'). Défaut: 'jpg'.
+        max_size (int, optional): Plus grand côté des images découpées (réduites
+            au-delà; JPEG décodé à échelle réduite quand c'est possible).
 
     Returns:
-        ZIP contenant les images découpées.
+        ZIP contenant les images découpées (et '_resume_crop.json').
     """
-    import zipfile
-    import io
-
     # --- Récupérer les paramètres ---
     params = request.form
 
@@ -299,16 +544,17 @@ def crop_image_batch_endpoint():
         y = int(params.get('y', -1))
         w = int(params.get('width', -1))
         h = int(params.get('height', -1))
+        max_size = int(params['max_size']) if params.get('max_size') else None
     except (ValueError, TypeError):
-        return jsonify({'error': 'x, y, width et height doivent être des entiers'}), 400
+        return jsonify({'error': 'x, y, width, height et max_size doivent être des entiers'}), 400
 
-    if x < 0 or y < 0 or w <= 0 or h <= 0:
+    if x < 0 or y < 0 or w <= 0 or h <= 0 or (max_size is not None and max_size <= 0):
         return jsonify({
             'error': 'Paramètres manquants ou invalides. '
                      'Fournir x, y (≥0) et width, height (>0) en pixels.'
         }), 400
 
-    files = request.files.getlist('images')
+    files = [f for f in request.files.getlist('images') if f.filename]
     if not files:
         return jsonify({'error': 'Aucune image fournie (champ "images").'}), 400
 
@@ -317,70 +563,17 @@ def crop_image_batch_endpoint():
         output_format = 'jpg'
     ext = 'jpg' if output_format in ('jpg', 'jpeg') else 'png'
 
-    temp_folder = current_app.config['UPLOAD_TEMP_FOLDER']
-    temp_files = []
-
-    try:
-        # Créer le ZIP en mémoire
-        zip_buffer = io.BytesIO()
-        results_summary = []
-
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for file in files:
-                if not file.filename:
-                    continue
-
-                original_name = secure_filename(file.filename)
-                base_name = os.path.splitext(original_name)[0]
-                temp_src = os.path.join(temp_folder, f"batch_{uuid.uuid4().hex[:8]}_{original_name}")
-                file.save(temp_src)
-                temp_files.append(temp_src)
-
-                try:
-                    output_name = f"{base_name}_crop.{ext}"
-                    temp_out = os.path.join(temp_folder, f"crop_{uuid.uuid4().hex[:8]}.{ext}")
-                    temp_files.append(temp_out)
-
-                    crop_image(temp_src, x, y, w, h, output_path=temp_out)
-                    zf.write(temp_out, output_name)
-                    results_summary.append({
-                        'filename': original_name,
-                        'output': output_name,
-                        'success': True
-                    })
-                except Exception as e:
-                    logger.warning(f"Erreur crop pour {original_name}: {e}")
-                    results_summary.append({
-                        'filename': original_name,
-                        'success': False,
-                        'error': str(e)
-                    })
-
-            # Ajouter un résumé JSON dans le ZIP
-            summary = json.dumps({
-                'crop_params': {'x': x, 'y': y, 'width': w, 'height': h},
-                'format': ext,
-                'total': len(results_summary),
-                'reussis': sum(1 for r in results_summary if r['success']),
-                'resultats': results_summary
-            }, ensure_ascii=False, indent=2)
-            zf.writestr('_resume_crop.json', summary)
-
-        zip_buffer.seek(0)
-
-        return send_file(
-            zip_buffer,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=f"crop_batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-        )
-    except Exception as e:
-        logger.exception("Erreur lors du crop batch")
-        return jsonify({'error': f'Erreur interne: {str(e)}'}), 500
-    finally:
-        for f in temp_files:
-            try:
-                if os.path.exists(f):
-                    os.remove(f)
-            except OSError:
-                pass
+    # Les flux des uploads (fichiers temporaires de Werkzeug au-delà de 500 Ko) sont repris
+    # par la réponse: sinon request.close() les fermerait dès la sortie de la vue
+    sources = []
+    for file in files:
+        sources.append((secure_filename(file.filename), file.stream))
+        file.stream = io.BytesIO()
+
+    workers = current_app.config['CROP_BATCH_WORKERS']
+    download_name = f"crop_batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return Response(
+        stream_with_context(_flux_zip_crop(sources, x, y, w, h, ext, max_size, workers)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename={download_name}', 'X-Accel-Buffering': 'no'}
+    )
@@ -12,8 +12,11 @@ import uuid
 import json
 from datetime import datetime
 
-from app.services.invoice_extractor import extraire_facture, extraire_facture_depuis_pdf, detecter_zone_facture
-from easy_core.pdf_utils import convert_pdf_to_image
+from app.services.invoice_extractor import (
+    extraire_facture, extraire_facture_depuis_pdf, extraire_facture_fichier, resume_facture, detecter_zone_facture
+)
+from app.services.ordonnanceur import SurchargeOCR
+from easy_core.pdf_utils import PdfPages
 
 invoice_bp = Blueprint('invoice', __name__)
 
@@ -22,13 +25,13 @@ PDF_EXTENSIONS = {'.pdf'}
 
 
 def _save_temp_file(file, prefix="inv"):
-    """Sauvegarde un fichier uploadé dans le dossier temporaire."""
+    """Sauvegarde un fichier uploadé dans le dossier temporaire (dépôt par contenu, alias unique)."""
     filename = secure_filename(file.filename)
     ext = os.path.splitext(filename)[1].lower()
     unique_id = str(uuid.uuid4())
     saved_filename = f"{prefix}_{unique_id}_{filename}"
     filepath = os.path.join(current_app.config['UPLOAD_TEMP_FOLDER'], saved_filename)
-    file.save(filepath)
+    current_app.depot_contenu.enregistrer(file.stream, filepath)
     return filepath, filename, ext
 
 
@@ -62,24 +65,16 @@ def api_detecter_zone():
         lang = request.form.get('lang', 'fra')
 
         if ext in PDF_EXTENSIONS:
-            import pypdfium2 as pdfium
-            pdf = pdfium.PdfDocument(filepath)
-            if len(pdf) < 1:
-                return jsonify({'error': 'Le PDF est vide'}), 400
-            page = pdf[0]
-            bitmap = page.render(scale=300/72)
-            pil_image = bitmap.to_pil()
-            temp_img = os.path.join(current_app.config['UPLOAD_TEMP_FOLDER'], f"detect_{uuid.uuid4().hex[:8]}.jpg")
-            pil_image.save(temp_img, format="JPEG")
-            
-            result = detecter_zone_facture(temp_img, lang=lang)
-            _cleanup(temp_img)
+            with PdfPages(filepath) as pages:
+                if len(pages) < 1:
+                    return jsonify({'error': 'Le PDF est vide'}), 400
+                # Première page rendue en mémoire, en niveaux de gris (suffisant pour l'OCR)
+                result = detecter_zone_facture(pages.render(0, grayscale=True), lang=lang)
+                preview_img = pages.render_pil(0, dpi=150)  # Résolution plus faible pour le web
             
             # Générer une version base64 pour l'aperçu frontend
             import base64
             from io import BytesIO
-            preview_bitmap = page.render(scale=150/72) # Résolution plus faible pour le web
-            preview_img = preview_bitmap.to_pil()
             buffered = BytesIO()
             preview_img.save(buffered, format="JPEG")
             img_str = base64.b64encode(buffered.getvalue()).decode()
@@ -142,12 +137,13 @@ def api_extraire_facture():
             except Exception:
                 pass
 
-        if ext in PDF_EXTENSIONS:
-            # Extraction PDF multi-pages
-            result = extraire_facture_depuis_pdf(filepath, lang=lang, zone_manuelle=zone_manuelle)
-        else:
-            # Extraction image directe
-            result = extraire_facture(filepath, lang=lang, zone_manuelle=zone_manuelle)
+        with current_app.ordonnanceur.creneau('interactive'):
+            if ext in PDF_EXTENSIONS:
+                # Extraction PDF multi-pages
+                result = extraire_facture_depuis_pdf(filepath, lang=lang, zone_manuelle=zone_manuelle)
+            else:
+                # Extraction image directe
+                result = extraire_facture(filepath, lang=lang, zone_manuelle=zone_manuelle)
 
         return jsonify({
             'success': result.get('success', False),
@@ -165,6 +161,8 @@ def api_extraire_facture():
             'debug': result.get('debug'),
         })
 
+    except SurchargeOCR:
+        raise
     except Exception as e:
         return jsonify({
             'error': f"Erreur lors de l'extraction: {str(e)}"
@@ -181,6 +179,8 @@ def api_extraire_facture():
 def api_extraire_facture_batch():
     """
     Extrait les articles de plusieurs factures en un seul appel.
+    Pour un gros lot, préférer l'upload par morceaux (POST /api/upload-session avec
+    traitement='factures'): chaque facture est extraite dès qu'elle est reçue.
 
     Form data:
         files: Fichiers image ou PDF (multipart/form-data, champ "files")
@@ -200,6 +200,7 @@ def api_extraire_facture_batch():
     resultats = []
     total_articles = 0
     temp_files = []
+    groupe = f"factures:{uuid.uuid4()}"  # Partage équitable avec les autres lots (ordonnanceur OCR)
 
     for file in files:
         if file.filename == '':
@@ -220,22 +221,12 @@ def api_extraire_facture_batch():
                 })
                 continue
 
-            if ext in PDF_EXTENSIONS:
-                result = extraire_facture_depuis_pdf(filepath, lang=lang)
-            else:
-                result = extraire_facture(filepath, lang=lang)
-
-            nb = result.get('nb_articles', 0)
-            total_articles += nb
+            with current_app.ordonnanceur.creneau('batch', groupe):
+                result = extraire_facture_fichier(filepath, lang=lang)
 
-            resultats.append({
-                'filename': filename,
-                'success': result.get('success', False),
-                'articles': result.get('articles', []),
-                'nb_articles': nb,
-                'en_tete_detecte': result.get('en_tete_detecte'),
-                'error': result.get('error'),
-            })
+            resultat = resume_facture(filename, result)
+            total_articles += resultat['nb_articles']
+            resultats.append(resultat)
 
         except Exception as e:
             resultats.append({
@@ -1,28 +1,57 @@
-from flask import Blueprint, request, jsonify, session, current_app, Response
+from flask import Blueprint, request, jsonify, session, current_app, Response, stream_with_context
 import os
+import io
 import json
 import uuid
 import threading
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait
 
 logger = logging.getLogger(__name__)
 
 from app.services.ocr_engine import analyser_hybride
-from app.services.ocr_engine_v2 import analyser_hybride as analyser_hybride_v2
+from app.services.ocr_engine_v2 import analyser_hybride as analyser_hybride_v2, stats_cache_cadres, stats_cache_ocr_zones, versions_moteurs
+from app.services.plan_analyse import PlanAnalyse
+from app.services.job_store import STATUTS_FINAUX
+from app.services.cache_resultats import json_defaut
+from app.services.ordonnanceur import SurchargeOCR
+from app.services.envois_fragmentes import DecalageEnvoi
+from app.services.analyses_anticipees import GROUPE_ANTICIPATION
+from app.services.invoice_extractor import extraire_facture_fichier, resume_facture
+from app.utils.cache_utils import AttenteDepassee, SingleFlight
+from app.utils.annulation import AnalyseAnnulee, JetonAnnulation, SurveillantDeconnexions
+from app.utils.pages_pdf import decouper_page, reference_page, developper_pages, charger_page, chemin_fichier, nombre_pages
 from werkzeug.utils import secure_filename
-from easy_core.pdf_utils import convert_pdf_to_image
+from easy_core.pdf_utils import PdfPages
+from PIL import Image
 
 ocr_bp = Blueprint('ocr', __name__)
 
-# Store for async batch jobs
-_batch_jobs = {}
-_batch_jobs_lock = threading.Lock()
+# Pool d'analyse partagé par tous les jobs batch (plafond global BATCH_MAX_WORKERS),
+# chaque job y soumet au plus `workers` fichiers à la fois
+_pool_batch = None
+_pool_batch_lock = threading.Lock()
+
+# Analyses identiques (même clé de cache) en cours: les requêtes concurrentes attendent la première
+_analyses_en_cours = SingleFlight()
+
+# Jetons d'annulation des jobs batch traités par ce process (job_id -> JetonAnnulation)
+_jetons_jobs = {}
+_jetons_jobs_lock = threading.Lock()
+
+# Requêtes synchrones: analyse annulée si le client se déconnecte
+_surveillant_deconnexions = SurveillantDeconnexions()
 
 IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.webp'}
 
 def _resolve_image_path(filename, app=None):
-    """Cherche un fichier dans uploads_temp d'abord, puis dans uploads."""
+    """Cherche un fichier dans uploads_temp d'abord, puis dans uploads.
+    Une page de PDF ('doc.pdf#2') garde son numéro de page dans le chemin retourné."""
+    nom, page = decouper_page(filename)
+    if page is not None:
+        chemin = _resolve_image_path(nom, app)
+        return reference_page(chemin, page) if chemin else None
     from flask import current_app as _ca
     ctx = app or _ca
     temp_folder = ctx.config['UPLOAD_TEMP_FOLDER']
@@ -32,36 +61,180 @@ def _resolve_image_path(filename, app=None):
         
     temp_path = os.path.join(temp_folder, filename)
     if os.path.exists(temp_path):
+        ctx.nettoyeur_temporaires.toucher(temp_path)  # Fichier utilisé: récent pour l'éviction LRU
         return temp_path
     perm_path = os.path.join(perm_folder, filename)
     if os.path.exists(perm_path):
         return perm_path
     return None  # introuvable
 
-def _analyser_un_fichier(image_path, filename, zones_config, cadre_reference, mode='rapide'):
-    """Analyse un seul fichier — utilisé par le ThreadPoolExecutor."""
-    try:
-        resultats, alertes, cadre_detecte = analyser_hybride_v2(image_path, zones_config, cadre_reference=cadre_reference, mode=mode)
-        
+def _fichiers_lot(filenames, app=None):
+    """
+    (filename, image_path) des fichiers d'un lot, un PDF entier étant développé en ses pages
+    ('doc.pdf#1', 'doc.pdf#2'...): chaque page passe séparément par les workers et n'est
+    rendue qu'au moment de son analyse.
+    """
+    fichiers = []
+    for filename in filenames:
+        fichiers.extend(developper_pages(filename, _resolve_image_path(filename, app)))
+    return fichiers
+
+def _stats_cache(stats_analyse):
+    """Statistiques de cache exposées dans les réponses (statut pour cette analyse + compteurs globaux)."""
+    return {
+        'cadre': stats_analyse.get('cache_cadre'),
+        'cadres': stats_cache_cadres(),
+        'ocr_zones': stats_cache_ocr_zones(),
+        'resultats': current_app.cache_resultats.compteurs(),
+        'coalescence': _analyses_en_cours.stats(),
+        'doublons': current_app.index_doublons.stats() if current_app.index_doublons else None
+    }
+
+def _executer_analyse(image_path, plan, mode='rapide', cache_mode=None, reutiliser_doublons=False, annulation=None,
+                      classe='interactive', groupe=None, poids=1, anticipation=None):
+    """
+    Analyse une image avec un plan compilé, en passant par le cache de résultats.
+    
+    Le cache est adressé par contenu (image + plan + mode + versions des moteurs):
+    un même scan renvoyé sous un autre nom retrouve le résultat déjà calculé.
+    cache_mode='bypass' force une nouvelle analyse (et rafraîchit l'entrée).
+    Les requêtes identiques simultanées partagent un seul calcul (coalesce=True).
+    Les quasi-doublons (même document rescanné) sont signalés dans 'doublon'; avec
+    reutiliser_doublons, leur cadre et leurs zones identiques sont réutilisés.
+    annulation (JetonAnnulation) interrompt l'analyse en levant AnalyseAnnulee.
+    image_path peut désigner une page de PDF ('doc.pdf#2'): elle n'est rendue (en mémoire,
+    au DPI de la référence de l'entité) qu'en cas d'absence du cache.
+    Le calcul occupe un créneau de l'ordonnanceur OCR (classe 'interactive' ou 'batch',
+    groupe/poids pour le partage entre jobs batch); SurchargeOCR si la file est saturée.
+    Sous charge, une requête interactive est exécutée dans un mode moins coûteux
+    (QualiteAdaptative) — sauf si le résultat du mode demandé est déjà en cache.
+    Une analyse anticipée à l'upload (voir anticiper_analyse) est réclamée: déjà démarrée,
+    la requête rejoint son calcul dans le mode demandé, sans dégradation.
+    anticipation: l'Anticipation exécutée par cet appel (appel fait par anticiper_analyse).
+    
+    Returns:
+        dict: {'success': True, 'resultats', 'alertes', 'cadre_detecte', 'stats_moteurs',
+               'stats_cache', 'redressement', 'doublon', 'cache_hit', 'cache_age', 'coalesce',
+               'mode', 'mode_effectif', 'degrade'}
+              ou {'success': False, 'error': ...} si les étiquettes sont introuvables.
+    """
+    cache = current_app.cache_resultats
+    index_doublons = current_app.index_doublons
+    reutiliser_doublons = bool(reutiliser_doublons and index_doublons)
+    versions = versions_moteurs()
+    
+    def cle_mode(m):
+        # Un résultat construit à partir d'un quasi-doublon n'est partagé qu'avec les requêtes qui l'acceptent
+        return cache.cle(image_path, plan, f"{m}+doublons" if reutiliser_doublons else m, versions)
+    
+    def depuis_cache(cle, mode_effectif):
+        entree = cache.get(cle) if cache_mode != 'bypass' else None
+        if entree is None:
+            return None
+        valeur, age = entree
+        logger.info(f"♻️ Résultat servi depuis le cache (âge {age:.0f}s, mode {mode_effectif}): {os.path.basename(image_path)}")
+        return {'success': True, **valeur, 'stats_cache': _stats_cache({}), 'doublon': None,
+                'cache_hit': True, 'cache_age': round(age, 1), 'coalesce': False,
+                'mode': mode, 'mode_effectif': mode_effectif, 'degrade': mode_effectif != mode}
+    
+    cle = cle_mode(mode)
+    anticipee = current_app.analyses_anticipees.reclamer(cle) if anticipation is None else None
+    resultat = depuis_cache(cle, mode)
+    if resultat is not None:
+        return resultat
+    
+    degradable = classe == 'interactive' and anticipee != 'en_cours'
+    mode_effectif = current_app.qualite_adaptative.mode_effectif(mode) if degradable else mode
+    if mode_effectif != mode:
+        logger.info(f"📉 {os.path.basename(image_path)}: mode '{mode}' dégradé en '{mode_effectif}' (charge OCR)")
+        cle = cle_mode(mode_effectif)
+        resultat = depuis_cache(cle, mode_effectif)
+        if resultat is not None:
+            return resultat
+    
+    ordonnanceur = current_app.ordonnanceur
+    
+    def calculer():
+        stats_analyse = {}
+        with ordonnanceur.creneau(classe, groupe, poids, annulation):
+            _analyses_en_cours.demarrer()  # Créneau obtenu: une requête interactive peut rejoindre ce calcul
+            if anticipation is not None:
+                anticipation.demarrer()
+            source = charger_page(image_path, (plan.cadre_reference or {}).get('image_base_dimensions'))
+            resultats, alertes, cadre_detecte = analyser_hybride_v2(
+                source, plan, mode=mode_effectif, stats=stats_analyse,
+                index_doublons=index_doublons, reutiliser_doublons=reutiliser_doublons,
+                annulation=annulation
+            )
         if resultats is None:
-            return {
-                'filename': filename,
-                'success': False,
-                'error': alertes
-            }
-        else:
-            stats = {}
-            for r in resultats.values():
-                m = r.get('moteur', 'inconnu')
-                stats[m] = stats.get(m, 0) + 1
-            return {
-                'filename': filename,
-                'success': True,
-                'resultats': resultats,
-                'alertes': alertes,
-                'cadre_detecte': cadre_detecte,
-                'stats_moteurs': stats
-            }
+            return {'success': False, 'error': alertes}
+        
+        stats = {}
+        for r in resultats.values():
+            m = r.get('moteur', 'inconnu')
+            stats[m] = stats.get(m, 0) + 1
+        
+        valeur = {
+            'resultats': resultats,
+            'alertes': alertes,
+            'cadre_detecte': cadre_detecte,
+            'stats_moteurs': stats,
+            'redressement': stats_analyse.get('redressement')
+        }
+        cache.put(cle, valeur)
+        return {'success': True, **valeur, 'stats_analyse': stats_analyse}
+    
+    # Même document + même plan déjà en cours d'analyse (retry client, onglets multiples):
+    # on attend le calcul en cours au lieu d'en relancer un second. Une requête interactive
+    # ne rejoint pas un calcul batch encore en file (elle calcule avec sa propre priorité),
+    # et n'attend un calcul partagé non démarré que attente_max secondes (503).
+    interactive = classe == 'interactive'
+    while True:
+        try:
+            resultat, coalesce = _analyses_en_cours.executer(
+                cle, calculer, prioritaire=interactive, annulation=annulation,
+                attente_max=ordonnanceur.attente_max if interactive else None
+            )
+            break
+        except AttenteDepassee:
+            raise ordonnanceur.refus_attente()
+        except AnalyseAnnulee:
+            if annulation is not None and annulation.annule:
+                raise
+            # Calcul partagé annulé par la requête qui l'avait lancé: on le relance pour nous
+            logger.info(f"🔁 Analyse partagée annulée par une autre requête, relance: {os.path.basename(image_path)}")
+    if coalesce:
+        logger.info(f"🔗 Analyse identique déjà en cours, résultat partagé: {os.path.basename(image_path)}")
+    if not resultat['success']:
+        return dict(resultat)
+    
+    resultat = dict(resultat)
+    stats_analyse = resultat.pop('stats_analyse')
+    return {
+        **resultat,
+        'stats_cache': _stats_cache(stats_analyse),
+        'doublon': stats_analyse.get('doublon'),
+        'cache_hit': False,
+        'cache_age': None,
+        'coalesce': coalesce,
+        'mode': mode,
+        'mode_effectif': mode_effectif,
+        'degrade': mode_effectif != mode
+    }
+
+def _analyser_un_fichier(image_path, filename, zones_config, cadre_reference, mode='rapide', cache_mode=None,
+                         reutiliser_doublons=False, annulation=None, **priorite):
+    """Analyse un seul fichier — utilisé par le ThreadPoolExecutor.
+    zones_config peut être un PlanAnalyse (cadre_reference est alors ignoré).
+    priorite: classe/groupe/poids pour l'ordonnanceur OCR (voir _executer_analyse).
+    AnalyseAnnulee est propagée (pas de résultat pour un fichier interrompu)."""
+    try:
+        plan = zones_config if isinstance(zones_config, PlanAnalyse) else PlanAnalyse(zones_config, cadre_reference)
+        return {'filename': filename, **_executer_analyse(image_path, plan, mode=mode, cache_mode=cache_mode,
+                                                          reutiliser_doublons=reutiliser_doublons,
+                                                          annulation=annulation, **priorite)}
+    except AnalyseAnnulee:
+        raise
     except Exception as e:
         return {
             'filename': filename,
@@ -70,6 +243,29 @@ def _analyser_un_fichier(image_path, filename, zones_config, cadre_reference, mo
         }
 
 
+def anticiper_analyse(image_path, plan, mode='rapide'):
+    """
+    Lance en arrière-plan l'analyse qu'un /api/analyser va probablement demander
+    (upload avec entité connue). Exécutée avec la priorité batch (groupe 'anticipation');
+    la requête qui suit la réclame par sa clé de cache (voir AnalysesAnticipees).
+
+    Returns:
+        bool: True si l'analyse a été lancée (False: désactivé, image illisible ou déjà anticipée).
+    """
+    app = current_app._get_current_object()
+    anticipations = app.analyses_anticipees
+    if not anticipations.active:
+        return False
+    cle = app.cache_resultats.cle(image_path, plan, mode, versions_moteurs())
+
+    def executer(anticipation):
+        with app.app_context():
+            _executer_analyse(image_path, plan, mode=mode, annulation=anticipation.jeton,
+                              classe='batch', groupe=GROUPE_ANTICIPATION, anticipation=anticipation)
+
+    return anticipations.lancer(cle, executer, os.path.basename(image_path))
+
+
 @ocr_bp.route('/api/analyser/v1', methods=['POST'])
 def api_analyser_v1():
     """
@@ -132,7 +328,8 @@ def api_analyser_v1():
     mode = data.get('mode', 'rapide')
     
     try:
-        resultats, alertes, cadre_detecte = analyser_hybride(image_path, zones_config, cadre_reference=cadre_reference, mode=mode)
+        with current_app.ordonnanceur.creneau('interactive'):
+            resultats, alertes, cadre_detecte = analyser_hybride(image_path, zones_config, cadre_reference=cadre_reference, mode=mode)
         
         if resultats is None:
             return jsonify({
@@ -156,6 +353,8 @@ def api_analyser_v1():
             'cadre_detecte': cadre_detecte,
             'stats_moteurs': stats
         })
+    except SurchargeOCR:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -177,6 +376,7 @@ def api_analyser():
             filename:
               type: string
               example: "document_test.jpg"
+              description: "Image, ou page d'un PDF uploadé ('document.pdf#2', première page par défaut)"
             mode:
               type: string
               example: "approfondi"
@@ -197,55 +397,54 @@ def api_analyser():
     elif 'image_path' in session:
         image_path = session['image_path']
         
-    if not image_path or not os.path.exists(image_path):
+    if not image_path or not os.path.exists(chemin_fichier(image_path)):
         return jsonify({'error': 'Image not found. Please upload first or provide filename.'}), 400
         
-    # 2. Determine Entity/Zones
+    # 2. Determine Entity/Zones → plan d'analyse compilé
     entite_active = session.get('entite_active')
+    cadre_reference = data.get('cadre_reference')
     
     if data.get('zones'):
-        zones_config = data['zones']
+        plan = PlanAnalyse(data['zones'], cadre_reference)
     elif data.get('entite'):
         # Charger l'entité depuis le manager si demandée explicitement (très utile pour Swagger)
+        # Plan compilé une fois par version du fichier de l'entité
         entite_nom = data['entite']
-        entite_config = current_app.entity_manager.charger_entite(entite_nom)
-        if entite_config and 'zones' in entite_config:
-            zones_config = {z['nom']: {**z, 'lang': z.get('lang', 'ara+fra'), 'char_filter': z.get('char_filter', 'none')} for z in entite_config['zones']}
-        else:
+        plan = current_app.entity_manager.charger_plan(entite_nom)
+        if not plan:
             return jsonify({'error': f"Entité '{entite_nom}' introuvable ou invalide."}), 400
+        if cadre_reference:
+            # Cadre explicite dans la requête: prioritaire sur celui de l'entité
+            plan = PlanAnalyse(plan.zones_config, cadre_reference, nom=plan.nom)
     elif entite_active:
-        zones_config = {z['nom']: {**z, 'lang': z.get('lang', 'ara+fra'), 'char_filter': z.get('char_filter', 'none')} for z in entite_active['zones']}
+        plan = PlanAnalyse(entite_active['zones'], cadre_reference)
     else:
-        zones_config = {"Test": {"coords": [100, 100, 300, 200]}}
+        plan = PlanAnalyse({"Test": {"coords": [100, 100, 300, 200]}}, cadre_reference)
     
-    cadre_reference = data.get('cadre_reference')
     mode = data.get('mode', 'rapide')
     
     try:
-        # APPEL A LA VERSION V2 (AVEC PADDLEOCR)
-        resultats, alertes, cadre_detecte = analyser_hybride_v2(image_path, zones_config, cadre_reference=cadre_reference, mode=mode)
+        # APPEL A LA VERSION V2 (AVEC PADDLEOCR), via le cache de résultats
+        # (interrompue si le client se déconnecte avant la fin)
+        with _surveillant_deconnexions.surveiller(request.environ) as annulation:
+            resultat = _executer_analyse(image_path, plan, mode=mode, cache_mode=data.get('cache'),
+                                         reutiliser_doublons=data.get('reutiliser_doublons', False),
+                                         annulation=annulation)
         
-        if resultats is None:
+        if not resultat['success']:
             return jsonify({
                 'success': False,
-                'error': alertes,
+                'error': resultat['error'],
                 'error_type': 'etiquettes_non_trouvees'
             }), 400
         
         # On ne sauvegarde pas dans la session pour ne pas perturber la V1
-        
-        stats = {}
-        for r in resultats.values():
-            m = r.get('moteur', 'inconnu')
-            stats[m] = stats.get(m, 0) + 1
-            
-        return jsonify({
-            'success': True, 
-            'resultats': resultats, 
-            'alertes': alertes, 
-            'cadre_detecte': cadre_detecte,
-            'stats_moteurs': stats
-        })
+        return jsonify(resultat)
+    except AnalyseAnnulee as e:
+        logger.info(f"🛑 Analyse de {os.path.basename(image_path)} annulée ({e})")
+        return jsonify({'success': False, 'error': 'Analyse annulée', 'cancelled': True}), 499
+    except SurchargeOCR:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -254,10 +453,61 @@ def api_analyser():
 # API CNI DÉDIÉE (Extraction directe depuis image)
 # =============================================
 
+def _conserver_fichiers_cni(filename, contenu, pages_rendues=None):
+    """Rétention de débogage: écrit le fichier reçu (et les pages PDF rendues) dans uploads_temp."""
+    temp_folder = current_app.config['UPLOAD_TEMP_FOLDER']
+    os.makedirs(temp_folder, exist_ok=True)
+    base = f"cni_direct_{uuid.uuid4()}_{filename}"
+    try:
+        with open(os.path.join(temp_folder, base), 'wb') as f:
+            f.write(contenu)
+        for numero, page_rendue in (pages_rendues or {}).items():
+            suffixe = '' if numero == 1 else f"_p{numero}"
+            page_rendue.save(os.path.join(temp_folder, f"{os.path.splitext(base)[0]}{suffixe}.jpg"), format='JPEG', quality=95)
+        logger.info(f"🐞 CNI: fichier conservé pour débogage: {base}")
+    except OSError as e:
+        logger.warning(f"⚠️ CNI: rétention de débogage impossible ({e})")
+
+
+def _pages_selectionnees(selection, total):
+    """Numéros de page (à partir de 1) demandés par le champ 'page': un numéro, ou 'all'."""
+    selection = (selection or '1').strip().lower()
+    if selection in ('all', '*'):
+        return list(range(1, total + 1))
+    if selection.isdigit() and 1 <= int(selection) <= total:
+        return [int(selection)]
+    raise ValueError(f"Page invalide: '{selection}' (le PDF compte {total} page(s))")
+
+
+def _fusionner_pages_cni(pages):
+    """
+    Fusionne les champs extraits de plusieurs pages (recto/verso): pour chaque champ, la
+    première valeur non vide dans l'ordre des pages. Un champ reste en alerte s'il l'est
+    sur la page dont provient sa valeur.
+    """
+    data, alertes_champ = {}, {}
+    for page in pages:
+        for champ, resultat in page['resultats'].items():
+            texte = resultat.get('texte_final', '')
+            if champ not in data or (texte and not data[champ]):
+                data[champ] = texte
+                alertes_champ[champ] = champ in page['alertes']
+    return data, [champ for champ, alerte in alertes_champ.items() if alerte]
+
+
 @ocr_bp.route('/api/v1/extract/cni', methods=['POST'])
 def api_extract_cni():
     """
     Extrait les informations d'une CNI (Carte Nationale d'Identité) à partir d'une image ou d'un PDF, en une seule étape.
+    
+    Le fichier est décodé (ou la page PDF rendue) directement en mémoire et analysé sans
+    écriture disque. Avec CNI_DEBUG_RETENTION, le fichier reçu et les pages rendues sont
+    conservés dans uploads_temp pour investigation.
+    
+    PDF de plusieurs pages: champ 'page' = numéro de la page à analyser (1 par défaut),
+    ou 'all' pour analyser chaque page (recto/verso) — les pages sont rendues une à une,
+    au moment de leur analyse, et leurs champs fusionnés dans 'data' (détail par page
+    dans 'pages').
     """
     if 'image' not in request.files:
         return jsonify({'success': False, 'error': 'Aucun fichier image/pdf fourni. Utilisez le champ "image".'}), 400
@@ -267,116 +517,226 @@ def api_extract_cni():
         return jsonify({'success': False, 'error': 'Le fichier est vide.'}), 400
         
     filename = secure_filename(file.filename)
-    unique_id = str(uuid.uuid4())
-    saved_filename = f"cni_direct_{unique_id}_{filename}"
-    temp_folder = current_app.config['UPLOAD_TEMP_FOLDER']
+    contenu = file.read()
+    est_pdf = filename.lower().endswith('.pdf') or contenu.startswith(b'%PDF')
     
-    os.makedirs(temp_folder, exist_ok=True)
-    filepath = os.path.join(temp_folder, saved_filename)
-    file.save(filepath)
-    
-    # 1. Conversion PDF -> Image si nécessaire
-    if filename.lower().endswith('.pdf'):
-        try:
-            image_filename = f"{os.path.splitext(saved_filename)[0]}.jpg"
-            image_filepath = os.path.join(temp_folder, image_filename)
-            convert_pdf_to_image(filepath, image_filepath)
-            
-            # On bascule sur l'image pour l'analyse
-            saved_filename = image_filename
-            filepath = image_filepath
-        except Exception as e:
-            return jsonify({'success': False, 'error': f'Erreur lors de la conversion du PDF: {str(e)}'}), 500
-            
-    # 2. Charger la configuration "cni_01" ou l'entité demandée
+    # 1. Charger la configuration "cni_01" ou l'entité demandée
     entite_nom = request.form.get('entite', 'cni_01')
-    entite_config = current_app.entity_manager.charger_entite(entite_nom)
+    plan = current_app.entity_manager.charger_plan(entite_nom)
     
-    if not entite_config or 'zones' not in entite_config:
+    if not plan:
         return jsonify({'success': False, 'error': f"L'entité '{entite_nom}' n'est pas configurée correctement."}), 500
+    
+    # 2. Décodage en mémoire (PDF -> pages rendues à la demande, au DPI de la référence de l'entité)
+    document = image = None
+    try:
+        if est_pdf:
+            document = PdfPages(contenu, base_dimensions=(plan.cadre_reference or {}).get('image_base_dimensions'))
+            numeros = _pages_selectionnees(request.form.get('page'), len(document))
+        else:
+            image = Image.open(io.BytesIO(contenu))
+            image.load()
+            numeros = [1]
+    except ValueError as e:
+        if document is not None:
+            document.close()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        if est_pdf:
+            return jsonify({'success': False, 'error': f'Erreur lors de la conversion du PDF: {str(e)}'}), 500
+        return jsonify({'success': False, 'error': f'Image illisible: {str(e)}'}), 400
         
-    zones_config = {z['nom']: {**z, 'lang': z.get('lang', 'ara+fra'), 'char_filter': z.get('char_filter', 'none')} for z in entite_config['zones']}
+    zones_config = plan.zones_config
+    retention = current_app.config['CNI_DEBUG_RETENTION']
+    pages_rendues = {}
     
-    # 3. Lancer l'analyse OCR (mode approfondi par défaut pour les API directes)
+    # 3. Lancer l'analyse OCR (mode approfondi par défaut pour les API directes, dégradé sous charge)
     mode = request.form.get('mode', 'approfondi')
+    mode_effectif = current_app.qualite_adaptative.mode_effectif(mode)
+    pages = []
     try:
-        resultats, alertes, cadre_detecte = analyser_hybride_v2(filepath, zones_config, mode=mode)
-        
-        # 4. Formater les données de retour
-        if resultats is None:
-             return jsonify({
-                 'success': False,
-                 'error': "Impossible d'extraire les données du document.",
-                 'alertes': alertes
-             }), 400
-             
-        extracted_data = {k: v.get('texte_final', '') for k, v in resultats.items()}
-        
-        # 5. Nettoyage du fichier temporaire (Optionnel mais propre)
-        try:
-            os.remove(filepath)
-            if filename.lower().endswith('.pdf'):
-                os.remove(os.path.join(temp_folder, saved_filename.replace('.jpg', '') + filename[-4:]))
-        except Exception as cleanup_err:
-            logger.warning(f"Failed to cleanup temp file {filepath}: {cleanup_err}")
-            
-        return jsonify({
-            'success': True,
-            'document_type': 'CNI',
-            'entite_utilisee': entite_nom,
-            'data': extracted_data,
-            'alertes': alertes
-        })
-        
+        for numero in numeros:
+            if document is not None:
+                image = document.render_pil(numero - 1)
+                if retention:
+                    pages_rendues[numero] = image
+            with current_app.ordonnanceur.creneau('interactive'):
+                resultats, alertes, cadre_detecte = analyser_hybride_v2(image, zones_config, mode=mode_effectif)
+            pages.append({'page': numero, 'resultats': resultats, 'alertes': alertes})
+            image = None  # Page suivante rendue seulement maintenant
+    except SurchargeOCR:
+        raise
     except Exception as e:
         logger.error(f"Erreur extraction CNI: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
-
-
+    finally:
+        if document is not None:
+            document.close()
+        if retention:
+            _conserver_fichiers_cni(filename, contenu, pages_rendues)
+    
+    # 4. Formater les données de retour
+    reussies = [p for p in pages if p['resultats'] is not None]
+    if not reussies:
+        return jsonify({
+            'success': False,
+            'error': "Impossible d'extraire les données du document.",
+            'alertes': pages[0]['alertes']
+        }), 400
+    
+    extracted_data, alertes = _fusionner_pages_cni(reussies)
+    reponse = {
+        'success': True,
+        'document_type': 'CNI',
+        'entite_utilisee': entite_nom,
+        'data': extracted_data,
+        'alertes': alertes,
+        'mode': mode,
+        'mode_effectif': mode_effectif,
+        'degrade': mode_effectif != mode
+    }
+    if len(numeros) > 1:
+        reponse['pages'] = [{
+            'page': p['page'],
+            'success': p['resultats'] is not None,
+            'data': {k: v.get('texte_final', '') for k, v in (p['resultats'] or {}).items()},
+            'alertes': p['alertes']
+        } for p in pages]
+    return jsonify(reponse)
 # =============================================
 # BATCH SYNCHRONE (petit nombre de fichiers)
 # =============================================
 
+def _analyser_batch_sync(fichiers, plan, annulation, **options):
+    """
+    Analyse séquentielle des fichiers du batch synchrone: génère les résultats un par un
+    (avec 'index' = position dans le lot développé et 'duree_ms'), sans les accumuler.
+    fichiers: liste de (filename, image_path ou None), voir _fichiers_lot.
+    """
+    for index, (filename, image_path) in enumerate(fichiers):
+        annulation.verifier()
+        debut = time.perf_counter()
+        
+        if not image_path:
+            result = {
+                'filename': filename,
+                'success': False,
+                'error': f'Fichier non trouvé: {filename}'
+            }
+        else:
+            result = _analyser_un_fichier(image_path, filename, plan, None, annulation=annulation, **options)
+        
+        result['index'] = index
+        result['duree_ms'] = round((time.perf_counter() - debut) * 1000)
+        yield result
+
+
+def _flux_batch_ndjson(fichiers, plan, environ, **options):
+    """
+    Batch synchrone en NDJSON: une ligne par fichier dès que son résultat est prêt
+    ({"type": "resultat", ...}), puis une ligne de résumé ({"type": "resume", ...}).
+    Seuls les compteurs sont gardés en mémoire, quelle que soit la taille du lot.
+    """
+    debut = time.perf_counter()
+    reussis = echoues = doublons = 0
+    duree_max_ms = 0
+    status = 'done'
+    
+    with _surveillant_deconnexions.surveiller(environ) as annulation:
+        try:
+            for result in _analyser_batch_sync(fichiers, plan, annulation, **options):
+                if result['success']:
+                    reussis += 1
+                else:
+                    echoues += 1
+                if result.get('doublon'):
+                    doublons += 1
+                duree_max_ms = max(duree_max_ms, result['duree_ms'])
+                yield json.dumps({'type': 'resultat', **result}, ensure_ascii=False, default=json_defaut) + "\n"
+        except AnalyseAnnulee as e:
+            status = 'cancelled'
+            logger.info(f"🛑 Batch NDJSON annulé après {reussis + echoues}/{len(fichiers)} fichier(s) ({e})")
+    
+    traites = reussis + echoues
+    duree_ms = round((time.perf_counter() - debut) * 1000)
+    yield json.dumps({
+        'type': 'resume',
+        'success': status == 'done',
+        'status': status,
+        'total': len(fichiers),
+        'traites': traites,
+        'reussis': reussis,
+        'echoues': echoues,
+        'doublons_probables': doublons,
+        'duree_ms': duree_ms,
+        'duree_moyenne_ms': round(duree_ms / traites) if traites else None,
+        'duree_max_ms': duree_max_ms
+    }, ensure_ascii=False) + "\n"
+
+
 @ocr_bp.route('/api/analyser-batch', methods=['POST'])
 def api_analyser_batch():
+    """Batch synchrone (petit nombre de fichiers), analysé séquentiellement.
+    Avec 'Accept: application/x-ndjson', les résultats sont envoyés en flux (une ligne
+    JSON par fichier, puis une ligne de résumé) au lieu d'un seul document final.
+    Pages de PDF: 'doc.pdf#2' pour une page, 'doc.pdf' (ou 'doc.pdf#all') pour toutes."""
     data = request.json or {}
     filenames = data.get('filenames', [])
     zones_config = data.get('zones')
     cadre_reference = data.get('cadre_reference')
-    mode = data.get('mode', 'rapide')
+    options = {
+        'mode': data.get('mode', 'rapide'),
+        'cache_mode': data.get('cache'),  # 'bypass' pour ignorer le cache de résultats
+        'reutiliser_doublons': data.get('reutiliser_doublons', False),
+        # Travail de fond pour l'ordonnanceur OCR: un groupe par requête, partagé avec les jobs
+        'classe': 'batch',
+        'groupe': f"sync:{uuid.uuid4()}",
+        'poids': data.get('poids', 1)
+    }
     
     if not filenames:
         return jsonify({'error': 'No filenames provided'}), 400
     
-    upload_folder = current_app.config['UPLOAD_TEMP_FOLDER']
+    # Plan compilé une seule fois pour tout le lot
+    plan = PlanAnalyse(zones_config, cadre_reference)
+    fichiers = _fichiers_lot(filenames)
+    
+    if request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson':
+        return Response(
+            stream_with_context(_flux_batch_ndjson(fichiers, plan, request.environ, **options)),
+            mimetype='application/x-ndjson',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    
     resultats_batch = []
     reussis = 0
     echoues = 0
     
-    for filename in filenames:
-        image_path = _resolve_image_path(filename)
-        
-        if not image_path:
-            resultats_batch.append({
-                'filename': filename,
+    with _surveillant_deconnexions.surveiller(request.environ) as annulation:
+        try:
+            for result in _analyser_batch_sync(fichiers, plan, annulation, **options):
+                resultats_batch.append(result)
+                if result['success']:
+                    reussis += 1
+                else:
+                    echoues += 1
+        except AnalyseAnnulee as e:
+            logger.info(f"🛑 Batch synchrone annulé après {len(resultats_batch)}/{len(fichiers)} fichier(s) ({e})")
+            return jsonify({
                 'success': False,
-                'error': f'Fichier non trouvé: {filename}'
-            })
-            echoues += 1
-            continue
-        
-        result = _analyser_un_fichier(image_path, filename, zones_config, cadre_reference, mode=mode)
-        resultats_batch.append(result)
-        if result['success']:
-            reussis += 1
-        else:
-            echoues += 1
+                'status': 'cancelled',
+                'total': len(fichiers),
+                'reussis': reussis,
+                'echoues': echoues,
+                'resultats_batch': resultats_batch
+            }), 499
     
     return jsonify({
         'success': True,
-        'total': len(filenames),
+        'total': len(fichiers),
         'reussis': reussis,
         'echoues': echoues,
+        'doublons_probables': sum(1 for r in resultats_batch if r.get('doublon')),
         'resultats_batch': resultats_batch
     })
 
@@ -385,148 +745,554 @@ def api_analyser_batch():
 # BATCH ASYNC (grand nombre de fichiers)
 # =============================================
 
+def _pool_analyses(app):
+    """Pool global des analyses batch (créé au premier job)."""
+    global _pool_batch
+    with _pool_batch_lock:
+        if _pool_batch is None:
+            _pool_batch = ThreadPoolExecutor(
+                max_workers=max(1, app.config['BATCH_MAX_WORKERS']),
+                thread_name_prefix='analyse-batch'
+            )
+        return _pool_batch
+
+def _workers_job(app, demande):
+    """Concurrence d'un job: max_workers demandé (ou défaut), borné par le plafond global."""
+    try:
+        workers = int(demande) if demande else app.config['BATCH_WORKERS_PER_JOB']
+    except (TypeError, ValueError):
+        workers = app.config['BATCH_WORKERS_PER_JOB']
+    return max(1, min(workers, app.config['BATCH_MAX_WORKERS']))
+
+def _extraire_facture_lot(image_path, filename, groupe, lang='fra', poids=1):
+    """Extraction de facture d'un fichier de job ('factures'), sur un créneau batch de l'ordonnanceur."""
+    with current_app.ordonnanceur.creneau('batch', groupe, poids):
+        return resume_facture(filename, extraire_facture_fichier(image_path, lang=lang))
+
+def _fichiers_du_job(app, job_id, fichiers, annule):
+    """
+    Fichiers à soumettre: ceux connus au lancement puis, tant que le job est ouvert
+    (upload par morceaux en cours), ceux qui lui sont ajoutés au fil de l'eau.
+    Un job ouvert sans nouveau fichier depuis UPLOAD_SESSION_IDLE_TIMEOUT est fermé.
+    """
+    store = app.job_store
+    soumis = set()
+    for fichier in fichiers:
+        soumis.add(fichier[0])
+        yield fichier
+    dernier_ajout = time.monotonic()
+    while not annule():
+        version = store.version(job_id)
+        job = store.job(job_id)  # Lu avant les fichiers: un job fermé n'a plus rien à ajouter ensuite
+        nouveaux = [f for f in store.fichiers_restants(job_id) if f[0] not in soumis]
+        for fichier in nouveaux:
+            soumis.add(fichier[0])
+            yield fichier
+        if nouveaux:
+            dernier_ajout = time.monotonic()
+            continue
+        if job is None or not job['ouvert']:
+            return
+        if time.monotonic() - dernier_ajout > app.config['UPLOAD_SESSION_IDLE_TIMEOUT']:
+            logger.warning(f"⚠️ Batch {job_id}: aucun fichier reçu depuis "
+                           f"{app.config['UPLOAD_SESSION_IDLE_TIMEOUT']}s, job fermé")
+            store.fermer(job_id)
+            continue
+        store.battre(job_id)  # Upload en cours (jusqu'à UPLOAD_SESSION_IDLE_TIMEOUT): le job reste à ce process
+        store.attendre(job_id, version, 1)
+
+def _executer_job_batch(app, job_id, fichiers, plan, workers, **options):
+    """
+    Analyse les fichiers d'un job sur le pool global, au plus `workers` à la fois.
+    
+    Args:
+        fichiers: Liste de (index, filename, image_path ou None si introuvable).
+        plan: PlanAnalyse du lot, ou None pour un job d'extraction de factures.
+        options: mode, cache_mode, reutiliser_doublons, poids (voir _analyser_un_fichier);
+                 lang, poids pour les factures.
+    
+    Chaque résultat (avec 'index' = position dans la demande et 'duree_ms') est écrit
+    dans le job store dès la fin de son analyse, dans l'ordre de fin.
+    Un job ouvert traite aussi les fichiers ajoutés pendant son exécution (_fichiers_du_job).
+    Une annulation (DELETE /api/batch/<job_id>, éventuellement reçue par un autre process)
+    interrompt les analyses en cours au prochain appel OCR; le job passe en 'cancelled'
+    avec les résultats déjà obtenus.
+    """
+    store = app.job_store
+    pool = _pool_analyses(app)
+    places = threading.BoundedSemaphore(workers)
+    debut_job = time.perf_counter()
+    annulation = JetonAnnulation()
+    with _jetons_jobs_lock:
+        _jetons_jobs[job_id] = annulation
+    
+    def annule():
+        """Annulation locale, ou demandée dans le job store par un autre process."""
+        if not annulation.annule and store.annulation_demandee(job_id):
+            annulation.annuler("annulé par l'utilisateur")
+        return annulation.annule
+    
+    def reserver_place():
+        """Attend une place libre dans le job; False si le job est annulé entre-temps."""
+        while not places.acquire(timeout=1):
+            if annule():
+                return False
+            store.battre(job_id)
+        if annule():
+            places.release()
+            return False
+        return True
+    
+    def analyser(index, filename, image_path):
+        if annulation.annule:
+            return  # Annulé avant d'avoir démarré
+        debut = time.perf_counter()
+        try:
+            if not image_path:
+                result = {'filename': filename, 'success': False, 'error': f'Fichier non trouvé: {filename}'}
+            else:
+                with app.app_context():
+                    if plan is None:
+                        result = _extraire_facture_lot(image_path, filename, job_id, **options)
+                    else:
+                        result = _analyser_un_fichier(image_path, filename, plan, None, annulation=annulation,
+                                                      classe='batch', groupe=job_id, **options)
+        except AnalyseAnnulee:
+            logger.info(f"🛑 Batch {job_id}: analyse de {filename} interrompue")
+            return
+        except Exception as e:
+            logger.error(f"❌ Batch: erreur inattendue sur {filename}: {e}")
+            result = {'filename': filename, 'success': False, 'error': str(e)}
+        result['index'] = index
+        result['duree_ms'] = round((time.perf_counter() - debut) * 1000)
+        try:
+            store.terminer_fichier(job_id, index, result)
+        except Exception as e:
+            logger.error(f"❌ Batch {job_id}: résultat de {filename} non enregistré: {e}")
+    
+    try:
+        futures = []
+        for index, filename, image_path in _fichiers_du_job(app, job_id, fichiers, annule):
+            if not reserver_place():
+                break  # Job annulé: les fichiers restants ne sont pas soumis
+            store.demarrer_fichier(job_id, index, filename)
+            future = pool.submit(analyser, index, filename, image_path)
+            future.add_done_callback(lambda _f: places.release())
+            futures.append(future)
+        
+        en_attente = futures
+        while en_attente:
+            en_attente = wait(en_attente, timeout=1).not_done
+            annule()
+            store.battre(job_id)  # Fichiers longs ou en file OCR: le job reste à ce process
+    finally:
+        with _jetons_jobs_lock:
+            _jetons_jobs.pop(job_id, None)
+    
+    statut = 'cancelled' if annulation.annule else 'done'
+    store.terminer_job(job_id, statut)
+    job = store.job(job_id) or {'completed': 0, 'total': len(fichiers)}
+    logger.info(f"📦 Batch {job_id} {'annulé' if statut == 'cancelled' else 'terminé'}: "
+                f"{job['completed']}/{job['total']} fichier(s) en {time.perf_counter() - debut_job:.1f}s ({workers} en parallèle)")
+
+def _lancer_job_batch(app, job_id, fichiers, params, workers):
+    """Démarre (ou relance) le traitement d'un job en arrière-plan."""
+    plan = None
+    if params.get('traitement') != 'factures':
+        with app.app_context():
+            plan = PlanAnalyse(params.get('zones'), params.get('cadre_reference'))  # Compilé une fois pour tout le lot
+    thread = threading.Thread(
+        target=_executer_job_batch,
+        args=(app, job_id, fichiers, plan, workers),
+        kwargs=params.get('options', {}),
+        daemon=True
+    )
+    thread.start()
+
+def _creer_job_batch(app, type_job, fichiers, data, workers, ouvert=False):
+    """Enregistre un job batch dans le job store et le démarre. Retourne son job_id.
+    type_job 'factures': extraction de factures (data: lang) au lieu d'une analyse par zones.
+    ouvert: d'autres fichiers seront ajoutés au job (voir JobStore.ajouter_fichiers)."""
+    job_id = str(uuid.uuid4())
+    if type_job == 'factures':
+        params = {
+            'traitement': 'factures',
+            'options': {'lang': data.get('lang', 'fra'), 'poids': data.get('poids', 1)}
+        }
+    else:
+        params = {
+            'zones': data.get('zones'),
+            'cadre_reference': data.get('cadre_reference'),
+            'options': {
+                'mode': data.get('mode', 'rapide'),
+                'cache_mode': data.get('cache'),  # 'bypass' pour ignorer le cache de résultats
+                'reutiliser_doublons': data.get('reutiliser_doublons', False),
+                'poids': data.get('poids', 1)  # Part du job dans le partage équitable entre jobs batch
+            }
+        }
+    app.job_store.creer(job_id, type_job, fichiers, params, workers, ouvert=ouvert)
+    reprendre_jobs_batch(app)  # Au passage: jobs abandonnés par un process disparu
+    _lancer_job_batch(app, job_id, [(i, f, p) for i, (f, p) in enumerate(fichiers)], params, workers)
+    return job_id
+
+def reprendre_jobs_batch(app):
+    """Relance les jobs 'running' abandonnés (process arrêté) avec leurs fichiers non traités."""
+    store = app.job_store
+    for job_id in store.reclamer_orphelins():
+        if store.annulation_demandee(job_id):
+            store.terminer_job(job_id, 'cancelled')
+            continue
+        job = store.job(job_id)
+        restants = store.fichiers_restants(job_id)
+        logger.info(f"♻️ Reprise du job {job_id}: {len(restants)}/{job['total']} fichier(s) restant(s)")
+        if restants or job['ouvert']:
+            _lancer_job_batch(app, job_id, restants, store.params(job_id), job['workers'])
+        else:
+            store.terminer_job(job_id, 'done')
+
+def _etat_job(job):
+    """Progression d'un job (sans les résultats)."""
+    return {
+        'status': job['status'],
+        'total': job['total'],
+        'completed': job['completed'],
+        'reussis': job['reussis'],
+        'echoues': job['echoues'],
+        'current_file': job['current_file'],
+        'en_cours': job['en_cours'],
+        'workers': job['workers'],
+        'duree_ms': job['duree_ms']
+    }
+
 @ocr_bp.route('/api/analyser-batch-async', methods=['POST'])
 def api_analyser_batch_async():
     """Lance une analyse batch en arrière-plan.
-    Traite les fichiers séquentiellement dans un thread unique avec le contexte Flask.
-    Retourne immédiatement un job_id pour suivre la progression via SSE."""
+    Les fichiers sont analysés en parallèle (max_workers par job, plafonné par BATCH_MAX_WORKERS).
+    Retourne immédiatement un job_id pour suivre la progression via SSE.
+    Un PDF entier ('doc.pdf' ou 'doc.pdf#all') compte pour une entrée par page."""
     data = request.json or {}
     filenames = data.get('filenames', [])
-    zones_config = data.get('zones')
-    cadre_reference = data.get('cadre_reference')
-    mode = data.get('mode', 'rapide')
     
     if not filenames:
         return jsonify({'error': 'No filenames provided'}), 400
     
-    job_id = str(uuid.uuid4())
     app = current_app._get_current_object()
-    
-    job = {
-        'status': 'running',
-        'total': len(filenames),
-        'completed': 0,
-        'reussis': 0,
-        'echoues': 0,
-        'resultats_batch': [],
-        'current_file': ''
-    }
-    
-    with _batch_jobs_lock:
-        _batch_jobs[job_id] = job
-    
-    def run_batch():
-        with app.app_context():
-            for filename in filenames:
-                with _batch_jobs_lock:
-                    job['current_file'] = filename
-                
-                image_path = _resolve_image_path(filename, app)
-                if not image_path:
-                    with _batch_jobs_lock:
-                        job['resultats_batch'].append({
-                            'filename': filename,
-                            'success': False,
-                            'error': f'Fichier non trouvé: {filename}'
-                        })
-                        job['completed'] += 1
-                        job['echoues'] += 1
-                    continue
-                
-                result = _analyser_un_fichier(image_path, filename, zones_config, cadre_reference, mode=mode)
-                with _batch_jobs_lock:
-                    job['resultats_batch'].append(result)
-                    job['completed'] += 1
-                    if result['success']:
-                        job['reussis'] += 1
-                    else:
-                        job['echoues'] += 1
-            
-            with _batch_jobs_lock:
-                job['status'] = 'done'
-    
-    thread = threading.Thread(target=run_batch, daemon=True)
-    thread.start()
+    workers = _workers_job(app, data.get('max_workers'))
+    fichiers = _fichiers_lot(filenames, app)
+    job_id = _creer_job_batch(app, 'batch', fichiers, data, workers)
     
     return jsonify({
         'success': True,
         'job_id': job_id,
-        'total': len(filenames)
+        'total': len(fichiers),
+        'workers': workers
     })
 
 
+def _evenement_sse(donnees, evenement=None, id_evenement=None):
+    """Formate un événement SSE (event/id optionnels, data JSON)."""
+    lignes = []
+    if id_evenement is not None:
+        lignes.append(f"id: {id_evenement}")
+    if evenement:
+        lignes.append(f"event: {evenement}")
+    lignes.append(f"data: {json.dumps(donnees, ensure_ascii=False)}")
+    return "\n".join(lignes) + "\n\n"
+
+
 @ocr_bp.route('/api/batch-progress/<job_id>', methods=['GET'])
 def api_batch_progress(job_id):
-    """SSE endpoint — envoie la progression en temps réel."""
+    """SSE endpoint — progression en temps réel, réveillé par les événements du job.
+    
+    Événements:
+        progress  : état du job (compteurs, fichiers en cours), à chaque changement
+        file_done : un fichier terminé, avec son résultat (id = rang de fin 'seq')
+        done      : résumé final (sans les résultats, déjà envoyés fichier par fichier)
+    Un commentaire heartbeat n'est envoyé que si rien ne s'est passé depuis SSE_HEARTBEAT_INTERVAL.
+    Reprise: l'en-tête Last-Event-ID (ou ?last_event_id=) indique le dernier 'seq' reçu."""
+    store = current_app.job_store
+    heartbeat = current_app.config['SSE_HEARTBEAT_INTERVAL']
+    intervalle_distant = current_app.config['SSE_REMOTE_POLL_INTERVAL']
+    page = current_app.config['BATCH_RESULTS_PAGE_SIZE']
+    dernier_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or '0'
+    dernier_seq = int(dernier_id) if dernier_id.isdigit() else 0
+    
     def generate():
+        seq = dernier_seq
+        etat_envoye = None
+        derniere_emission = time.monotonic()
+        yield "retry: 2000\n\n"
+        
         while True:
-            with _batch_jobs_lock:
-                job = _batch_jobs.get(job_id)
+            version = store.version(job_id)
+            job = store.job(job_id)
             
             if not job:
-                yield f"data: {json.dumps({'error': 'Job not found'})}\n\n"
+                yield _evenement_sse({'error': 'Job not found'})
                 break
             
-            payload = {
-                'status': job['status'],
-                'total': job['total'],
-                'completed': job['completed'],
-                'reussis': job['reussis'],
-                'echoues': job['echoues'],
-                'current_file': job['current_file']
-            }
+            etat = _etat_job(job)
+            nouveaux = store.resultats(job_id, offset=seq, limite=page, avec_seq=True)
+            for seq, resultat in nouveaux:
+                yield _evenement_sse({'seq': seq, 'resultat': resultat}, 'file_done', seq)
+            
+            if etat != etat_envoye:
+                yield _evenement_sse(etat, 'progress')
+                etat_envoye = etat
+                derniere_emission = time.monotonic()
+            elif nouveaux:
+                derniere_emission = time.monotonic()
             
-            if job['status'] == 'done':
-                payload['resultats_batch'] = job['resultats_batch']
-                yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
-                # Nettoyage après livraison
-                with _batch_jobs_lock:
-                    _batch_jobs.pop(job_id, None)
+            if len(nouveaux) == page:
+                continue  # Rattrapage: page suivante sans attendre
+            
+            if job['status'] in STATUTS_FINAUX and seq >= job['completed']:
+                yield _evenement_sse(etat, 'done', seq)
                 break
             
-            yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
-            time.sleep(0.5)
+            delai = heartbeat if version is not None else min(heartbeat, intervalle_distant)
+            if not store.attendre(job_id, version, delai) and time.monotonic() - derniere_emission >= heartbeat:
+                yield ": heartbeat\n\n"
+                derniere_emission = time.monotonic()
     
     return Response(generate(), mimetype='text/event-stream',
                     headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
+@ocr_bp.route('/api/batch/<job_id>', methods=['DELETE'])
+def api_annuler_batch(job_id):
+    """Annule un job batch en cours. Les fichiers déjà analysés restent disponibles
+    (/api/batch-result); le job passe en 'cancelled' dès que les analyses en cours
+    se sont interrompues (au plus un appel OCR)."""
+    store = current_app.job_store
+    job = store.job(job_id)
+    
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if not store.demander_annulation(job_id):
+        return jsonify({'success': False, 'error': 'Job déjà terminé', **_etat_job(store.job(job_id))}), 409
+    
+    with _jetons_jobs_lock:
+        jeton = _jetons_jobs.get(job_id)
+    if jeton:
+        jeton.annuler("annulé par l'utilisateur")
+    logger.info(f"🛑 Annulation demandée pour le batch {job_id} ({job['completed']}/{job['total']} fichier(s) analysé(s))")
+    
+    return jsonify({'success': True, 'job_id': job_id, 'status': 'cancelling'}), 202
+
+
+@ocr_bp.route('/api/charge-ocr', methods=['GET'])
+def api_charge_ocr():
+    """État de l'ordonnanceur OCR: créneaux occupés, files d'attente, partage entre jobs batch,
+    plafond de qualité appliqué aux requêtes interactives, analyses anticipées à l'upload."""
+    return jsonify({**current_app.ordonnanceur.stats(), 'qualite': current_app.qualite_adaptative.stats(),
+                    'anticipation': current_app.analyses_anticipees.stats()})
+
+
 @ocr_bp.route('/api/batch-result/<job_id>', methods=['GET'])
 def api_batch_result(job_id):
-    """Polling fallback — retourne l'état courant du job."""
-    with _batch_jobs_lock:
-        job = _batch_jobs.get(job_id)
+    """Polling fallback — état courant du job et une page de résultats (ordre de fin d'analyse).
+    
+    Query params: offset (nombre de résultats déjà reçus, défaut 0),
+                  limit (taille de page, défaut BATCH_RESULTS_PAGE_SIZE)."""
+    store = current_app.job_store
+    job = store.job(job_id)
     
     if not job:
         return jsonify({'error': 'Job not found'}), 404
     
-    response = {
-        'status': job['status'],
-        'total': job['total'],
-        'completed': job['completed'],
-        'reussis': job['reussis'],
-        'echoues': job['echoues'],
-        'current_file': job['current_file']
-    }
+    page_max = current_app.config['BATCH_RESULTS_PAGE_SIZE']
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = min(max(1, request.args.get('limit', page_max, type=int)), 10 * page_max)
     
-    if job['status'] == 'done':
-        response['resultats_batch'] = job['resultats_batch']
+    resultats = store.resultats(job_id, offset=offset, limite=limit)
+    suivant = offset + len(resultats)
+    
+    response = _etat_job(job)
+    response['resultats_batch'] = resultats
+    response['pagination'] = {
+        'offset': offset,
+        'limit': limit,
+        'count': len(resultats),
+        'next_offset': suivant if suivant < job['completed'] else None
+    }
     
     return jsonify(response)
 
 
+# =============================================
+# UPLOAD PAR MORCEAUX (gros lots, reprise après coupure)
+# =============================================
+
+def _fichier_envoi(envoi, index, termine=None):
+    """Description d'un fichier terminé d'un envoi (format de /api/upload-batch)."""
+    fichier = envoi['fichiers'][index]
+    alias = current_app.envois_fragmentes.alias(envoi, index)
+    description = {'index': index, 'filename': fichier['nom'], 'saved_filename': os.path.basename(alias)}
+    if termine is not None:
+        description['deja_recu'] = termine['deja_present']
+    if envoi.get('traitement') != 'factures' and alias.lower().endswith('.pdf'):
+        try:
+            description['nombre_pages'] = nombre_pages(alias)
+        except Exception as e:
+            description['error'] = f'Erreur conversion PDF: {str(e)}'
+    return description
+
+def _ajouter_au_job(envoi, index):
+    """Ajoute un fichier terminé au job de l'envoi (un PDF analysé par zones: une entrée par page)."""
+    alias = current_app.envois_fragmentes.alias(envoi, index)
+    if envoi.get('traitement') == 'factures':
+        entrees = [(envoi['fichiers'][index]['nom'], alias)]
+    else:
+        entrees = developper_pages(os.path.basename(alias), alias)
+    if current_app.job_store.ajouter_fichiers(envoi['job_id'], entrees) is None:
+        logger.warning(f"⚠️ Envoi {envoi['upload_id']}: job {envoi['job_id']} déjà terminé, "
+                       f"{envoi['fichiers'][index]['nom']} non traité")
+
+@ocr_bp.route('/api/upload-session', methods=['POST'])
+def api_creer_envoi():
+    """Crée un upload par morceaux, reprenable (alternative à /api/upload-batch et
+    /api/extraire-facture-batch pour les gros lots).
+    
+    Body JSON:
+        fichiers: [{'filename', 'taille'}] (taille en octets)
+        traitement: None (upload seul), 'analyse' (analyse par zones: zones, cadre_reference,
+                    mode, cache, reutiliser_doublons, poids, max_workers comme
+                    /api/analyser-batch-async) ou 'factures' (lang).
+    
+    Protocole:
+        PUT  /api/upload-session/<upload_id>/<index>?offset=N  corps brut = octets [N, N+len[
+        GET  /api/upload-session/<upload_id>                   octets reçus par fichier (reprise)
+        POST /api/upload-session/<upload_id>/finaliser         clôt l'envoi
+    Avec un traitement, un job batch est créé d'emblée (suivi: /api/batch-progress/<job_id>):
+    chaque fichier y entre dès son dernier morceau, pendant que les suivants arrivent."""
+    data = request.json or {}
+    traitement = data.get('traitement')
+    if traitement not in (None, 'analyse', 'factures'):
+        return jsonify({'error': f'Traitement inconnu: {traitement}'}), 400
+    annonces = data.get('fichiers')
+    if not isinstance(annonces, list) or not all(isinstance(f, dict) for f in annonces):
+        return jsonify({'error': 'fichiers: liste de {filename, taille} requise'}), 400
+    
+    app = current_app._get_current_object()
+    fichiers = [{'nom': secure_filename(f.get('filename') or ''), 'taille': f.get('taille')} for f in annonces]
+    try:
+        fichiers = app.envois_fragmentes.valider(fichiers)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    job_id, workers = None, None
+    if traitement:
+        workers = _workers_job(app, data.get('max_workers'))
+        job_id = _creer_job_batch(app, 'factures' if traitement == 'factures' else 'batch',
+                                  [], data, workers, ouvert=True)
+    envoi = app.envois_fragmentes.creer(fichiers, 'inv_batch' if traitement == 'factures' else 'ocr',
+                                        traitement=traitement, job_id=job_id)
+    
+    return jsonify({
+        'success': True,
+        **app.envois_fragmentes.etat(envoi),
+        'job_id': envoi['job_id'],
+        'workers': workers,
+        'taille_morceau_max': app.config['UPLOAD_CHUNK_MAX_BYTES']
+    }), 201
+
+@ocr_bp.route('/api/upload-session/<upload_id>', methods=['GET'])
+def api_etat_envoi(upload_id):
+    """État d'un envoi: octets reçus par fichier (offset de reprise) et fichiers terminés."""
+    envoi = current_app.envois_fragmentes.charger(upload_id)
+    if not envoi:
+        return jsonify({'error': 'Envoi inconnu ou expiré'}), 404
+    return jsonify({'success': True, **current_app.envois_fragmentes.etat(envoi), 'job_id': envoi['job_id']})
+
+@ocr_bp.route('/api/upload-session/<upload_id>/<int:index>', methods=['PUT'])
+def api_morceau_envoi(upload_id, index):
+    """Reçoit un morceau du fichier `index` (corps brut, écrit sur disque au fil de la lecture).
+    Query: offset = position du morceau dans le fichier (= octets déjà reçus).
+    409 avec 'recu' si l'offset ne correspond pas: reprendre à 'recu'."""
+    envois = current_app.envois_fragmentes
+    envoi = envois.charger(upload_id)
+    if not envoi:
+        return jsonify({'error': 'Envoi inconnu ou expiré'}), 404
+    offset = request.args.get('offset', type=int)
+    longueur = request.content_length
+    if offset is None or offset < 0:
+        return jsonify({'error': 'offset requis'}), 400
+    if longueur is None:
+        return jsonify({'error': 'Content-Length requis'}), 411
+    if longueur > current_app.config['UPLOAD_CHUNK_MAX_BYTES']:
+        return jsonify({'error': f"Morceau trop gros (maximum {current_app.config['UPLOAD_CHUNK_MAX_BYTES']} octets)"}), 413
+    
+    try:
+        recu, termine = envois.ecrire(envoi, index, offset, request.stream, longueur)
+    except IndexError as e:
+        return jsonify({'error': str(e)}), 404
+    except DecalageEnvoi as e:
+        return jsonify({'success': False, 'error': str(e), 'recu': e.recu}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    reponse = {'success': True, 'index': index, 'recu': recu, 'taille': envoi['fichiers'][index]['taille'],
+               'complet': recu == envoi['fichiers'][index]['taille']}
+    if termine is not None:
+        if envoi['job_id']:
+            _ajouter_au_job(envoi, index)
+        reponse.update(_fichier_envoi(envoi, index, termine))
+    return jsonify(reponse)
+
+@ocr_bp.route('/api/upload-session/<upload_id>/finaliser', methods=['POST'])
+def api_finaliser_envoi(upload_id):
+    """Clôt un envoi dont tous les fichiers sont reçus (rejouable).
+    Retourne les fichiers comme /api/upload-batch; le job éventuel se termine
+    une fois ses derniers fichiers traités."""
+    envois = current_app.envois_fragmentes
+    envoi = envois.charger(upload_id)
+    if not envoi:
+        return jsonify({'error': 'Envoi inconnu ou expiré'}), 404
+    try:
+        envois.finaliser(envoi)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), **envois.etat(envoi)}), 409
+    
+    if envoi['job_id']:
+        # Fichier terminé sans avoir rejoint le job (process arrêté entre les deux): rattrapé ici
+        dans_le_job = current_app.job_store.chemins_job(envoi['job_id'])
+        for index in range(len(envoi['fichiers'])):
+            if envois.alias(envoi, index) not in dans_le_job:
+                _ajouter_au_job(envoi, index)
+        current_app.job_store.fermer(envoi['job_id'])
+    
+    return jsonify({
+        'success': True,
+        'upload_id': upload_id,
+        'files': [_fichier_envoi(envoi, index) for index in range(len(envoi['fichiers']))],
+        'job_id': envoi['job_id']
+    })
+
+@ocr_bp.route('/api/upload-session/<upload_id>', methods=['DELETE'])
+def api_abandonner_envoi(upload_id):
+    """Abandonne un envoi: fichiers partiels supprimés, job éventuel fermé
+    (les fichiers déjà reçus restent traités)."""
+    envoi = current_app.envois_fragmentes.charger(upload_id)
+    if not envoi:
+        return jsonify({'error': 'Envoi inconnu ou expiré'}), 404
+    current_app.envois_fragmentes.abandonner(envoi)
+    if envoi['job_id']:
+        current_app.job_store.fermer(envoi['job_id'])
+    return jsonify({'success': True, 'upload_id': upload_id})
+
+
 # =============================================
 # ANALYSE DE DOSSIER SERVEUR
 # =============================================
 
 @ocr_bp.route('/api/analyser-dossier', methods=['POST'])
 def api_analyser_dossier():
-    """Analyse tous les fichiers image d'un dossier côté serveur.
+    """Analyse tous les fichiers image d'un dossier côté serveur (et chaque page de ses PDF).
     Le dossier doit être dans uploads/ ou un chemin absolu autorisé."""
     data = request.json or {}
     dossier_path = data.get('dossier')
-    zones_config = data.get('zones')
-    cadre_reference = data.get('cadre_reference')
     
     if not dossier_path:
         return jsonify({'error': 'dossier path required'}), 400
@@ -543,56 +1309,25 @@ def api_analyser_dossier():
     filenames = []
     for f in sorted(os.listdir(dossier_path)):
         ext = os.path.splitext(f)[1].lower()
-        if ext in IMAGE_EXTENSIONS:
+        if ext in IMAGE_EXTENSIONS or ext == '.pdf':
             filenames.append(f)
     
     if not filenames:
         return jsonify({'error': 'Aucun fichier image trouvé dans le dossier'}), 400
     
-    # Lancer en mode async
-    job_id = str(uuid.uuid4())
-    max_workers = data.get('max_workers', 2)
+    # Lancer en mode async, en parallèle sur le pool global
     app = current_app._get_current_object()
-    
-    job = {
-        'status': 'running',
-        'total': len(filenames),
-        'completed': 0,
-        'reussis': 0,
-        'echoues': 0,
-        'resultats_batch': [],
-        'current_file': ''
-    }
-    
-    with _batch_jobs_lock:
-        _batch_jobs[job_id] = job
-    
-    def run_folder_batch():
-        with app.app_context():
-            for filename in filenames:
-                with _batch_jobs_lock:
-                    job['current_file'] = filename
-                
-                image_path = os.path.join(dossier_path, filename)
-                result = _analyser_un_fichier(image_path, filename, zones_config, cadre_reference)
-                with _batch_jobs_lock:
-                    job['resultats_batch'].append(result)
-                    job['completed'] += 1
-                    if result['success']:
-                        job['reussis'] += 1
-                    else:
-                        job['echoues'] += 1
-            
-            with _batch_jobs_lock:
-                job['status'] = 'done'
-    
-    thread = threading.Thread(target=run_folder_batch, daemon=True)
-    thread.start()
+    workers = _workers_job(app, data.get('max_workers'))
+    fichiers = []
+    for filename in filenames:
+        fichiers.extend(developper_pages(filename, os.path.join(dossier_path, filename)))
+    job_id = _creer_job_batch(app, 'dossier', fichiers, data, workers)
     
     return jsonify({
         'success': True,
         'job_id': job_id,
-        'total': len(filenames),
+        'total': len(fichiers),
+        'workers': workers,
         'filenames': filenames
     })
 
@@ -77,26 +77,29 @@ def run_optimizer():
         stop_threshold = 0.9
 
     try:
-        # Prepare image
-        image_de_travail, cadre_info, crop_a_nettoyer = preparer_image_de_travail(image_file, entity)
-        
-        # Optimize zone
-        debut_zone = time.time()
-        resultat = optimiser_zone(
-            image_path=image_de_travail,
-            nom_zone=zone_name,
-            coords_base=coords_base,
-            texte_attendu=texte_attendu,
-            lang=lang,
-            preprocess=preprocess,
-            expected_format=expected_format,
-            char_filter=char_filter,
-            margin=margin,
-            use_tesseract=use_tesseract,
-            use_paddleocr=use_paddleocr,
-            use_easyocr=use_easyocr,
-            stop_threshold=stop_threshold
-        )
+        # Préparation (détection du cadre) + optimisation: nombreux appels OCR,
+        # file batch de l'ordonnanceur OCR avec un groupe par entité
+        with current_app.ordonnanceur.creneau('batch', f"optimiseur:{entity_name}"):
+            # Prepare image
+            image_de_travail, cadre_info, crop_a_nettoyer = preparer_image_de_travail(image_file, entity)
+            
+            # Optimize zone
+            debut_zone = time.time()
+            resultat = optimiser_zone(
+                image_path=image_de_travail,
+                nom_zone=zone_name,
+                coords_base=coords_base,
+                texte_attendu=texte_attendu,
+                lang=lang,
+                preprocess=preprocess,
+                expected_format=expected_format,
+                char_filter=char_filter,
+                margin=margin,
+                use_tesseract=use_tesseract,
+                use_paddleocr=use_paddleocr,
+                use_easyocr=use_easyocr,
+                stop_threshold=stop_threshold
+            )
         duree_zone = time.time() - debut_zone
         resultat['duree_secondes'] = round(duree_zone, 1)
 
@@ -0,0 +1,167 @@
+"""
+analyses_anticipees.py - Analyse lancée dès l'upload quand l'entité est connue.
+
+Le parcours de l'interface est toujours /api/upload puis, peu après, /api/analyser
+avec l'entité active. Si l'upload précise l'entité (et le mode), l'analyse démarre
+aussitôt en arrière-plan; le /api/analyser qui suit la « réclame » par sa clé de
+cache de résultats (image + plan + mode + versions des moteurs):
+- analyse terminée: son résultat est déjà dans le cache de résultats;
+- analyse en cours: la requête rejoint le calcul (SingleFlight), sans le relancer;
+- analyse encore en file d'attente: elle est annulée et la requête s'exécute
+  normalement, avec la priorité interactive.
+
+Une anticipation tourne avec la priorité batch (groupe 'anticipation'): elle ne prend
+jamais les créneaux réservés à l'interactif. Non réclamée au bout du TTL, elle est
+annulée si elle n'est pas terminée (un résultat déjà calculé reste dans le cache).
+L'expiration est paresseuse (aucun thread de minuterie): vérifiée à chaque lancement,
+réclamation ou lecture des stats, et par le worker avant d'exécuter une anticipation
+restée en file.
+
+La réclamation est locale au process: une requête servie par un autre worker ne
+retrouve que les analyses terminées (cache de résultats partagé).
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.annulation import AnalyseAnnulee, JetonAnnulation
+
+logger = logging.getLogger(__name__)
+
+GROUPE_ANTICIPATION = 'anticipation'  # Groupe batch de l'ordonnanceur OCR
+
+
+class Anticipation:
+    """Une analyse anticipée: jeton d'annulation et état ('en_attente', 'en_cours', 'terminee', 'annulee', 'echec')."""
+
+    def __init__(self, cle, description):
+        self.cle = cle
+        self.description = description
+        self.jeton = JetonAnnulation()
+        self.etat = 'en_attente'
+        self.cree = time.monotonic()
+
+    def demarrer(self):
+        """Appelé quand l'analyse obtient son créneau OCR (le calcul commence)."""
+        if self.etat == 'en_attente':
+            self.etat = 'en_cours'
+
+
+class AnalysesAnticipees:
+    """
+    Args:
+        ttl: Délai (secondes) pour réclamer une anticipation avant son abandon.
+        max_workers: Anticipations exécutées simultanément (les suivantes attendent).
+        active: False = aucune analyse anticipée.
+    """
+
+    def __init__(self, ttl=120, max_workers=2, active=True):
+        self.ttl = ttl
+        self.max_workers = max(1, max_workers)
+        self.active = active
+        self._lock = threading.Lock()
+        self._pool = None
+        self._anticipations = {}  # clé de cache -> Anticipation
+        self.compteurs = {'lancees': 0, 'servies': 0, 'reprises': 0, 'abandonnees': 0, 'inutilisees': 0, 'echecs': 0}
+
+    def lancer(self, cle, executer, description=''):
+        """
+        Lance une analyse anticipée.
+
+        Args:
+            cle: Clé de cache de résultats de l'analyse attendue.
+            executer: Callable(anticipation) qui effectue l'analyse (anticipation.jeton
+                      pour l'annulation, anticipation.demarrer() une fois le créneau obtenu).
+            description: Libellé pour les logs (ex. nom du fichier).
+
+        Returns:
+            bool: False si désactivé ou si la même analyse est déjà anticipée.
+        """
+        if not self.active or cle is None:
+            return False
+        self._expirer_echues()
+        anticipation = Anticipation(cle, description)
+        with self._lock:
+            if cle in self._anticipations:
+                return False
+            self._anticipations[cle] = anticipation
+            self.compteurs['lancees'] += 1
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='analyse-anticipee')
+            pool = self._pool
+        pool.submit(self._executer, anticipation, executer)
+        logger.info(f"🔮 Analyse anticipée lancée: {description}")
+        return True
+
+    def _executer(self, anticipation, executer):
+        if self._echue(anticipation, time.monotonic()):
+            self._expirer(anticipation)  # Restée en file au-delà du TTL: jamais démarrée
+        if anticipation.jeton.annule:
+            anticipation.etat = 'annulee'
+            return
+        try:
+            executer(anticipation)
+            anticipation.etat = 'terminee'
+        except AnalyseAnnulee:
+            anticipation.etat = 'annulee'
+        except Exception as e:
+            anticipation.etat = 'echec'
+            with self._lock:
+                self.compteurs['echecs'] += 1
+            logger.warning(f"⚠️ Analyse anticipée en échec ({anticipation.description}): {e}")
+
+    def reclamer(self, cle):
+        """
+        Réclame l'anticipation d'une analyse demandée.
+
+        Returns:
+            str: État de l'anticipation au moment de la réclamation, ou None s'il n'y en a pas.
+                 'en_cours': le calcul est engagé, la requête doit le rejoindre (même mode);
+                 'en_attente': l'anticipation est annulée, la requête calcule elle-même.
+        """
+        with self._lock:
+            anticipation = self._anticipations.pop(cle, None)
+            if anticipation is None:
+                return None
+            etat = anticipation.etat
+            if etat == 'en_attente':
+                anticipation.jeton.annuler("réclamée avant d'avoir démarré")
+                self.compteurs['reprises'] += 1
+            else:
+                self.compteurs['servies'] += 1
+        if etat != 'en_attente':
+            logger.info(f"🔮 Analyse anticipée réclamée ({etat}, après "
+                        f"{time.monotonic() - anticipation.cree:.1f}s): {anticipation.description}")
+        self._expirer_echues()
+        return etat
+
+    def _echue(self, anticipation, maintenant):
+        return maintenant - anticipation.cree >= self.ttl
+
+    def _expirer_echues(self):
+        """Abandonne les anticipations non réclamées depuis plus que le TTL."""
+        maintenant = time.monotonic()
+        with self._lock:
+            echues = [a for a in self._anticipations.values() if self._echue(a, maintenant)]
+        for anticipation in echues:
+            self._expirer(anticipation)
+
+    def _expirer(self, anticipation):
+        with self._lock:
+            if self._anticipations.get(anticipation.cle) is not anticipation:
+                return  # Déjà réclamée
+            del self._anticipations[anticipation.cle]
+            abandon = anticipation.etat in ('en_attente', 'en_cours')
+            self.compteurs['abandonnees' if abandon else 'inutilisees'] += 1
+        if abandon:
+            anticipation.jeton.annuler("anticipation non réclamée")
+            logger.info(f"🗑️ Analyse anticipée non réclamée après {self.ttl}s, abandonnée: {anticipation.description}")
+
+    def stats(self):
+        self._expirer_echues()
+        with self._lock:
+            etats = {}
+            for anticipation in self._anticipations.values():
+                etats[anticipation.etat] = etats.get(anticipation.etat, 0) + 1
+            return {'active': self.active, 'ttl': self.ttl, 'en_attente_de_reclamation': etats, **self.compteurs}
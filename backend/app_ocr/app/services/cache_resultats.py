@@ -0,0 +1,230 @@
+"""
+cache_resultats.py - Cache des résultats d'analyse, adressé par contenu.
+
+Clé = SHA-256(contenu de l'image) + empreinte du plan (zones + cadre_reference)
+      + mode + versions du pipeline et des moteurs OCR.
+Un même scan renvoyé (retry, double clic, ré-upload sous un autre nom) retrouve
+donc le résultat déjà calculé, quel que soit son nom de fichier.
+
+Deux niveaux:
+- mémoire: LRU borné (accès immédiat)
+- disque: SQLite sous uploads_temp (survit aux redémarrages), borné en taille
+Les entrées expirent après un TTL commun aux deux niveaux.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from app.utils.cache_utils import LRUCache, empreinte_fichier, empreinte_config
+from app.utils.pages_pdf import decouper_page, est_pdf
+
+logger = logging.getLogger(__name__)
+
+
+def json_defaut(obj):
+    """Sérialise les scalaires numpy éventuels présents dans les résultats."""
+    if hasattr(obj, 'item'):
+        return obj.item()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type non sérialisable: {type(obj).__name__}")
+
+
+class CacheResultats:
+    """
+    Cache des résultats d'analyse (mémoire LRU + SQLite).
+
+    Args:
+        chemin_db: Fichier SQLite du niveau disque (None = mémoire uniquement).
+        ttl: Durée de vie d'une entrée en secondes.
+        max_memoire: Nombre maximum d'entrées en mémoire.
+        max_octets_disque: Taille maximale cumulée des entrées sur disque.
+    """
+
+    PURGE_TOUS_LES = 50  # Purge du niveau disque toutes les N écritures
+
+    def __init__(self, chemin_db=None, ttl=24 * 3600, max_memoire=256, max_octets_disque=200 * 1024 * 1024):
+        self.chemin_db = chemin_db
+        self.ttl = ttl
+        self.max_octets_disque = max_octets_disque
+        self._memoire = LRUCache(max_entries=max_memoire, ttl=ttl)
+        self._lock = threading.Lock()
+        self._ecritures = 0
+        self.hits_memoire = 0
+        self.hits_disque = 0
+        self.misses = 0
+        if chemin_db:
+            self._initialiser_db()
+
+    # --- Clé ---
+
+    @staticmethod
+    def cle(image_path, plan, mode, versions):
+        """Clé de cache d'une analyse (None si l'image est illisible).
+        image_path peut désigner une page de PDF ('doc.pdf#2'): contenu du PDF + numéro de page."""
+        chemin, page = decouper_page(image_path)
+        try:
+            empreinte_image = empreinte_fichier(chemin)
+        except OSError:
+            return None
+        if est_pdf(chemin):
+            empreinte_image = f"{empreinte_image}#{page or 1}"
+        return empreinte_config({
+            'image': empreinte_image,
+            'plan': plan.empreinte,
+            'mode': mode,
+            'versions': versions
+        })
+
+    # --- Niveau disque ---
+
+    @contextmanager
+    def _connexion(self):
+        """Connexion courte (une par opération): commit en sortie, puis fermeture."""
+        conn = sqlite3.connect(self.chemin_db, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _initialiser_db(self):
+        try:
+            os.makedirs(os.path.dirname(self.chemin_db) or '.', exist_ok=True)
+            with self._lock, self._connexion() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS resultats ("
+                    " cle TEXT PRIMARY KEY, valeur TEXT NOT NULL,"
+                    " cree REAL NOT NULL, acces REAL NOT NULL, taille INTEGER NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_resultats_acces ON resultats(acces)")
+        except sqlite3.Error as e:
+            logger.error(f"❌ Cache résultats: niveau disque désactivé ({e})")
+            self.chemin_db = None
+
+    def _lire_disque(self, cle):
+        if not self.chemin_db:
+            return None
+        try:
+            with self._lock, self._connexion() as conn:
+                ligne = conn.execute("SELECT valeur, cree FROM resultats WHERE cle = ?", (cle,)).fetchone()
+                if ligne is None:
+                    return None
+                valeur, cree = ligne
+                if time.time() - cree > self.ttl:
+                    conn.execute("DELETE FROM resultats WHERE cle = ?", (cle,))
+                    return None
+                conn.execute("UPDATE resultats SET acces = ? WHERE cle = ?", (time.time(), cle))
+            return cree, json.loads(valeur)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"⚠️ Cache résultats: lecture disque impossible ({e})")
+            return None
+
+    def _ecrire_disque(self, cle, cree, valeur):
+        if not self.chemin_db:
+            return
+        try:
+            brut = json.dumps(valeur, ensure_ascii=False, default=json_defaut)
+            with self._lock, self._connexion() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO resultats (cle, valeur, cree, acces, taille) VALUES (?, ?, ?, ?, ?)",
+                    (cle, brut, cree, cree, len(brut))
+                )
+                self._ecritures += 1
+                if self._ecritures % self.PURGE_TOUS_LES == 0:
+                    self._purger(conn)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"⚠️ Cache résultats: écriture disque impossible ({e})")
+
+    def _purger(self, conn):
+        """Supprime les entrées expirées puis les moins récemment lues au-delà de la taille max."""
+        conn.execute("DELETE FROM resultats WHERE cree < ?", (time.time() - self.ttl,))
+        total = conn.execute("SELECT COALESCE(SUM(taille), 0) FROM resultats").fetchone()[0]
+        if total <= self.max_octets_disque:
+            return
+        a_liberer = total - self.max_octets_disque
+        liberes = 0
+        supprimees = []
+        for cle, taille in conn.execute("SELECT cle, taille FROM resultats ORDER BY acces ASC"):
+            supprimees.append((cle,))
+            liberes += taille
+            if liberes >= a_liberer:
+                break
+        conn.executemany("DELETE FROM resultats WHERE cle = ?", supprimees)
+        logger.info(f"🧹 Cache résultats: {len(supprimees)} entrée(s) évincée(s) du disque ({liberes} octets)")
+
+    # --- API ---
+
+    def get(self, cle):
+        """
+        Retourne (valeur, age_secondes) ou None.
+        Une entrée trouvée sur disque est remontée en mémoire.
+        """
+        if cle is None:
+            return None
+        entree = self._memoire.get(cle)
+        if entree is not None and time.time() - entree[0] > self.ttl:
+            # Entrée remontée du disque: son âge compte depuis sa création, pas sa remontée
+            self._memoire.pop(cle)
+            entree = None
+        if entree is not None:
+            self.hits_memoire += 1
+            cree, valeur = entree
+            return valeur, time.time() - cree
+
+        entree = self._lire_disque(cle)
+        if entree is not None:
+            self.hits_disque += 1
+            self._memoire.put(cle, entree)
+            cree, valeur = entree
+            return valeur, time.time() - cree
+
+        self.misses += 1
+        return None
+
+    def put(self, cle, valeur):
+        """Enregistre un résultat d'analyse dans les deux niveaux."""
+        if cle is None:
+            return
+        cree = time.time()
+        self._memoire.put(cle, (cree, valeur))
+        self._ecrire_disque(cle, cree, valeur)
+
+    def vider(self):
+        self._memoire.clear()
+        if self.chemin_db:
+            try:
+                with self._lock, self._connexion() as conn:
+                    conn.execute("DELETE FROM resultats")
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Cache résultats: vidage disque impossible ({e})")
+
+    def compteurs(self):
+        """Compteurs de hits/misses (sans accès disque)."""
+        total = self.hits_memoire + self.hits_disque + self.misses
+        return {
+            'hits_memoire': self.hits_memoire,
+            'hits_disque': self.hits_disque,
+            'misses': self.misses,
+            'hit_rate': round((self.hits_memoire + self.hits_disque) / total, 4) if total else 0.0
+        }
+
+    def stats(self):
+        """Statistiques des deux niveaux du cache."""
+        stats = {
+            **self.compteurs(),
+            'memoire': self._memoire.stats(),
+            'ttl': self.ttl
+        }
+        if self.chemin_db:
+            try:
+                with self._lock, self._connexion() as conn:
+                    nb, octets = conn.execute("SELECT COUNT(*), COALESCE(SUM(taille), 0) FROM resultats").fetchone()
+                stats['disque'] = {'entries': nb, 'octets': octets, 'max_octets': self.max_octets_disque}
+            except sqlite3.Error:
+                pass
+        return stats
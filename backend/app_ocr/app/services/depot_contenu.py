@@ -0,0 +1,182 @@
+"""
+depot_contenu.py - Stockage des uploads adressé par contenu (déduplication).
+
+Chaque fichier reçu est écrit une seule fois sous 'cas_<sha256><ext>', l'empreinte
+étant calculée pendant l'écriture (un seul passage sur les données). Le nom renvoyé
+au client (saved_filename, ex. 'ocr_<uuid>_<nom>') est un alias: un lien physique vers
+cet objet. Le reste du code continue donc de lire un fichier ordinaire, et un contenu
+déjà reçu ne coûte ni écriture ni espace disque supplémentaire.
+
+Les empreintes étant mémorisées par inode (cache_utils.empreinte_fichier), tous les
+alias d'un même contenu partagent les caches en aval (cadres détectés, zones OCR,
+résultats d'analyse) sans relire le fichier.
+
+Sans support des liens physiques (système de fichiers), l'alias est une copie.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import uuid
+
+from app.utils.cache_utils import memoriser_empreinte
+
+logger = logging.getLogger(__name__)
+
+PREFIXE_OBJET = 'cas_'
+TAILLE_BLOC = 1 << 20
+
+
+class DepotContenu:
+    """
+    Args:
+        dossier: Dossier des objets et de leurs alias (UPLOAD_TEMP_FOLDER).
+    """
+
+    def __init__(self, dossier):
+        self.dossier = dossier
+        self._lock = threading.Lock()
+        self._liens_physiques = True  # Passe à False au premier échec (copie ensuite)
+        self.ecritures = 0
+        self.doublons = 0
+        self.octets_ecrits = 0
+        self.octets_evites = 0
+
+    def chemin_objet(self, empreinte, ext='', suffixe=''):
+        """Chemin de l'objet d'un contenu (suffixe: variante dérivée, ex. '_p1_300dpi')."""
+        return os.path.join(self.dossier, f"{PREFIXE_OBJET}{empreinte}{suffixe}{ext.lower()}")
+
+    def lier(self, objet, alias):
+        """Crée (ou remplace) alias comme lien physique vers objet; copie si les liens sont impossibles."""
+        if os.path.exists(alias):
+            if os.path.samefile(objet, alias):
+                return alias
+            os.remove(alias)
+        if self._liens_physiques:
+            try:
+                os.link(objet, alias)
+                return alias
+            except FileNotFoundError:
+                raise
+            except OSError as e:
+                self._liens_physiques = False
+                logger.warning(f"⚠️ Liens physiques indisponibles ({e}): les alias seront des copies")
+        shutil.copy2(objet, alias)
+        return alias
+
+    def deriver(self, empreinte, suffixe, ext, produire, alias):
+        """
+        Variante dérivée d'un contenu (ex. page d'un PDF rendue), produite une seule fois
+        par contenu et exposée sous `alias`.
+
+        Args:
+            produire: Callable(chemin) qui écrit la variante dans le fichier indiqué.
+
+        Returns:
+            bool: True si la variante existait déjà (rien n'a été produit).
+        """
+        objet = self.chemin_objet(empreinte, ext, suffixe)
+        if os.path.exists(objet):
+            try:
+                self.lier(objet, alias)
+                os.utime(objet)
+                return True
+            except FileNotFoundError:
+                pass  # Supprimée entre-temps par le nettoyage: on la reproduit
+        partiel = os.path.join(self.dossier, f"{PREFIXE_OBJET}tmp_{uuid.uuid4().hex}.part")
+        try:
+            produire(partiel)
+            os.replace(partiel, objet)
+        except BaseException:
+            if os.path.exists(partiel):
+                os.remove(partiel)
+            raise
+        self.lier(objet, alias)
+        return False
+
+    def enregistrer(self, flux, alias):
+        """
+        Enregistre un upload sous son empreinte et crée son alias.
+
+        Args:
+            flux: Contenu (objet fichier en lecture, ex. FileStorage.stream).
+            alias: Chemin sous lequel le fichier doit être accessible (saved_filename).
+
+        Returns:
+            dict: {'chemin': alias, 'objet', 'empreinte', 'taille', 'deja_present'}
+        """
+        partiel = os.path.join(self.dossier, f"{PREFIXE_OBJET}tmp_{uuid.uuid4().hex}.part")
+        h = hashlib.sha256()
+        taille = 0
+        try:
+            with open(partiel, 'wb') as f:
+                for bloc in iter(lambda: flux.read(TAILLE_BLOC), b''):
+                    h.update(bloc)
+                    f.write(bloc)
+                    taille += len(bloc)
+        except BaseException:
+            if os.path.exists(partiel):
+                os.remove(partiel)
+            raise
+        return self._installer(partiel, h.hexdigest(), taille, alias)
+
+    def adopter(self, chemin, alias):
+        """
+        Range sous son empreinte un fichier déjà écrit dans le dossier du dépôt
+        (ex. fichier assemblé morceau par morceau) et crée son alias. Le fichier est
+        déplacé (ou supprimé si le contenu était déjà présent).
+
+        Returns:
+            dict: Comme enregistrer().
+        """
+        h = hashlib.sha256()
+        taille = 0
+        with open(chemin, 'rb') as f:
+            for bloc in iter(lambda: f.read(TAILLE_BLOC), b''):
+                h.update(bloc)
+                taille += len(bloc)
+        return self._installer(chemin, h.hexdigest(), taille, alias)
+
+    def _installer(self, partiel, empreinte, taille, alias):
+        """Déplace `partiel` vers l'objet de son empreinte (sauf doublon) et crée l'alias."""
+        objet = self.chemin_objet(empreinte, os.path.splitext(alias)[1])
+        try:
+            deja_present = os.path.exists(objet) and os.path.getsize(objet) == taille
+            if deja_present:
+                try:
+                    self.lier(objet, alias)
+                    os.utime(objet)  # Contenu réutilisé: récent pour le nettoyage LRU
+                except FileNotFoundError:
+                    deja_present = False  # Objet supprimé entre-temps par le nettoyage
+            if deja_present:
+                os.remove(partiel)
+            else:
+                os.replace(partiel, objet)  # Atomique: deux uploads simultanés du même contenu donnent le même objet
+                self.lier(objet, alias)
+        except BaseException:
+            if os.path.exists(partiel):
+                os.remove(partiel)
+            raise
+
+        memoriser_empreinte(alias, empreinte)
+        with self._lock:
+            if deja_present:
+                self.doublons += 1
+                self.octets_evites += taille
+            else:
+                self.ecritures += 1
+                self.octets_ecrits += taille
+        if deja_present:
+            logger.info(f"♻️ Upload identique à un contenu déjà reçu ({empreinte[:12]}): aucune écriture")
+        return {'chemin': alias, 'objet': objet, 'empreinte': empreinte, 'taille': taille, 'deja_present': deja_present}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ecritures': self.ecritures,
+                'doublons': self.doublons,
+                'octets_ecrits': self.octets_ecrits,
+                'octets_evites': self.octets_evites,
+                'liens_physiques': self._liens_physiques
+            }
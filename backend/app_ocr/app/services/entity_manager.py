@@ -1,14 +1,21 @@
 import json
 import os
+import threading
 from datetime import datetime
 from PIL import Image, ImageDraw
 import base64
 from io import BytesIO
+from app.services.plan_analyse import PlanAnalyse
 
 class EntityManager:
-    def __init__(self, entities_dir="entities"):
+    def __init__(self, entities_dir="entities", dossiers_templates=None):
         self.entities_dir = entities_dir
         self.composites_dir = os.path.join(entities_dir, "composites")
+        # Dossiers où résoudre les template_path relatifs des ancres (uploads_temp, uploads)
+        self.dossiers_templates = tuple(dossiers_templates or ())
+        # Plans d'analyse compilés: nom -> (version du fichier, PlanAnalyse)
+        self._plans = {}
+        self._plans_lock = threading.Lock()
         os.makedirs(entities_dir, exist_ok=True)
         os.makedirs(self.composites_dir, exist_ok=True)
     
@@ -43,6 +50,32 @@ class EntityManager:
                 return json.load(f)
         return None
     
+    def charger_plan(self, nom_entite):
+        """
+        Retourne le plan d'analyse compilé d'une entité (None si introuvable).
+        Le plan est recompilé uniquement quand le fichier JSON de l'entité change.
+        """
+        fichier_entite = os.path.join(self.entities_dir, f"{nom_entite}.json")
+        try:
+            stat = os.stat(fichier_entite)
+        except OSError:
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        
+        with self._plans_lock:
+            entree = self._plans.get(nom_entite)
+            if entree and entree[0] == version:
+                return entree[1]
+        
+        entite = self.charger_entite(nom_entite)
+        if not entite or 'zones' not in entite:
+            return None
+        plan = PlanAnalyse.depuis_entite(entite, version=version, dossiers_templates=self.dossiers_templates)
+        
+        with self._plans_lock:
+            self._plans[nom_entite] = (version, plan)
+        return plan
+    
     def lister_entites(self):
         """Liste toutes les entités disponibles"""
         entites = []
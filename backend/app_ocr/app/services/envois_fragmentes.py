@@ -0,0 +1,294 @@
+"""
+envois_fragmentes.py - Uploads par morceaux, reprenables (gros lots, PDF volumineux).
+
+Un lot n'est plus envoyé en une seule requête multipart (analysée en entier par
+Werkzeug avant toute écriture, et perdue si la connexion tombe):
+1. création d'un envoi: liste des fichiers annoncés (nom, taille);
+2. envoi des morceaux de chaque fichier à leur offset (PUT, corps brut écrit
+   directement sur disque); après une coupure, l'état de l'envoi donne pour chaque
+   fichier l'offset à partir duquel reprendre;
+3. finalisation: l'envoi est clos.
+
+Un fichier est terminé dès son dernier morceau: il est alors rangé dans le dépôt par
+contenu sous son alias (saved_filename), et peut être traité sans attendre la fin du lot.
+
+Tout l'état est sur disque dans le dossier temporaire, partagé par les process workers:
+- 'envoi_<id>.json'          : manifeste (fichiers annoncés, job associé, finalisé ou non);
+- 'envoi_<id>_<index>.part'  : octets reçus d'un fichier (taille = offset de reprise);
+- 'envoi_<id>_<index>.verrou' : verrou (flock) des écritures d'un fichier;
+- l'alias du fichier terminé ('<prefixe>_<id>_<index>_<nom>').
+Les morceaux d'un même fichier sont sérialisés entre process (verrou fcntl sur le
+fichier '.verrou') et entre threads: une reprise client envoyée à un autre worker
+pendant que le morceau d'origine s'écrit encore retrouve l'offset à jour (409).
+Plusieurs fichiers d'un envoi peuvent avancer en parallèle.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: serveur mono-process, verrous des threads seulement
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+PREFIXE_ENVOI = 'envoi_'
+TAILLE_BLOC = 1 << 20
+_FORMAT_ID = re.compile(r'[0-9a-f]{32}')
+
+
+class DecalageEnvoi(Exception):
+    """Morceau envoyé à un offset différent des octets déjà reçus (reprendre à `recu`)."""
+
+    def __init__(self, recu):
+        super().__init__(f"Offset attendu: {recu}")
+        self.recu = recu
+
+
+class EnvoisFragmentes:
+    """
+    Args:
+        dossier: Dossier temporaire (UPLOAD_TEMP_FOLDER), celui du dépôt.
+        depot: DepotContenu où sont rangés les fichiers terminés.
+        max_fichiers: Nombre maximum de fichiers par envoi.
+        taille_max_fichier: Taille maximum annoncée par fichier (octets).
+    """
+
+    def __init__(self, dossier, depot, max_fichiers=1000, taille_max_fichier=200 * 1024 * 1024):
+        self.dossier = dossier
+        self.depot = depot
+        self.max_fichiers = max_fichiers
+        self.taille_max_fichier = taille_max_fichier
+        self._lock = threading.Lock()
+        self._verrous = {}  # (upload_id, index) -> [Lock, utilisateurs] (retiré au dernier utilisateur)
+
+    # --- Chemins ---
+
+    def _manifeste(self, upload_id):
+        return os.path.join(self.dossier, f"{PREFIXE_ENVOI}{upload_id}.json")
+
+    def _partiel(self, upload_id, index):
+        return os.path.join(self.dossier, f"{PREFIXE_ENVOI}{upload_id}_{index}.part")
+
+    def alias(self, envoi, index):
+        """Chemin du fichier terminé (saved_filename dans le dossier temporaire)."""
+        fichier = envoi['fichiers'][index]
+        return os.path.join(self.dossier, f"{envoi['prefixe']}_{envoi['upload_id']}_{index}_{fichier['nom']}")
+
+    def _fichier_verrou(self, upload_id, index):
+        return os.path.join(self.dossier, f"{PREFIXE_ENVOI}{upload_id}_{index}.verrou")
+
+    @contextmanager
+    def _verrou(self, upload_id, index):
+        """Exclusion des écritures d'un fichier: threads de ce process, puis autres process (flock)."""
+        cle = (upload_id, index)
+        with self._lock:
+            entree = self._verrous.setdefault(cle, [threading.Lock(), 0])
+            entree[1] += 1
+        try:
+            with entree[0]:
+                if fcntl is None:
+                    yield
+                else:
+                    with open(self._fichier_verrou(upload_id, index), 'ab') as verrou:
+                        fcntl.flock(verrou, fcntl.LOCK_EX)
+                        try:
+                            yield
+                        finally:
+                            fcntl.flock(verrou, fcntl.LOCK_UN)
+        finally:
+            with self._lock:
+                entree[1] -= 1
+                if entree[1] == 0:
+                    del self._verrous[cle]
+
+    def _ecrire_manifeste(self, envoi):
+        chemin = self._manifeste(envoi['upload_id'])
+        partiel = f"{chemin}.{uuid.uuid4().hex}.tmp"
+        with open(partiel, 'w', encoding='utf-8') as f:
+            json.dump(envoi, f, ensure_ascii=False)
+        os.replace(partiel, chemin)
+
+    # --- Cycle de vie ---
+
+    def valider(self, fichiers):
+        """
+        Vérifie les fichiers annoncés ([{'nom': nom sécurisé, 'taille': octets}]).
+
+        Raises:
+            ValueError: Liste vide, trop de fichiers, nom ou taille invalide.
+        """
+        if not fichiers:
+            raise ValueError("Aucun fichier annoncé")
+        if len(fichiers) > self.max_fichiers:
+            raise ValueError(f"Trop de fichiers ({len(fichiers)}, maximum {self.max_fichiers})")
+        annonces = []
+        for fichier in fichiers:
+            nom, taille = fichier.get('nom'), fichier.get('taille')
+            if not nom:
+                raise ValueError("Nom de fichier manquant")
+            if not isinstance(taille, int) or isinstance(taille, bool) or taille < 0:
+                raise ValueError(f"Taille invalide pour {nom}")
+            if taille > self.taille_max_fichier:
+                raise ValueError(f"{nom}: {taille} octets (maximum {self.taille_max_fichier})")
+            annonces.append({'nom': nom, 'taille': taille})
+        return annonces
+
+    def creer(self, fichiers, prefixe='ocr', **extra):
+        """
+        Crée un envoi.
+
+        Args:
+            fichiers: [{'nom': nom sécurisé, 'taille': octets}] (voir valider).
+            prefixe: Préfixe des alias des fichiers terminés ('ocr', 'inv_batch'...).
+            extra: Informations conservées dans le manifeste (ex. job_id, traitement).
+
+        Raises:
+            ValueError: Fichiers annoncés invalides.
+        """
+        annonces = self.valider(fichiers)
+        envoi = {
+            'upload_id': uuid.uuid4().hex,
+            'prefixe': prefixe,
+            'cree': time.time(),
+            'finalise': False,
+            'fichiers': annonces,
+            **extra
+        }
+        self._ecrire_manifeste(envoi)
+        logger.info(f"📤 Envoi {envoi['upload_id']} créé: {len(annonces)} fichier(s), "
+                    f"{sum(f['taille'] for f in annonces) / 1e6:.1f} Mo annoncés")
+        return envoi
+
+    def charger(self, upload_id):
+        """Manifeste d'un envoi, ou None s'il est inconnu (ou expiré)."""
+        if not _FORMAT_ID.fullmatch(upload_id or ''):
+            return None
+        try:
+            with open(self._manifeste(upload_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def recu(self, envoi, index):
+        """Octets reçus d'un fichier (sa taille s'il est terminé)."""
+        if os.path.exists(self.alias(envoi, index)):
+            return envoi['fichiers'][index]['taille']
+        try:
+            return os.path.getsize(self._partiel(envoi['upload_id'], index))
+        except FileNotFoundError:
+            return 0
+
+    def etat(self, envoi):
+        """État de l'envoi: pour chaque fichier, octets reçus (offset de reprise) et alias s'il est terminé."""
+        fichiers = []
+        for index, fichier in enumerate(envoi['fichiers']):
+            alias = self.alias(envoi, index)
+            termine = os.path.exists(alias)
+            fichiers.append({
+                'index': index,
+                'filename': fichier['nom'],
+                'taille': fichier['taille'],
+                'recu': fichier['taille'] if termine else self.recu(envoi, index),
+                'complet': termine,
+                'saved_filename': os.path.basename(alias) if termine else None
+            })
+        return {
+            'upload_id': envoi['upload_id'],
+            'finalise': envoi['finalise'],
+            'complet': all(f['complet'] for f in fichiers),
+            'fichiers': fichiers
+        }
+
+    def ecrire(self, envoi, index, offset, flux, longueur):
+        """
+        Écrit un morceau d'un fichier à `offset`; termine le fichier à son dernier octet.
+
+        Args:
+            flux: Corps de la requête (lu par blocs, jamais chargé en entier).
+            longueur: Taille du morceau (Content-Length).
+
+        Returns:
+            (recu, termine): octets reçus après écriture, et le résultat de
+            DepotContenu.adopter si ce morceau a terminé le fichier (sinon None).
+
+        Raises:
+            IndexError: Fichier inconnu dans l'envoi.
+            DecalageEnvoi: offset différent des octets déjà reçus.
+            ValueError: Envoi finalisé, ou morceau au-delà de la taille annoncée.
+        """
+        if not 0 <= index < len(envoi['fichiers']):
+            raise IndexError(f"Fichier {index} absent de l'envoi")
+        if envoi['finalise']:
+            raise ValueError("Envoi déjà finalisé")
+        taille = envoi['fichiers'][index]['taille']
+        partiel = self._partiel(envoi['upload_id'], index)
+        with self._verrou(envoi['upload_id'], index):
+            recu = self.recu(envoi, index)
+            if os.path.exists(self.alias(envoi, index)):
+                if offset == taille and not longueur:
+                    return recu, None  # Dernier morceau rejoué: rien à faire
+                raise DecalageEnvoi(recu)
+            if offset != recu:
+                raise DecalageEnvoi(recu)
+            if offset + longueur > taille:
+                raise ValueError(f"Morceau au-delà de la taille annoncée ({offset + longueur} > {taille} octets)")
+            with open(partiel, 'ab') as f:
+                reste = longueur
+                while reste > 0:
+                    bloc = flux.read(min(TAILLE_BLOC, reste))
+                    if not bloc:
+                        break  # Connexion coupée: les octets écrits restent acquis
+                    f.write(bloc)
+                    reste -= len(bloc)
+            recu = os.path.getsize(partiel)
+            os.utime(self._manifeste(envoi['upload_id']))  # Envoi actif: pas d'expiration
+            if recu < taille:
+                return recu, None
+            termine = self.depot.adopter(partiel, self.alias(envoi, index))
+        logger.info(f"📥 Envoi {envoi['upload_id']}: {envoi['fichiers'][index]['nom']} reçu ({taille} octets)")
+        return taille, termine
+
+    def finaliser(self, envoi):
+        """
+        Clôt l'envoi (idempotent).
+
+        Raises:
+            ValueError: Des fichiers ne sont pas terminés (message: leurs index).
+        """
+        incomplets = [f['index'] for f in self.etat(envoi)['fichiers'] if not f['complet']]
+        if incomplets:
+            raise ValueError(f"Fichier(s) incomplet(s): {incomplets}")
+        if not envoi['finalise']:
+            envoi['finalise'] = True
+            self._ecrire_manifeste(envoi)
+        self._supprimer_verrous(envoi)
+        return envoi
+
+    def abandonner(self, envoi):
+        """Supprime un envoi et ses fichiers partiels (les fichiers terminés restent, comme tout upload)."""
+        for index in range(len(envoi['fichiers'])):
+            with self._verrou(envoi['upload_id'], index):
+                try:
+                    os.remove(self._partiel(envoi['upload_id'], index))
+                except FileNotFoundError:
+                    pass
+        try:
+            os.remove(self._manifeste(envoi['upload_id']))
+        except FileNotFoundError:
+            pass
+        self._supprimer_verrous(envoi)
+
+    def _supprimer_verrous(self, envoi):
+        """Fichiers '.verrou' d'un envoi clos (ceux d'un envoi expiré partent avec le nettoyage)."""
+        for index in range(len(envoi['fichiers'])):
+            try:
+                os.remove(self._fichier_verrou(envoi['upload_id'], index))
+            except FileNotFoundError:
+                pass
@@ -3,7 +3,7 @@ image_matcher.py - Détection robuste de template image (ORB + Multi-Scale Pixel
 
 Améliorations vs version précédente:
 - ORB: min_matches 10→5, nfeatures 1000→2000
-- Pixel matching: multi-échelle (50% à 200%)
+- Pixel matching: multi-échelle (20% à 200%), recherche pyramidale coarse-to-fine
 - Pré-traitement: CLAHE (normalisation du contraste)
 - Meilleur logging pour le diagnostic
 """
@@ -11,6 +11,7 @@ import cv2
 import numpy as np
 import logging
 from pathlib import Path
+from app.utils.normalisation_images import charger_gris
 
 logger = logging.getLogger(__name__)
 
@@ -24,17 +25,78 @@ def _preprocess_image(img_gray):
     return clahe.apply(img_gray)
 
 
-def find_template_orb(image_path: str, template_path: str, min_matches: int = 5) -> dict:
+class ImagePreparee:
     """
-    Détection robuste de template image avec 2 méthodes en cascade:
+    Image cible décodée une seule fois, avec ses cartes de caractéristiques
+    (CLAHE, keypoints ORB, contours Canny) calculées à la demande puis conservées.
+
+    Permet de chercher plusieurs templates dans la même image sans la redécoder
+    ni recalculer ses features (ex: détection répétée des étiquettes pendant
+    l'édition d'une entité).
+    """
+
+    def __init__(self, gris):
+        self.gris = gris
+        self.h, self.w = gris.shape[:2]
+        self._pretraitee = None
+        self._orb = None
+        self._contours = None
+
+    @classmethod
+    def depuis_source(cls, source):
+        """Construit une ImagePreparee depuis un chemin ou un tableau numpy (None si illisible)."""
+        if isinstance(source, ImagePreparee):
+            return source
+        gris = _charger_gris(source)
+        return cls(gris) if gris is not None else None
+
+    @property
+    def pretraitee(self):
+        if self._pretraitee is None:
+            self._pretraitee = _preprocess_image(self.gris)
+        return self._pretraitee
+
+    @property
+    def orb(self):
+        """(keypoints, descriptors) ORB de l'image pré-traitée."""
+        if self._orb is None:
+            orb = cv2.ORB_create(nfeatures=2000)
+            self._orb = orb.detectAndCompute(self.pretraitee, None)
+        return self._orb
+
+    @property
+    def contours(self):
+        if self._contours is None:
+            self._contours = _to_edges(self.pretraitee)
+        return self._contours
+
+
+def _charger_gris(source):
+    """Charge une image en niveaux de gris depuis un chemin ou un tableau numpy."""
+    if source is None:
+        return None
+    if isinstance(source, np.ndarray):
+        if source.ndim == 3:
+            code = cv2.COLOR_BGRA2GRAY if source.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+            return cv2.cvtColor(source, code)
+        return source
+    return charger_gris(source)
+
+
+def find_template_orb(image, template, min_matches: int = 5, region: list = None) -> dict:
+    """
+    Détection robuste de template image avec 3 méthodes en cascade:
     
     1. ORB (Oriented FAST and Rotated BRIEF) — Invariant à l'échelle et rotation
-    2. Multi-Scale Pixel Matching — Teste le template à plusieurs échelles
+    2. Multi-Scale Pixel Matching — Recherche pyramidale coarse-to-fine
+    3. Edge Matching — Même recherche sur les cartes de contours
     
     Args:
-        image_path: Chemin de l'image cible (où chercher).
-        template_path: Chemin du template à trouver.
+        image: Image cible (où chercher): chemin, tableau numpy ou ImagePreparee.
+        template: Template à trouver: chemin ou tableau numpy (ex: extraire_template).
         min_matches: Nombre minimum de correspondances ORB (défaut: 5).
+        region: Optionnel - [x_min, y_min, x_max, y_max] relatifs (0-1) limitant
+                la recherche pixel/edge (ex: region_pour_ancre autour de position_base).
     
     Returns:
         dict: {
@@ -51,34 +113,34 @@ def find_template_orb(image_path: str, template_path: str, min_matches: int = 5)
         }
     """
     try:
-        # Charger les images en niveaux de gris
-        img = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
-        template = cv2.imread(str(template_path), cv2.IMREAD_GRAYSCALE)
+        # Charger les images en niveaux de gris (sauf si déjà préparée)
+        cible = ImagePreparee.depuis_source(image)
+        template = _charger_gris(template)
         
-        if img is None:
-            logger.error(f"Could not load target image: {image_path}")
+        if cible is None:
+            logger.error(f"Could not load target image: {image if isinstance(image, str) else type(image).__name__}")
             return {'found': False, 'error': 'Could not load target image'}
         
-        if template is None:
-            logger.error(f"Could not load template image: {template_path}")
+        if template is None or template.size == 0:
+            logger.error(f"Could not load template image: {template if isinstance(template, str) else 'array'}")
             return {'found': False, 'error': 'Could not load template image'}
             
-        h, w = img.shape
+        h, w = cible.h, cible.w
         th, tw = template.shape
         
         # Pré-traitement CLAHE pour améliorer le contraste
-        img_processed = _preprocess_image(img)
+        img_processed = cible.pretraitee
         template_processed = _preprocess_image(template)
 
         # --- Méthode 1: ORB (Feature Invariant) ---
-        orb_result = _try_orb_matching(img_processed, template_processed, w, h, tw, th, min_matches)
+        orb_result = _try_orb_matching(img_processed, template_processed, w, h, tw, th, min_matches, features_image=cible.orb)
         if orb_result.get('found'):
             return orb_result
         orb_error = orb_result.get('error', 'Unknown')
             
         # --- Méthode 2: Multi-Scale Pixel Matching ---
         logger.info(f"⚠️ ORB échoué ({orb_error}) → Tentative Pixel Matching multi-échelle...")
-        pixel_result = _try_multiscale_pixel_matching(img_processed, template_processed, w, h, tw, th)
+        pixel_result = _try_multiscale_pixel_matching(img_processed, template_processed, w, h, tw, th, region)
         if pixel_result.get('found'):
             return pixel_result
         pixel_error = pixel_result.get('error', 'Unknown')
@@ -86,7 +148,7 @@ def find_template_orb(image_path: str, template_path: str, min_matches: int = 5)
         # --- Méthode 3: Edge Matching (contours Canny + matchTemplate multi-échelle) ---
         # Même algorithme que Pixel mais sur des cartes de contours → invariant couleur/texture
         logger.info(f"⚠️ Pixel échoué ({pixel_error}) → Tentative Edge Matching (contours)...")
-        edge_result = _try_edge_matching(img_processed, template_processed, w, h, tw, th)
+        edge_result = _try_edge_matching(img_processed, template_processed, w, h, tw, th, region, img_edges=cible.contours)
         if edge_result.get('found'):
             return edge_result
         edge_error = edge_result.get('error', 'Unknown')
@@ -100,16 +162,17 @@ def find_template_orb(image_path: str, template_path: str, min_matches: int = 5)
         return {'found': False, 'error': str(e)}
 
 
-def _try_orb_matching(img, template, w, h, tw, th, min_matches):
+def _try_orb_matching(img, template, w, h, tw, th, min_matches, features_image=None):
     """
     Méthode 1: ORB Feature Matching.
     Invariant à l'échelle et la rotation.
+    features_image: (keypoints, descriptors) de img déjà calculés (optionnel).
     """
     try:
         # Plus de features pour de meilleurs résultats
         orb = cv2.ORB_create(nfeatures=2000)
         kp1, des1 = orb.detectAndCompute(template, None)
-        kp2, des2 = orb.detectAndCompute(img, None)
+        kp2, des2 = features_image if features_image is not None else orb.detectAndCompute(img, None)
         
         n_kp_template = len(kp1) if kp1 else 0
         n_kp_image = len(kp2) if kp2 else 0
@@ -186,86 +249,252 @@ def _try_orb_matching(img, template, w, h, tw, th, min_matches):
         return {'found': False, 'error': str(e)}
 
 
-def _try_multiscale_pixel_matching(img, template, w, h, tw, th):
+# Paramètres de la recherche pyramidale (coarse-to-fine)
+PYRAMIDE_LARGEUR_MAX = 640      # Largeur max de l'image au niveau grossier (px)
+PYRAMIDE_TEMPLATE_MIN = 5       # Taille min (px) d'un template redimensionné
+PYRAMIDE_TOP_K = 3              # Pics globaux conservés au niveau grossier (en plus du meilleur par échelle)
+PYRAMIDE_PLAGE_FINE = 0.1       # Plage d'échelle (+/-) autour de chaque pic pendant le raffinement
+
+
+def _generer_echelles():
     """
-    Méthode 2: Multi-Scale Pixel Matching.
-    Teste le template à plusieurs échelles pour gérer les différences de résolution.
-    
-    Échelles testées: 50% à 200% par pas de 10%
+    Échelles testées au niveau grossier: 20% à 200% par pas de 10%.
+    On commence par 1.0 (échelle originale) puis on s'en éloigne progressivement.
     """
-    # Définir les échelles à tester
-    # On commence par 1.0 (échelle originale) puis on s'en éloigne progressivement
     scales = [1.0]
     for delta in [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]:
         scales.append(1.0 + delta)  # Plus grand
-        scales.append(1.0 - delta)  # Plus petit (min 0.1)
+        scales.append(1.0 - delta)  # Plus petit
     scales = [s for s in scales if s >= 0.2]  # Éliminer les échelles trop petites
-    scales = sorted(set(scales))  # Dédupliquer et trier
-    
-    best_val = -1
-    best_result = None
-    best_scale = 1.0
-    threshold = 0.60  # Seuil de confiance minimum (assoupli vs 0.65 avant)
-    
-    for scale in scales:
-        # Redimensionner le template à cette échelle
-        new_tw = int(tw * scale)
-        new_th = int(th * scale)
-        
-        # Vérifier que le template redimensionné est valide
-        if new_tw < 5 or new_th < 5:
+    return sorted(set(scales))
+
+
+def _region_en_pixels(region, w, h):
+    """
+    Convertit une région relative [x_min, y_min, x_max, y_max] (0-1) en pixels bornés.
+    Retourne (x0, y0, x1, y1) ou l'image entière si region est None/invalide.
+    """
+    if not region or len(region) != 4:
+        return 0, 0, w, h
+    x0 = max(0, int(region[0] * w))
+    y0 = max(0, int(region[1] * h))
+    x1 = min(w, int(np.ceil(region[2] * w)))
+    y1 = min(h, int(np.ceil(region[3] * h)))
+    if x1 - x0 < PYRAMIDE_TEMPLATE_MIN or y1 - y0 < PYRAMIDE_TEMPLATE_MIN:
+        return 0, 0, w, h
+    return x0, y0, x1, y1
+
+
+def region_pour_ancre(ancre_id, position_base, tolerance=0.25):
+    """
+    Construit la région de recherche relative d'une ancre autour de position_base [x, y].
+
+    Seul l'axe validé par ocr_engine est contraint (Y pour HAUT/BAS, X pour GAUCHE/DROITE),
+    avec la même tolérance que le rejet des faux positifs de template (25% de l'image).
+    Une détection hors de cette bande serait de toute façon rejetée.
+
+    Returns:
+        list: [x_min, y_min, x_max, y_max] relatifs, ou None si pas de position_base.
+    """
+    if not position_base or len(position_base) < 2:
+        return None
+    x, y = float(position_base[0]), float(position_base[1])
+    x_min, y_min, x_max, y_max = 0.0, 0.0, 1.0, 1.0
+    if ancre_id in ('haut', 'bas'):
+        y_min, y_max = y - tolerance, y + tolerance
+    elif ancre_id in ('gauche', 'droite'):
+        x_min, x_max = x - tolerance, x + tolerance
+    else:
+        x_min, x_max = x - tolerance, x + tolerance
+        y_min, y_max = y - tolerance, y + tolerance
+    return [max(0.0, x_min), max(0.0, y_min), min(1.0, x_max), min(1.0, y_max)]
+
+
+def _pics_locaux(res, k, rayon_x, rayon_y):
+    """Extrait jusqu'à k maxima locaux d'une carte de corrélation (suppression des voisins)."""
+    res = res.copy()
+    pics = []
+    for _ in range(k):
+        _, max_val, _, max_loc = cv2.minMaxLoc(res)
+        if not np.isfinite(max_val) or max_val <= -1:
+            break
+        pics.append((float(max_val), max_loc))
+        x, y = max_loc
+        res[max(0, y - rayon_y):y + rayon_y + 1, max(0, x - rayon_x):x + rayon_x + 1] = -1
+    return pics
+
+
+def _recherche_pyramidale(img, template, region=None):
+    """
+    Recherche multi-échelle coarse-to-fine de template par cv2.matchTemplate.
+
+    1. Niveau grossier: image et template réduits (largeur ~PYRAMIDE_LARGEUR_MAX),
+       corrélation sur toutes les échelles, conservation des PYRAMIDE_TOP_K meilleurs
+       pics (position, échelle).
+    2. Raffinement: pour chaque pic, corrélation pleine résolution sur une petite
+       fenêtre autour de la position, à l'échelle du pic et ses voisines de la grille.
+
+    Args:
+        img: Image cible (niveaux de gris ou carte de contours), pleine résolution.
+        template: Template (même type que img), pleine résolution.
+        region: Optionnel - [x_min, y_min, x_max, y_max] relatifs (0-1) où chercher.
+
+    Returns:
+        tuple: (best_val, top_left, matched_tw, matched_th, best_scale)
+               top_left est en pixels dans l'image complète (ou None si rien).
+    """
+    h, w = img.shape[:2]
+    th, tw = template.shape[:2]
+
+    # La région contraint la position du template: on l'élargit de la taille
+    # maximale du template (échelle 2.0) pour qu'il y tienne entièrement.
+    rx0, ry0, rx1, ry1 = _region_en_pixels(region, w, h)
+    if (rx0, ry0, rx1, ry1) != (0, 0, w, h):
+        rx0, ry0 = max(0, rx0 - 2 * tw), max(0, ry0 - 2 * th)
+        rx1, ry1 = min(w, rx1 + 2 * tw), min(h, ry1 + 2 * th)
+    roi = img[ry0:ry1, rx0:rx1]
+    roi_h, roi_w = roi.shape[:2]
+
+    # Facteur de réduction: l'image grossière fait ~PYRAMIDE_LARGEUR_MAX de large,
+    # sans que le plus petit template (échelle 0.2) passe sous PYRAMIDE_TEMPLATE_MIN.
+    echelles = _generer_echelles()
+    facteur = min(1.0, PYRAMIDE_LARGEUR_MAX / max(roi_w, roi_h))
+    facteur = max(facteur, min(1.0, PYRAMIDE_TEMPLATE_MIN / (min(tw, th) * echelles[0])))
+
+    if facteur < 1.0:
+        roi_coarse = cv2.resize(roi, (max(1, int(roi_w * facteur)), max(1, int(roi_h * facteur))), interpolation=cv2.INTER_AREA)
+    else:
+        roi_coarse = roi
+    coarse_h, coarse_w = roi_coarse.shape[:2]
+
+    # --- Niveau grossier: toutes les échelles ---
+    candidats = []  # (score, (x, y) grossier, échelle)
+    for scale in echelles:
+        new_tw = int(tw * scale * facteur)
+        new_th = int(th * scale * facteur)
+        if new_tw < PYRAMIDE_TEMPLATE_MIN or new_th < PYRAMIDE_TEMPLATE_MIN:
             continue  # Template trop petit
-        if new_tw > w or new_th > h:
+        if new_tw > coarse_w or new_th > coarse_h:
             continue  # Template plus grand que l'image
-        
         try:
             resized_template = cv2.resize(template, (new_tw, new_th), interpolation=cv2.INTER_AREA)
-            
-            res = cv2.matchTemplate(img, resized_template, cv2.TM_CCOEFF_NORMED)
-            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
-            
-            if max_val > best_val:
-                best_val = max_val
-                best_scale = scale
-                best_result = {
-                    'top_left': max_loc,
-                    'tw': new_tw,
-                    'th': new_th,
-                }
+            res = cv2.matchTemplate(roi_coarse, resized_template, cv2.TM_CCOEFF_NORMED)
+            for val, loc in _pics_locaux(res, PYRAMIDE_TOP_K, max(1, new_tw // 2), max(1, new_th // 2)):
+                candidats.append((val, loc, scale))
         except Exception:
             continue
+
+    if not candidats:
+        return -1, None, tw, th, 1.0
+
+    # Pics retenus: le meilleur pic de chaque échelle + les PYRAMIDE_TOP_K meilleurs pics
+    # globaux. Les petits templates donnent des corrélations parasites élevées:
+    # un simple top-k global risquerait d'écarter le vrai pic d'une grande échelle.
+    candidats.sort(key=lambda c: c[0], reverse=True)
+    retenus = []
+    echelles_vues = set()
+    for val, loc, scale in candidats:
+        if scale in echelles_vues and len(retenus) >= PYRAMIDE_TOP_K:
+            continue
+        rayon = max(2, int(min(tw, th) * scale * facteur / 2))
+        if any(abs(loc[0] - r[1][0]) <= rayon and abs(loc[1] - r[1][1]) <= rayon and abs(scale - r[2]) < 0.15
+               for r in retenus):
+            continue
+        retenus.append((val, loc, scale))
+        echelles_vues.add(scale)
+
+    if facteur >= 1.0:
+        # Pas de réduction: le niveau grossier EST la pleine résolution
+        val, loc, scale = retenus[0]
+        return val, (loc[0] + rx0, loc[1] + ry0), int(tw * scale), int(th * scale), scale
+
+    # --- Raffinement pleine résolution autour de chaque pic ---
+    best_val = -1
+    best_top_left = None
+    best_tw, best_th, best_scale = tw, th, 1.0
+    marge = int(np.ceil(2.0 / facteur)) + 2  # Incertitude de position du niveau grossier (px)
+
+    for _, loc, scale_coarse in retenus:
+        # Centre du pic en pleine résolution (invariant quand l'échelle varie)
+        cx_full = (loc[0] + tw * scale_coarse * facteur / 2) / facteur
+        cy_full = (loc[1] + th * scale_coarse * facteur / 2) / facteur
+        # Échelles voisines de la grille (mêmes valeurs que la recherche exhaustive)
+        for scale in (e for e in echelles if abs(e - scale_coarse) <= PYRAMIDE_PLAGE_FINE + 1e-6):
+            new_tw = int(tw * scale)
+            new_th = int(th * scale)
+            if new_tw < PYRAMIDE_TEMPLATE_MIN or new_th < PYRAMIDE_TEMPLATE_MIN:
+                continue
+            if new_tw > roi_w or new_th > roi_h:
+                continue
+
+            # Fenêtre de recherche: template centré sur le pic, +/- marge
+            x_full = int(round(cx_full - new_tw / 2))
+            y_full = int(round(cy_full - new_th / 2))
+            wx0 = max(0, x_full - marge)
+            wy0 = max(0, y_full - marge)
+            wx1 = min(roi_w, x_full + marge + new_tw)
+            wy1 = min(roi_h, y_full + marge + new_th)
+            if wx1 - wx0 < new_tw or wy1 - wy0 < new_th:
+                continue
+
+            try:
+                resized_template = cv2.resize(template, (new_tw, new_th), interpolation=cv2.INTER_AREA)
+                res = cv2.matchTemplate(roi[wy0:wy1, wx0:wx1], resized_template, cv2.TM_CCOEFF_NORMED)
+                _, max_val, _, max_loc = cv2.minMaxLoc(res)
+            except Exception:
+                continue
+
+            if max_val > best_val:
+                best_val = max_val
+                best_top_left = (max_loc[0] + wx0 + rx0, max_loc[1] + wy0 + ry0)
+                best_tw, best_th, best_scale = new_tw, new_th, scale
+
+    return best_val, best_top_left, best_tw, best_th, best_scale
+
+
+def _construire_resultat(top_left, matched_tw, matched_th, w, h, confidence, method, scale):
+    """Formate un résultat de matchTemplate en coordonnées relatives (0-1)."""
+    bottom_right = (top_left[0] + matched_tw, top_left[1] + matched_th)
+    center_x = top_left[0] + matched_tw / 2
+    center_y = top_left[1] + matched_th / 2
+    return {
+        'found': True,
+        'x': float(center_x / w),
+        'y': float(center_y / h),
+        'x_min': float(top_left[0] / w),
+        'y_min': float(top_left[1] / h),
+        'x_max': float(bottom_right[0] / w),
+        'y_max': float(bottom_right[1] / h),
+        'confidence': float(confidence),
+        'method': method,
+        'scale': scale,
+        'source': 'image_template'
+    }
+
+
+def _try_multiscale_pixel_matching(img, template, w, h, tw, th, region=None):
+    """
+    Méthode 2: Multi-Scale Pixel Matching.
+    Teste le template à plusieurs échelles pour gérer les différences de résolution.
     
-    if best_val >= threshold and best_result:
-        top_left = best_result['top_left']
-        matched_tw = best_result['tw']
-        matched_th = best_result['th']
-        
-        bottom_right = (top_left[0] + matched_tw, top_left[1] + matched_th)
-        center_x = top_left[0] + matched_tw / 2
-        center_y = top_left[1] + matched_th / 2
-        
-        result = {
-            'found': True,
-            'x': float(center_x / w),
-            'y': float(center_y / h),
-            'x_min': float(top_left[0] / w),
-            'y_min': float(top_left[1] / h),
-            'x_max': float(bottom_right[0] / w),
-            'y_max': float(bottom_right[1] / h),
-            'confidence': float(best_val),
-            'method': 'pixel_multiscale',
-            'scale': best_scale,
-            'source': 'image_template'
-        }
+    Échelles testées: 20% à 200% par pas de 10%, d'abord sur une image réduite,
+    puis en pleine résolution autour des meilleurs pics (voir _recherche_pyramidale).
+    """
+    threshold = 0.60  # Seuil de confiance minimum (assoupli vs 0.65 avant)
+    
+    best_val, top_left, matched_tw, matched_th, best_scale = _recherche_pyramidale(img, template, region)
+    
+    if best_val >= threshold and top_left is not None:
+        result = _construire_resultat(top_left, matched_tw, matched_th, w, h, best_val, 'pixel_multiscale', best_scale)
         logger.info(
             f"✅ Pixel Multi-Scale: Template trouvé à ({result['x']:.3f}, {result['y']:.3f}) "
-            f"échelle={best_scale:.1f}x, confiance={best_val:.2f}"
+            f"échelle={best_scale:.2f}x, confiance={best_val:.2f}"
         )
         return result
     else:
         return {
             'found': False, 
-            'error': f"Meilleure confiance={best_val:.2f} à échelle={best_scale:.1f}x (seuil={threshold})"
+            'error': f"Meilleure confiance={best_val:.2f} à échelle={best_scale:.2f}x (seuil={threshold})"
         }
 
 
@@ -281,7 +510,7 @@ def _to_edges(img_gray):
     return cv2.Canny(blurred, low, high)
 
 
-def _try_edge_matching(img, template, w, h, tw, th):
+def _try_edge_matching(img, template, w, h, tw, th, region=None, img_edges=None):
     """
     Méthode 3: Edge Matching multi-échelle.
     
@@ -293,8 +522,9 @@ def _try_edge_matching(img, template, w, h, tw, th):
     - Très bon pour les formes distinctives (cartes, logos, symboles)
     - Même précision de localisation que cv2.matchTemplate
     """
-    # Convertir en cartes de contours
-    img_edges = _to_edges(img)
+    # Convertir en cartes de contours (sauf si déjà calculée pour l'image cible)
+    if img_edges is None:
+        img_edges = _to_edges(img)
     template_edges = _to_edges(template)
     
     # Vérifier qu'il y a assez de contours dans le template
@@ -302,79 +532,49 @@ def _try_edge_matching(img, template, w, h, tw, th):
     if edge_density < 0.01:  # Moins de 1% de pixels de contour
         return {'found': False, 'error': f"Template sans contours significatifs (densité={edge_density:.3f})"}
     
-    # Mêmes échelles que le pixel matching
-    scales = [1.0]
-    for delta in [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]:
-        scales.append(1.0 + delta)
-        scales.append(1.0 - delta)
-    scales = [s for s in scales if s >= 0.2]
-    scales = sorted(set(scales))
-    
-    best_val = -1
-    best_result = None
-    best_scale = 1.0
     threshold = 0.30  # Seuil plus bas que pixel (corrélation sur edges est naturellement plus basse)
     
-    for scale in scales:
-        new_tw = int(tw * scale)
-        new_th = int(th * scale)
-        
-        if new_tw < 5 or new_th < 5:
-            continue
-        if new_tw > w or new_th > h:
-            continue
-        
-        try:
-            resized_edges = cv2.resize(template_edges, (new_tw, new_th), interpolation=cv2.INTER_AREA)
-            
-            res = cv2.matchTemplate(img_edges, resized_edges, cv2.TM_CCOEFF_NORMED)
-            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
-            
-            if max_val > best_val:
-                best_val = max_val
-                best_scale = scale
-                best_result = {
-                    'top_left': max_loc,
-                    'tw': new_tw,
-                    'th': new_th,
-                }
-        except Exception:
-            continue
+    # Même recherche pyramidale que le pixel matching, sur les cartes de contours
+    best_val, top_left, matched_tw, matched_th, best_scale = _recherche_pyramidale(img_edges, template_edges, region)
     
-    if best_val >= threshold and best_result:
-        top_left = best_result['top_left']
-        matched_tw = best_result['tw']
-        matched_th = best_result['th']
-        
-        bottom_right = (top_left[0] + matched_tw, top_left[1] + matched_th)
-        center_x = top_left[0] + matched_tw / 2
-        center_y = top_left[1] + matched_th / 2
-        
-        result = {
-            'found': True,
-            'x': float(center_x / w),
-            'y': float(center_y / h),
-            'x_min': float(top_left[0] / w),
-            'y_min': float(top_left[1] / h),
-            'x_max': float(bottom_right[0] / w),
-            'y_max': float(bottom_right[1] / h),
-            'confidence': float(best_val),
-            'method': 'edge_multiscale',
-            'scale': best_scale,
-            'source': 'image_template'
-        }
+    if best_val >= threshold and top_left is not None:
+        result = _construire_resultat(top_left, matched_tw, matched_th, w, h, best_val, 'edge_multiscale', best_scale)
         logger.info(
             f"✅ Edge Multi-Scale: Template trouvé à ({result['x']:.3f}, {result['y']:.3f}) "
-            f"échelle={best_scale:.1f}x, confiance={best_val:.2f}"
+            f"échelle={best_scale:.2f}x, confiance={best_val:.2f}"
         )
         return result
     else:
         return {
             'found': False, 
-            'error': f"Meilleure confiance edges={best_val:.2f} à échelle={best_scale:.1f}x (seuil={threshold})"
+            'error': f"Meilleure confiance edges={best_val:.2f} à échelle={best_scale:.2f}x (seuil={threshold})"
         }
 
 
+def extraire_template(image, coords):
+    """
+    Découpe une région d'une image déjà chargée, sans passer par le disque.
+    
+    Args:
+        image: Tableau numpy (gris ou couleur) ou ImagePreparee.
+        coords: [x1, y1, x2, y2] en coordonnées relatives (0-1).
+    
+    Returns:
+        np.ndarray: Vue sur la région découpée, ou None si la région est vide.
+    """
+    img = image.gris if isinstance(image, ImagePreparee) else image
+    h, w = img.shape[:2]
+    x1, y1, x2, y2 = coords
+    
+    # Convert relative to absolute coordinates
+    template = img[int(y1 * h):int(y2 * h), int(x1 * w):int(x2 * w)]
+    
+    if template.size == 0:
+        logger.error(f"Empty template region: {coords}")
+        return None
+    return template
+
+
 def extract_and_save_template(image_path: str, coords: list, output_path: str) -> bool:
     """
     Extract a region from an image and save as a template.
@@ -393,20 +593,9 @@ def extract_and_save_template(image_path: str, coords: list, output_path: str) -
             logger.error(f"Could not load image: {image_path}")
             return False
         
-        h, w = img.shape[:2]
-        x1, y1, x2, y2 = coords
-        
-        # Convert relative to absolute coordinates
-        abs_x1 = int(x1 * w)
-        abs_y1 = int(y1 * h)
-        abs_x2 = int(x2 * w)
-        abs_y2 = int(y2 * h)
-        
         # Extract region
-        template = img[abs_y1:abs_y2, abs_x1:abs_x2]
-        
-        if template.size == 0:
-            logger.error(f"Empty template region: {coords}")
+        template = extraire_template(img, coords)
+        if template is None:
             return False
         
         # Ensure output directory exists
@@ -0,0 +1,151 @@
+"""
+index_doublons.py - Index des quasi-doublons parmi les documents récemment analysés.
+
+Un même document physique scanné plusieurs fois donne des fichiers différents
+(octets, compression, léger décalage) : l'empreinte SHA-256 du cache de résultats
+ne les rapproche pas. On indexe donc une empreinte perceptuelle (pHash DCT) :
+- du cadre rogné en niveaux de gris: signalement des doublons probables;
+- de l'image entière (hash fin, seuil strict): recherche AVANT la détection du
+  cadre, pour réutiliser la détection des ancres d'un fichier quasi identique au
+  pixel près (ré-encodage, renvoi) — un rescan décalé doit refaire sa détection;
+- de chaque zone rognée (hash plus fin): réutilisation des résultats de zones
+  visuellement identiques, sur demande explicite de l'appelant.
+
+L'index est borné (LRU) et le seuil de similarité (distance de Hamming) configurable.
+"""
+import logging
+import threading
+
+import cv2
+import numpy as np
+
+from app.utils.cache_utils import LRUCache
+from app.utils.normalisation_images import charger_gris
+
+logger = logging.getLogger(__name__)
+
+TAILLE_HASH = 8         # pHash 8x8 = 64 bits (document / cadre)
+TAILLE_HASH_ZONE = 16   # pHash 16x16 = 256 bits (zones: distingue mieux les petits textes)
+FACTEUR_DCT = 4         # Image réduite à (taille_hash * 4)² avant la DCT
+
+
+def phash(gris, taille_hash=TAILLE_HASH):
+    """
+    Empreinte perceptuelle (pHash DCT) d'une image en niveaux de gris (tableau numpy).
+
+    Returns:
+        int: Empreinte de taille_hash² bits.
+    """
+    cote = taille_hash * FACTEUR_DCT
+    reduite = cv2.resize(gris, (cote, cote), interpolation=cv2.INTER_AREA).astype(np.float32)
+    basses_frequences = cv2.dct(reduite)[:taille_hash, :taille_hash].flatten()
+    bits = basses_frequences > np.median(basses_frequences[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def distance_hamming(a, b):
+    """Nombre de bits différents entre deux empreintes."""
+    return (a ^ b).bit_count()
+
+
+def gris_depuis_pil(img):
+    """Tableau numpy niveaux de gris depuis une image PIL."""
+    return np.asarray(img.convert('L'))
+
+
+def phash_fichier(image_path, taille_hash=TAILLE_HASH):
+    """pHash de l'image entière (lecture réduite en niveaux de gris), ou None si illisible."""
+    gris = charger_gris(image_path, cv2.IMREAD_REDUCED_GRAYSCALE_4 | cv2.IMREAD_IGNORE_ORIENTATION)
+    if gris is None or gris.size == 0:
+        return None
+    return phash(gris, taille_hash)
+
+
+class IndexDoublons:
+    """
+    Index borné des documents récemment analysés, interrogeable par similarité perceptuelle.
+
+    Args:
+        max_entrees: Nombre maximum de documents indexés (les plus anciens sont évincés).
+        seuil: Distance de Hamming maximale (sur 64 bits) pour considérer deux documents
+               comme doublons probables.
+        seuil_zone: Distance maximale (sur 256 bits) pour réutiliser le résultat d'une zone
+                    ou la détection du cadre d'une image entière.
+    """
+
+    def __init__(self, max_entrees=512, seuil=6, seuil_zone=4):
+        self.seuil = seuil
+        self.seuil_zone = seuil_zone
+        self._entrees = LRUCache(max_entries=max_entrees)
+        self._lock = threading.Lock()
+        self.recherches = 0
+        self.doublons = 0
+        self.cadres_reutilises = 0
+        self.zones_reutilisees = 0
+
+    def enregistrer(self, empreinte_image, entree):
+        """
+        Indexe (ou met à jour) un document analysé.
+
+        entree: {'filename', 'empreinte_cadre', 'dims', 'phash_image', 'phash_cadre',
+                 'cadre' (entrée du cache des cadres ou None), 'zones' {nom: (phash_zone, resultat)}}
+        """
+        if empreinte_image and entree.get('phash_image') is not None:
+            self._entrees.put(empreinte_image, {**entree, 'empreinte_image': empreinte_image})
+
+    def chercher(self, valeur_phash, champ='phash_cadre', empreinte_cadre=None, exclure=None, seuil=None):
+        """
+        Document indexé le plus proche (même cadre_reference) sous le seuil
+        (défaut: seuil des documents).
+
+        Returns:
+            tuple: (entree, distance) ou (None, None)
+        """
+        if valeur_phash is None:
+            return None, None
+        seuil = self.seuil if seuil is None else seuil
+        with self._lock:
+            self.recherches += 1
+        meilleur, meilleure_distance = None, None
+        for entree in self._entrees.valeurs():
+            if entree['empreinte_image'] == exclure or entree.get(champ) is None:
+                continue
+            if entree.get('empreinte_cadre') != empreinte_cadre:
+                continue
+            d = distance_hamming(valeur_phash, entree[champ])
+            if d <= seuil and (meilleure_distance is None or d < meilleure_distance):
+                meilleur, meilleure_distance = entree, d
+        if meilleur is not None:
+            with self._lock:
+                self.doublons += 1
+        return meilleur, meilleure_distance
+
+    def zone_reutilisable(self, entree, nom_zone, phash_zone):
+        """Résultat de zone du doublon si le crop est visuellement identique, sinon None."""
+        stockee = (entree.get('zones') or {}).get(nom_zone)
+        if not stockee or phash_zone is None:
+            return None
+        phash_stocke, resultat = stockee
+        if distance_hamming(phash_zone, phash_stocke) > self.seuil_zone:
+            return None
+        with self._lock:
+            self.zones_reutilisees += 1
+        return resultat
+
+    def compter_cadre_reutilise(self):
+        with self._lock:
+            self.cadres_reutilises += 1
+
+    def stats(self):
+        """Statistiques de l'index."""
+        with self._lock:
+            return {
+                'entrees': len(self._entrees),
+                'max_entrees': self._entrees.max_entries,
+                'seuil': self.seuil,
+                'seuil_zone': self.seuil_zone,
+                'recherches': self.recherches,
+                'doublons': self.doublons,
+                'cadres_reutilises': self.cadres_reutilises,
+                'zones_reutilisees': self.zones_reutilisees
+            }
@@ -13,10 +13,8 @@ Algorithme:
   6. Arrêt aux mots-clés de fin de tableau (total, sous-total, etc.)
 """
 
-import os
 import re
 import logging
-import uuid
 import numpy as np
 from PIL import Image
 
@@ -93,26 +91,40 @@ def _is_numeric_or_monetary(text):
 # OCR global avec positions
 # ═══════════════════════════════════════════════════════════
 
+def _decrire_source(image_path):
+    """Libellé d'une source pour les logs (chemin, ou page rendue en mémoire)."""
+    if isinstance(image_path, np.ndarray):
+        return f"<page {image_path.shape[1]}x{image_path.shape[0]}px>"
+    return image_path
+
+
 def _ocr_with_positions(image_path, lang='fra'):
     """
     Effectue un OCR global et retourne tous les mots avec leurs positions.
     Utilise PaddleOCR en priorité, puis Tesseract en fallback.
+    image_path: chemin, ou tableau numpy (page PDF rendue en mémoire, BGR ou niveaux de gris).
     
     Returns:
         list[dict]: Mots/Blocs avec {text, x, y, width, height, conf, line_num}
         tuple: (img_width, img_height)
     """
-    img = Image.open(image_path)
+    if isinstance(image_path, np.ndarray):
+        img = Image.fromarray(image_path if image_path.ndim == 2 else image_path[..., ::-1])
+    else:
+        img = Image.open(image_path)
     img_w, img_h = img.size
     mots = []
 
     # 1. Tenter avec PaddleOCR (bien plus performant pour les factures)
     try:
-        from app.services.ocr_engine_v2 import get_paddleocr_reader, PADDLEOCR_DISPONIBLE
+        from app.services.ocr_engine_v2 import get_paddleocr_reader, PADDLEOCR_DISPONIBLE, _paddleocr_lock
         if PADDLEOCR_DISPONIBLE:
             reader = get_paddleocr_reader(lang)
             if reader:
-                result = reader.ocr(image_path, cls=True)
+                # Lecteur partagé avec les analyses par zones et les autres factures du lot:
+                # l'inférence PaddleOCR n'est pas thread-safe
+                with _paddleocr_lock:
+                    result = reader.ocr(image_path, cls=True)
                 if result and result[0]:
                     for idx, line in enumerate(result[0]):
                         box = line[0]
@@ -456,7 +468,7 @@ def detecter_zone_facture(image_path, lang='fra'):
             'error': str
         }
     """
-    logger.info(f"🔍 Détection de zone facture: {image_path} (lang={lang})")
+    logger.info(f"🔍 Détection de zone facture: {_decrire_source(image_path)} (lang={lang})")
     
     mots, img_dims = _ocr_with_positions(image_path, lang=lang)
     img_w, img_h = img_dims
@@ -506,7 +518,7 @@ def extraire_facture(image_path, lang='fra', fallback_bounds=None, zone_manuelle
     Extrait la liste des articles (désignations) d'une image de facture.
     
     Args:
-        image_path: Chemin vers l'image (ou PDF converti en image)
+        image_path: Chemin vers l'image, ou page PDF rendue (tableau numpy)
         lang: Langue OCR (fra, ara+fra, eng)
         fallback_bounds: Bornes {x_min, x_max} (en pourcentage) à utiliser si l'en-tête est introuvable.
         zone_manuelle: Bornes {x_min, x_max, y_min, y_max} en pourcentage pour forcer l'extraction.
@@ -525,7 +537,7 @@ def extraire_facture(image_path, lang='fra', fallback_bounds=None, zone_manuelle
             'debug': {...}  # Infos de debug
         }
     """
-    logger.info(f"🧾 Extraction facture: {image_path} (lang={lang})")
+    logger.info(f"🧾 Extraction facture: {_decrire_source(image_path)} (lang={lang})")
     
     # 1. OCR global
     mots, img_dims = _ocr_with_positions(image_path, lang=lang)
@@ -625,7 +637,8 @@ def extraire_facture(image_path, lang='fra', fallback_bounds=None, zone_manuelle
 def extraire_facture_depuis_pdf(pdf_path, lang='fra', dpi=300, zone_manuelle=None):
     """
     Extrait les articles d'une facture PDF.
-    Convertit chaque page en image puis applique l'extraction OCR.
+    Rend chaque page à la demande en niveaux de gris (en mémoire, sans fichier
+    temporaire) puis applique l'extraction OCR.
     
     Args:
         pdf_path: Chemin vers le fichier PDF
@@ -636,75 +649,53 @@ def extraire_facture_depuis_pdf(pdf_path, lang='fra', dpi=300, zone_manuelle=Non
     Returns:
         dict: Même structure que extraire_facture() avec champ 'pages' supplémentaire
     """
-    import pypdfium2 as pdfium
+    from easy_core.pdf_utils import PdfPages
     
     logger.info(f"🧾 Extraction facture PDF: {pdf_path} (lang={lang}, dpi={dpi})")
     
     try:
-        pdf = pdfium.PdfDocument(pdf_path)
-        nb_pages = len(pdf)
+        with PdfPages(pdf_path, dpi=dpi, grayscale=True) as pages:
+            nb_pages = len(pages)
         
-        if nb_pages < 1:
-            return {
-                'success': False,
-                'error': 'Le PDF est vide',
-                'articles': [],
-                'nb_articles': 0,
-            }
-        
-        all_articles = []
-        pages_results = []
-        en_tete_global = None
-        colonne_global = None
-        last_bounds = None
+            if nb_pages < 1:
+                return {
+                    'success': False,
+                    'error': 'Le PDF est vide',
+                    'articles': [],
+                    'nb_articles': 0,
+                }
         
-        temp_dir = os.path.dirname(pdf_path)
-        temp_images = []
+            all_articles = []
+            pages_results = []
+            en_tete_global = None
+            colonne_global = None
+            last_bounds = None
         
-        for page_num in range(nb_pages):
-            # Convertir la page en image
-            page = pdf[page_num]
-            scale = dpi / 72
-            bitmap = page.render(scale=scale)
-            pil_image = bitmap.to_pil()
-            
-            # Sauvegarder temporairement
-            temp_filename = f"invoice_page_{uuid.uuid4().hex[:8]}.jpg"
-            temp_path = os.path.join(temp_dir, temp_filename)
-            pil_image.save(temp_path, format="JPEG", quality=95)
-            temp_images.append(temp_path)
-            
-            # Extraire
-            result = extraire_facture(temp_path, lang=lang, fallback_bounds=last_bounds, zone_manuelle=zone_manuelle)
+            for page_num, page in enumerate(pages):
+                # Extraire (page rendue en mémoire)
+                result = extraire_facture(page, lang=lang, fallback_bounds=last_bounds, zone_manuelle=zone_manuelle)
             
-            page_result = {
-                'page': page_num + 1,
-                'nb_articles': result.get('nb_articles', 0),
-                'en_tete_detecte': result.get('en_tete_detecte'),
-                'articles': result.get('articles', []),
-            }
-            pages_results.append(page_result)
+                page_result = {
+                    'page': page_num + 1,
+                    'nb_articles': result.get('nb_articles', 0),
+                    'en_tete_detecte': result.get('en_tete_detecte'),
+                    'articles': result.get('articles', []),
+                }
+                pages_results.append(page_result)
             
-            # Accumuler les articles
-            for article in result.get('articles', []):
-                article_with_page = {**article, 'page': page_num + 1}
-                all_articles.append(article_with_page)
+                # Accumuler les articles
+                for article in result.get('articles', []):
+                    article_with_page = {**article, 'page': page_num + 1}
+                    all_articles.append(article_with_page)
             
-            # Garder le premier en-tête trouvé
-            if en_tete_global is None and result.get('en_tete_detecte'):
-                en_tete_global = result['en_tete_detecte']
+                # Garder le premier en-tête trouvé
+                if en_tete_global is None and result.get('en_tete_detecte'):
+                    en_tete_global = result['en_tete_detecte']
                 
-            # Mettre à jour les bounds de colonne pour la page suivante
-            if result.get('colonne_designation'):
-                colonne_global = result.get('colonne_designation')
-                last_bounds = colonne_global
-        
-        # Nettoyage des images temporaires
-        for temp_path in temp_images:
-            try:
-                os.remove(temp_path)
-            except Exception:
-                pass
+                # Mettre à jour les bounds de colonne pour la page suivante
+                if result.get('colonne_designation'):
+                    colonne_global = result.get('colonne_designation')
+                    last_bounds = colonne_global
         
         logger.info(f"✅ PDF {nb_pages} pages: {len(all_articles)} articles extraits au total")
         
@@ -727,3 +718,25 @@ def extraire_facture_depuis_pdf(pdf_path, lang='fra', dpi=300, zone_manuelle=Non
             'articles': [],
             'nb_articles': 0,
         }
+
+
+def extraire_facture_fichier(chemin, lang='fra', zone_manuelle=None):
+    """
+    Extrait les articles d'un fichier de facture selon son extension:
+    toutes les pages d'un PDF, sinon l'image.
+    """
+    if chemin.lower().endswith('.pdf'):
+        return extraire_facture_depuis_pdf(chemin, lang=lang, zone_manuelle=zone_manuelle)
+    return extraire_facture(chemin, lang=lang, zone_manuelle=zone_manuelle)
+
+
+def resume_facture(filename, result):
+    """Résultat d'un fichier dans un lot de factures (sans les détails de debug)."""
+    return {
+        'filename': filename,
+        'success': result.get('success', False),
+        'articles': result.get('articles', []),
+        'nb_articles': result.get('nb_articles', 0),
+        'en_tete_detecte': result.get('en_tete_detecte'),
+        'error': result.get('error'),
+    }
@@ -0,0 +1,430 @@
+"""
+job_store.py - Stockage durable des jobs batch (SQLite par défaut).
+
+Remplace le dict en mémoire des jobs asynchrones:
+- métadonnées du job (statut, compteurs, paramètres pour pouvoir le relancer)
+- un enregistrement par fichier, avec son résultat écrit dès la fin de son analyse
+  ('seq' = rang de fin, sert à paginer et à reprendre un flux de progression)
+- nettoyage des jobs expirés (TTL)
+- notification des changements (condition) pour les jobs traités par ce process:
+  le flux SSE de progression se réveille à chaque fichier au lieu d'interroger en boucle
+- reprise: un job 'running' dont le process propriétaire a disparu (même machine,
+  PID mort) ou, sur une autre machine, ne donne plus signe de vie (battement) est
+  réclamé par un autre process, qui continue avec les fichiers non traités.
+- jobs ouverts: créé avant que tous ses fichiers soient disponibles (upload par
+  morceaux), un job reçoit ses fichiers au fil de l'eau et ne se termine qu'une fois fermé.
+
+Le fichier SQLite est partagé entre les process workers d'un même serveur.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from app.services.cache_resultats import json_defaut
+from app.utils.pages_pdf import chemin_fichier
+
+logger = logging.getLogger(__name__)
+
+STATUTS_FINAUX = ('done', 'cancelled', 'error')
+
+
+def proprietaire_courant():
+    """Identifiant du process courant (machine:pid)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _process_vivant(proprietaire):
+    """État du process propriétaire: True/False sur cette machine, None sur une autre (inconnu)."""
+    hote, _, pid = (proprietaire or '').rpartition(':')
+    if hote != socket.gethostname() or not pid.isdigit():
+        return None  # Autre machine: on ne peut pas savoir, on se fie au battement
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class JobStore:
+    """
+    Jobs batch persistés dans SQLite.
+
+    Args:
+        chemin_db: Fichier SQLite (':memory:' non supporté: une connexion par opération).
+        ttl: Durée de conservation d'un job après sa dernière mise à jour (secondes).
+        delai_orphelin: Sans battement depuis ce délai, un job 'running' d'une autre
+                        machine est considéré comme abandonné (secondes). Sur la même
+                        machine, seul compte le PID du propriétaire: un job qui attend
+                        (créneau OCR, fichiers d'un upload) n'est jamais repris à son process.
+    """
+
+    PURGE_TOUTES_LES = 60  # Secondes minimum entre deux purges
+    BATTEMENT_TOUTES_LES = 30  # Secondes minimum entre deux battements écrits par battre()
+
+    def __init__(self, chemin_db, ttl=24 * 3600, delai_orphelin=300):
+        self.chemin_db = chemin_db
+        self.ttl = ttl
+        self.delai_orphelin = delai_orphelin
+        self._lock = threading.Lock()
+        self._changement = threading.Condition()
+        self._versions = {}  # job_id -> compteur de changements (jobs traités par ce process)
+        self._battements = {}  # job_id -> dernier battement écrit par battre() (monotonic)
+        self._derniere_purge = 0.0
+        os.makedirs(os.path.dirname(chemin_db) or '.', exist_ok=True)
+        with self._connexion() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY, type TEXT NOT NULL, status TEXT NOT NULL,"
+                " total INTEGER NOT NULL, completed INTEGER NOT NULL DEFAULT 0,"
+                " reussis INTEGER NOT NULL DEFAULT 0, echoues INTEGER NOT NULL DEFAULT 0,"
+                " workers INTEGER NOT NULL DEFAULT 1, current_file TEXT NOT NULL DEFAULT '',"
+                " params TEXT NOT NULL, proprietaire TEXT, battement REAL,"
+                " cree REAL NOT NULL, maj REAL NOT NULL, duree_ms INTEGER,"
+                " annulation INTEGER NOT NULL DEFAULT 0, ouvert INTEGER NOT NULL DEFAULT 0)"
+            )
+            colonnes = {r['name'] for r in conn.execute("PRAGMA table_info(jobs)")}
+            if 'annulation' not in colonnes:  # Base créée avant l'annulation des jobs
+                conn.execute("ALTER TABLE jobs ADD COLUMN annulation INTEGER NOT NULL DEFAULT 0")
+            if 'ouvert' not in colonnes:  # Base créée avant les jobs ouverts
+                conn.execute("ALTER TABLE jobs ADD COLUMN ouvert INTEGER NOT NULL DEFAULT 0")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fichiers ("
+                " job_id TEXT NOT NULL, idx INTEGER NOT NULL, filename TEXT NOT NULL,"
+                " image_path TEXT, statut TEXT NOT NULL DEFAULT 'attente', seq INTEGER,"
+                " resultat TEXT, duree_ms INTEGER, PRIMARY KEY (job_id, idx))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_fichiers_seq ON fichiers(job_id, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_maj ON jobs(maj)")
+
+    @contextmanager
+    def _connexion(self):
+        """Connexion courte (une par opération): commit en sortie, puis fermeture."""
+        conn = sqlite3.connect(self.chemin_db, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- Notifications ---
+
+    def _signaler(self, job_id):
+        with self._changement:
+            self._versions[job_id] = self._versions.get(job_id, 0) + 1
+            self._changement.notify_all()
+
+    def version(self, job_id):
+        """Compteur de changements du job, ou None s'il n'est pas traité par ce process."""
+        with self._changement:
+            return self._versions.get(job_id)
+
+    def attendre(self, job_id, version, timeout):
+        """
+        Attend un changement du job après `version` (au plus timeout secondes).
+        Un job traité par un autre process ne notifie pas: on attend simplement timeout.
+
+        Returns:
+            bool: True si le job a changé.
+        """
+        with self._changement:
+            if version is None and job_id not in self._versions:
+                self._changement.wait(timeout)
+                return False
+            return self._changement.wait_for(lambda: self._versions.get(job_id) != version, timeout)
+
+    # --- Création / progression ---
+
+    def creer(self, job_id, type_job, fichiers, params, workers=1, ouvert=False):
+        """
+        Enregistre un nouveau job 'running' appartenant au process courant.
+
+        Args:
+            fichiers: Liste de (filename, image_path ou None).
+            params: Paramètres JSON-sérialisables nécessaires pour relancer le job.
+            ouvert: True = d'autres fichiers seront ajoutés (ajouter_fichiers) jusqu'à fermer().
+        """
+        self.purger()
+        maintenant = time.time()
+        with self._connexion() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, type, status, total, workers, params, proprietaire, battement, cree, maj, ouvert)"
+                " VALUES (?, ?, 'running', ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, type_job, len(fichiers), workers, json.dumps(params, ensure_ascii=False, default=json_defaut),
+                 proprietaire_courant(), maintenant, maintenant, maintenant, int(ouvert))
+            )
+            conn.executemany(
+                "INSERT INTO fichiers (job_id, idx, filename, image_path) VALUES (?, ?, ?, ?)",
+                [(job_id, idx, filename, image_path) for idx, (filename, image_path) in enumerate(fichiers)]
+            )
+        self._signaler(job_id)
+
+    def ajouter_fichiers(self, job_id, fichiers):
+        """
+        Ajoute des fichiers à un job ouvert.
+
+        Args:
+            fichiers: Liste de (filename, image_path ou None).
+
+        Returns:
+            list: [(idx, filename, image_path)] ajoutés, ou None si le job n'est plus ouvert.
+        """
+        with self._lock, self._connexion() as conn:
+            # Lecture de total et insertions dans une même transaction d'écriture: deux process
+            # qui ajoutent des fichiers au même job ne peuvent pas lire le même total
+            conn.execute("BEGIN IMMEDIATE")
+            ligne = conn.execute(
+                "SELECT total FROM jobs WHERE job_id = ? AND status = 'running' AND ouvert = 1", (job_id,)
+            ).fetchone()
+            if ligne is None:
+                return None
+            ajoutes = [(ligne['total'] + i, filename, image_path) for i, (filename, image_path) in enumerate(fichiers)]
+            conn.executemany(
+                "INSERT INTO fichiers (job_id, idx, filename, image_path) VALUES (?, ?, ?, ?)",
+                [(job_id, idx, filename, image_path) for idx, filename, image_path in ajoutes]
+            )
+            conn.execute(
+                "UPDATE jobs SET total = total + ?, maj = ? WHERE job_id = ?", (len(ajoutes), time.time(), job_id)
+            )
+        self._signaler(job_id)
+        return ajoutes
+
+    def fermer(self, job_id):
+        """Plus aucun fichier ne sera ajouté: le job se termine avec ses fichiers actuels."""
+        with self._lock, self._connexion() as conn:
+            conn.execute("UPDATE jobs SET ouvert = 0, maj = ? WHERE job_id = ?", (time.time(), job_id))
+        self._signaler(job_id)
+
+    def demarrer_fichier(self, job_id, idx, filename):
+        """Marque un fichier comme en cours d'analyse (et rafraîchit le battement du job)."""
+        maintenant = time.time()
+        with self._connexion() as conn:
+            conn.execute("UPDATE fichiers SET statut = 'en_cours' WHERE job_id = ? AND idx = ?", (job_id, idx))
+            conn.execute(
+                "UPDATE jobs SET current_file = ?, battement = ?, maj = ? WHERE job_id = ?",
+                (filename, maintenant, maintenant, job_id)
+            )
+        self._signaler(job_id)
+
+    def terminer_fichier(self, job_id, idx, resultat):
+        """
+        Enregistre le résultat d'un fichier et met à jour les compteurs du job.
+
+        Returns:
+            int: Rang de fin du fichier dans le job (seq, à partir de 1), ou None si déjà terminé.
+        """
+        brut = json.dumps(resultat, ensure_ascii=False, default=json_defaut)
+        succes = 1 if resultat.get('success') else 0
+        maintenant = time.time()
+        with self._lock, self._connexion() as conn:
+            ligne = conn.execute(
+                "SELECT statut FROM fichiers WHERE job_id = ? AND idx = ?", (job_id, idx)
+            ).fetchone()
+            if ligne is None or ligne['statut'] == 'termine':
+                return None
+            seq = conn.execute("SELECT completed FROM jobs WHERE job_id = ?", (job_id,)).fetchone()[0] + 1
+            conn.execute(
+                "UPDATE fichiers SET statut = 'termine', seq = ?, resultat = ?, duree_ms = ? WHERE job_id = ? AND idx = ?",
+                (seq, brut, resultat.get('duree_ms'), job_id, idx)
+            )
+            conn.execute(
+                "UPDATE jobs SET completed = ?, reussis = reussis + ?, echoues = echoues + ?, battement = ?, maj = ?"
+                " WHERE job_id = ?",
+                (seq, succes, 1 - succes, maintenant, maintenant, job_id)
+            )
+        self._signaler(job_id)
+        return seq
+
+    def battre(self, job_id):
+        """
+        Signe de vie d'un job dont aucun fichier ne progresse (attente d'un créneau OCR,
+        d'une place dans le job, des fichiers d'un upload): appelable à chaque tour de boucle,
+        écrit au plus toutes les BATTEMENT_TOUTES_LES secondes. Sans effet sur un job
+        repris par un autre process.
+        """
+        maintenant = time.monotonic()
+        with self._lock:
+            if maintenant - self._battements.get(job_id, float('-inf')) < self.BATTEMENT_TOUTES_LES:
+                return
+            self._battements[job_id] = maintenant
+        with self._connexion() as conn:
+            conn.execute(
+                "UPDATE jobs SET battement = ? WHERE job_id = ? AND status = 'running' AND proprietaire = ?",
+                (time.time(), job_id, proprietaire_courant())
+            )
+
+    def terminer_job(self, job_id, status='done'):
+        """Passe le job dans un statut final (durée totale comptée depuis sa création).
+        Les fichiers interrompus (job annulé) repassent en attente: seuls les résultats complets restent."""
+        maintenant = time.time()
+        with self._connexion() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, current_file = '', duree_ms = CAST((? - cree) * 1000 AS INTEGER), maj = ?"
+                " WHERE job_id = ? AND status = 'running'",
+                (status, maintenant, maintenant, job_id)
+            )
+            conn.execute("UPDATE fichiers SET statut = 'attente' WHERE job_id = ? AND statut = 'en_cours'", (job_id,))
+        with self._lock:
+            self._battements.pop(job_id, None)
+        self._signaler(job_id)
+
+    def demander_annulation(self, job_id):
+        """
+        Demande l'annulation d'un job 'running' (vue par le process qui le traite, quel qu'il soit).
+
+        Returns:
+            bool: False si le job est inconnu ou déjà terminé.
+        """
+        with self._connexion() as conn:
+            demandee = conn.execute(
+                "UPDATE jobs SET annulation = 1, maj = ? WHERE job_id = ? AND status = 'running'",
+                (time.time(), job_id)
+            ).rowcount == 1
+        if demandee:
+            self._signaler(job_id)
+        return demandee
+
+    def annulation_demandee(self, job_id):
+        with self._connexion() as conn:
+            ligne = conn.execute("SELECT annulation FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(ligne and ligne['annulation'])
+
+    # --- Lecture ---
+
+    def job(self, job_id):
+        """Métadonnées du job (sans les résultats), ou None s'il est inconnu/expiré."""
+        with self._connexion() as conn:
+            ligne = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if ligne is None:
+                return None
+            en_cours = [r['filename'] for r in conn.execute(
+                "SELECT filename FROM fichiers WHERE job_id = ? AND statut = 'en_cours' ORDER BY idx", (job_id,)
+            )]
+        return {
+            'job_id': ligne['job_id'],
+            'type': ligne['type'],
+            'status': ligne['status'],
+            'total': ligne['total'],
+            'completed': ligne['completed'],
+            'reussis': ligne['reussis'],
+            'echoues': ligne['echoues'],
+            'workers': ligne['workers'],
+            'current_file': ligne['current_file'],
+            'en_cours': en_cours,
+            'duree_ms': ligne['duree_ms'],
+            'ouvert': bool(ligne['ouvert']),
+            'cree': ligne['cree'],
+            'maj': ligne['maj']
+        }
+
+    def params(self, job_id):
+        with self._connexion() as conn:
+            ligne = conn.execute("SELECT params FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(ligne['params']) if ligne else None
+
+    def resultats(self, job_id, offset=0, limite=None, avec_seq=False):
+        """Résultats des fichiers terminés, dans l'ordre de fin (seq > offset).
+        Avec avec_seq=True: liste de (seq, resultat)."""
+        requete = "SELECT seq, resultat FROM fichiers WHERE job_id = ? AND seq > ? ORDER BY seq"
+        args = [job_id, offset]
+        if limite is not None:
+            requete += " LIMIT ?"
+            args.append(limite)
+        with self._connexion() as conn:
+            lignes = conn.execute(requete, args).fetchall()
+        if avec_seq:
+            return [(r['seq'], json.loads(r['resultat'])) for r in lignes]
+        return [json.loads(r['resultat']) for r in lignes]
+
+    def fichiers_restants(self, job_id):
+        """Fichiers non terminés: [(idx, filename, image_path)]."""
+        with self._connexion() as conn:
+            return [(r['idx'], r['filename'], r['image_path']) for r in conn.execute(
+                "SELECT idx, filename, image_path FROM fichiers WHERE job_id = ? AND statut != 'termine' ORDER BY idx",
+                (job_id,)
+            )]
+
+    def chemins_job(self, job_id):
+        """Chemins (sans numéro de page) des fichiers d'un job."""
+        with self._connexion() as conn:
+            lignes = conn.execute(
+                "SELECT DISTINCT image_path FROM fichiers WHERE job_id = ? AND image_path IS NOT NULL", (job_id,)
+            ).fetchall()
+        return {chemin_fichier(r['image_path']) for r in lignes}
+
+    def chemins_jobs_actifs(self):
+        """Chemins (sans numéro de page) des fichiers des jobs 'running', quel que soit le process."""
+        with self._connexion() as conn:
+            lignes = conn.execute(
+                "SELECT DISTINCT f.image_path FROM fichiers f JOIN jobs j ON j.job_id = f.job_id"
+                " WHERE j.status = 'running' AND f.image_path IS NOT NULL"
+            ).fetchall()
+        return {chemin_fichier(r['image_path']) for r in lignes}
+
+    # --- Reprise / nettoyage ---
+
+    def reclamer_orphelins(self):
+        """
+        Réclame pour le process courant les jobs 'running' abandonnés.
+
+        Returns:
+            list: job_id réclamés (leurs fichiers 'en_cours' repassent en attente).
+        """
+        moi = proprietaire_courant()
+        limite_battement = time.time() - self.delai_orphelin
+        with self._connexion() as conn:
+            candidats = [dict(r) for r in conn.execute(
+                "SELECT job_id, proprietaire, battement FROM jobs WHERE status = 'running'"
+            )]
+        reclames = []
+        for candidat in candidats:
+            if candidat['proprietaire'] == moi:
+                continue
+            vivant = _process_vivant(candidat['proprietaire'])
+            if vivant or (vivant is None and (candidat['battement'] or 0) > limite_battement):
+                continue  # Process de la machine en vie, ou autre machine qui bat encore
+            maintenant = time.time()
+            with self._connexion() as conn:
+                reclame = conn.execute(
+                    "UPDATE jobs SET proprietaire = ?, battement = ?, maj = ? WHERE job_id = ? AND status = 'running'"
+                    " AND proprietaire IS ?",
+                    (moi, maintenant, maintenant, candidat['job_id'], candidat['proprietaire'])
+                ).rowcount == 1
+                if reclame:
+                    conn.execute(
+                        "UPDATE fichiers SET statut = 'attente' WHERE job_id = ? AND statut = 'en_cours'",
+                        (candidat['job_id'],)
+                    )
+            if reclame:
+                self._signaler(candidat['job_id'])
+                logger.info(f"♻️ Job {candidat['job_id']} repris (ancien propriétaire: {candidat['proprietaire']})")
+                reclames.append(candidat['job_id'])
+        return reclames
+
+    def purger(self, force=False):
+        """Supprime les jobs sans mise à jour depuis plus que le TTL."""
+        maintenant = time.time()
+        if not force and maintenant - self._derniere_purge < self.PURGE_TOUTES_LES:
+            return 0
+        self._derniere_purge = maintenant
+        with self._connexion() as conn:
+            expires = [r['job_id'] for r in conn.execute(
+                "SELECT job_id FROM jobs WHERE maj < ?", (maintenant - self.ttl,)
+            )]
+            if expires:
+                conn.executemany("DELETE FROM fichiers WHERE job_id = ?", [(j,) for j in expires])
+                conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(j,) for j in expires])
+        if expires:
+            with self._changement:
+                for job_id in expires:
+                    self._versions.pop(job_id, None)
+            logger.info(f"🧹 {len(expires)} job(s) batch expiré(s) supprimé(s)")
+        return len(expires)
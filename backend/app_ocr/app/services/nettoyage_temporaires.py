@@ -0,0 +1,351 @@
+"""
+nettoyage_temporaires.py - Cycle de vie des fichiers temporaires (uploads_temp, exports).
+
+Un thread de fond parcourt périodiquement le dossier temporaire (et les exports JSON
+écrits dans le dossier permanent) et supprime:
+1. les fichiers dont la classe a dépassé son TTL (depuis le dernier accès);
+2. si le total dépasse le quota disque, les fichiers les moins récemment utilisés
+   (LRU), jusqu'à repasser sous le quota.
+
+Ne sont jamais supprimés:
+- les bases SQLite (cache de résultats, job store) et leurs journaux;
+- les fichiers d'une classe inconnue (déposés à la main, templates...);
+- les fichiers des jobs batch en cours (job store, tous process confondus);
+- les fichiers référencés par une session active (vue depuis moins de fenetre_session);
+  ces marques sont partagées par les process workers (base SQLite 'nettoyage.sqlite3');
+- les fichiers de moins de age_min secondes (upload ou écriture en cours);
+- un objet du dépôt par contenu ('cas_*') tant qu'un alias pointe dessus.
+
+Les alias du dépôt étant des liens physiques, les octets sont comptés une fois par
+inode, et une suppression ne libère de la place qu'avec le dernier lien.
+
+Chaque process worker a son nettoyeur: un accès (toucher) est noté dans la date d'accès
+du fichier (atime, la date de modification restant celle des empreintes mémorisées) et
+les marques de session dans la base partagée, pour que tous les nettoyeurs les voient.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Classe d'un fichier d'après le préfixe de son nom (premier préfixe correspondant)
+CLASSES_FICHIERS = (
+    ('upload', ('ocr_', 'inv_', 'detect_')),                                   # Uploads des sessions OCR/factures
+    ('entite', ('temp_entite_', 'temp_template_')),                            # Images en cours de configuration d'entité
+    ('derive', ('crop_', 'cropped_', 'batch_', '_optimizer_crop_', 'redresse_')),  # Découpes, images intermédiaires
+    ('cni', ('cni_direct_',)),                                                 # Rétention de débogage de l'API CNI
+    ('export', ('export_', 'facture_')),                                       # Exports JSON téléchargés
+    ('contenu', ('cas_',)),                                                    # Dépôt par contenu (objets des alias)
+    ('envoi', ('envoi_',)),                                                    # Uploads par morceaux en cours
+)
+SUFFIXES_SYSTEME = ('.sqlite3', '.sqlite3-wal', '.sqlite3-shm', '.sqlite3-journal')
+RAFRAICHISSEMENT_SESSION = 60  # Secondes entre deux écritures de la marque d'un même fichier (par process)
+
+TTL_DEFAUT = {
+    'upload': 24 * 3600,
+    'entite': 7 * 24 * 3600,
+    'derive': 3600,
+    'cni': 7 * 24 * 3600,
+    'export': 3600,
+    'contenu': 24 * 3600,
+    'envoi': 24 * 3600,
+}
+
+
+def classe_fichier(nom):
+    """Classe d'un fichier temporaire: 'systeme', une classe de CLASSES_FICHIERS, ou 'autre'."""
+    if nom.endswith(SUFFIXES_SYSTEME):
+        return 'systeme'
+    for classe, prefixes in CLASSES_FICHIERS:
+        if nom.startswith(prefixes):
+            return classe
+    return 'autre'
+
+
+class NettoyeurTemporaires:
+    """
+    Args:
+        dossier_temp: Dossier des fichiers temporaires (UPLOAD_TEMP_FOLDER).
+        dossier_exports: Dossier où sont aussi écrits les exports 'export_*.json' (UPLOAD_FOLDER);
+                         seuls ces exports y sont gérés.
+        ttl: TTL par classe en secondes (complète TTL_DEFAUT; None = jamais expiré).
+        quota_octets: Taille totale maximale des fichiers gérés (None = pas de quota).
+        age_min: Âge minimum d'un fichier avant toute suppression (secondes).
+        fenetre_session: Un fichier référencé par une session reste protégé tant que
+                         cette session a été vue depuis moins de fenetre_session secondes.
+        chemins_proteges: Callable retournant des chemins à ne pas supprimer
+                          (ex. JobStore.chemins_jobs_actifs).
+        chemin_db: Base SQLite des marques de session, partagée par les process workers
+                   (None = marques locales au process).
+    """
+
+    def __init__(self, dossier_temp, dossier_exports=None, ttl=None, quota_octets=None, age_min=60,
+                 fenetre_session=2 * 3600, chemins_proteges=None, chemin_db=None):
+        self.dossier_temp = dossier_temp
+        self.dossier_exports = dossier_exports
+        self.ttl = {**TTL_DEFAUT, **(ttl or {})}
+        self.quota_octets = quota_octets
+        self.age_min = age_min
+        self.fenetre_session = fenetre_session
+        self.chemins_proteges = chemins_proteges
+        self.chemin_db = chemin_db
+        self._lock = threading.Lock()
+        self._passe_lock = threading.Lock()
+        self._sessions = {}  # chemin absolu -> dernière marque écrite par ce process
+        self._thread = None
+        self.evictions = {raison: {'fichiers': 0, 'octets': 0} for raison in ('ttl', 'quota')}
+        self.evictions_par_classe = {}
+        self.derniere_passe = None
+        if chemin_db:
+            self._initialiser_db()
+
+    # --- Marques de session partagées ---
+
+    @contextmanager
+    def _connexion(self):
+        """Connexion courte (une par opération): commit en sortie, puis fermeture."""
+        conn = sqlite3.connect(self.chemin_db, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _initialiser_db(self):
+        try:
+            os.makedirs(os.path.dirname(self.chemin_db) or '.', exist_ok=True)
+            with self._connexion() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS sessions (chemin TEXT PRIMARY KEY, vu REAL NOT NULL)")
+        except sqlite3.Error as e:
+            logger.error(f"❌ Nettoyage: marques de session partagées indisponibles ({e}), marques locales au process")
+            self.chemin_db = None
+
+    def _sessions_actives(self, maintenant):
+        """Chemins marqués par une session active, tous process confondus (purge les marques expirées)."""
+        limite = maintenant - self.fenetre_session
+        with self._lock:
+            self._sessions = {c: vu for c, vu in self._sessions.items() if vu > limite}
+            actifs = set(self._sessions)
+        if self.chemin_db:
+            with self._connexion() as conn:
+                conn.execute("DELETE FROM sessions WHERE vu <= ?", (limite,))
+                actifs.update(c for (c,) in conn.execute("SELECT chemin FROM sessions"))
+        return actifs
+
+    # --- Signaux d'utilisation ---
+
+    def toucher(self, *chemins):
+        """
+        Enregistre un accès (analyse, téléchargement): le fichier redevient récent pour le LRU.
+        Seule la date d'accès est mise à jour (visible de tous les process).
+        """
+        maintenant_ns = time.time_ns()
+        for chemin in chemins:
+            if chemin:
+                try:
+                    os.utime(chemin, ns=(maintenant_ns, os.stat(chemin).st_mtime_ns))
+                except OSError:
+                    pass  # Fichier absent ou supprimé entre-temps
+
+    def marquer_session(self, *chemins):
+        """Fichiers référencés par la session de la requête en cours (protégés tant qu'elle est active)."""
+        maintenant = time.time()
+        a_ecrire = []
+        with self._lock:
+            for chemin in chemins:
+                if chemin:
+                    chemin = os.path.abspath(chemin)
+                    if maintenant - self._sessions.get(chemin, 0) >= RAFRAICHISSEMENT_SESSION:
+                        self._sessions[chemin] = maintenant
+                        a_ecrire.append((chemin, maintenant))
+        if a_ecrire and self.chemin_db:
+            try:
+                with self._connexion() as conn:
+                    conn.executemany("INSERT OR REPLACE INTO sessions (chemin, vu) VALUES (?, ?)", a_ecrire)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Nettoyage: marque de session non enregistrée ({e})")
+
+    # --- Inventaire ---
+
+    def _lister(self):
+        """[(chemin absolu, classe, taille, récence, inode, liens physiques)] des fichiers gérés ou comptés."""
+        fichiers = []
+        dossiers = [(self.dossier_temp, None)]
+        if self.dossier_exports:
+            dossiers.append((self.dossier_exports, 'export'))
+        for dossier, seule_classe in dossiers:
+            try:
+                entrees = list(os.scandir(dossier))
+            except OSError:
+                continue
+            for entree in entrees:
+                classe = classe_fichier(entree.name)
+                if seule_classe and classe != seule_classe:
+                    continue
+                try:
+                    if not entree.is_file(follow_symlinks=False):
+                        continue
+                    stat = entree.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                chemin = os.path.abspath(entree.path)
+                recence = max(stat.st_mtime, stat.st_atime)
+                inode = (stat.st_dev, stat.st_ino) if stat.st_ino else chemin
+                fichiers.append((chemin, classe, stat.st_size, recence, inode, stat.st_nlink))
+        return fichiers
+
+    def _proteges(self, maintenant):
+        try:
+            proteges = self._sessions_actives(maintenant)
+        except sqlite3.Error as e:
+            # Sans les marques des autres process, on ne supprime rien de cette passe
+            logger.warning(f"⚠️ Nettoyage: marques de session indisponibles ({e}), passe annulée")
+            return None
+        if self.chemins_proteges:
+            try:
+                proteges.update(os.path.abspath(c) for c in self.chemins_proteges())
+            except Exception as e:
+                # Sans la liste des jobs en cours, on ne supprime rien de cette passe
+                logger.warning(f"⚠️ Nettoyage: fichiers protégés indisponibles ({e}), passe annulée")
+                return None
+        return proteges
+
+    def _supprimer(self, chemin, classe, taille, raison):
+        try:
+            os.remove(chemin)
+        except FileNotFoundError:
+            return False  # Déjà supprimé (autre process)
+        except OSError as e:
+            logger.warning(f"⚠️ Nettoyage: suppression impossible de {os.path.basename(chemin)} ({e})")
+            return False
+        with self._lock:
+            self.evictions[raison]['fichiers'] += 1
+            self.evictions[raison]['octets'] += taille
+            self.evictions_par_classe[classe] = self.evictions_par_classe.get(classe, 0) + taille
+        return True
+
+    # --- Passe de nettoyage ---
+
+    def passe(self):
+        """
+        Une passe complète: expiration par TTL puis éviction LRU au-delà du quota.
+
+        Returns:
+            dict: Résumé de la passe (fichiers/octets supprimés par raison, octets détenus).
+        """
+        with self._passe_lock:
+            debut = time.perf_counter()
+            maintenant = time.time()
+            # Alias avant objets du dépôt: un objet ne devient supprimable qu'une fois ses alias partis
+            fichiers = sorted(self._lister(), key=lambda f: f[1] == 'contenu')
+            proteges = self._proteges(maintenant)
+            supprimes = {'ttl': [0, 0], 'quota': [0, 0]}
+
+            # inode -> [noms vus dans cette passe, liens hors des dossiers parcourus]
+            liens = {}
+            for f in fichiers:
+                liens.setdefault(f[4], [0, f[5]])[0] += 1
+            for compte in liens.values():
+                compte[1] -= compte[0]
+
+            def supprimable(fichier):
+                chemin, classe, _taille, recence, inode, _nlink = fichier
+                if proteges is None or classe not in self.ttl or chemin in proteges:
+                    return False
+                if classe == 'contenu' and liens[inode][0] > 1:
+                    return False  # Objet encore référencé par un alias
+                return maintenant - recence >= self.age_min
+
+            def supprimer(fichier, raison):
+                """Supprime un nom; retourne les octets réellement libérés (dernier lien), ou None."""
+                chemin, classe, taille, _recence, inode, _nlink = fichier
+                compte = liens[inode]
+                libere = taille if compte[0] == 1 and compte[1] <= 0 else 0
+                if not self._supprimer(chemin, classe, libere, raison):
+                    return None
+                compte[0] -= 1
+                supprimes[raison][0] += 1
+                supprimes[raison][1] += libere
+                return libere
+
+            restants = []
+            for fichier in fichiers:
+                ttl = self.ttl.get(fichier[1])
+                if ttl is not None and maintenant - fichier[3] > ttl and supprimable(fichier):
+                    if supprimer(fichier, 'ttl') is not None:
+                        continue
+                restants.append(fichier)
+
+            def octets_par_classe(liste):
+                """Octets par classe, un inode compté une seule fois (sur son premier nom)."""
+                vus, octets = set(), {}
+                for _chemin, classe, taille, _recence, inode, _nlink in liste:
+                    if inode not in vus:
+                        vus.add(inode)
+                        octets[classe] = octets.get(classe, 0) + taille
+                return octets
+
+            # Quota sur les classes gérées: les bases SQLite ont leur propre borne, 'autre' n'est pas à nous
+            total = sum(o for c, o in octets_par_classe(restants).items() if c in self.ttl)
+            if self.quota_octets is not None and total > self.quota_octets:
+                evinces = set()
+                for fichier in sorted(restants, key=lambda f: (f[3], f[1] == 'contenu')):
+                    if total <= self.quota_octets:
+                        break
+                    if supprimable(fichier):
+                        libere = supprimer(fichier, 'quota')
+                        if libere is not None:
+                            total -= libere
+                            evinces.add(fichier[0])
+                restants = [f for f in restants if f[0] not in evinces]
+                if total > self.quota_octets:
+                    logger.warning(f"⚠️ Quota des fichiers temporaires dépassé: {total / 1e6:.1f} Mo "
+                                   f"(quota {self.quota_octets / 1e6:.1f} Mo) — le reste est protégé")
+
+            detenus = octets_par_classe(restants)
+            self.derniere_passe = {
+                'date': maintenant,
+                'duree_ms': round((time.perf_counter() - debut) * 1000),
+                'fichiers': len(restants),
+                'octets_detenus': sum(detenus.values()),
+                'octets_par_classe': detenus,
+                'supprimes': {r: {'fichiers': n, 'octets': o} for r, (n, o) in supprimes.items()},
+                'proteges': len(proteges) if proteges is not None else None
+            }
+            if supprimes['ttl'][0] or supprimes['quota'][0]:
+                logger.info(f"🧹 Fichiers temporaires: {supprimes['ttl'][0]} expiré(s), {supprimes['quota'][0]} évincé(s) "
+                            f"(quota), {(supprimes['ttl'][1] + supprimes['quota'][1]) / 1e6:.1f} Mo libérés")
+            return self.derniere_passe
+
+    # --- Thread de fond ---
+
+    def demarrer(self, intervalle=300):
+        """Lance le thread de nettoyage (une passe au démarrage puis toutes les `intervalle` secondes)."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._boucle, args=(intervalle,), name='nettoyage-temporaires', daemon=True)
+        self._thread.start()
+
+    def _boucle(self, intervalle):
+        while True:
+            try:
+                self.passe()
+            except Exception as e:
+                logger.error(f"❌ Nettoyage des fichiers temporaires: {e}")
+            time.sleep(intervalle)
+
+    def stats(self):
+        """Octets détenus (dernière passe), évictions cumulées, configuration."""
+        with self._lock:
+            return {
+                'derniere_passe': self.derniere_passe,
+                'evictions': {r: dict(v) for r, v in self.evictions.items()},
+                'octets_evinces_par_classe': dict(self.evictions_par_classe),
+                'sessions_actives_fichiers': len(self._sessions),
+                'ttl': dict(self.ttl),
+                'quota_octets': self.quota_octets
+            }
@@ -9,7 +9,7 @@ from difflib import SequenceMatcher
 from PIL import Image, ImageOps
 from easy_core.image_utils import apply_pillow_patch
 from easy_core.qrcode_utils import decoder_code_hybride
-from app.services.image_matcher import find_template_orb
+from app.services.image_matcher import find_template_orb, region_pour_ancre, ImagePreparee
 
 # Apply patch
 apply_pillow_patch()
@@ -375,6 +375,15 @@ def ocr_global_avec_positions(image_path, lang='ara+fra'):
         return [], (img_w, img_h)
 
 
+def _source_disponible(source):
+    """Vrai si source est une image en mémoire, ou un chemin de fichier existant."""
+    if source is None:
+        return False
+    if isinstance(source, str):
+        return bool(source) and os.path.exists(source)
+    return True
+
+
 def detecter_ancres(mots_ocr, ancres_config, img_dims, seuil_similarite=0.7, image_path=None):
     """
     Cherche les ancres définies dans les résultats OCR.
@@ -384,7 +393,8 @@ def detecter_ancres(mots_ocr, ancres_config, img_dims, seuil_similarite=0.7, ima
         ancres_config: Liste d'ancres avec leurs labels à chercher
         img_dims: (width, height) de l'image
         seuil_similarite: Seuil minimum pour accepter un match (0.0 à 1.0)
-        image_path: Chemin image source (optionnel, requis pour image matching)
+        image_path: Image source (optionnel, requis pour image matching): chemin,
+                    tableau numpy ou ImagePreparee (features réutilisées entre ancres)
     
     Formats de labels supportés:
         - Texte simple: "PASSEPORT" (recherche exacte ou fuzzy)
@@ -398,6 +408,7 @@ def detecter_ancres(mots_ocr, ancres_config, img_dims, seuil_similarite=0.7, ima
     
     img_w, img_h = img_dims
     resultats = {}
+    image_cible = None
     
     for ancre in ancres_config:
         ancre_id = ancre.get('id', 'unknown')
@@ -479,8 +490,11 @@ def detecter_ancres(mots_ocr, ancres_config, img_dims, seuil_similarite=0.7, ima
             logger.info(f"✅ Ancre '{ancre_id}' trouvée ({match_type}): '{meilleur_match['text']}' (sim={meilleure_similarite:.0%})")
         else:
             # 2. Fallback: Recherche par Template Image (ORB)
-            template_path = ancre.get('template_path_abs') # Priorité au chemin absolu (temp files)
-            if not template_path:
+            # Priorité au template déjà découpé en mémoire, puis au chemin absolu (temp files)
+            template_path = ancre.get('template_image')
+            if template_path is None:
+                template_path = ancre.get('template_path_abs')
+            if template_path is None:
                  # Résoudre chemin relatif si nécessaire (cherche dans uploads_temp puis uploads)
                  rel_path = ancre.get('template_path')
                  if rel_path:
@@ -496,9 +510,14 @@ def detecter_ancres(mots_ocr, ancres_config, img_dims, seuil_similarite=0.7, ima
             
             orb_match_found = False
             
-            if template_path and os.path.exists(template_path) and image_path and os.path.exists(image_path):
+            if _source_disponible(template_path) and _source_disponible(image_path):
                  logger.info(f"📷 Fallback OCR échoué: Tentative matching image pour ancre {ancre_id}...")
-                 result = find_template_orb(image_path, template_path)
+                 # Recherche limitée à la bande de tolérance autour de position_base (si connue)
+                 region = region_pour_ancre(ancre_id, ancre.get('position_base'))
+                 # Image cible décodée une seule fois pour toutes les ancres
+                 if image_cible is None:
+                     image_cible = ImagePreparee.depuis_source(image_path)
+                 result = find_template_orb(image_cible, template_path, region=region)
                  
                  if result.get('found'):
                      resultats[ancre_id] = {
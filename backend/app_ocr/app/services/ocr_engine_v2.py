@@ -1,15 +1,22 @@
 import os
 import re
-import ast
 import shutil
+import hashlib
+import copy
 import logging
 import threading
 import numpy as np
 from difflib import SequenceMatcher
+from contextlib import contextmanager
 from PIL import Image, ImageOps
 from easy_core.image_utils import apply_pillow_patch
 from easy_core.qrcode_utils import decoder_code_hybride
-from app.services.image_matcher import find_template_orb
+from app.services.image_matcher import find_template_orb, region_pour_ancre, ImagePreparee
+from app.services.redressement import detecter_redressement, appliquer_redressement, rectangle_vers_origine
+from app.services.plan_analyse import PlanAnalyse, compiler_formule, compiler_formules_cadre
+from app.services.index_doublons import phash, phash_fichier, gris_depuis_pil, TAILLE_HASH, TAILLE_HASH_ZONE
+from app.utils.cache_utils import LRUCache, empreinte_fichier, empreinte_config
+from app.utils.annulation import AnalyseAnnulee, verifier_annulation
 try:
     from bidi.algorithm import get_display
 except ImportError:
@@ -332,6 +339,62 @@ def auto_crop_zone(zone_img, margin=5, min_content_ratio=0.01):
         return zone_img
 
 
+# =============================================================================
+# SOURCES D'IMAGE (CHEMIN OU IMAGE EN MÉMOIRE)
+# =============================================================================
+# analyser_hybride accepte un chemin de fichier ou une image déjà décodée (PIL, ou
+# tableau numpy BGR/niveaux de gris): une source en mémoire est analysée sans aucune
+# écriture disque (crop du cadre et image redressée restent eux aussi en mémoire).
+
+def _en_memoire(source):
+    return isinstance(source, (Image.Image, np.ndarray))
+
+
+def _charger_image(source):
+    """Image PIL depuis un chemin, une image PIL ou un tableau numpy (BGR ou niveaux de gris)."""
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, np.ndarray):
+        if source.ndim == 3:
+            return Image.fromarray(np.ascontiguousarray(source[..., 2::-1]))
+        return Image.fromarray(source)
+    return Image.open(source)
+
+
+@contextmanager
+def _ouvrir_image(source):
+    """Comme `with Image.open(source)`, sans fermer une image en mémoire appartenant à l'appelant."""
+    if _en_memoire(source):
+        yield _charger_image(source)
+    else:
+        with Image.open(source) as img:
+            yield img
+
+
+def _source_cv(source):
+    """Source utilisable par les fonctions OpenCV (chemin, ou tableau numpy en niveaux de gris)."""
+    if isinstance(source, Image.Image):
+        return gris_depuis_pil(source)
+    return source
+
+
+def _empreinte_source(source):
+    """SHA-256 du fichier, ou empreinte des pixels d'une image en mémoire."""
+    if _en_memoire(source):
+        return empreinte_pixels(source)
+    return empreinte_fichier(source)
+
+
+def _phash_source(source, taille_hash):
+    if _en_memoire(source):
+        return phash(gris_depuis_pil(_charger_image(source)), taille_hash)
+    return phash_fichier(source, taille_hash)
+
+
+def _nom_source(source):
+    return os.path.basename(source) if isinstance(source, str) else '<mémoire>'
+
+
 # =============================================================================
 # FONCTIONS POUR REPÈRE GÉOMÉTRIQUE (DÉTECTION PAR ANCRES)
 # =============================================================================
@@ -341,7 +404,7 @@ def ocr_global_avec_positions(image_path, lang='ara+fra'):
     Fait un OCR global du document et retourne tous les mots avec leurs positions.
     
     Args:
-        image_path: Chemin vers l'image
+        image_path: Chemin vers l'image (ou image en mémoire)
         lang: Langue Tesseract
     
     Returns:
@@ -350,7 +413,7 @@ def ocr_global_avec_positions(image_path, lang='ara+fra'):
     """
     import pytesseract
     
-    img = Image.open(image_path)
+    img = _charger_image(image_path)
     img_w, img_h = img.size
     
     try:
@@ -379,6 +442,15 @@ def ocr_global_avec_positions(image_path, lang='ara+fra'):
         return [], (img_w, img_h)
 
 
+def _source_disponible(source):
+    """Vrai si source est une image en mémoire, ou un chemin de fichier existant."""
+    if source is None:
+        return False
+    if isinstance(source, str):
+        return bool(source) and os.path.exists(source)
+    return True
+
+
 def detecter_ancres(mots_ocr, ancres_config, img_dims, seuil_similarite=0.7, image_path=None):
     """
     Cherche les ancres définies dans les résultats OCR.
@@ -388,7 +460,8 @@ def detecter_ancres(mots_ocr, ancres_config, img_dims, seuil_similarite=0.7, ima
         ancres_config: Liste d'ancres avec leurs labels à chercher
         img_dims: (width, height) de l'image
         seuil_similarite: Seuil minimum pour accepter un match (0.0 à 1.0)
-        image_path: Chemin image source (optionnel, requis pour image matching)
+        image_path: Image source (optionnel, requis pour image matching): chemin,
+                    tableau numpy ou ImagePreparee (features réutilisées entre ancres)
     
     Formats de labels supportés:
         - Texte simple: "PASSEPORT" (recherche exacte ou fuzzy)
@@ -402,6 +475,7 @@ def detecter_ancres(mots_ocr, ancres_config, img_dims, seuil_similarite=0.7, ima
     
     img_w, img_h = img_dims
     resultats = {}
+    image_cible = None
     
     for ancre in ancres_config:
         ancre_id = ancre.get('id', 'unknown')
@@ -483,8 +557,11 @@ def detecter_ancres(mots_ocr, ancres_config, img_dims, seuil_similarite=0.7, ima
             logger.info(f"✅ Ancre '{ancre_id}' trouvée ({match_type}): '{meilleur_match['text']}' (sim={meilleure_similarite:.0%})")
         else:
             # 2. Fallback: Recherche par Template Image (ORB)
-            template_path = ancre.get('template_path_abs') # Priorité au chemin absolu (temp files)
-            if not template_path:
+            # Priorité au template déjà découpé en mémoire, puis au chemin absolu (temp files)
+            template_path = ancre.get('template_image')
+            if template_path is None:
+                template_path = ancre.get('template_path_abs')
+            if template_path is None:
                  # Résoudre chemin relatif si nécessaire (cherche dans uploads_temp puis uploads)
                  rel_path = ancre.get('template_path')
                  if rel_path:
@@ -500,9 +577,14 @@ def detecter_ancres(mots_ocr, ancres_config, img_dims, seuil_similarite=0.7, ima
             
             orb_match_found = False
             
-            if template_path and os.path.exists(template_path) and image_path and os.path.exists(image_path):
+            if _source_disponible(template_path) and _source_disponible(image_path):
                  logger.info(f"📷 Fallback OCR échoué: Tentative matching image pour ancre {ancre_id}...")
-                 result = find_template_orb(image_path, template_path)
+                 # Recherche limitée à la bande de tolérance autour de position_base (si connue)
+                 region = region_pour_ancre(ancre_id, ancre.get('position_base'))
+                 # Image cible décodée une seule fois pour toutes les ancres
+                 if image_cible is None:
+                     image_cible = ImagePreparee.depuis_source(image_path)
+                 result = find_template_orb(image_cible, template_path, region=region)
                  
                  if result.get('found'):
                      resultats[ancre_id] = {
@@ -684,8 +766,36 @@ try:
 except ImportError:
     logger.warning("⚠️ PaddleOCR non disponible.")
 
+# Version du pipeline d'analyse: à incrémenter quand une modification change les résultats
+# (fait partie de la clé du cache de résultats)
+VERSION_PIPELINE = '2.1'
+_versions_moteurs = None
+
+def versions_moteurs():
+    """Versions du pipeline et des moteurs OCR disponibles (calculées une seule fois)."""
+    global _versions_moteurs
+    if _versions_moteurs is None:
+        from importlib import metadata
+        versions = {'pipeline': VERSION_PIPELINE}
+        for paquet, disponible in (('paddleocr', PADDLEOCR_DISPONIBLE), ('easyocr', EASYOCR_DISPONIBLE)):
+            try:
+                versions[paquet] = metadata.version(paquet) if disponible else None
+            except metadata.PackageNotFoundError:
+                versions[paquet] = 'inconnue'
+        try:
+            versions['tesseract'] = str(pytesseract.get_tesseract_version()) if TESSERACT_DISPONIBLE else None
+        except Exception:
+            versions['tesseract'] = 'inconnue'
+        _versions_moteurs = versions
+    return _versions_moteurs
+
 # EasyOCR Lazy Loading - Multiple readers for different language combinations
 _easyocr_readers = {}
+# Les modèles EasyOCR/PaddleOCR (chargement et inférence) ne sont pas thread-safe: un verrou
+# par moteur. Le reste de l'analyse (Tesseract en sous-processus, ancres, rognage,
+# prétraitements) s'exécute en parallèle entre analyses concurrentes.
+_easyocr_lock = threading.RLock()
+_paddleocr_lock = threading.RLock()
 
 def get_easyocr_reader(zone_lang='ara+fra'):
     """
@@ -709,20 +819,22 @@ def get_easyocr_reader(zone_lang='ara+fra'):
         key = 'ar_en'
     
     if key not in _easyocr_readers and EASYOCR_DISPONIBLE:
-        try:
-            use_gpu = False
-            try:
-                import torch
-                use_gpu = torch.cuda.is_available()
-            except ImportError:
-                pass
-
-            logger.info(f"🔄 Chargement EasyOCR ({'+'.join(langs)}) [GPU={use_gpu}]...")
-            _easyocr_readers[key] = easyocr.Reader(langs, gpu=use_gpu)
-            logger.info(f"✅ EasyOCR chargé ({key}).")
-        except Exception as e:
-            logger.error(f"❌ Erreur EasyOCR: {e}")
-            return None
+        with _easyocr_lock:
+            if key not in _easyocr_readers:
+                try:
+                    use_gpu = False
+                    try:
+                        import torch
+                        use_gpu = torch.cuda.is_available()
+                    except ImportError:
+                        pass
+
+                    logger.info(f"🔄 Chargement EasyOCR ({'+'.join(langs)}) [GPU={use_gpu}]...")
+                    _easyocr_readers[key] = easyocr.Reader(langs, gpu=use_gpu)
+                    logger.info(f"✅ EasyOCR chargé ({key}).")
+                except Exception as e:
+                    logger.error(f"❌ Erreur EasyOCR: {e}")
+                    return None
     
     return _easyocr_readers.get(key)
 
@@ -742,15 +854,17 @@ def get_paddleocr_reader(zone_lang='ara+fra'):
         lang_code = 'ar'
         
     if lang_code not in _paddleocr_readers and PADDLEOCR_DISPONIBLE:
-        try:
-            import logging as pp_logging
-            pp_logging.getLogger('ppocr').setLevel(pp_logging.ERROR)
-            # use_angle_cls=True pour détecter l'orientation du texte
-            reader = PaddleOCR(use_angle_cls=True, lang=lang_code, show_log=False)
-            _paddleocr_readers[lang_code] = reader
-            logger.info(f"Modèle PaddleOCR chargé pour la langue '{lang_code}' (Logs désactivés)")
-        except Exception as e:
-            logger.error(f"Erreur chargement modèle PaddleOCR {lang_code}: {e}")
+        with _paddleocr_lock:
+            if lang_code not in _paddleocr_readers:
+                try:
+                    import logging as pp_logging
+                    pp_logging.getLogger('ppocr').setLevel(pp_logging.ERROR)
+                    # use_angle_cls=True pour détecter l'orientation du texte
+                    reader = PaddleOCR(use_angle_cls=True, lang=lang_code, show_log=False)
+                    _paddleocr_readers[lang_code] = reader
+                    logger.info(f"Modèle PaddleOCR chargé pour la langue '{lang_code}' (Logs désactivés)")
+                except Exception as e:
+                    logger.error(f"Erreur chargement modèle PaddleOCR {lang_code}: {e}")
             
     return _paddleocr_readers.get(lang_code)
 
@@ -821,6 +935,7 @@ def evaluer_formule_securisee(formule, variables):
     
     Seuls les opérations arithmétiques de base sont autorisées:
     +, -, *, /, et les noms de variables (H, B, G, D).
+    La formule n'est parsée et compilée qu'une fois (voir plan_analyse.compiler_formule).
     
     Args:
         formule: Expression mathématique (ex: "H + 0.40", "D - G")
@@ -829,50 +944,15 @@ def evaluer_formule_securisee(formule, variables):
     Returns:
         float ou None si évaluation impossible
     """
-    try:
-        tree = ast.parse(formule.strip(), mode='eval')
-    except SyntaxError as e:
-        logger.warning(f"🧮 Formule invalide (syntaxe): '{formule}' — {e}")
-        return None
-    
-    # Vérifier que seuls des nœuds sûrs sont utilisés
-    ALLOWED_NODES = (
-        ast.Expression, ast.BinOp, ast.UnaryOp,
-        ast.Add, ast.Sub, ast.Mult, ast.Div,
-        ast.USub, ast.UAdd,
-        ast.Constant, ast.Name, ast.Load
-    )
-    
-    for node in ast.walk(tree):
-        if not isinstance(node, ALLOWED_NODES):
-            logger.warning(f"🧮 Formule rejetée (nœud interdit {type(node).__name__}): '{formule}'")
-            return None
-    
-    # Vérifier que toutes les variables référencées sont disponibles
-    for node in ast.walk(tree):
-        if isinstance(node, ast.Name):
-            if node.id not in variables:
-                logger.debug(f"🧮 Variable '{node.id}' non encore disponible pour formule '{formule}'")
-                return None  # Variable manquante, sera peut-être résolue à une passe suivante
-    
-    # Évaluer de manière sécurisée
-    try:
-        code = compile(tree, '<formula>', 'eval')
-        result = eval(code, {"__builtins__": {}}, variables)
-        if isinstance(result, (int, float)) and not (result != result):  # Pas NaN
-            return float(result)
-        else:
-            logger.warning(f"🧮 Résultat invalide pour '{formule}': {result}")
-            return None
-    except Exception as e:
-        logger.warning(f"🧮 Erreur évaluation formule '{formule}': {e}")
-        return None
+    compilee = compiler_formule(formule)
+    return compilee.evaluer(variables) if compilee else None
 
 
-def resoudre_formules_ancres(cadre_reference, etiquettes_detectees, img_dims, img_info=None):
+def resoudre_formules_ancres(cadre_reference, etiquettes_detectees, img_dims, img_info=None, formules=None):
     """
     Résout les formules de fallback pour les ancres non détectées.
-    Effectue jusqu'à 4 passes pour gérer les dépendances croisées.
+    Les formules sont évaluées dans l'ordre de leurs dépendances (une ancre résolue
+    par formule sert immédiatement de variable aux formules qui l'utilisent).
     
     Variables disponibles:
         H = position Y (relative 0-1) de l'ancre HAUT
@@ -890,6 +970,7 @@ def resoudre_formules_ancres(cadre_reference, etiquettes_detectees, img_dims, im
         cadre_reference: Configuration du cadre avec les formules
         etiquettes_detectees: Résultats de détection OCR/template
         img_dims: (width, height) de l'image courante
+        formules: Optionnel - formules déjà compilées et ordonnées (PlanAnalyse.formules)
     
     Returns:
         int: Nombre d'ancres résolues par formule
@@ -897,8 +978,12 @@ def resoudre_formules_ancres(cadre_reference, etiquettes_detectees, img_dims, im
     if not cadre_reference:
         return 0
     
+    if formules is None:
+        formules = compiler_formules_cadre(cadre_reference)
+    if not formules:
+        return 0
+    
     img_w, img_h = img_dims
-    MAX_PASSES = 4
     total_resolues = 0
     
     # Calcul des ratios RH/RW pour formules legacy (ex: "H * RH + 0.5").
@@ -936,167 +1021,156 @@ def resoudre_formules_ancres(cadre_reference, etiquettes_detectees, img_dims, im
     # Appliqué uniquement aux détections par template image (OCR est plus fiable).
     TOLERANCE = 0.25  # 25% de l'image
     
-    for passe in range(MAX_PASSES):
-        # 1. Construire les variables à partir des ancres DÉJÀ détectées
-        variables_legacy = {
-            'RH': ratio_h,  # Ratio hauteur (ref/current)
-            'RW': ratio_w,  # Ratio largeur (ref/current)
-        }
-        
-        dimensions_absolues = cadre_reference.get('dimensions_absolues', {})
-        variables_manuel = {
-            'largeur': dimensions_absolues.get('largeur', 0) * scale_x,
-            'hauteur': dimensions_absolues.get('hauteur', 0) * scale_y,
-        }
-        
-        for ancre_id, info in ANCRE_MAP.items():
-            det = etiquettes_detectees.get(ancre_id, {})
-            ref_data = cadre_reference.get(ancre_id, {})
-            pos_base = ref_data.get('position_base')
-            
-            val = None
-            if det.get('found'):
-                # Utiliser les bords de la bbox si disponible, sinon le centre
-                if 'x_min' in det:
-                    if ancre_id == 'haut':
-                        detected_val = det.get('y_min', det.get('y', 0))
-                    elif ancre_id == 'bas':
-                        detected_val = det.get('y_max', det.get('y', 0))
-                    elif ancre_id == 'gauche':
-                        detected_val = det.get('x_min', det.get('x', 0))
-                    elif ancre_id == 'droite':
-                        detected_val = det.get('x_max', det.get('x', 0))
-                    else:
-                        detected_val = det.get(info['axis'], 0)
+    # 1. Construire les variables à partir des ancres DÉJÀ détectées
+    variables_legacy = {
+        'RH': ratio_h,  # Ratio hauteur (ref/current)
+        'RW': ratio_w,  # Ratio largeur (ref/current)
+    }
+    
+    dimensions_absolues = cadre_reference.get('dimensions_absolues', {})
+    variables_manuel = {
+        'largeur': dimensions_absolues.get('largeur', 0) * scale_x,
+        'hauteur': dimensions_absolues.get('hauteur', 0) * scale_y,
+    }
+    
+    def definir_variable(info, val):
+        variables_legacy[info['var']] = val
+        # Pour les formules manuelles, les variables de position sont en pixels de l'image courante
+        if info['axis'] == 'x':
+            variables_manuel[info['var']] = val * img_w
+        else:
+            variables_manuel[info['var']] = val * img_h
+    
+    for ancre_id, info in ANCRE_MAP.items():
+        det = etiquettes_detectees.get(ancre_id, {})
+        ref_data = cadre_reference.get(ancre_id, {})
+        pos_base = ref_data.get('position_base')
+        
+        val = None
+        if det.get('found'):
+            # Utiliser les bords de la bbox si disponible, sinon le centre
+            if 'x_min' in det:
+                if ancre_id == 'haut':
+                    detected_val = det.get('y_min', det.get('y', 0))
+                elif ancre_id == 'bas':
+                    detected_val = det.get('y_max', det.get('y', 0))
+                elif ancre_id == 'gauche':
+                    detected_val = det.get('x_min', det.get('x', 0))
+                elif ancre_id == 'droite':
+                    detected_val = det.get('x_max', det.get('x', 0))
                 else:
                     detected_val = det.get(info['axis'], 0)
-                    
-                source = det.get('source', 'ocr')
+            else:
+                detected_val = det.get(info['axis'], 0)
                 
-                # Validation de cohérence pour les détections par template image
-                if source == 'image_template' and pos_base and len(pos_base) > info['pos_idx']:
-                    expected_val = pos_base[info['pos_idx']]
-                    ecart = abs(detected_val - expected_val)
-                    
-                    if ecart > TOLERANCE:
-                        logger.warning(
-                            f"🧮⚠️ Ancre '{ancre_id}' détectée par template à {info['var']}={detected_val:.4f} "
-                            f"mais position_base={expected_val:.4f} (écart={ecart:.4f} > seuil={TOLERANCE}). "
-                            f"Faux positif probable → utilisation de position_base pour les formules."
-                        )
-                        val = expected_val
-                    else:
-                        val = detected_val
+            source = det.get('source', 'ocr')
+            
+            # Validation de cohérence pour les détections par template image
+            if source == 'image_template' and pos_base and len(pos_base) > info['pos_idx']:
+                expected_val = pos_base[info['pos_idx']]
+                ecart = abs(detected_val - expected_val)
+                
+                if ecart > TOLERANCE:
+                    logger.warning(
+                        f"🧮⚠️ Ancre '{ancre_id}' détectée par template à {info['var']}={detected_val:.4f} "
+                        f"mais position_base={expected_val:.4f} (écart={ecart:.4f} > seuil={TOLERANCE}). "
+                        f"Faux positif probable → utilisation de position_base pour les formules."
+                    )
+                    val = expected_val
                 else:
                     val = detected_val
             else:
-                # Ancre non détectée → fallback vers position_base
-                if pos_base and len(pos_base) > info['pos_idx']:
-                    val = pos_base[info['pos_idx']]
-                    logger.debug(f"🧮 Variable {info['var']} = {val:.4f} (depuis position_base, ancre '{ancre_id}' non détectée)")
-            
-            if val is not None:
-                variables_legacy[info['var']] = val
-                # Pour les formules manuelles, les variables de position sont en pixels de l'image courante
+                val = detected_val
+        else:
+            # Ancre non détectée → fallback vers position_base
+            if pos_base and len(pos_base) > info['pos_idx']:
+                val = pos_base[info['pos_idx']]
+                logger.debug(f"🧮 Variable {info['var']} = {val:.4f} (depuis position_base, ancre '{ancre_id}' non détectée)")
+        
+        if val is not None:
+            definir_variable(info, val)
+    
+    logger.debug(f"🧮 Variables = Legacy: {variables_legacy}, Manuel(px): {variables_manuel}")
+    
+    # 2. Résoudre les ancres manquantes, dans l'ordre des dépendances
+    for ancre_id, formule_manuelle, formule_legacy in formules:
+        info = ANCRE_MAP[ancre_id]
+        det = etiquettes_detectees.get(ancre_id, {})
+        if det.get('found'):
+            continue  # Déjà détectée, pas besoin de formule
+        
+        result = None
+        formule_utilisee = ""
+        
+        # Évaluer la formule manuelle (pixels) en priorité
+        if formule_manuelle:
+            result_px = formule_manuelle.evaluer(variables_manuel)
+            if result_px is not None:
+                # Convertir le pixel calculé en coordonnée relative
                 if info['axis'] == 'x':
-                    variables_manuel[info['var']] = val * img_w
+                    result = result_px / img_w if img_w > 0 else 0.5
                 else:
-                    variables_manuel[info['var']] = val * img_h
-        
-        logger.debug(f"🧮 Passe {passe + 1}/{MAX_PASSES}: Variables = Legacy: {variables_legacy}, Manuel(px): {variables_manuel}")
-        
-        # 2. Essayer de résoudre les ancres manquantes
-        resolues_cette_passe = 0
-        
-        for ancre_id, info in ANCRE_MAP.items():
-            det = etiquettes_detectees.get(ancre_id, {})
-            if det.get('found'):
-                continue  # Déjà détectée, pas besoin de formule
-            
-            # Récupérer la formule depuis cadre_reference
-            ref_data = cadre_reference.get(ancre_id, {})
-            manuel_formula = (ref_data.get('manuel_formula') or '').strip()
-            legacy_formula = (ref_data.get('fallback_formula') or '').strip()
-            
-            if not manuel_formula and not legacy_formula:
-                continue  # Pas de formule configurée
-            
-            result = None
-            formule_utilisee = ""
-            
-            # Évaluer la formule manuelle (pixels) en priorité
-            if manuel_formula:
-                result_px = evaluer_formule_securisee(manuel_formula, variables_manuel)
-                if result_px is not None:
-                    # Convertir le pixel calculé en coordonnée relative
-                    if info['axis'] == 'x':
-                        result = result_px / img_w if img_w > 0 else 0.5
-                    else:
-                        result = result_px / img_h if img_h > 0 else 0.5
-                    formule_utilisee = manuel_formula
-            
-            # Sinon évaluer la formule legacy (relatif avec ratio)
-            if result is None and legacy_formula:
-                result = evaluer_formule_securisee(legacy_formula, variables_legacy)
-                if result is not None:
-                    formule_utilisee = legacy_formula
-            
-            if result is None:
-                continue  # Pas assez de variables pour résoudre, on réessaiera
-            
-            # Clamp le résultat entre 0 et 1
-            result = max(0.0, min(1.0, result))
-            
-            # Injecter le résultat comme ancre détectée
-            # Défauts de position Y/X si position_base absent:
-            # HAUT/BAS → centre Y = 0.5 ;  GAUCHE → bord gauche = 0 ; DROITE → bord droit = 1
-            pos_base = ref_data.get('position_base')
-            default_x = 0.0 if ancre_id == 'gauche' else (1.0 if ancre_id == 'droite' else 0.5)
-            default_y = 0.0 if ancre_id == 'haut' else (1.0 if ancre_id == 'bas' else 0.5)
-            
-            pb_x = pos_base[0] if pos_base and len(pos_base) > 0 else default_x
-            pb_y = pos_base[1] if pos_base and len(pos_base) > 1 else default_y
-            
-            if info['axis'] == 'x':
-                # Ancre horizontale (GAUCHE, DROITE)
-                etiquettes_detectees[ancre_id] = {
-                    'found': True,
-                    'text': f'[Formule: {formule_utilisee} = {result:.4f}]',
-                    'x': result,
-                    'y': pb_y,
-                    'x_min': result,
-                    'y_min': pb_y,
-                    'x_max': result,
-                    'y_max': pb_y,
-                    'source': 'formula',
-                    'formula': formule_utilisee,
-                    'formula_result': result
-                }
-            else:
-                # Ancre verticale (HAUT, BAS)
-                etiquettes_detectees[ancre_id] = {
-                    'found': True,
-                    'text': f'[Formule: {formule_utilisee} = {result:.4f}]',
-                    'x': pb_x,
-                    'y': result,
-                    'x_min': pb_x,
-                    'y_min': result,
-                    'x_max': pb_x,
-                    'y_max': result,
-                    'source': 'formula',
-                    'formula': formule_utilisee,
-                    'formula_result': result
-                }
-
-            
-            resolues_cette_passe += 1
-            total_resolues += 1
-            logger.info(f"🧮 Ancre '{ancre_id.upper()}' résolue par formule: {formule_utilisee} = {result:.4f} (passe {passe + 1})")
-        
-        if resolues_cette_passe == 0:
-            if passe > 0:
-                logger.debug(f"🧮 Plus rien à résoudre après {passe + 1} passes")
-            break  # Plus rien à résoudre
+                    result = result_px / img_h if img_h > 0 else 0.5
+                formule_utilisee = formule_manuelle.source
+        
+        # Sinon évaluer la formule legacy (relatif avec ratio)
+        if result is None and formule_legacy:
+            result = formule_legacy.evaluer(variables_legacy)
+            if result is not None:
+                formule_utilisee = formule_legacy.source
+        
+        if result is None:
+            continue  # Variables insuffisantes pour résoudre cette ancre
+        
+        # Clamp le résultat entre 0 et 1
+        result = max(0.0, min(1.0, result))
+        
+        # Injecter le résultat comme ancre détectée
+        # Défauts de position Y/X si position_base absent:
+        # HAUT/BAS → centre Y = 0.5 ;  GAUCHE → bord gauche = 0 ; DROITE → bord droit = 1
+        ref_data = cadre_reference.get(ancre_id, {})
+        pos_base = ref_data.get('position_base')
+        default_x = 0.0 if ancre_id == 'gauche' else (1.0 if ancre_id == 'droite' else 0.5)
+        default_y = 0.0 if ancre_id == 'haut' else (1.0 if ancre_id == 'bas' else 0.5)
+        
+        pb_x = pos_base[0] if pos_base and len(pos_base) > 0 else default_x
+        pb_y = pos_base[1] if pos_base and len(pos_base) > 1 else default_y
+        
+        if info['axis'] == 'x':
+            # Ancre horizontale (GAUCHE, DROITE)
+            etiquettes_detectees[ancre_id] = {
+                'found': True,
+                'text': f'[Formule: {formule_utilisee} = {result:.4f}]',
+                'x': result,
+                'y': pb_y,
+                'x_min': result,
+                'y_min': pb_y,
+                'x_max': result,
+                'y_max': pb_y,
+                'source': 'formula',
+                'formula': formule_utilisee,
+                'formula_result': result
+            }
+        else:
+            # Ancre verticale (HAUT, BAS)
+            etiquettes_detectees[ancre_id] = {
+                'found': True,
+                'text': f'[Formule: {formule_utilisee} = {result:.4f}]',
+                'x': pb_x,
+                'y': result,
+                'x_min': pb_x,
+                'y_min': result,
+                'x_max': pb_x,
+                'y_max': result,
+                'source': 'formula',
+                'formula': formule_utilisee,
+                'formula_result': result
+            }
+        
+        # Disponible immédiatement pour les formules qui en dépendent
+        definir_variable(info, result)
+        total_resolues += 1
+        logger.info(f"🧮 Ancre '{ancre_id.upper()}' résolue par formule: {formule_utilisee} = {result:.4f}")
     
     if total_resolues > 0:
         logger.info(f"🧮 Total ancres résolues par formule: {total_resolues}")
@@ -1104,99 +1178,261 @@ def resoudre_formules_ancres(cadre_reference, etiquettes_detectees, img_dims, im
     return total_resolues
 
 
-_analyser_lock = threading.Lock()
+# Cadres détectés: la détection des ancres + formules ne dépend que de l'image et du
+# cadre_reference (pas des zones ni du mode) → réutilisable entre analyses du même fichier.
+CACHE_CADRES_MAX = 256
+_cache_cadres = LRUCache(max_entries=CACHE_CADRES_MAX)
+
+
+def _cle_cache_cadre(image_path, empreinte_cadre):
+    """Clé (empreinte image, empreinte cadre_reference), ou None si l'image est illisible."""
+    try:
+        return (_empreinte_source(image_path), empreinte_cadre)
+    except OSError as e:
+        logger.warning(f"⚠️ Cache cadre désactivé pour cette analyse: {e}")
+        return None
+
+
+def stats_cache_cadres():
+    """Statistiques du cache des cadres détectés (hits, misses, entrées...)."""
+    return _cache_cadres.stats()
+
+
+def vider_cache_cadres():
+    _cache_cadres.clear()
+
+
+def _sauver_image_redressee(image_path, redressement):
+    """
+    Écrit l'image redressée à côté de l'original. Retourne (chemin, dims, info) ou None.
+    Pour une source en mémoire, l'image redressée est rendue au lieu d'un chemin.
+    """
+    import uuid
+    try:
+        with _ouvrir_image(image_path) as img:
+            info = img.info
+            img_redressee = appliquer_redressement(img, redressement)
+        if _en_memoire(image_path):
+            logger.info(f"🧭 Image redressée en mémoire (rotation={redressement['rotation']}°, inclinaison={redressement['angle']}°)")
+            return img_redressee, img_redressee.size, info
+        temp_path = os.path.join(os.path.dirname(image_path), f"redresse_{uuid.uuid4().hex[:8]}.jpg")
+        img_redressee.save(temp_path, 'JPEG', quality=95)
+        logger.info(f"🧭 Image redressée (rotation={redressement['rotation']}°, inclinaison={redressement['angle']}°): {temp_path}")
+        return temp_path, img_redressee.size, info
+    except Exception as e:
+        logger.error(f"❌ Erreur lors du redressement: {e}")
+        return None
+
+
+def _phash_zones(image_path, zones_config):
+    """pHash fin (256 bits) du crop de chaque zone OCR, pour l'index des quasi-doublons."""
+    empreintes = {}
+    try:
+        with _ouvrir_image(image_path) as img:
+            gris = gris_depuis_pil(img)
+    except Exception as e:
+        logger.debug(f"Empreintes de zones impossibles: {e}")
+        return empreintes
+    img_h, img_w = gris.shape[:2]
+    for nom_zone, config in zones_config.items():
+        if config.get('type') in ('qrcode', 'barcode'):
+            continue
+        x1, y1, x2, y2 = get_absolute_coords(config['coords'], img_w, img_h)
+        margin = config.get('margin') or 0
+        x1, y1 = max(0, int(x1 - margin)), max(0, int(y1 - margin))
+        x2, y2 = min(img_w, int(x2 + margin)), min(img_h, int(y2 + margin))
+        if x2 - x1 >= 2 and y2 - y1 >= 2:
+            empreintes[nom_zone] = phash(gris[y1:y2, x1:x2], TAILLE_HASH_ZONE)
+    return empreintes
+
+
+def _vers_image_origine(resultats, redressement, dims_origine, dims_redressee, cadre_px=None):
+    """
+    Ramène les coords des zones (relatives au cadre, ou à l'image sans cadre) de l'image
+    redressée vers l'image d'origine. Retourne le cadre détecté dans l'image d'origine
+    (relatif, comme cadre_detecte) ou None sans cadre.
+    """
+    if cadre_px is not None:
+        x, y, w, h = cadre_px
+        reference = (x, y, x + w, y + h)
+    else:
+        reference = (0, 0, dims_redressee[0], dims_redressee[1])
+    ref_w, ref_h = reference[2] - reference[0], reference[3] - reference[1]
+    if cadre_px is not None:
+        x1, y1, x2, y2 = rectangle_vers_origine(redressement, dims_origine, dims_redressee, reference)
+    else:
+        x1, y1, x2, y2 = 0, 0, dims_origine[0], dims_origine[1]  # Zones relatives à toute l'image d'origine
+    cadre_w, cadre_h = (x2 - x1) or 1, (y2 - y1) or 1
+    for resultat in resultats.values():
+        c = resultat.get('coords')
+        if not c or len(c) != 4:
+            continue
+        zone = (reference[0] + c[0] * ref_w, reference[1] + c[1] * ref_h,
+                reference[0] + c[2] * ref_w, reference[1] + c[3] * ref_h)
+        zx1, zy1, zx2, zy2 = rectangle_vers_origine(redressement, dims_origine, dims_redressee, zone)
+        resultat['coords'] = [max(0, min(1, v)) for v in
+                              ((zx1 - x1) / cadre_w, (zy1 - y1) / cadre_h, (zx2 - x1) / cadre_w, (zy2 - y1) / cadre_h)]
+    if cadre_px is None:
+        return None
+    return {'x': x1 / dims_origine[0], 'y': y1 / dims_origine[1],
+            'width': cadre_w / dims_origine[0], 'height': cadre_h / dims_origine[1]}
+
+
+def _supprimer_temporaires(*chemins):
+    """Supprime les fichiers temporaires de l'analyse (crop du cadre, image redressée)."""
+    for temp_path in chemins:
+        if temp_path and os.path.exists(temp_path):
+            try:
+                os.remove(temp_path)
+                logger.info(f"🗑️ Fichier temporaire supprimé: {temp_path}")
+            except Exception as e:
+                logger.warning(f"⚠️ Nettoyage impossible: {e}")
 
-def analyser_hybride(image_path, zones_config, cadre_reference=None, mode='rapide'):
+
+def analyser_hybride(image_path, zones_config, cadre_reference=None, mode='rapide', stats=None,
+                     index_doublons=None, reutiliser_doublons=False, annulation=None):
     """
     Analyse hybride avec support pour le cadre de référence à 3 étiquettes.
     
     Args:
-        image_path: Chemin vers l'image
-        zones_config: Configuration des zones
+        image_path: Chemin vers l'image, ou image déjà décodée (PIL ou tableau numpy BGR):
+                    analysée alors sans aucun fichier temporaire
+        zones_config: Configuration des zones, ou PlanAnalyse précompilé
+                      (EntityManager.charger_plan) — cadre_reference est alors ignoré
         cadre_reference: Optionnel - Configuration du cadre de référence avec 3 étiquettes:
                         - origine: étiquette définissant le point (0,0)
                         - largeur: étiquette définissant la largeur du cadre
                         - hauteur: étiquette définissant la hauteur du cadre
+        mode: 'rapide' (marge configurée), 'approfondi' (plusieurs marges Tesseract) ou
+              'economique' (mode dégradé sous charge: moins de PSM/variantes, sans EasyOCR)
+        stats: Optionnel - dict complété avec les statistiques de l'analyse
+               (ex: stats['cache_cadre'] = 'hit' | 'miss' | 'doublon', stats['redressement'],
+               stats['doublon'] = {'filename', 'empreinte', 'distance'})
+        index_doublons: Optionnel - IndexDoublons: signale les quasi-doublons (scans répétés)
+                        et indexe ce document pour les analyses suivantes
+        reutiliser_doublons: Réutilise la détection du cadre et les résultats des zones
+                             visuellement identiques d'un quasi-doublon indexé
+        annulation: Optionnel - JetonAnnulation vérifié avant chaque appel OCR
+                    (lève AnalyseAnnulee, fichiers temporaires nettoyés)
         
     Returns:
-        tuple: (resultats, alertes) ou (None, erreur) si étiquettes non trouvées
+        tuple: (resultats, alertes, cadre_detecte) ou (None, erreur, None) si étiquettes non trouvées.
+               Avec un redressement, cadre_detecte et les coords des zones sont exprimés
+               dans l'image d'origine (cadre englobant si l'image a été inclinée).
     """
-    with _analyser_lock:
-        resultats = {}
-        temp_crop_path = None  # IMPORTANT: Initialiser au niveau fonction pour portée globale
-        x_ref_px = None
-        y_ref_px = None
-        largeur_cadre_rel = None
-        hauteur_cadre_rel = None
-        img_dims = None
-        img_info = {}
+    verifier_annulation(annulation)
+    if isinstance(image_path, np.ndarray):
+        image_path = _charger_image(image_path)  # Source en mémoire: PIL pour toute la cascade
+    
+    # Plan compilé: zones normalisées, ancres, formules (ad-hoc si la config est fournie brute)
+    plan = zones_config if isinstance(zones_config, PlanAnalyse) else PlanAnalyse(zones_config, cadre_reference)
+    zones_config = plan.zones_config
+    cadre_reference = plan.cadre_reference
+    
+    resultats = {}
+    temp_crop_path = None  # IMPORTANT: Initialiser au niveau fonction pour portée globale
+    phash_cadre = None
+    x_ref_px = None
+    y_ref_px = None
+    largeur_cadre_rel = None
+    hauteur_cadre_rel = None
+    img_dims = None
+    img_info = {}
+    image_source = image_path
+    cadre_rogne = False
+    try:
+        with _ouvrir_image(image_path) as img:
+            img_dims = img.size
+            img_info = img.info
+    except:
+        pass
+    dims_source = img_dims
+    
+    # 0. NOUVEAU: Si un cadre de référence est défini, détecter les étiquettes et transformer les coordonnées
+    # Support des clés: haut, droite, gauche_bas (Nouveau) OU origine, largeur, hauteur (Legacy)
+    if not cadre_reference:
+        logger.warning("⚠️ DEBUG: Pas de cadre de référence fourni. Analyse en coordonnées Image (0,0).")
+    
+    cle_cadre = None
+    cadre_en_cache = None
+    if cadre_reference and (cadre_reference.get('haut') or cadre_reference.get('origine')):
+        cle_cadre = _cle_cache_cadre(image_path, plan.empreinte_cadre)
+        if cle_cadre:
+            cadre_en_cache = _cache_cadres.get(cle_cadre)
+            if stats is not None:
+                stats['cache_cadre'] = 'hit' if cadre_en_cache else 'miss'
+    
+    # 0. Index des quasi-doublons: un fichier quasi identique au pixel près (même
+    # cadre_reference, même résolution) déjà analysé fournit directement la détection du cadre.
+    empreinte_image = None
+    phash_image = None
+    doublon_entree = None
+    if index_doublons is not None:
+        phash_image = _phash_source(image_source, TAILLE_HASH_ZONE)
         try:
-            with Image.open(image_path) as img:
-                img_dims = img.size
-                img_info = img.info
-        except:
+            empreinte_image = _empreinte_source(image_source)
+        except OSError:
             pass
+        if reutiliser_doublons and cle_cadre and not cadre_en_cache:
+            candidat, distance = index_doublons.chercher(phash_image, 'phash_image', plan.empreinte_cadre,
+                                                         exclure=empreinte_image, seuil=index_doublons.seuil_zone)
+            if candidat and candidat.get('cadre') and tuple(candidat['dims'] or ()) == tuple(img_dims or ()):
+                cadre_en_cache = candidat['cadre']
+                _cache_cadres.put(cle_cadre, cadre_en_cache)
+                index_doublons.compter_cadre_reutilise()
+                logger.info(f"👯 Cadre réutilisé depuis le quasi-doublon {candidat['filename']} (distance={distance})")
+                if stats is not None:
+                    stats['cache_cadre'] = 'doublon'
+    
+    # 0a. Redressement rapide (rotation 90/180/270 + inclinaison) avant la détection des ancres
+    # Configurable par entité via cadre_reference['redressement'] (voir services/redressement.py)
+    temp_redresse_path = None
+    dims_redressee = None
+    redressement = None
+    if cadre_en_cache:
+        redressement = cadre_en_cache.get('redressement')
+    elif plan.redressement:
+        redressement = detecter_redressement(_source_cv(image_path), plan.redressement, cadre_reference.get('image_base_dimensions'))
+    try:
+        if redressement and (redressement['rotation'] or redressement['angle']):
+            image_redressee = _sauver_image_redressee(image_path, redressement)
+            if image_redressee:
+                image_path, img_dims, img_info = image_redressee
+                dims_redressee = img_dims
+                if not _en_memoire(image_path):
+                    temp_redresse_path = image_path
+        if stats is not None and redressement:
+            stats['redressement'] = redressement
+    
+        if cadre_en_cache:
+            # Cadre déjà détecté pour cette image et ce cadre_reference → pas d'OCR global ni de matching
+            etiquettes_detectees = cadre_en_cache['etiquettes_detectees']
+            img_dims = cadre_en_cache['img_dims']
+            x_ref_px, y_ref_px, detected_w_px, detected_h_px = cadre_en_cache['crop']
+            logger.info(f"♻️ Cadre réutilisé depuis le cache: Origine=({x_ref_px:.0f}px, {y_ref_px:.0f}px), L={detected_w_px:.0f}px, H={detected_h_px:.0f}px")
+    
+        elif cadre_reference and (cadre_reference.get('haut') or cadre_reference.get('origine')):
+            logger.info(f"📐 Détection du cadre de référence (3 étiquettes)...")
         
-        # 0. NOUVEAU: Si un cadre de référence est défini, détecter les étiquettes et transformer les coordonnées
-        # Support des clés: haut, droite, gauche_bas (Nouveau) OU origine, largeur, hauteur (Legacy)
-        if not cadre_reference:
-            logger.warning("⚠️ DEBUG: Pas de cadre de référence fourni. Analyse en coordonnées Image (0,0).")
+            # Ancres déjà construites par le plan (templates résolus en chemins absolus)
+            ancres_config = list(plan.ancres_config)
         
-        if cadre_reference and (cadre_reference.get('haut') or cadre_reference.get('origine')):
-            logger.info(f"📐 Détection du cadre de référence (3 étiquettes)...")
-            
-            # Convertir format cadre_reference vers format ancres pour détection
-            ancres_config = []
-            
             logger.info(f"🔍 DEBUG: Cadre reference reçu: {cadre_reference}")
-            
-            
-            # Helper pour construire la config ancre
-            def add_anchor_config(anchor_id, ref_data, default_pos):
-                if not ref_data: return
-                
-                labels = ref_data.get('labels', [])
-                template_path = ref_data.get('template_path')
-                
-                # Ajouter si labels OU template présent
-                if labels or template_path:
-                    conf = {
-                        'id': anchor_id, 
-                        'labels': labels, 
-                        'position_base': ref_data.get('position_base', default_pos),
-                        'template_path': template_path
-                    }
-                    ancres_config.append(conf)
-                    
-                    log_msg = f"  ✅ Ancre {anchor_id.upper()} configurée:"
-                    if labels: log_msg += f" Labels={labels}"
-                    if template_path: log_msg += f" Template={template_path}"
-                    logger.info(log_msg)
-    
-            add_anchor_config('haut', cadre_reference.get('haut'), [0.5, 0])
-            add_anchor_config('droite', cadre_reference.get('droite'), [1, 0.5])
-            add_anchor_config('gauche', cadre_reference.get('gauche'), [0, 0.5])
-            add_anchor_config('bas', cadre_reference.get('bas'), [0.5, 1])
-            
-            # Support ancien format 3 ancres (backward compatibility)
-            if not cadre_reference.get('gauche') and not cadre_reference.get('bas'):
-                 add_anchor_config('gauche_bas', cadre_reference.get('gauche_bas'), [0, 1])
-                
-            # Mapping legacy (si nouveau format absent)
-            if not ancres_config and cadre_reference.get('origine'):
-                 add_anchor_config('origine', cadre_reference.get('origine'), [0, 0])
-                 add_anchor_config('largeur', cadre_reference.get('largeur'), [1, 0])
-                 add_anchor_config('hauteur', cadre_reference.get('hauteur'), [0, 1])
-            
+            for conf in ancres_config:
+                log_msg = f"  ✅ Ancre {conf['id'].upper()} configurée:"
+                if conf['labels']: log_msg += f" Labels={conf['labels']}"
+                if conf['template_path']: log_msg += f" Template={conf['template_path']}"
+                logger.info(log_msg)
+        
             logger.info(f"📋 Total ancres configurées: {len(ancres_config)}")
-            
+        
             etiquettes_detectees = {}
-            
+        
             # S'il y a des ancres à chercher
             if len(ancres_config) > 0:
                 # OCR global pour trouver les étiquettes
                 mots_ocr, img_dims = ocr_global_avec_positions(image_path, lang='fra+eng')
-                
+            
                 # Note: mots_ocr peut être vide si pas de texte, mais on continue pour les templates
                 if not mots_ocr:
                     logger.warning("⚠️ OCR global vide (pas de texte détecté)")
@@ -1204,71 +1440,71 @@ def analyser_hybride(image_path, zones_config, cadre_reference=None, mode='rapid
                     # Besoin de img_dims si OCR n'a rien renvoyé
                     if not img_dims:
                         try: 
-                            with Image.open(image_path) as img: img_dims = img.size
+                            with _ouvrir_image(image_path) as img: img_dims = img.size
                         except: pass
-    
+
                 if not img_dims: # Si toujours pas de dims, erreur
-                     return None, "Impossible de lire les dimensions de l'image"
-                
+                     return None, "Impossible de lire les dimensions de l'image", None
+            
                 # Détecter les étiquettes (avec image_path pour fallback template)
                 etiquettes_detectees, toutes_trouvees = detecter_ancres(
                     mots_ocr, 
                     ancres_config, 
                     img_dims,
-                    image_path=image_path
+                    image_path=_source_cv(image_path)
                 )
-                
+            
                 if not toutes_trouvees:
                     etiquettes_manquantes = [k for k, v in etiquettes_detectees.items() if not v.get('found')]
                     logger.warning(f"⚠️ Certaines étiquettes non trouvées: {', '.join(etiquettes_manquantes)}")
-                
+            
                 # Résolution par formule (Algorithmique + Manuel en pixels)
-                nb_resolues = resoudre_formules_ancres(cadre_reference, etiquettes_detectees, img_dims, img_info)
+                nb_resolues = resoudre_formules_ancres(cadre_reference, etiquettes_detectees, img_dims, img_info, formules=plan.formules)
                 if nb_resolues > 0:
                     logger.info(f"🧮 {nb_resolues} ancre(s) résolue(s) par formule algorithmique/manuelle")
             else:
                 # Pas d'ancres configurées
                 try:
-                    with Image.open(image_path) as img:
+                    with _ouvrir_image(image_path) as img:
                         img_dims = img.size
                         logger.info(f"📏 Pas d'ancres configurées, dimensions image: {img_dims}")
                 except Exception as e:
                     logger.error(f"❌ Impossible d'ouvrir l'image: {e}")
-                    return None, str(e)
-    
+                    return None, str(e), None
+
             # Calculer la transformation de coordonnées (Unified Logic)
             # On construit les 4 bornes (Top, Bottom, Left, Right)
             # IMPORTANT: Les zones dans l'entité sont relatives au cadre défini par position_base.
             # Donc on DOIT utiliser position_base pour reconstruire le même cadre qu'à la sauvegarde.
             # ORB/OCR est un fallback si position_base n'existe pas.
-            
+        
             img_w, img_h = img_dims
-            
+        
             def get_anchor_edge(anchor_id, axis, edge_side, default_val):
                 """
                 Retourne la coordonnée de bord correcte pour une ancre.
                 ALGORITHME UTILISATEUR:
                 Priorité: DÉTECTION (position réelle dans l'image courante) > position_base > défaut
-                
+            
                 Validation: Les détections par template image sont vérifiées contre position_base.
                 Si l'écart dépasse 25%, c'est un faux positif probable → fallback vers position_base.
                 """
                 ref_data = cadre_reference.get(anchor_id) if cadre_reference else None
                 det = etiquettes_detectees.get(anchor_id, {})
                 TOLERANCE_PX = 0.25  # 25% de l'image
-                
+            
                 # 1. PRIORITÉ: résultat de DÉTECTION (position réelle dans l'image courante)
                 if det.get('found') and edge_side in det:
                     val = det[edge_side] * (img_w if axis == 'x' else img_h)
                     source = det.get('source', 'ocr')
-                    
+                
                     # Validation de cohérence pour les détections par template image
                     if source == 'image_template' and ref_data and ref_data.get('position_base'):
                         idx = 0 if axis == 'x' else 1
                         dim = img_w if axis == 'x' else img_h
                         pb_val = ref_data['position_base'][idx] * dim
                         ecart_rel = abs(det[edge_side] - ref_data['position_base'][idx])
-                        
+                    
                         if ecart_rel > TOLERANCE_PX:
                             # Faux positif probable → fallback vers position_base
                             logger.warning(
@@ -1279,7 +1515,7 @@ def analyser_hybride(image_path, zones_config, cadre_reference=None, mode='rapid
                         else:
                             logger.info(f"  🔍 {anchor_id.upper()}: DÉTECTION (template) → {val:.0f}px (position_base: {pb_val:.0f}px, Δ={abs(val-pb_val):.0f}px ✓)")
                             return val
-                    
+                
                     # Log de comparaison avec position_base si disponible (OCR ou formule)
                     if ref_data and ref_data.get('position_base'):
                         idx = 0 if axis == 'x' else 1
@@ -1298,10 +1534,10 @@ def analyser_hybride(image_path, zones_config, cadre_reference=None, mode='rapid
                 else:
                     logger.info(f"  ⚠️ {anchor_id.upper()}: non trouvée → défaut {default_val:.0f}px")
                     return default_val
-            
+        
             # 1. TOP (Y Min) — HAUT
             y_ref_min = get_anchor_edge('haut', 'y', 'y_min', 0)
-                
+            
             # 2. BOTTOM (Y Max) — BAS (avec fallback gauche_bas legacy)
             if cadre_reference and cadre_reference.get('bas'):
                 y_ref_max = get_anchor_edge('bas', 'y', 'y_max', img_h)
@@ -1309,7 +1545,7 @@ def analyser_hybride(image_path, zones_config, cadre_reference=None, mode='rapid
                 y_ref_max = etiquettes_detectees['gauche_bas']['y_max'] * img_h
             else:
                 y_ref_max = img_h
-                
+            
             # 3. LEFT (X Min) — GAUCHE (avec fallback gauche_bas legacy)
             if cadre_reference and cadre_reference.get('gauche'):
                 x_ref_min = get_anchor_edge('gauche', 'x', 'x_min', 0)
@@ -1317,27 +1553,27 @@ def analyser_hybride(image_path, zones_config, cadre_reference=None, mode='rapid
                 x_ref_min = etiquettes_detectees['gauche_bas']['x_min'] * img_w
             else:
                 x_ref_min = 0
-                
+            
             # 4. RIGHT (X Max) — DROITE
             x_ref_max = get_anchor_edge('droite', 'x', 'x_max', img_w)
-                
             
+        
             # Validation des dimensions calculées
             detected_w_px = x_ref_max - x_ref_min
             detected_h_px = y_ref_max - y_ref_min
-            
+        
             # Protection contre croisements ou dimensions nulles
             if detected_w_px <= 10: detected_w_px = max(10, img_w - x_ref_min)
             if detected_h_px <= 10: detected_h_px = max(10, img_h - y_ref_min)
-            
+        
             x_ref_px = x_ref_min
             y_ref_px = y_ref_min
-    
+
             # ─── Dimensions du Cadre ───
             # On garde les dimensions détectées (via OCR, templates ou Formules)
             # pour respecter le redimensionnement et les ancres de Droite/Bas.
             logger.info(f"📐 CADRE DÉTECTÉ: Origine=({x_ref_px:.0f}px, {y_ref_px:.0f}px), L={detected_w_px:.0f}px, H={detected_h_px:.0f}px")
-    
+
             # Clamp pour ne pas dépasser l'image
             if x_ref_px + detected_w_px > img_w:
                 detected_w_px = img_w - x_ref_px
@@ -1345,64 +1581,109 @@ def analyser_hybride(image_path, zones_config, cadre_reference=None, mode='rapid
             if y_ref_px + detected_h_px > img_h:
                 detected_h_px = img_h - y_ref_px
                 logger.warning(f"⚠️ Cadre tronqué en hauteur: {detected_h_px:.0f}px")
-    
+
             logger.info(f"📐 CADRE FINAL: Origine=({x_ref_px:.0f}px, {y_ref_px:.0f}px), L={detected_w_px:.0f}px, H={detected_h_px:.0f}px")
-    
+
             # Flag pour déclencher le rognage
             has_4_anchors = True
-    
-    
+        
+            cadre_en_cache = {
+                'etiquettes_detectees': etiquettes_detectees,
+                'img_dims': img_dims,
+                'crop': (x_ref_px, y_ref_px, detected_w_px, detected_h_px),
+                'redressement': redressement
+            }
+            if cle_cadre:
+                _cache_cadres.put(cle_cadre, cadre_en_cache)
+
+
         # --- Code Commun : Rognage physique ---
         if x_ref_px is not None:
             logger.info(f"✂️ Début du rognage de l'image sur le cadre...")
             import uuid
             try:
-                with Image.open(image_path) as img_pil:
+                with _ouvrir_image(image_path) as img_pil:
                     left = int(x_ref_px)
                     top = int(y_ref_px)
                     right = int(left + detected_w_px)
                     bottom = int(top + detected_h_px)
-                    
+                
                     # Clamp
                     left = max(0, left)
                     top = max(0, top)
                     right = min(img_pil.width, right)
                     bottom = min(img_pil.height, bottom)
-                    
+                
                     if right > left and bottom > top:
                         img_crop = img_pil.crop((left, top, right, bottom))
-                        
+                    
                         # Convertir RGBA → RGB si nécessaire (JPEG ne supporte pas la transparence)
                         if img_crop.mode in ('RGBA', 'P', 'LA'):
                             img_crop = img_crop.convert('RGB')
+                    
+                        if index_doublons is not None:
+                            phash_cadre = phash(gris_depuis_pil(img_crop))
+                    
+                        if _en_memoire(image_path):
+                            # Source en mémoire: le crop y reste aussi
+                            logger.info(f"✂️ Image rognée en mémoire: {img_crop.size}")
+                            image_path = img_crop
+                        else:
+                            temp_filename = f"crop_{uuid.uuid4().hex[:8]}.jpg"
+                            temp_path = os.path.join(os.path.dirname(image_path), temp_filename)
+                            img_crop.save(temp_path)
                         
-                        temp_filename = f"crop_{uuid.uuid4().hex[:8]}.jpg"
-                        temp_path = os.path.join(os.path.dirname(image_path), temp_filename)
-                        img_crop.save(temp_path)
-                        
-                        logger.info(f"✂️ Image sauvegardée: {temp_path}")
+                            logger.info(f"✂️ Image sauvegardée: {temp_path}")
                         
-                        image_path = temp_path
-                        temp_crop_path = temp_path
+                            image_path = temp_path
+                            temp_crop_path = temp_path
+                        cadre_rogne = True
                     else:
                         logger.error(f"❌ Crop invalide: L={left}, T={top}, R={right}, B={bottom}")
-                    
+                
             except Exception as e:
                 logger.error(f"❌ Erreur lors du rognage: {e}")
-                
+            
         logger.info(f"✅ Coordonnées ajustées selon cadre de référence")
     
-        
+        # 0b. Quasi-doublon: empreinte du cadre rogné (ou de l'image entière sans cadre)
+        zones_reutilisees = set()
+        phash_zones = {}
+        if index_doublons is not None:
+            if phash_cadre is None:
+                phash_cadre = _phash_source(image_path, TAILLE_HASH)
+            doublon_entree, distance = index_doublons.chercher(phash_cadre, 'phash_cadre', plan.empreinte_cadre, exclure=empreinte_image)
+            if doublon_entree:
+                logger.info(f"👯 Doublon probable de {doublon_entree['filename']} (distance={distance})")
+                if stats is not None:
+                    stats['doublon'] = {
+                        'filename': doublon_entree['filename'],
+                        'empreinte': doublon_entree['empreinte_image'],
+                        'distance': distance
+                    }
+            phash_zones = _phash_zones(image_path, zones_config)
+        
+            # Zones dont le crop est visuellement identique à celui du doublon → résultat réutilisé
+            if doublon_entree and reutiliser_doublons:
+                for nom_zone, phash_zone in phash_zones.items():
+                    resultat_zone = index_doublons.zone_reutilisable(doublon_entree, nom_zone, phash_zone)
+                    if resultat_zone:
+                        resultats[nom_zone] = {**copy.deepcopy(resultat_zone), 'reutilise_de': doublon_entree['filename']}
+                        zones_reutilisees.add(nom_zone)
+                if zones_reutilisees:
+                    logger.info(f"👯 {len(zones_reutilisees)} zone(s) réutilisée(s) depuis {doublon_entree['filename']}")
+    
         # 1. Détection QR codes/codes-barres pour les zones marquées
-        zones_qr = {k: v for k, v in zones_config.items() if v.get('type') == 'qrcode' or v.get('type') == 'barcode'}
+        zones_qr = {k: v for k, v in zones_config.items() if (v.get('type') == 'qrcode' or v.get('type') == 'barcode') and k not in zones_reutilisees}
         for nom_zone, config in zones_qr.items():
             try:
+                verifier_annulation(annulation)
                 qr_result = decoder_code_hybride(image_path, config['coords'])
                 if qr_result['success']:
                     # Extraire les séquences séparées par des astérisques
                     qr_data = qr_result['data']
                     sequences = [s for s in qr_data.split('*') if s]  # Filtrer les chaînes vides
-                    
+                
                     resultats[nom_zone] = {
                         'texte_auto': qr_data,
                         'confiance_auto': 1.0,  # QR code = 100% confiance si décodé
@@ -1414,35 +1695,39 @@ def analyser_hybride(image_path, zones_config, cadre_reference=None, mode='rapid
                         'code_count': qr_result['count'],
                         'sequences': sequences  # Liste des séquences extraites
                     }
-    
+
                 else:
                     # QR code non détecté, on laissera l'OCR essayer
                     logger.warning(f"QR code non détecté dans zone {nom_zone}: {qr_result.get('error')}")
+            except AnalyseAnnulee:
+                raise
             except Exception as e:
                 logger.error(f"Erreur détection QR code zone {nom_zone}: {e}")
-        
+    
         # 2. Zones OCR classiques (exclure les zones QR déjà traitées)
         zones_ocr = {k: v for k, v in zones_config.items() if k not in resultats}
-        
+    
         # 3. Essai PaddleOCR sur zones OCR en premier (Moteur le plus précis)
         if zones_ocr and PADDLEOCR_DISPONIBLE:
             try:
                 logger.info(f"🚣 PaddleOCR: analyse primaire de {len(zones_ocr)} zone(s)")
-                resultats_paddle = analyser_avec_paddleocr(image_path, zones_ocr)
+                resultats_paddle = analyser_avec_paddleocr(image_path, zones_ocr, mode=mode, annulation=annulation)
                 resultats.update(resultats_paddle)
+            except AnalyseAnnulee:
+                raise
             except Exception as e:
                 logger.error(f"Erreur PaddleOCR global: {e}")
-        
+    
         # 4. Identification des zones à refaire (échec ou faible confiance de PaddleOCR)
         # PaddleOCR est très fiable. Si sa confiance est < 90%, on donne sa chance à Tesseract.
         seuil_refaire_tesseract = 0.90
-        zones_a_refaire_tess = {k: v for k, v in zones_config.items() if k not in resultats or resultats[k]['confiance_auto'] < seuil_refaire_tesseract}
-        
+        zones_a_refaire_tess = {k: v for k, v in zones_config.items() if k not in zones_reutilisees and (k not in resultats or resultats[k]['confiance_auto'] < seuil_refaire_tesseract)}
+    
         # 5. Essai Tesseract sur les zones difficiles (2ème étage)
         if zones_a_refaire_tess and TESSERACT_DISPONIBLE:
             try:
                 logger.info(f"🔤 Tesseract: analyse secondaire de {len(zones_a_refaire_tess)} zone(s)")
-                res_tess = analyser_avec_tesseract(image_path, zones_a_refaire_tess, mode=mode)
+                res_tess = analyser_avec_tesseract(image_path, zones_a_refaire_tess, mode=mode, annulation=annulation)
                 for k, v in res_tess.items():
                     if k in resultats:
                         current_conf = resultats[k]['confiance_auto']
@@ -1456,17 +1741,21 @@ def analyser_hybride(image_path, zones_config, cadre_reference=None, mode='rapid
                     else:
                         resultats[k] = v
                         resultats[k]['ameliore_par'] = 'tesseract'
+            except AnalyseAnnulee:
+                raise
             except Exception as e:
                 logger.error(f"Erreur Tesseract global: {e}")
 
         # 6. Mise à jour des zones à refaire (au cas où ni Paddle ni Tesseract n'auraient dépassé 70%)
-        zones_a_refaire = {k: v for k, v in zones_config.items() if k not in resultats or resultats[k]['confiance_auto'] < 0.70}
+        zones_a_refaire = {k: v for k, v in zones_config.items() if k not in zones_reutilisees and (k not in resultats or resultats[k]['confiance_auto'] < 0.70)}
 
-        # 7. Essai EasyOCR sur les zones très difficiles (3ème étage)
-        if zones_a_refaire and EASYOCR_DISPONIBLE:
+        # 7. Essai EasyOCR sur les zones très difficiles (3ème étage) — sauté en mode économique
+        if zones_a_refaire and EASYOCR_DISPONIBLE and mode == 'economique':
+            logger.info(f"⏭️ EasyOCR: étage sauté en mode économique ({len(zones_a_refaire)} zone(s) sous 70%)")
+        elif zones_a_refaire and EASYOCR_DISPONIBLE:
             try:
                 logger.info(f"🔤 EasyOCR: analyse de {len(zones_a_refaire)} zone(s) à améliorer (3ème étage)")
-                res_easy = analyser_avec_easyocr(image_path, zones_a_refaire)
+                res_easy = analyser_avec_easyocr(image_path, zones_a_refaire, annulation=annulation)
                 for k, v in res_easy.items():
                     if k in resultats:
                         current_conf = resultats[k]['confiance_auto']
@@ -1480,9 +1769,11 @@ def analyser_hybride(image_path, zones_config, cadre_reference=None, mode='rapid
                     else:
                         resultats[k] = v
                         resultats[k]['ameliore_par'] = 'easyocr'
+            except AnalyseAnnulee:
+                raise
             except Exception as e:
                 logger.error(f"Erreur EasyOCR global: {e}")
-        
+    
         # 6. Correction avec valeurs attendues (si définies)
         for nom_zone, config in zones_config.items():
             if nom_zone in resultats and 'valeurs_attendues' in config:
@@ -1490,24 +1781,24 @@ def analyser_hybride(image_path, zones_config, cadre_reference=None, mode='rapid
                 if valeurs and resultats[nom_zone].get('texte_auto'):
                     texte_original = resultats[nom_zone]['texte_auto']
                     texte_corrige, score = corriger_avec_valeurs_connues(texte_original, valeurs, force_match=True)
-                    
+                
                     if score > 0:
                         resultats[nom_zone]['texte_final'] = texte_corrige
                         resultats[nom_zone]['correction_appliquee'] = True
                         resultats[nom_zone]['valeur_originale'] = texte_original
                         resultats[nom_zone]['score_correction'] = score
-                        
+                    
                         # Améliorer le statut si la correction a un bon score
                         if score >= 0.7:
                             resultats[nom_zone]['statut'] = 'ok'
                         elif score >= 0.6 and resultats[nom_zone]['statut'] == 'echec':
                             resultats[nom_zone]['statut'] = 'faible_confiance'
-                            
+                        
                         resultats[nom_zone]['confiance_auto'] = max(
                             resultats[nom_zone]['confiance_auto'], 
                             score
                         )
-            
+        
         # 7. Remplissage des échecs complets
         for k in zones_config:
             if k not in resultats:
@@ -1519,11 +1810,11 @@ def analyser_hybride(image_path, zones_config, cadre_reference=None, mode='rapid
                     'coords': zones_config[k]['coords'],
                     'texte_final': ''
                 }
-                
+            
         # NORMALISATION FINALE DES COORDONNÉES: Relatives au CADRE DÉTECTÉ!
         # L'utilisateur souhaite que les zones soient toujours calculées et retournées
         # par rapport au cadre courant (origine 0,0 en haut à gauche du cadre, dimensions de 0 à 1).
-        if temp_crop_path and x_ref_px is not None and y_ref_px is not None:
+        if cadre_rogne and x_ref_px is not None and y_ref_px is not None:
             logger.info(f"🔄 NORMALISATION des coordonnées de {len(resultats)} zone(s) par rapport au CADRE DÉTECTÉ...")
             crop_w = detected_w_px
             crop_h = detected_h_px
@@ -1531,12 +1822,12 @@ def analyser_hybride(image_path, zones_config, cadre_reference=None, mode='rapid
             # Si on n'a pas rogné, on utilise l'image d'origine
             if not img_dims:
                 try:
-                    with Image.open(image_path) as img:
+                    with _ouvrir_image(image_path) as img:
                         img_dims = img.size
                 except:
                     img_dims = (1, 1)
             crop_w, crop_h = img_dims
-    
+
         for k, v in resultats.items():
             if 'coords' in v and v['coords']:
                 c = v['coords']
@@ -1556,15 +1847,7 @@ def analyser_hybride(image_path, zones_config, cadre_reference=None, mode='rapid
                     # Clamp au cas où Tesseract déborde très légèrement
                     v['coords'] = [max(0, min(1, val)) for val in v['coords']]
                     logger.debug(f"📏 Normalisation coords zone '{k}' par rapport au cadre: {c} -> {v['coords']}")
-    
-        # NETTOYAGE DU CROP TEMPORAIRE
-        if temp_crop_path and os.path.exists(temp_crop_path):
-            try:
-                os.remove(temp_crop_path)
-                logger.info(f"🗑️ Fichier temporaire supprimé: {temp_crop_path}")
-            except Exception as e:
-                logger.warning(f"⚠️ Nettoyage impossible: {e}")
-    
+
         # Pour que le frontend puisse dessiner les résultats en surimpression sur l'image Oiginale,
         # on doit lui retourner la position du cadre sur l'image originale.
         cadre_detecte = None
@@ -1577,9 +1860,88 @@ def analyser_hybride(image_path, zones_config, cadre_reference=None, mode='rapid
                     'width': detected_w_px / orig_w,
                     'height': detected_h_px / orig_h
                 }
-    
+
+        # Indexation pour les prochains scans du même document
+        if index_doublons is not None and empreinte_image:
+            index_doublons.enregistrer(empreinte_image, {
+                'filename': _nom_source(image_source),
+                'empreinte_cadre': plan.empreinte_cadre,
+                'dims': dims_source,
+                'phash_image': phash_image,
+                'phash_cadre': phash_cadre,
+                'cadre': cadre_en_cache,
+                'zones': {
+                    nom_zone: (phash_zone, copy.deepcopy(resultats[nom_zone]))
+                    for nom_zone, phash_zone in phash_zones.items()
+                    if nom_zone in resultats and nom_zone not in zones_reutilisees
+                }
+            })
+
+        # Image redressée: cadre et zones ramenés dans les coordonnées de l'image d'origine,
+        # celle sur laquelle le client les dessine (après indexation: l'index garde l'espace redressé)
+        if dims_redressee and dims_source:
+            cadre_detecte = _vers_image_origine(resultats, redressement, dims_source, dims_redressee,
+                                                (x_ref_px, y_ref_px, detected_w_px, detected_h_px) if cadre_rogne else None)
+
         alertes = [k for k, v in resultats.items() if v['statut'] != 'ok']
         return resultats, alertes, cadre_detecte
+    finally:
+        # Crop du cadre et image redressée temporaires, y compris après un retour anticipé,
+        # une erreur ou une annulation (AnalyseAnnulee)
+        _supprimer_temporaires(temp_crop_path, temp_redresse_path)
+
+# Mode 'economique' (qualité dégradée sous charge): premier PSM et premières variantes
+# de prétraitement seulement, pas d'étage EasyOCR
+VARIANTES_MODE_ECONOMIQUE = 2
+
+# Cache OCR par crop: mêmes pixels + même moteur/langue/PSM/variante → même texte.
+# Les évaluations du zone optimizer (coordonnées voisines arrondies au même crop), les marges
+# du mode approfondi qui recoupent le mode rapide et les ré-analyses retombent sur des crops identiques.
+CACHE_OCR_ZONES_MAX = 4096
+_cache_ocr_zones = LRUCache(max_entries=CACHE_OCR_ZONES_MAX)
+
+
+def empreinte_pixels(img):
+    """Empreinte (BLAKE2b) des pixels d'une image PIL ou d'un tableau numpy."""
+    arr = np.asarray(img)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{arr.shape}|{arr.dtype}".encode())
+    h.update(np.ascontiguousarray(arr).tobytes())
+    return h.hexdigest()
+
+
+def ocr_memoise(moteur, lang, psm, variante, empreinte_crop, calcul):
+    """
+    Retourne le résultat OCR (texte, confiance) mémorisé pour ce crop, ou l'exécute via calcul().
+    Les exceptions ne sont pas mémorisées.
+    """
+    cle = (moteur, lang, psm, variante, empreinte_crop)
+    resultat = _cache_ocr_zones.get(cle)
+    if resultat is None:
+        resultat = calcul()
+        _cache_ocr_zones.put(cle, resultat)
+    return resultat
+
+
+def stats_cache_ocr_zones():
+    """Statistiques du cache OCR par crop (hits, misses, entrées...)."""
+    return _cache_ocr_zones.stats()
+
+
+def vider_cache_ocr_zones():
+    _cache_ocr_zones.clear()
+
+
+def _tesseract_texte_confiance(img_variant, zone_lang, psm):
+    """Texte et confiance moyenne (0-1) de Tesseract pour une variante de zone."""
+    tess_config = f'--oem 3 --psm {psm}'
+    text = pytesseract.image_to_string(img_variant, lang=zone_lang, config=tess_config).strip()
+    if not text:
+        return text, 0.0
+    data = pytesseract.image_to_data(img_variant, lang=zone_lang, config=tess_config, output_type=pytesseract.Output.DICT)
+    confs = [int(c) for c in data['conf'] if c != '-1' and str(c).isdigit()]
+    return text, (sum(confs) / len(confs) / 100 if confs else 0.0)
+
 
 def get_absolute_coords(coords, img_w, img_h):
     """
@@ -1598,14 +1960,15 @@ def get_absolute_coords(coords, img_w, img_h):
         )
     return x1, y1, x2, y2
 
-def analyser_avec_tesseract(image_path, zones_config, mode='rapide'):
+def analyser_avec_tesseract(image_path, zones_config, mode='rapide', annulation=None):
     if not TESSERACT_DISPONIBLE:
         return {}
         
-    img = Image.open(image_path)
+    img = _charger_image(image_path)
     img_w, img_h = img.size
     resultats = {}
     for nom_zone, config in zones_config.items():
+        verifier_annulation(annulation)
         # Récupérer la langue de la zone (défaut: ara+fra)
         zone_lang = config.get('lang', 'ara+fra')
         
@@ -1646,6 +2009,8 @@ def analyser_avec_tesseract(image_path, zones_config, mode='rapide'):
             psm_modes = [8, 10]
         else: # auto
             psm_modes = [7, 6, 13, 8]
+        if mode == 'economique':
+            psm_modes = psm_modes[:1]
         
         # === BOUCLE MULTI-MARGE ===
         best_text = ""
@@ -1655,6 +2020,7 @@ def analyser_avec_tesseract(image_path, zones_config, mode='rapide'):
         best_margin = margin_configuree
         
         for margin in margins_to_test:
+            verifier_annulation(annulation)
             # Appliquer la marge
             x1 = x1_base - margin
             y1 = y1_base - margin
@@ -1669,6 +2035,7 @@ def analyser_avec_tesseract(image_path, zones_config, mode='rapide'):
                 continue
 
             zone_img = img.crop((x1, y1, x2, y2))
+            empreinte_crop = empreinte_pixels(zone_img)
             
             # Upscale pour les petits textes
             zone_img = upscale_for_ocr(zone_img)
@@ -1709,18 +2076,19 @@ def analyser_avec_tesseract(image_path, zones_config, mode='rapide'):
                 variants = [
                     (zone_img_gray, "raw"),
                 ]
+            if mode == 'economique':
+                variants = variants[:VARIANTES_MODE_ECONOMIQUE]
             
             for psm in psm_modes:
                 for img_variant, variant_name in variants:
+                    verifier_annulation(annulation)
                     try:
-                        tess_config = f'--oem 3 --psm {psm}'
-                        text = pytesseract.image_to_string(img_variant, lang=zone_lang, config=tess_config).strip()
+                        text, conf = ocr_memoise(
+                            'tesseract', zone_lang, psm, variant_name, empreinte_crop,
+                            lambda: _tesseract_texte_confiance(img_variant, zone_lang, psm)
+                        )
                         
                         if text:
-                            data = pytesseract.image_to_data(img_variant, lang=zone_lang, config=tess_config, output_type=pytesseract.Output.DICT)
-                            confs = [int(c) for c in data['conf'] if c != '-1' and str(c).isdigit()]
-                            conf = sum(confs) / len(confs) / 100 if confs else 0.0
-                            
                             if conf > best_conf or (conf == best_conf and len(text) > len(best_text)):
                                 best_text = text
                                 best_conf = conf
@@ -1771,13 +2139,14 @@ def analyser_avec_tesseract(image_path, zones_config, mode='rapide'):
         }
     return resultats
 
-def analyser_avec_easyocr(image_path, zones_config):
-    img = Image.open(image_path).convert('RGB')
+def analyser_avec_easyocr(image_path, zones_config, annulation=None):
+    img = _charger_image(image_path).convert('RGB')
     img_w, img_h = img.size
     img_np = np.array(img)
     resultats = {}
     
     for nom_zone, config in zones_config.items():
+        verifier_annulation(annulation)
         # Récupérer la langue de la zone pour choisir le bon reader EasyOCR
         zone_lang = config.get('lang', 'ara+fra')
         reader = get_easyocr_reader(zone_lang)
@@ -1807,6 +2176,7 @@ def analyser_avec_easyocr(image_path, zones_config):
             continue
 
         zone_img_pil = img.crop((x1, y1, x2, y2))
+        empreinte_crop = empreinte_pixels(zone_img_pil)
         
         # Upscale pour les petits textes
         zone_img_upscaled = upscale_for_ocr(zone_img_pil)
@@ -1827,13 +2197,19 @@ def analyser_avec_easyocr(image_path, zones_config):
         best_conf = 0.0
         best_variant = "brute"
         
+        def lire_easyocr(zone_img):
+            with _easyocr_lock:
+                results = reader.readtext(zone_img)
+            confs = [conf for _, _, conf in results]
+            return " ".join(text for _, text, _ in results), (sum(confs) / len(confs) if confs else 0.0)
+        
         for zone_img, variant_name in variants:
+            verifier_annulation(annulation)
             try:
-                results = reader.readtext(zone_img)
-                textes = [text for _, text, _ in results]
-                confs = [conf for _, _, conf in results]
-                texte = " ".join(textes)
-                conf = sum(confs) / len(confs) if confs else 0.0
+                texte, conf = ocr_memoise(
+                    'easyocr', zone_lang, None, variant_name, empreinte_crop,
+                    lambda: lire_easyocr(zone_img)
+                )
                 
                 if conf > best_conf or (conf == best_conf and len(texte) > len(best_text)):
                     best_text = texte
@@ -1874,13 +2250,14 @@ def analyser_avec_easyocr(image_path, zones_config):
             
     return resultats
 
-def analyser_avec_paddleocr(image_path, zones_config):
-    img = Image.open(image_path).convert('RGB')
+def analyser_avec_paddleocr(image_path, zones_config, mode='rapide', annulation=None):
+    img = _charger_image(image_path).convert('RGB')
     img_w, img_h = img.size
     img_np = np.array(img)
     resultats = {}
     
     for nom_zone, config in zones_config.items():
+        verifier_annulation(annulation)
         # Récupérer la langue de la zone
         zone_lang = config.get('lang', 'ara+fra')
         reader = get_paddleocr_reader(zone_lang)
@@ -1910,6 +2287,7 @@ def analyser_avec_paddleocr(image_path, zones_config):
             continue
 
         zone_img_pil = img.crop((x1, y1, x2, y2))
+        empreinte_crop = empreinte_pixels(zone_img_pil)
         
         # Upscale pour les petits textes
         zone_img_upscaled = upscale_for_ocr(zone_img_pil)
@@ -1925,30 +2303,42 @@ def analyser_avec_paddleocr(image_path, zones_config):
             (np.array(zone_img_isolated_80.convert('RGB')), "iso80"),
             (np.array(zone_img_isolated_100.convert('RGB')), "iso100"),
         ]
+        if mode == 'economique':
+            variants = variants[:VARIANTES_MODE_ECONOMIQUE]
         
         best_text = ""
         best_conf = 0.0
         best_variant = "brute"
         
+        def lire_paddleocr(zone_img):
+            # PaddleOCR retourne une liste de résultats : [[[box], (text, conf)], ...]
+            with _paddleocr_lock:
+                results = reader.ocr(zone_img)
+            if not (results and results[0]):
+                return None, 0.0
+            
+            # Extraire textes et confiances
+            textes = [line[1][0] for line in results[0]]
+            confs = [line[1][1] for line in results[0]]
+            
+            texte = " ".join(textes)
+            
+            # CORRECTION ARABE : PaddleOCR retourne le texte arabe dans l'ordre visuel (gauche à droite).
+            # On utilise bidi.get_display pour rétablir l'ordre logique (droite à gauche) tout en préservant les nombres.
+            if 'ara' in zone_lang or zone_lang == 'ar':
+                texte = get_display(texte)
+            
+            return texte, (sum(confs) / len(confs) if confs else 0.0)
+        
         for zone_img, variant_name in variants:
+            verifier_annulation(annulation)
             try:
-                # PaddleOCR retourne une liste de résultats : [[[box], (text, conf)], ...]
-                results = reader.ocr(zone_img)
+                texte, conf = ocr_memoise(
+                    'paddleocr', zone_lang, None, variant_name, empreinte_crop,
+                    lambda: lire_paddleocr(zone_img)
+                )
                 
-                if results and results[0]:
-                    # Extraire textes et confiances
-                    textes = [line[1][0] for line in results[0]]
-                    confs = [line[1][1] for line in results[0]]
-                    
-                    texte = " ".join(textes)
-                    
-                    # CORRECTION ARABE : PaddleOCR retourne le texte arabe dans l'ordre visuel (gauche à droite).
-                    # On utilise bidi.get_display pour rétablir l'ordre logique (droite à gauche) tout en préservant les nombres.
-                    if 'ara' in zone_lang or zone_lang == 'ar':
-                        texte = get_display(texte)
-                        
-                    conf = sum(confs) / len(confs) if confs else 0.0
-                    
+                if texte is not None:
                     if conf > best_conf or (conf == best_conf and len(texte) > len(best_text)):
                         best_text = texte
                         best_conf = conf
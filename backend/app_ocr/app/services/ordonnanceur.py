@@ -0,0 +1,267 @@
+"""
+ordonnanceur.py - Ordonnanceur global du travail OCR.
+
+Toute analyse OCR (requête interactive, fichier d'un batch, extraction de facture,
+optimisation de zone) occupe un créneau parmi `capacite` pendant son exécution.
+Quand tous les créneaux sont pris, les demandes attendent dans deux files:
+- 'interactive' (UI, API partenaires): servie en priorité, profondeur bornée —
+  au-delà, ou après attente_max secondes, la demande est refusée (SurchargeOCR,
+  429/503 + Retry-After) au lieu d'attendre indéfiniment;
+- 'batch': partage équitable pondéré entre les groupes (un groupe = un job batch):
+  le créneau libéré va au groupe qui a reçu le moins de service rapporté à son poids.
+`reserve_interactive` créneaux restent toujours disponibles pour l'interactif.
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from app.utils.annulation import verifier_annulation
+
+logger = logging.getLogger(__name__)
+
+CLASSES = ('interactive', 'batch')
+
+
+class SurchargeOCR(Exception):
+    """
+    File d'attente OCR saturée (code 429) ou attente trop longue (code 503).
+
+    Attributes:
+        code: Code HTTP à renvoyer.
+        retry_after: Délai conseillé avant de réessayer (secondes).
+    """
+
+    def __init__(self, message, code, retry_after):
+        super().__init__(message)
+        self.code = code
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    __slots__ = ('classe', 'groupe', 'accorde', 'demande', 'arrivee')
+
+    def __init__(self, classe, groupe):
+        self.classe = classe
+        self.groupe = groupe
+        self.accorde = False
+        self.demande = time.monotonic()  # Entrée en file
+        self.arrivee = self.demande      # Début d'occupation du créneau
+
+
+class OrdonnanceurOCR:
+    """
+    Args:
+        capacite: Nombre d'analyses OCR simultanées.
+        profondeur_max: Nombre maximum de demandes interactives en attente.
+        attente_max: Attente maximale d'une demande interactive (secondes).
+        reserve_interactive: Créneaux réservés à l'interactif (si capacite > reserve).
+    """
+
+    FENETRE_LATENCES = 60.0  # Secondes de latences interactives prises en compte par charge()
+
+    def __init__(self, capacite=2, profondeur_max=32, attente_max=30.0, reserve_interactive=1):
+        self.capacite = max(1, capacite)
+        self.profondeur_max = profondeur_max
+        self.attente_max = attente_max
+        self.capacite_batch = max(1, self.capacite - reserve_interactive)
+        self._cond = threading.Condition()
+        self._actifs = {classe: 0 for classe in CLASSES}
+        self._file_interactive = deque()
+        self._files_batch = {}        # groupe -> deque de tickets
+        self._temps_virtuel = {}      # groupe -> service reçu / poids
+        self._poids = {}              # groupe -> poids
+        self._actifs_groupe = {}      # groupe -> créneaux occupés
+        self._durees = deque(maxlen=200)  # Durées récentes d'occupation d'un créneau (secondes)
+        self._latences = deque(maxlen=500)  # (fin, attente + exécution) des demandes interactives récentes
+        self.accordes = {classe: 0 for classe in CLASSES}
+        self.refus = {'file_pleine': 0, 'attente_max': 0}
+
+    # --- Distribution des créneaux ---
+
+    def _libres(self, classe):
+        occupes = sum(self._actifs.values())
+        if classe == 'batch':
+            return occupes < self.capacite and self._actifs['batch'] < self.capacite_batch
+        return occupes < self.capacite
+
+    def _groupe_suivant(self):
+        """Groupe batch en attente ayant reçu le moins de service pondéré."""
+        groupes = [g for g, file in self._files_batch.items() if file]
+        return min(groupes, key=lambda g: self._temps_virtuel[g]) if groupes else None
+
+    def _distribuer(self):
+        """Accorde les créneaux libres: interactif d'abord, puis batch en partage pondéré."""
+        accorde = False
+        while self._file_interactive and self._libres('interactive'):
+            self._accorder(self._file_interactive.popleft())
+            accorde = True
+        while self._libres('batch'):
+            groupe = self._groupe_suivant()
+            if groupe is None:
+                break
+            self._temps_virtuel[groupe] += 1.0 / self._poids[groupe]
+            self._accorder(self._files_batch[groupe].popleft())
+            accorde = True
+        if accorde:
+            self._cond.notify_all()
+
+    def _accorder(self, ticket):
+        ticket.accorde = True
+        self._actifs[ticket.classe] += 1
+        self.accordes[ticket.classe] += 1
+        if ticket.groupe is not None:
+            self._actifs_groupe[ticket.groupe] = self._actifs_groupe.get(ticket.groupe, 0) + 1
+
+    def _liberer(self, ticket):
+        self._actifs[ticket.classe] -= 1
+        if ticket.groupe is not None:
+            self._actifs_groupe[ticket.groupe] -= 1
+            self._oublier_groupe_inactif(ticket.groupe)
+        self._distribuer()
+
+    def _oublier_groupe_inactif(self, groupe):
+        if not self._files_batch.get(groupe) and not self._actifs_groupe.get(groupe):
+            self._files_batch.pop(groupe, None)
+            self._temps_virtuel.pop(groupe, None)
+            self._poids.pop(groupe, None)
+            self._actifs_groupe.pop(groupe, None)
+
+    def _mettre_en_file(self, ticket, poids):
+        if ticket.classe == 'interactive':
+            self._file_interactive.append(ticket)
+            return
+        groupe = ticket.groupe
+        if groupe not in self._files_batch:
+            # Un nouveau groupe démarre au niveau des groupes actifs (pas de rattrapage de l'historique)
+            self._temps_virtuel[groupe] = min(self._temps_virtuel.values(), default=0.0)
+            self._files_batch[groupe] = deque()
+        self._poids[groupe] = max(0.1, float(poids or 1))
+        self._files_batch[groupe].append(ticket)
+
+    def _retirer_de_file(self, ticket):
+        if ticket.classe == 'interactive':
+            self._file_interactive.remove(ticket)
+        else:
+            self._files_batch[ticket.groupe].remove(ticket)
+            self._oublier_groupe_inactif(ticket.groupe)
+
+    def _retry_after(self):
+        """Estimation (secondes) du temps pour écouler la file actuelle."""
+        duree = sum(self._durees) / len(self._durees) if self._durees else 5.0
+        en_attente = len(self._file_interactive) + sum(self._actifs.values())
+        return max(1, math.ceil(duree * en_attente / self.capacite))
+
+    # --- API ---
+
+    def acquerir(self, classe='interactive', groupe=None, poids=1, annulation=None):
+        """
+        Attend un créneau OCR.
+
+        Args:
+            classe: 'interactive' ou 'batch'.
+            groupe: Groupe de partage équitable (batch) — typiquement le job_id.
+            poids: Part relative du groupe (batch).
+            annulation: JetonAnnulation vérifié pendant l'attente.
+
+        Returns:
+            Ticket à rendre avec liberer().
+
+        Raises:
+            SurchargeOCR: File interactive pleine ou attente trop longue.
+            AnalyseAnnulee: Jeton annulé pendant l'attente.
+        """
+        if classe not in CLASSES:
+            raise ValueError(f"Classe de priorité inconnue: {classe}")
+        if classe == 'batch' and groupe is None:
+            groupe = 'batch'
+        ticket = _Ticket(classe, groupe if classe == 'batch' else None)
+        limite = time.monotonic() + self.attente_max if classe == 'interactive' else None
+
+        with self._cond:
+            if classe == 'interactive' and len(self._file_interactive) >= self.profondeur_max:
+                self.refus['file_pleine'] += 1
+                raise SurchargeOCR("File d'attente OCR saturée, réessayez plus tard", 429, self._retry_after())
+            self._mettre_en_file(ticket, poids)
+            self._distribuer()
+            while not ticket.accorde:
+                restant = None if limite is None else limite - time.monotonic()
+                if restant is not None and restant <= 0:
+                    self._retirer_de_file(ticket)
+                    self.refus['attente_max'] += 1
+                    raise SurchargeOCR("Service OCR surchargé, réessayez plus tard", 503, self._retry_after())
+                self._cond.wait(0.5 if restant is None else min(0.5, restant))
+                if annulation is not None and annulation.annule and not ticket.accorde:
+                    self._retirer_de_file(ticket)
+                    verifier_annulation(annulation)
+        ticket.arrivee = time.monotonic()
+        return ticket
+
+    def refus_attente(self):
+        """
+        SurchargeOCR (503) pour une demande interactive qui attend hors de l'ordonnanceur
+        (calcul partagé encore en file) au-delà de attente_max; comptée dans refus['attente_max'].
+        """
+        with self._cond:
+            self.refus['attente_max'] += 1
+            return SurchargeOCR("Service OCR surchargé, réessayez plus tard", 503, self._retry_after())
+
+    def liberer(self, ticket):
+        """Rend un créneau et le transmet à la demande suivante."""
+        maintenant = time.monotonic()
+        with self._cond:
+            self._durees.append(maintenant - ticket.arrivee)
+            if ticket.classe == 'interactive':
+                self._latences.append((maintenant, maintenant - ticket.demande))
+            self._liberer(ticket)
+
+    def charge(self):
+        """
+        Indicateurs de charge vus par les requêtes interactives.
+
+        Returns:
+            dict: {'en_attente': demandes interactives en file,
+                   'p95_ms': 95e centile de leur latence (attente + exécution)
+                             sur la dernière minute, ou None}
+        """
+        depuis = time.monotonic() - self.FENETRE_LATENCES
+        with self._cond:
+            latences = sorted(d for fin, d in self._latences if fin >= depuis)
+            en_attente = len(self._file_interactive)
+        return {
+            'en_attente': en_attente,
+            'p95_ms': round(latences[int(0.95 * (len(latences) - 1))] * 1000) if latences else None
+        }
+
+    @contextmanager
+    def creneau(self, classe='interactive', groupe=None, poids=1, annulation=None):
+        """Occupe un créneau OCR le temps du bloc: `with ordonnanceur.creneau('batch', job_id): ...`"""
+        ticket = self.acquerir(classe, groupe, poids, annulation)
+        try:
+            yield ticket
+        finally:
+            self.liberer(ticket)
+
+    def stats(self):
+        """État des files et compteurs."""
+        with self._cond:
+            durees = sorted(self._durees)
+            return {
+                'capacite': self.capacite,
+                'capacite_batch': self.capacite_batch,
+                'actifs': dict(self._actifs),
+                'en_attente': {
+                    'interactive': len(self._file_interactive),
+                    'batch': sum(len(f) for f in self._files_batch.values())
+                },
+                'groupes_batch': {
+                    g: {'en_attente': len(f), 'actifs': self._actifs_groupe.get(g, 0), 'poids': self._poids[g]}
+                    for g, f in self._files_batch.items()
+                },
+                'accordes': dict(self.accordes),
+                'refus': dict(self.refus),
+                'duree_p95_ms': round(durees[int(0.95 * (len(durees) - 1))] * 1000) if durees else None
+            }
+
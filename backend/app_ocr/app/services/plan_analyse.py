@@ -0,0 +1,269 @@
+"""
+plan_analyse.py - Plan d'analyse précompilé d'une entité.
+
+Tout ce qui ne dépend que de la configuration de l'entité (et pas de l'image)
+est préparé une seule fois:
+- zones normalisées (valeurs par défaut lang/char_filter/preprocess... appliquées)
+- configuration des ancres avec chemins absolus des templates déjà résolus
+- formules d'ancres compilées (code objects) triées selon leurs dépendances
+- configuration du redressement, empreintes du plan et du cadre_reference (clés de cache)
+
+Le plan est immuable: EntityManager le garde en mémoire tant que le fichier
+JSON de l'entité ne change pas, et analyser_hybride l'exécute directement.
+"""
+import ast
+import copy
+import logging
+import os
+from collections.abc import Mapping
+from functools import lru_cache
+from types import MappingProxyType
+
+from app.services.redressement import config_redressement
+from app.utils.cache_utils import empreinte_config
+
+logger = logging.getLogger(__name__)
+
+# Réglages moteur par défaut d'une zone (mêmes défauts que les moteurs OCR)
+ZONE_DEFAUTS = {
+    'lang': 'ara+fra',
+    'char_filter': 'none',
+    'preprocess': 'auto',
+    'expected_format': 'auto',
+    'type': 'text'
+}
+
+# Ancre -> variable utilisable dans les formules
+VARIABLES_ANCRES = {'haut': 'H', 'bas': 'B', 'gauche': 'G', 'droite': 'D'}
+
+_NOEUDS_AUTORISES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp,
+    ast.Add, ast.Sub, ast.Mult, ast.Div,
+    ast.USub, ast.UAdd,
+    ast.Constant, ast.Name, ast.Load
+)
+
+
+class FormuleCompilee:
+    """Formule d'ancre validée et compilée une fois, évaluable sans re-parsing."""
+
+    __slots__ = ('source', 'code', 'variables')
+
+    def __init__(self, source, code, variables):
+        self.source = source
+        self.code = code
+        self.variables = variables
+
+    def evaluer(self, variables):
+        """Évalue la formule. Retourne None si une variable manque ou si le résultat est invalide."""
+        manquantes = self.variables - variables.keys()
+        if manquantes:
+            logger.debug(f"🧮 Variable(s) {sorted(manquantes)} non encore disponible(s) pour formule '{self.source}'")
+            return None
+        try:
+            result = eval(self.code, {"__builtins__": {}}, dict(variables))
+            if isinstance(result, (int, float)) and not (result != result):  # Pas NaN
+                return float(result)
+            logger.warning(f"🧮 Résultat invalide pour '{self.source}': {result}")
+            return None
+        except Exception as e:
+            logger.warning(f"🧮 Erreur évaluation formule '{self.source}': {e}")
+            return None
+
+
+@lru_cache(maxsize=256)
+def compiler_formule(formule):
+    """
+    Valide (opérations arithmétiques et noms de variables uniquement) et compile une formule.
+
+    Returns:
+        FormuleCompilee ou None si la formule est invalide.
+    """
+    formule = formule.strip()
+    try:
+        tree = ast.parse(formule, mode='eval')
+    except SyntaxError as e:
+        logger.warning(f"🧮 Formule invalide (syntaxe): '{formule}' — {e}")
+        return None
+
+    for node in ast.walk(tree):
+        if not isinstance(node, _NOEUDS_AUTORISES):
+            logger.warning(f"🧮 Formule rejetée (nœud interdit {type(node).__name__}): '{formule}'")
+            return None
+
+    variables = frozenset(node.id for node in ast.walk(tree) if isinstance(node, ast.Name))
+    return FormuleCompilee(formule, compile(tree, '<formula>', 'eval'), variables)
+
+
+def compiler_formules_cadre(cadre_reference):
+    """
+    Compile les formules (manuelle et legacy) de chaque ancre du cadre.
+
+    Returns:
+        tuple: ((ancre_id, formule_manuelle, formule_legacy), ...) dans l'ordre
+               topologique des dépendances (une ancre après celles qu'elle utilise).
+    """
+    formules = {}
+    for ancre_id in VARIABLES_ANCRES:
+        ref_data = cadre_reference.get(ancre_id) or {}
+        manuel = (ref_data.get('manuel_formula') or '').strip()
+        legacy = (ref_data.get('fallback_formula') or '').strip()
+        if manuel or legacy:
+            formules[ancre_id] = (
+                compiler_formule(manuel) if manuel else None,
+                compiler_formule(legacy) if legacy else None
+            )
+
+    # Dépendances entre ancres à formule (H, B, G, D)
+    ancre_par_variable = {v: k for k, v in VARIABLES_ANCRES.items()}
+    dependances = {}
+    for ancre_id, compilees in formules.items():
+        noms = set()
+        for formule in compilees:
+            if formule:
+                noms |= formule.variables
+        dependances[ancre_id] = {
+            ancre_par_variable[v] for v in noms
+            if v in ancre_par_variable and ancre_par_variable[v] != ancre_id and ancre_par_variable[v] in formules
+        }
+
+    # Tri topologique (ordre haut, bas, gauche, droite à égalité)
+    ordre = []
+    restantes = dict(dependances)
+    while restantes:
+        pretes = [a for a in VARIABLES_ANCRES if a in restantes and not (restantes[a] - set(ordre))]
+        if not pretes:
+            # Dépendance circulaire: on garde l'ordre par défaut pour les ancres concernées
+            pretes = [a for a in VARIABLES_ANCRES if a in restantes]
+            logger.warning(f"🧮 Dépendance circulaire entre formules: {pretes}")
+        for ancre_id in pretes:
+            ordre.append(ancre_id)
+            del restantes[ancre_id]
+
+    return tuple((ancre_id, *formules[ancre_id]) for ancre_id in ordre)
+
+
+def normaliser_zone(zone):
+    """Copie de la zone avec les réglages moteur par défaut appliqués (coords figées en tuple)."""
+    zone = {**ZONE_DEFAUTS, **zone}
+    if isinstance(zone.get('coords'), list):
+        zone['coords'] = tuple(zone['coords'])
+    return zone
+
+
+def _resoudre_template(chemin_relatif, dossiers_templates):
+    """Chemin absolu d'un template (cherche dans uploads_temp puis uploads), ou None."""
+    for dossier in dossiers_templates:
+        candidat = os.path.join(dossier, chemin_relatif)
+        if os.path.exists(candidat):
+            return candidat
+    return None
+
+
+def construire_ancres_config(cadre_reference, dossiers_templates=()):
+    """Convertit le cadre_reference en liste de configurations d'ancres pour detecter_ancres."""
+    ancres_config = []
+
+    def add_anchor_config(anchor_id, ref_data, default_pos):
+        if not ref_data:
+            return
+
+        labels = ref_data.get('labels', [])
+        template_path = ref_data.get('template_path')
+
+        # Ajouter si labels OU template présent
+        if labels or template_path:
+            conf = {
+                'id': anchor_id,
+                'labels': labels,
+                'position_base': ref_data.get('position_base', default_pos),
+                'template_path': template_path
+            }
+            if template_path:
+                template_abs = _resoudre_template(template_path, dossiers_templates)
+                if template_abs:
+                    conf['template_path_abs'] = template_abs
+            ancres_config.append(conf)
+
+    add_anchor_config('haut', cadre_reference.get('haut'), [0.5, 0])
+    add_anchor_config('droite', cadre_reference.get('droite'), [1, 0.5])
+    add_anchor_config('gauche', cadre_reference.get('gauche'), [0, 0.5])
+    add_anchor_config('bas', cadre_reference.get('bas'), [0.5, 1])
+
+    # Support ancien format 3 ancres (backward compatibility)
+    if not cadre_reference.get('gauche') and not cadre_reference.get('bas'):
+        add_anchor_config('gauche_bas', cadre_reference.get('gauche_bas'), [0, 1])
+
+    # Mapping legacy (si nouveau format absent)
+    if not ancres_config and cadre_reference.get('origine'):
+        add_anchor_config('origine', cadre_reference.get('origine'), [0, 0])
+        add_anchor_config('largeur', cadre_reference.get('largeur'), [1, 0])
+        add_anchor_config('hauteur', cadre_reference.get('hauteur'), [0, 1])
+
+    return ancres_config
+
+
+def _dossiers_templates_app():
+    """Dossiers de templates de l'application Flask courante (si contexte disponible)."""
+    try:
+        import flask
+        if flask.has_app_context():
+            config = flask.current_app.config
+            return (config.get('UPLOAD_TEMP_FOLDER', 'uploads_temp'), config.get('UPLOAD_FOLDER', 'uploads'))
+    except ImportError:
+        pass
+    return ()
+
+
+class PlanAnalyse:
+    """
+    Plan d'analyse immuable (zones + cadre de référence compilés).
+
+    Args:
+        zones: Liste de zones (format entité) ou dict {nom: config} (format zones_config).
+        cadre_reference: Optionnel - cadre de référence de l'entité.
+        nom: Optionnel - nom de l'entité.
+        version: Optionnel - version du fichier source (mtime, taille).
+        dossiers_templates: Dossiers où résoudre les template_path relatifs
+                            (défaut: uploads_temp puis uploads de l'app courante).
+    """
+
+    __slots__ = ('nom', 'version', 'zones_config', 'cadre_reference', 'empreinte', 'empreinte_cadre',
+                 'ancres_config', 'formules', 'redressement')
+
+    def __init__(self, zones, cadre_reference=None, nom=None, version=None, dossiers_templates=None):
+        if dossiers_templates is None:
+            dossiers_templates = _dossiers_templates_app()
+
+        zones = zones or {}
+        if isinstance(zones, Mapping):
+            zones_config = {nom_zone: normaliser_zone(z) for nom_zone, z in zones.items()}
+        else:
+            zones_config = {z['nom']: normaliser_zone(z) for z in zones}
+
+        cadre_reference = copy.deepcopy(cadre_reference) if cadre_reference else None
+
+        definir = super().__setattr__
+        definir('nom', nom)
+        definir('version', version)
+        definir('zones_config', MappingProxyType({k: MappingProxyType(v) for k, v in zones_config.items()}))
+        definir('cadre_reference', cadre_reference)
+        definir('empreinte', empreinte_config({'zones': zones_config, 'cadre_reference': cadre_reference}))
+        definir('empreinte_cadre', empreinte_config(cadre_reference) if cadre_reference else None)
+        definir('ancres_config', tuple(
+            MappingProxyType(a) for a in construire_ancres_config(cadre_reference, dossiers_templates)
+        ) if cadre_reference else ())
+        definir('formules', compiler_formules_cadre(cadre_reference) if cadre_reference else ())
+        definir('redressement', config_redressement(cadre_reference) if cadre_reference else None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PlanAnalyse est immuable")
+
+    @classmethod
+    def depuis_entite(cls, entite, version=None, dossiers_templates=None):
+        """Compile une entité chargée (dict JSON) en plan d'analyse."""
+        return cls(entite.get('zones', []), entite.get('cadre_reference'),
+                   nom=entite.get('nom'), version=version, dossiers_templates=dossiers_templates)
+
+    def __repr__(self):
+        return f"PlanAnalyse(nom={self.nom!r}, zones={len(self.zones_config)}, ancres={len(self.ancres_config)}, formules={len(self.formules)})"
@@ -0,0 +1,80 @@
+"""
+qualite_adaptative.py - Dégradation automatique de la qualité d'analyse sous charge.
+
+Le mode 'approfondi' multiplie le travail Tesseract par le nombre de marges testées:
+aux heures de pointe, c'est lui qui fait dépasser les délais. À partir des indicateurs
+de l'ordonnanceur (file interactive en attente, p95 de latence sur la dernière minute),
+le mode demandé est plafonné:
+- au-delà des seuils 'rapide': approfondi → rapide (une seule marge);
+- au-delà des seuils 'economique': → economique (moins de PSM et de variantes,
+  pas d'étage EasyOCR).
+Le mode effectif est renvoyé au client, qui peut relancer plus tard en qualité complète.
+"""
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+MODES = ('economique', 'rapide', 'approfondi')  # Du moins au plus coûteux
+
+
+class QualiteAdaptative:
+    """
+    Args:
+        ordonnanceur: OrdonnanceurOCR dont la charge est surveillée.
+        active: False = le mode demandé est toujours respecté.
+        file_rapide / p95_rapide_ms: Seuils de plafonnement au mode 'rapide'.
+        file_economique / p95_economique_ms: Seuils de plafonnement au mode 'economique'.
+    """
+
+    def __init__(self, ordonnanceur, active=True, file_rapide=4, p95_rapide_ms=8000,
+                 file_economique=12, p95_economique_ms=20000):
+        self.ordonnanceur = ordonnanceur
+        self.active = active
+        self.seuils = {
+            'economique': (file_economique, p95_economique_ms),
+            'rapide': (file_rapide, p95_rapide_ms)
+        }
+        self._lock = threading.Lock()
+        self.degradations = {}  # "approfondi→rapide" -> nombre de requêtes
+        self._plafond_precedent = None
+
+    def plafond(self, charge=None):
+        """Mode le plus coûteux autorisé par la charge actuelle (None = pas de plafond)."""
+        if not self.active:
+            return None
+        charge = charge or self.ordonnanceur.charge()
+        for mode, (seuil_file, seuil_p95) in self.seuils.items():
+            if charge['en_attente'] >= seuil_file or (charge['p95_ms'] or 0) >= seuil_p95:
+                return mode
+        return None
+
+    def mode_effectif(self, mode):
+        """Mode à exécuter pour une requête demandant `mode` (inchangé hors charge ou si inconnu)."""
+        charge = self.ordonnanceur.charge()
+        plafond = self.plafond(charge)
+        with self._lock:
+            if plafond != self._plafond_precedent:
+                if plafond:
+                    logger.warning(f"📉 Charge OCR élevée ({charge['en_attente']} en attente, p95={charge['p95_ms']}ms): "
+                                   f"qualité plafonnée au mode '{plafond}'")
+                else:
+                    logger.info("📈 Charge OCR revenue à la normale: qualité complète rétablie")
+                self._plafond_precedent = plafond
+            if plafond is None or mode not in MODES or MODES.index(mode) <= MODES.index(plafond):
+                return mode
+            transition = f"{mode}→{plafond}"
+            self.degradations[transition] = self.degradations.get(transition, 0) + 1
+        return plafond
+
+    def stats(self):
+        """Plafond courant, seuils et compteurs de dégradation."""
+        charge = self.ordonnanceur.charge()
+        with self._lock:
+            return {
+                'active': self.active,
+                'plafond': self.plafond(charge),
+                'charge': charge,
+                'seuils': {mode: {'en_attente': f, 'p95_ms': p} for mode, (f, p) in self.seuils.items()},
+                'degradations': dict(self.degradations)
+            }
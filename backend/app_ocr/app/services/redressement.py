@@ -0,0 +1,248 @@
+"""
+redressement.py - Pré-étape rapide d'orientation (90°/180°/270°) et de correction
+d'inclinaison (deskew) des documents photographiés.
+
+Travaille sur une version réduite en niveaux de gris de l'image, avec des profils
+de projection (pas d'appel à Tesseract OSD):
+- Inclinaison: l'angle qui rend le profil horizontal le plus "contrasté"
+  (lignes de texte nettes séparées par des interlignes vides).
+- 90°/270°: le profil vertical est plus contrasté que l'horizontal → texte vertical.
+- 180°: asymétrie des lignes de texte (la masse d'encre d'une ligne latine/arabe
+  est concentrée vers la ligne de base, donc dans la moitié basse de la ligne).
+
+Pré-étape désactivée par défaut (elle change les coordonnées de sortie): une entité
+l'active via cadre_reference['redressement'] = true, ou avec un dictionnaire:
+    {
+        "actif": true,          # Active la pré-étape (défaut: true si le dictionnaire est présent)
+        "orientation": true,    # Détection des rotations 90/180/270
+        "inclinaison": true,    # Correction de l'inclinaison
+        "angle_max": 10         # Inclinaison maximale recherchée (degrés)
+    }
+"""
+import logging
+import numpy as np
+import cv2
+from PIL import Image
+
+from app.utils.normalisation_images import charger_gris
+
+logger = logging.getLogger(__name__)
+
+REDRESSEMENT_DEFAUT = {
+    'actif': False,
+    'orientation': True,
+    'inclinaison': True,
+    'angle_max': 10
+}
+
+TAILLE_ANALYSE = 800          # Plus grand côté de l'image réduite analysée (px)
+SEUIL_TEXTE_VERTICAL = 1.5    # Ratio profil vertical / horizontal pour conclure à un texte vertical
+SEUIL_INCLINAISON = 0.5       # En dessous (degrés), l'image n'est pas redressée
+SEUIL_VOTE_180 = 0.6          # Part minimale des lignes "à l'envers" pour retourner l'image
+LIGNES_MIN_180 = 3            # Nombre minimal de lignes de texte pour juger le 180°
+
+
+def config_redressement(cadre_reference):
+    """Configuration effective du redressement pour une entité (None si l'entité ne l'active pas)."""
+    config = dict(REDRESSEMENT_DEFAUT)
+    choix = (cadre_reference or {}).get('redressement')
+    if isinstance(choix, dict):
+        config.update({'actif': True, **choix})
+    elif choix is True:
+        config['actif'] = True
+    return config if config.get('actif') else None
+
+
+def _binariser(gris):
+    """Réduit l'image et renvoie un masque binaire texte=1 / fond=0."""
+    h, w = gris.shape[:2]
+    facteur = min(1.0, TAILLE_ANALYSE / max(h, w))
+    if facteur < 1.0:
+        gris = cv2.resize(gris, (int(w * facteur), int(h * facteur)), interpolation=cv2.INTER_AREA)
+    _, binaire = cv2.threshold(gris, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    return binaire
+
+
+def _nettete_profil(binaire):
+    """Score de netteté du profil horizontal (somme des carrés des variations ligne à ligne)."""
+    profil = binaire.sum(axis=1, dtype=np.float64)
+    return float(np.sum(np.diff(profil) ** 2))
+
+
+def _tourner(binaire, angle):
+    """Rotation d'un petit masque autour de son centre (sans agrandissement)."""
+    h, w = binaire.shape[:2]
+    matrice = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(binaire, matrice, (w, h), flags=cv2.INTER_NEAREST, borderValue=0)
+
+
+def _meilleur_angle(binaire, angle_max):
+    """Recherche grossière (pas 0.5°) puis fine (pas 0.1°) de l'angle d'inclinaison."""
+    def recherche(angles):
+        scores = [(_nettete_profil(_tourner(binaire, a)), a) for a in angles]
+        return max(scores)
+
+    score, angle = recherche(np.arange(-angle_max, angle_max + 0.01, 0.5))
+    score, angle = recherche(np.arange(angle - 0.5, angle + 0.51, 0.1))
+    return round(float(angle), 1), score
+
+
+def _est_a_l_envers(binaire):
+    """
+    Vote sur les lignes de texte: la masse d'encre d'une ligne à l'endroit est
+    sous le milieu de la ligne (ligne de base). Retourne (a_l_envers, part_des_lignes).
+    """
+    profil = binaire.sum(axis=1, dtype=np.float64)
+    if profil.max() <= 0:
+        return False, 0.0
+    lignes_texte = profil > (0.15 * profil.max())
+
+    # Bandes continues de lignes de texte
+    bandes = []
+    debut = None
+    for y, actif in enumerate(lignes_texte):
+        if actif and debut is None:
+            debut = y
+        elif not actif and debut is not None:
+            bandes.append((debut, y))
+            debut = None
+    if debut is not None:
+        bandes.append((debut, len(lignes_texte)))
+
+    votes_envers = 0
+    votes = 0
+    for y0, y1 in bandes:
+        if y1 - y0 < 4:
+            continue
+        poids = profil[y0:y1]
+        centre_masse = np.sum(np.arange(y0, y1) * poids) / np.sum(poids)
+        milieu = (y0 + y1 - 1) / 2
+        votes += 1
+        if centre_masse < milieu:
+            votes_envers += 1
+
+    if votes < LIGNES_MIN_180:
+        return False, 0.0
+    part = votes_envers / votes
+    return part >= SEUIL_VOTE_180, part
+
+
+def detecter_redressement(source, config=None, dims_reference=None):
+    """
+    Détecte la rotation (0/90/180/270, sens horaire) et l'inclinaison d'un document.
+
+    Args:
+        source: Chemin de l'image ou tableau numpy (niveaux de gris ou BGR).
+        config: Configuration (voir config_redressement), défaut REDRESSEMENT_DEFAUT.
+        dims_reference: Optionnel - {'width', 'height'} de l'image de référence de l'entité
+                        (un format paysage attendu face à une image portrait favorise 90°).
+
+    Returns:
+        dict: {'rotation': int, 'angle': float}
+    """
+    config = config or REDRESSEMENT_DEFAUT
+    resultat = {'rotation': 0, 'angle': 0.0}
+
+    if isinstance(source, np.ndarray):
+        gris = source
+    else:
+        # Pixels bruts (sans EXIF), comme les lit le reste du pipeline (PIL)
+        gris = charger_gris(source, cv2.IMREAD_GRAYSCALE | cv2.IMREAD_IGNORE_ORIENTATION)
+    if gris is None:
+        return resultat
+    if gris.ndim == 3:
+        gris = cv2.cvtColor(gris, cv2.COLOR_BGR2GRAY)
+
+    binaire = _binariser(gris)
+    angle_max = float(config.get('angle_max', REDRESSEMENT_DEFAUT['angle_max']))
+    angle_max = angle_max if config.get('inclinaison', True) else 0.0
+
+    # 1. Inclinaison + netteté des profils dans les deux sens
+    angle_h, score_h = _meilleur_angle(binaire, angle_max)
+    rotation = 0
+    angle = angle_h
+
+    if config.get('orientation', True):
+        binaire_v = cv2.rotate(binaire, cv2.ROTATE_90_CLOCKWISE)
+        angle_v, score_v = _meilleur_angle(binaire_v, angle_max)
+
+        seuil = SEUIL_TEXTE_VERTICAL
+        if dims_reference and dims_reference.get('width') and dims_reference.get('height'):
+            # Format attendu ≠ format reçu (paysage vs portrait) → indice fort de rotation 90°
+            ref_paysage = dims_reference['width'] > dims_reference['height']
+            img_paysage = gris.shape[1] > gris.shape[0]
+            if ref_paysage != img_paysage:
+                seuil = 1.0
+
+        if score_v > seuil * score_h:
+            rotation = 90
+            angle = angle_v
+            binaire = binaire_v
+
+        # 2. Retournement 180° (sur l'image déjà redressée)
+        a_l_envers, part = _est_a_l_envers(_tourner(binaire, angle) if angle else binaire)
+        if a_l_envers:
+            rotation = (rotation + 180) % 360
+        logger.debug(f"🧭 Profils: horizontal={score_h:.3g}, vertical={score_v:.3g}, lignes à l'envers={part:.0%}")
+
+    if abs(angle) < SEUIL_INCLINAISON:
+        angle = 0.0
+    resultat['rotation'] = rotation
+    resultat['angle'] = angle
+    return resultat
+
+
+def appliquer_redressement(img, redressement):
+    """
+    Applique une rotation/inclinaison détectée à une image PIL pleine résolution.
+
+    L'angle est exprimé comme pour cv2 (positif = anti-horaire) après rotation
+    de `rotation` degrés dans le sens horaire.
+    """
+    rotation = redressement.get('rotation', 0)
+    angle = redressement.get('angle', 0.0)
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    if rotation:
+        img = img.rotate(-rotation, expand=True)
+    if angle:
+        img = img.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor='white')
+    return img
+
+
+def point_vers_origine(redressement, dims_origine, dims_redressee, x, y):
+    """
+    Position dans l'image d'origine d'un point (pixels) de l'image redressée par
+    appliquer_redressement (inverse de l'inclinaison, puis de la rotation).
+    """
+    W, H = dims_origine
+    rotation = redressement.get('rotation', 0)
+    angle = redressement.get('angle', 0.0)
+    w1, h1 = (H, W) if rotation in (90, 270) else (W, H)
+    if angle:
+        a = np.radians(angle)
+        dx, dy = x - dims_redressee[0] / 2, y - dims_redressee[1] / 2
+        x = dx * np.cos(a) - dy * np.sin(a) + w1 / 2
+        y = dx * np.sin(a) + dy * np.cos(a) + h1 / 2
+    if rotation == 90:
+        x, y = y, H - x
+    elif rotation == 180:
+        x, y = W - x, H - y
+    elif rotation == 270:
+        x, y = W - y, x
+    return float(x), float(y)
+
+
+def rectangle_vers_origine(redressement, dims_origine, dims_redressee, rectangle):
+    """
+    Rectangle (x1, y1, x2, y2) en pixels de l'image redressée → rectangle englobant
+    dans l'image d'origine (borné à l'image). Exact pour les rotations 90/180/270;
+    avec une inclinaison, c'est l'enveloppe du rectangle incliné.
+    """
+    x1, y1, x2, y2 = rectangle
+    coins = [point_vers_origine(redressement, dims_origine, dims_redressee, x, y)
+             for x, y in ((x1, y1), (x2, y1), (x1, y2), (x2, y2))]
+    W, H = dims_origine
+    xs = [min(max(x, 0.0), W) for x, _ in coins]
+    ys = [min(max(y, 0.0), H) for _, y in coins]
+    return min(xs), min(ys), max(xs), max(ys)
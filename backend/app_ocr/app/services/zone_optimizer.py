@@ -10,6 +10,10 @@ from app.services.ocr_engine_v2 import (
     analyser_avec_easyocr,
     analyser_avec_paddleocr,
     analyser_hybride,
+    get_absolute_coords,
+    empreinte_pixels,
+    ocr_memoise,
+    stats_cache_ocr_zones,
     TESSERACT_DISPONIBLE,
     EASYOCR_DISPONIBLE,
     PADDLEOCR_DISPONIBLE
@@ -95,7 +99,42 @@ def preparer_image_de_travail(image_path, entity):
 def ocr_zone_unique(image_path, nom_zone, coords, lang='ara', preprocess='arabic_textured', use_tesseract=True, use_paddleocr=True, use_easyocr=False, expected_format='auto', char_filter='none', margin=0):
     """
     Exécute l'OCR sur une seule zone et retourne le résultat.
+    
+    Des coordonnées voisines qui tombent sur les mêmes pixels (arrondi au pixel,
+    bornage à l'image) réutilisent le résultat déjà calculé via le cache OCR par crop.
     """
+    empreinte_crop = _empreinte_crop_zone(image_path, coords, margin)
+    if empreinte_crop is None:
+        return _ocr_zone(image_path, nom_zone, coords, lang, preprocess, use_tesseract, use_paddleocr, use_easyocr, expected_format, char_filter, margin)
+    
+    variante = (
+        use_tesseract and TESSERACT_DISPONIBLE,
+        use_paddleocr and PADDLEOCR_DISPONIBLE,
+        use_easyocr and EASYOCR_DISPONIBLE,
+        preprocess, expected_format, char_filter
+    )
+    return dict(ocr_memoise(
+        'zone_unique', lang, None, variante, empreinte_crop,
+        lambda: _ocr_zone(image_path, nom_zone, coords, lang, preprocess, use_tesseract, use_paddleocr, use_easyocr, expected_format, char_filter, margin)
+    ))
+
+def _empreinte_crop_zone(image_path, coords, margin=0):
+    """Empreinte des pixels effectivement OCRisés pour ces coordonnées (None si crop vide/illisible)."""
+    try:
+        with Image.open(image_path) as img:
+            img_w, img_h = img.size
+            x1, y1, x2, y2 = get_absolute_coords(coords, img_w, img_h)
+            margin = margin or 0
+            box = (max(0, x1 - margin), max(0, y1 - margin), min(img_w, x2 + margin), min(img_h, y2 + margin))
+            if box[2] <= box[0] or box[3] <= box[1]:
+                return None
+            return empreinte_pixels(img.crop(box))
+    except OSError as e:
+        logger.debug(f"Empreinte crop impossible ({e})")
+        return None
+
+def _ocr_zone(image_path, nom_zone, coords, lang, preprocess, use_tesseract, use_paddleocr, use_easyocr, expected_format, char_filter, margin):
+    """OCR d'une zone avec les moteurs demandés (meilleure confiance)."""
     zones_config = {
         nom_zone: {
             'coords': coords,
@@ -321,5 +360,6 @@ def optimiser_zone(image_path, nom_zone, coords_base, texte_attendu, lang='ara',
             'score': best_score,
         },
         'amelioration': amelioration,
-        'nb_evaluations': len(all_results)
+        'nb_evaluations': len(all_results),
+        'cache_ocr': stats_cache_ocr_zones()
     }
@@ -0,0 +1,124 @@
+"""
+annulation.py - Annulation coopérative des analyses en cours.
+
+Un JetonAnnulation est transmis à travers la cascade OCR (batch → analyser_hybride →
+analyser_avec_*). Chaque boucle (fichiers, zones, marges/PSM/variantes) le vérifie
+avant un appel OCR: une analyse annulée s'arrête donc en au plus un appel OCR,
+en levant AnalyseAnnulee.
+
+Sources d'annulation:
+- DELETE /api/batch/<job_id> pour un job batch
+- déconnexion du client pour une requête synchrone (SurveillantDeconnexions)
+"""
+import logging
+import select
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class AnalyseAnnulee(Exception):
+    """L'analyse a été interrompue parce que son jeton d'annulation a été déclenché."""
+
+
+class JetonAnnulation:
+    """Drapeau d'annulation partagé entre le demandeur et les threads d'analyse."""
+
+    def __init__(self):
+        self._evenement = threading.Event()
+        self.raison = None
+
+    def annuler(self, raison='annulée'):
+        if not self._evenement.is_set():
+            self.raison = raison
+            self._evenement.set()
+
+    @property
+    def annule(self):
+        return self._evenement.is_set()
+
+    def verifier(self):
+        """Lève AnalyseAnnulee si l'annulation a été demandée."""
+        if self._evenement.is_set():
+            raise AnalyseAnnulee(self.raison)
+
+
+def verifier_annulation(jeton):
+    """Point de contrôle (jeton optionnel): lève AnalyseAnnulee si l'analyse est annulée."""
+    if jeton is not None:
+        jeton.verifier()
+
+
+def socket_client(environ):
+    """Socket de la connexion client (serveur de dev Werkzeug ou Gunicorn), ou None."""
+    return environ.get('werkzeug.socket') or environ.get('gunicorn.socket')
+
+
+def client_deconnecte(sock):
+    """
+    True si le client a fermé la connexion.
+
+    Le corps de la requête ayant été lu, une socket lisible sans données (EOF)
+    signifie que le client est parti. Les données en attente (requête suivante
+    en keep-alive) sont laissées intactes (MSG_PEEK).
+    """
+    try:
+        lisible, _, _ = select.select([sock], [], [], 0)
+        if not lisible:
+            return False
+        return sock.recv(1, socket.MSG_PEEK) == b''
+    except ValueError:
+        return False  # Socket sans MSG_PEEK (TLS): on ne peut pas savoir
+    except OSError:
+        return True
+
+
+class SurveillantDeconnexions:
+    """
+    Surveille les connexions des requêtes synchrones en cours et annule leur jeton
+    si le client se déconnecte (un seul thread pour toutes les requêtes).
+
+    Args:
+        intervalle: Période de vérification (secondes).
+    """
+
+    def __init__(self, intervalle=0.5):
+        self.intervalle = intervalle
+        self._surveillees = {}  # id(jeton) -> (socket, jeton)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.annulations = 0
+
+    @contextmanager
+    def surveiller(self, environ):
+        """Jeton annulé si le client de la requête se déconnecte pendant le bloc."""
+        jeton = JetonAnnulation()
+        sock = socket_client(environ)
+        if sock is None:
+            yield jeton  # Serveur sans accès à la socket: pas de détection
+            return
+        with self._lock:
+            self._surveillees[id(jeton)] = (sock, jeton)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._boucle, name='surveillant-deconnexions', daemon=True)
+                self._thread.start()
+        try:
+            yield jeton
+        finally:
+            with self._lock:
+                self._surveillees.pop(id(jeton), None)
+
+    def _boucle(self):
+        while True:
+            time.sleep(self.intervalle)
+            with self._lock:
+                surveillees = list(self._surveillees.values())
+            for sock, jeton in surveillees:
+                if not jeton.annule and client_deconnecte(sock):
+                    jeton.annuler('client déconnecté')
+                    with self._lock:
+                        self.annulations += 1
+                    logger.info("🔌 Client déconnecté: analyse en cours annulée")
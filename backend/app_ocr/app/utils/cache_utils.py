@@ -0,0 +1,261 @@
+"""
+cache_utils.py - Cache mémoire LRU thread-safe avec expiration optionnelle (TTL),
+empreintes de contenu et regroupement des calculs identiques en cours (single-flight).
+
+Utilisé pour garder en mémoire les objets coûteux à recalculer entre deux
+requêtes (images décodées, cartes de caractéristiques, résultats OCR...).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+
+from app.utils.annulation import verifier_annulation
+
+
+class LRUCache:
+    """
+    Cache LRU borné en nombre d'entrées, avec TTL optionnel.
+
+    Args:
+        max_entries: Nombre maximum d'entrées (les moins récemment utilisées sont évincées).
+        ttl: Durée de vie d'une entrée en secondes (None = pas d'expiration).
+    """
+
+    def __init__(self, max_entries=128, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (timestamp, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expire(self, timestamp):
+        return self.ttl is not None and (time.monotonic() - timestamp) > self.ttl
+
+    def get(self, key, default=None):
+        """Retourne la valeur associée à key (et la marque comme récente), ou default."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            timestamp, value = entry
+            if self._expire(timestamp):
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Ajoute ou remplace une entrée, en évinçant les plus anciennes si nécessaire."""
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Retire une entrée du cache."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return entry[1] if entry is not None else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def valeurs(self):
+        """Copie des valeurs non expirées (de la plus ancienne à la plus récente)."""
+        with self._lock:
+            return [value for timestamp, value in self._data.values() if not self._expire(timestamp)]
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and not self._expire(entry[0])
+
+    def stats(self):
+        """Statistiques d'utilisation du cache."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+# Empreintes de fichiers déjà calculées: (fichier, mtime, taille) -> sha256
+_empreintes_fichiers = LRUCache(max_entries=512)
+
+
+def _cle_fichier(chemin, stat):
+    """Identité d'un fichier: son inode (partagé par les liens physiques d'un même contenu), sinon son chemin."""
+    fichier = (stat.st_dev, stat.st_ino) if stat.st_ino else os.path.abspath(chemin)
+    return (fichier, stat.st_mtime_ns, stat.st_size)
+
+
+def empreinte_fichier(chemin, taille_bloc=1 << 20):
+    """
+    SHA-256 du contenu d'un fichier, lu par blocs.
+
+    Mémorisé par (inode, mtime, taille) pour ne pas relire un fichier inchangé,
+    ni les autres noms (liens physiques) d'un même contenu.
+    """
+    stat = os.stat(chemin)
+    cle = _cle_fichier(chemin, stat)
+    empreinte = _empreintes_fichiers.get(cle)
+    if empreinte is None:
+        h = hashlib.sha256()
+        with open(chemin, 'rb') as f:
+            for bloc in iter(lambda: f.read(taille_bloc), b''):
+                h.update(bloc)
+        empreinte = h.hexdigest()
+        _empreintes_fichiers.put(cle, empreinte)
+    return empreinte
+
+
+def memoriser_empreinte(chemin, empreinte):
+    """Enregistre l'empreinte d'un fichier déjà calculée ailleurs (pendant son écriture)."""
+    _empreintes_fichiers.put(_cle_fichier(chemin, os.stat(chemin)), empreinte)
+
+
+def empreinte_config(config):
+    """SHA-256 d'une configuration JSON-sérialisable (clés triées, indépendant de l'ordre)."""
+    brut = json.dumps(config, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(brut.encode('utf-8')).hexdigest()
+
+
+class AttenteDepassee(TimeoutError):
+    """Calcul partagé toujours pas démarré après l'attente maximale de l'appelant."""
+
+
+class _Calcul:
+    """Calcul en cours d'une clé: son Future, sa priorité, et s'il a démarré."""
+    __slots__ = ('future', 'prioritaire', 'demarre')
+
+    def __init__(self, prioritaire):
+        self.future = Future()
+        self.prioritaire = prioritaire
+        self.demarre = False
+
+
+class SingleFlight:
+    """
+    Regroupe les calculs identiques simultanés: le premier appelant d'une clé
+    exécute le calcul, les suivants (même clé, calcul en cours) attendent son
+    Future et reçoivent le même résultat (ou la même exception).
+
+    Un appelant prioritaire ne rejoint pas un calcul non prioritaire qui attend encore
+    ses ressources (ex. analyse batch en file dans l'ordonnanceur): il calcule pour
+    lui-même plutôt que d'attendre derrière toute la file batch. Le calcul signale
+    qu'il a obtenu ses ressources avec demarrer().
+    """
+
+    ATTENTE_POLL = 0.5  # Secondes entre deux vérifications d'annulation d'un appelant en attente
+
+    def __init__(self):
+        self._en_cours = {}  # cle -> _Calcul
+        self._lock = threading.Lock()
+        self._local = threading.local()  # Calcul mené par le thread courant (pour demarrer())
+        self.executions = 0
+        self.coalescees = 0
+        self.independantes = 0
+
+    def executer(self, cle, fonction, prioritaire=False, annulation=None, attente_max=None):
+        """
+        Exécute fonction() une seule fois par clé en cours de calcul.
+
+        Args:
+            prioritaire: L'appelant ne doit pas attendre un calcul non prioritaire pas encore démarré.
+            annulation: JetonAnnulation de l'appelant, vérifié pendant l'attente d'un calcul partagé.
+            attente_max: Attente maximale (secondes) d'un calcul partagé tant qu'il n'a pas démarré.
+
+        Returns:
+            tuple: (resultat, coalesce) — coalesce=True si l'appel a rejoint un calcul existant.
+
+        Raises:
+            AnalyseAnnulee: Jeton de l'appelant annulé pendant l'attente d'un calcul partagé.
+            AttenteDepassee: Calcul partagé toujours pas démarré après attente_max.
+        """
+        if cle is None:
+            return fonction(), False
+
+        with self._lock:
+            calcul = self._en_cours.get(cle)
+            if calcul is None:
+                calcul = _Calcul(prioritaire)
+                self._en_cours[cle] = calcul
+                self.executions += 1
+                meneur = True
+            elif prioritaire and not calcul.prioritaire and not calcul.demarre:
+                self.independantes += 1
+                calcul = None
+                meneur = False
+            else:
+                self.coalescees += 1
+                meneur = False
+
+        if calcul is None:
+            return self._mener(None, fonction), False
+        if not meneur:
+            return self._attendre(calcul, annulation, attente_max), True
+
+        try:
+            resultat = self._mener(calcul, fonction)
+        except BaseException as e:
+            calcul.future.set_exception(e)
+            raise
+        else:
+            calcul.future.set_result(resultat)
+            return resultat, False
+        finally:
+            with self._lock:
+                self._en_cours.pop(cle, None)
+
+    def _mener(self, calcul, fonction):
+        precedent = getattr(self._local, 'calcul', None)
+        self._local.calcul = calcul
+        try:
+            return fonction()
+        finally:
+            self._local.calcul = precedent
+
+    def _attendre(self, calcul, annulation, attente_max):
+        debut = time.monotonic()
+        while not wait([calcul.future], timeout=self.ATTENTE_POLL).done:
+            verifier_annulation(annulation)
+            if attente_max is not None and not calcul.demarre and time.monotonic() - debut > attente_max:
+                raise AttenteDepassee(f"Calcul partagé non démarré après {attente_max}s")
+        return calcul.future.result()
+
+    def demarrer(self):
+        """Appelé par le calcul en cours quand il a obtenu ses ressources: tous les appelants peuvent le rejoindre."""
+        calcul = getattr(self._local, 'calcul', None)
+        if calcul is not None:
+            calcul.demarre = True
+
+    def stats(self):
+        """Statistiques de regroupement."""
+        with self._lock:
+            return {
+                'en_cours': len(self._en_cours),
+                'executions': self.executions,
+                'coalescees': self.coalescees,
+                'independantes': self.independantes
+            }
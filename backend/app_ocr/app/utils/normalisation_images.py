@@ -0,0 +1,202 @@
+"""
+normalisation_images.py - Normalisation des images à l'upload (une fois pour toutes les analyses).
+
+Les uploads étaient conservés tels que reçus: photos de 12 MP avec une orientation
+EXIF que l'analyse ignore, PNG avec transparence, TIFF CMJN... Chaque étape de
+l'analyse repayait alors la pleine résolution et la conversion des couleurs.
+
+À l'upload, l'image est:
+1. redressée selon son orientation EXIF (balise retirée ensuite);
+2. convertie dans un mode canonique: 'RGB' (transparence aplatie sur fond blanc,
+   CMJN, palette...) ou 'L' pour une image déjà en niveaux de gris;
+3. réduite si sa résolution effective dépasse dpi_max pour la taille du document
+   de l'entité visée (image_base_dimensions), sinon si elle dépasse pixels_max.
+Le résultat (le « master ») remplace l'upload sous son saved_filename, dans le
+format d'origine; une version en niveaux de gris est écrite à côté ('<fichier>.gris.png')
+et lue directement par les étapes qui travaillent en gris (redressement, matching
+des ancres, empreintes perceptuelles).
+
+Master et gris sont des variantes du dépôt par contenu: un même upload normalisé
+vers la même taille ne l'est qu'une fois.
+"""
+import logging
+import math
+import os
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+SUFFIXE_GRIS = '.gris.png'
+DPI_REFERENCE = 300     # DPI supposé d'une image de référence sans dpi_y (rendu PDF, scan)
+DPI_SCAN_MIN = 150      # En dessous, le DPI des métadonnées n'est pas celui d'un scanner (ex. 72 des photos)
+REDUCTION_MIN = 0.9     # Pas de rééchantillonnage pour un gain inférieur à 10 %
+ORIENTATION_EXIF = 0x0112
+
+# Options d'écriture du master, par format PIL (format d'origine conservé)
+OPTIONS_FORMAT = {
+    'JPEG': {'quality': 95},
+    'MPO': {'quality': 95},
+    'WEBP': {'quality': 95},
+    'PNG': {'compress_level': 1},
+    'TIFF': {'compression': 'tiff_deflate'},
+}
+
+
+def chemin_gris(chemin):
+    """Chemin de la version en niveaux de gris précalculée d'une image."""
+    return f"{chemin}{SUFFIXE_GRIS}"
+
+
+def charger_gris(chemin, flags=cv2.IMREAD_GRAYSCALE):
+    """
+    Image en niveaux de gris (tableau numpy) depuis un chemin: la version précalculée
+    à l'upload si elle existe, sinon décodage et conversion de l'image.
+
+    Args:
+        flags: Drapeaux cv2.imread (ex. IMREAD_REDUCED_GRAYSCALE_4 | IMREAD_IGNORE_ORIENTATION).
+    """
+    gris = chemin_gris(str(chemin))
+    if os.path.exists(gris):
+        image = cv2.imread(gris, flags)
+        if image is not None:
+            return image
+    return cv2.imread(str(chemin), flags)
+
+
+def dimensions_cibles(taille, dpi_image=None, base_dimensions=None, dpi_max=400, pixels_max=None):
+    """
+    Taille après plafonnement de la résolution effective.
+
+    Avec l'entité visée (base_dimensions: image de référence {'width', 'height', 'dpi_y'?}),
+    l'image est supposée cadrer le document: sa résolution effective est son grand côté
+    rapporté au grand côté du document (en pouces, au DPI de la référence).
+    Sans entité: DPI des métadonnées s'il s'agit d'un scan, puis plafond en pixels.
+
+    Returns:
+        (largeur, hauteur): taille inchangée si la réduction serait inférieure à 10 %.
+    """
+    largeur, hauteur = taille
+    facteur = 1.0
+    ref_w, ref_h = (base_dimensions or {}).get('width'), (base_dimensions or {}).get('height')
+    if ref_w and ref_h and dpi_max:
+        dpi_ref = float(base_dimensions.get('dpi_y') or DPI_REFERENCE)
+        dpi_effectif = max(largeur, hauteur) / (max(ref_w, ref_h) / dpi_ref)
+        facteur = min(facteur, dpi_max / dpi_effectif)
+    else:
+        if dpi_image and dpi_image >= DPI_SCAN_MIN and dpi_max:
+            facteur = min(facteur, dpi_max / dpi_image)
+        if pixels_max:
+            facteur = min(facteur, math.sqrt(pixels_max / (largeur * hauteur)))
+    if facteur >= REDUCTION_MIN:
+        return largeur, hauteur
+    return max(1, round(largeur * facteur)), max(1, round(hauteur * facteur))
+
+
+def mode_canonique(img):
+    """Image en 'RGB', ou en 'L' si elle est déjà en niveaux de gris (transparence aplatie sur blanc)."""
+    if img.mode in ('RGB', 'L'):
+        return img
+    if img.mode in ('I;16', 'I;16B', 'I;16L', 'I', 'F'):
+        tableau = np.asarray(img, dtype=np.float32)
+        maximum = 65535.0 if img.mode.startswith('I;16') else max(float(tableau.max()), 1.0)
+        return Image.fromarray(np.clip(tableau * (255.0 / maximum), 0, 255).astype(np.uint8), 'L')
+    if img.mode in ('1', 'LA', 'La'):
+        gris = img.convert('LA')
+        fond = Image.new('L', img.size, 255)
+        fond.paste(gris.getchannel('L'), mask=gris.getchannel('A'))
+        return fond
+    if img.mode in ('RGBA', 'RGBa', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+        rgba = img.convert('RGBA')
+        fond = Image.new('RGB', img.size, (255, 255, 255))
+        fond.paste(rgba, mask=rgba.getchannel('A'))
+        return fond
+    return img.convert('RGB')  # CMYK, P, YCbCr, LAB...
+
+
+def _dpi_image(img):
+    dpi = img.info.get('dpi')
+    try:
+        return float(dpi[1]) if dpi else None
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def normaliser_upload(depot, chemin, empreinte, base_dimensions=None, dpi_max=400, pixels_max=None):
+    """
+    Normalise une image uploadée (voir l'en-tête du module) et précalcule sa version en gris.
+
+    Args:
+        depot: DepotContenu où l'upload est rangé (chemin en est un alias).
+        chemin: Alias de l'upload (saved_filename), remplacé par le master si nécessaire.
+        empreinte: SHA-256 de l'upload reçu (DepotContenu.enregistrer).
+        base_dimensions: image_base_dimensions de l'entité visée (None: plafond en pixels).
+
+    Returns:
+        dict: {'dimensions_origine', 'dimensions', 'orientation_exif', 'mode_origine',
+               'modifie', 'gris'} — ou None si le fichier n'est pas une image lisible.
+    """
+    try:
+        with Image.open(chemin) as img:
+            format_image = img.format
+            mode_origine = img.mode
+            taille_origine = img.size
+            orientation = img.getexif().get(ORIENTATION_EXIF, 1)
+            dpi = _dpi_image(img)
+    except Exception:
+        return None
+
+    tourne = orientation in (5, 6, 7, 8)
+    taille_redressee = taille_origine[::-1] if tourne else taille_origine
+    taille = dimensions_cibles(taille_redressee, dpi, base_dimensions, dpi_max, pixels_max)
+    modifie = orientation != 1 or mode_origine not in ('RGB', 'L') or taille != taille_redressee
+    suffixe = f"_n{taille[0]}x{taille[1]}"
+    ext = os.path.splitext(chemin)[1]
+    normalisee = {}
+
+    def image_normalisee():
+        """Décodée une seule fois, partagée entre master et gris."""
+        if 'image' not in normalisee:
+            with Image.open(chemin) as img:
+                if taille != taille_redressee and format_image in ('JPEG', 'MPO'):
+                    # Décodage JPEG réduit (1/2, 1/4, 1/8) au plus près de la taille visée
+                    img.draft(img.mode, taille[::-1] if tourne else taille)
+                img = ImageOps.exif_transpose(img)
+                img = mode_canonique(img)
+                if img.size != taille:
+                    img = img.resize(taille, Image.LANCZOS, reducing_gap=3.0)
+                normalisee['image'] = img
+        return normalisee['image']
+
+    def ecrire_master(destination):
+        options = dict(OPTIONS_FORMAT.get(format_image, {}))
+        if dpi:
+            options['dpi'] = (dpi * taille[0] / taille_redressee[0],) * 2
+        format_ecriture = 'JPEG' if format_image == 'MPO' else format_image
+        try:
+            image_normalisee().save(destination, format=format_ecriture, **options)
+        except (OSError, ValueError, KeyError):
+            image_normalisee().save(destination, format=format_ecriture)  # Option non supportée (ex. sans libtiff)
+
+    def ecrire_gris(destination):
+        image = image_normalisee()
+        (image if image.mode == 'L' else image.convert('L')).save(destination, format='PNG', compress_level=1)
+
+    if modifie:
+        depot.deriver(empreinte, suffixe, ext, ecrire_master, chemin)
+        logger.info(f"🧼 Upload normalisé: {taille_origine[0]}x{taille_origine[1]} {mode_origine} "
+                    f"(orientation EXIF {orientation}) → {taille[0]}x{taille[1]}")
+    gris = None
+    if mode_origine != 'L' or modifie:
+        gris = chemin_gris(chemin)
+        depot.deriver(empreinte, f"{suffixe}_gris", '.png', ecrire_gris, gris)
+    return {
+        'dimensions_origine': {'width': taille_origine[0], 'height': taille_origine[1]},
+        'dimensions': {'width': taille[0], 'height': taille[1]},
+        'orientation_exif': orientation,
+        'mode_origine': mode_origine,
+        'modifie': modifie,
+        'gris': os.path.basename(gris) if gris else None
+    }
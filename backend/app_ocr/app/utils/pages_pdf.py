@@ -0,0 +1,126 @@
+"""
+pages_pdf.py - Adressage des pages d'un PDF stocké: 'document.pdf#3'.
+
+Un PDF uploadé est conservé tel quel; ses pages ne sont rendues qu'au moment où une
+analyse les demande (rendu en mémoire, au DPI de la référence de l'entité).
+Une référence de page reste une simple chaîne: elle traverse donc le job store et la
+reprise des jobs batch comme un chemin d'image ordinaire.
+
+Dans les endpoints batch:
+- 'document.pdf#3'  → page 3 (numérotation à partir de 1);
+- 'document.pdf', 'document.pdf#all' ou 'document.pdf#*' → toutes les pages.
+Pour une analyse unitaire, un PDF sans numéro de page désigne sa première page.
+"""
+import os
+
+from easy_core.pdf_utils import PdfPages, save_pdf_page
+from app.utils.cache_utils import LRUCache
+
+SEPARATEUR_PAGE = '#'
+TOUTES_PAGES = ('all', '*')
+
+# Nombre de pages par (chemin, mtime, taille): l'expansion d'un lot ne rouvre pas les PDF connus
+_nombres_pages = LRUCache(max_entries=512)
+
+
+def est_pdf(chemin):
+    return chemin.lower().endswith('.pdf')
+
+
+def decouper_page(reference):
+    """
+    Sépare un chemin de son numéro de page.
+
+    Returns:
+        (chemin, page): page = int (à partir de 1), 'all', ou None sans suffixe.
+    """
+    chemin, sep, suffixe = reference.rpartition(SEPARATEUR_PAGE)
+    if not sep or not est_pdf(chemin):
+        return reference, None
+    if suffixe.isdigit():
+        return chemin, int(suffixe)
+    if suffixe.lower() in TOUTES_PAGES:
+        return chemin, 'all'
+    return reference, None
+
+
+def chemin_fichier(reference):
+    """Chemin du fichier sur disque (sans le numéro de page)."""
+    return decouper_page(reference)[0]
+
+
+def reference_page(chemin, page):
+    return f"{chemin}{SEPARATEUR_PAGE}{page}"
+
+
+def nombre_pages(chemin):
+    """Nombre de pages d'un PDF (ouvert sans rendu, mémorisé tant que le fichier ne change pas)."""
+    stat = os.stat(chemin)
+    cle = (os.path.abspath(chemin), stat.st_mtime_ns, stat.st_size)
+    nombre = _nombres_pages.get(cle)
+    if nombre is None:
+        with PdfPages(chemin) as pages:
+            nombre = len(pages)
+        _nombres_pages.put(cle, nombre)
+    return nombre
+
+
+def developper_pages(filename, image_path):
+    """
+    Développe une entrée de lot en une entrée par page à analyser.
+
+    Args:
+        filename: Nom demandé par le client ('doc.pdf', 'doc.pdf#2', 'doc.pdf#all', 'img.jpg').
+        image_path: Chemin résolu (avec son éventuel '#page'), ou None si introuvable.
+
+    Returns:
+        list: [(filename, image_path)] — pour un PDF entier, une entrée 'doc.pdf#n' par page.
+              Une page hors du document donne image_path=None (fichier non trouvé).
+    """
+    if not image_path:
+        return [(filename, None)]
+    chemin, page = decouper_page(image_path)
+    if not est_pdf(chemin):
+        return [(filename, image_path)]
+    try:
+        total = nombre_pages(chemin)
+    except Exception:
+        return [(filename, image_path)]  # PDF illisible: l'erreur sera rapportée par l'analyse
+    nom = decouper_page(filename)[0]
+    if isinstance(page, int):
+        return [(filename, image_path if 1 <= page <= total else None)]
+    return [(reference_page(nom, n), reference_page(chemin, n)) for n in range(1, total + 1)]
+
+
+def rendre_premiere_page(depot, chemin_pdf, empreinte, alias, base_dimensions=None):
+    """
+    Rend la première page d'un PDF en PNG sans perte sous `alias` (aperçu, image de session).
+    Le rendu est partagé via le dépôt par contenu: un même PDF rendu au même DPI ne l'est qu'une fois.
+
+    Args:
+        depot: DepotContenu.
+        empreinte: SHA-256 du PDF (retourné par DepotContenu.enregistrer).
+    """
+    with PdfPages(chemin_pdf, base_dimensions=base_dimensions) as pages:
+        dpi = pages.dpi(0)
+    depot.deriver(empreinte, f"_p1_{round(dpi, 2):g}dpi", '.png',
+                  lambda chemin: save_pdf_page(chemin_pdf, chemin, dpi=dpi), alias)
+    return alias
+
+
+def charger_page(reference, base_dimensions=None):
+    """
+    Source d'analyse d'une référence: la page rendue en mémoire (tableau BGR) pour un PDF,
+    le chemin inchangé pour une image.
+
+    Args:
+        base_dimensions: image_base_dimensions de l'entité (DPI de rendu, voir PdfPages).
+
+    Raises:
+        IndexError: Page hors du document.
+    """
+    chemin, page = decouper_page(reference)
+    if not est_pdf(chemin):
+        return reference
+    with PdfPages(chemin, base_dimensions=base_dimensions) as pages:
+        return pages.render(page - 1 if isinstance(page, int) else 0)
@@ -8,5 +8,79 @@ class Config:
     ENTITIES_FOLDER = os.path.join(BASE_DIR, 'entities')
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'tiff', 'pdf', 'docx'}
     
+    # Cache des résultats d'analyse (mémoire LRU + SQLite dans uploads_temp)
+    RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL', 24 * 3600))     # secondes
+    RESULT_CACHE_MEMORY_ENTRIES = int(os.environ.get('RESULT_CACHE_MEMORY_ENTRIES', 256))
+    RESULT_CACHE_DISK_MAX_BYTES = int(os.environ.get('RESULT_CACHE_DISK_MAX_BYTES', 200 * 1024 * 1024))
+    
+    # Analyses batch asynchrones (/api/analyser-batch-async, /api/analyser-dossier)
+    BATCH_WORKERS_PER_JOB = int(os.environ.get('BATCH_WORKERS_PER_JOB', 2))          # défaut par job (max_workers)
+    BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', os.cpu_count() or 4))  # plafond global du process
+    CROP_BATCH_WORKERS = int(os.environ.get('CROP_BATCH_WORKERS', os.cpu_count() or 4))  # découpes simultanées (/api/crop-image-batch)
+    
+    # Job store des analyses batch (SQLite dans uploads_temp, partagé entre process)
+    JOB_STORE_TTL = int(os.environ.get('JOB_STORE_TTL', 24 * 3600))          # secondes après la dernière mise à jour
+    JOB_ORPHAN_DELAY = int(os.environ.get('JOB_ORPHAN_DELAY', 300))          # secondes sans battement = job abandonné
+    JOB_RESUME_ON_START = os.environ.get('JOB_RESUME_ON_START', 'true').lower() == 'true'
+    BATCH_RESULTS_PAGE_SIZE = int(os.environ.get('BATCH_RESULTS_PAGE_SIZE', 100))  # /api/batch-result
+    SSE_HEARTBEAT_INTERVAL = float(os.environ.get('SSE_HEARTBEAT_INTERVAL', 15))   # secondes sans événement
+    SSE_REMOTE_POLL_INTERVAL = float(os.environ.get('SSE_REMOTE_POLL_INTERVAL', 1))  # job traité par un autre process
+    
+    # Ordonnanceur OCR global (toutes les analyses: interactif prioritaire, batch en partage équitable)
+    OCR_MAX_CONCURRENCY = int(os.environ.get('OCR_MAX_CONCURRENCY', os.cpu_count() or 2))  # analyses simultanées
+    OCR_INTERACTIVE_RESERVED = int(os.environ.get('OCR_INTERACTIVE_RESERVED', 1))  # créneaux jamais pris par le batch
+    OCR_MAX_QUEUE = int(os.environ.get('OCR_MAX_QUEUE', 32))                     # requêtes interactives en attente (sinon 429)
+    OCR_INTERACTIVE_MAX_WAIT = float(os.environ.get('OCR_INTERACTIVE_MAX_WAIT', 30))  # secondes (sinon 503)
+    
+    # Qualité adaptative: sous charge, les requêtes interactives passent en mode moins coûteux
+    # (file interactive en attente OU p95 de latence sur la dernière minute au-dessus du seuil)
+    OCR_ADAPTIVE_QUALITY = os.environ.get('OCR_ADAPTIVE_QUALITY', 'true').lower() == 'true'
+    OCR_DEGRADE_QUEUE = int(os.environ.get('OCR_DEGRADE_QUEUE', 4))               # approfondi → rapide
+    OCR_DEGRADE_P95_MS = int(os.environ.get('OCR_DEGRADE_P95_MS', 8000))
+    OCR_ECONOMY_QUEUE = int(os.environ.get('OCR_ECONOMY_QUEUE', 12))              # → economique (moins de variantes, sans EasyOCR)
+    OCR_ECONOMY_P95_MS = int(os.environ.get('OCR_ECONOMY_P95_MS', 20000))
+    
+    # Analyse anticipée à l'upload (champ 'entite' fourni): priorité batch, abandonnée si
+    # aucun /api/analyser ne la réclame dans ANALYSE_ANTICIPEE_TTL secondes
+    ANALYSE_ANTICIPEE = os.environ.get('ANALYSE_ANTICIPEE', 'true').lower() == 'true'
+    ANALYSE_ANTICIPEE_TTL = float(os.environ.get('ANALYSE_ANTICIPEE_TTL', 120))
+    ANALYSE_ANTICIPEE_WORKERS = int(os.environ.get('ANALYSE_ANTICIPEE_WORKERS', 2))
+    # Un gros lot n'est anticipé que sur ses premières images/pages (le reste attendrait au-delà du TTL)
+    ANALYSE_ANTICIPEE_MAX_PAR_UPLOAD = int(os.environ.get('ANALYSE_ANTICIPEE_MAX_PAR_UPLOAD', 16))
+    
+    # Index des quasi-doublons (empreinte perceptuelle des scans récemment analysés)
+    NEAR_DUPLICATE_INDEX = os.environ.get('NEAR_DUPLICATE_INDEX', 'true').lower() == 'true'
+    NEAR_DUPLICATE_MAX_ENTRIES = int(os.environ.get('NEAR_DUPLICATE_MAX_ENTRIES', 512))
+    NEAR_DUPLICATE_THRESHOLD = int(os.environ.get('NEAR_DUPLICATE_THRESHOLD', 6))             # bits différents / 64
+    NEAR_DUPLICATE_ZONE_THRESHOLD = int(os.environ.get('NEAR_DUPLICATE_ZONE_THRESHOLD', 4))   # bits différents / 256
+    
+    # Normalisation des images à l'upload (/api/upload, /api/upload-batch): orientation EXIF,
+    # mode canonique, niveaux de gris précalculés; résolution effective plafonnée à INGEST_MAX_DPI
+    # pour la taille du document de l'entité visée, sinon à INGEST_MAX_PIXELS
+    INGEST_NORMALIZE = os.environ.get('INGEST_NORMALIZE', 'true').lower() == 'true'
+    INGEST_MAX_DPI = int(os.environ.get('INGEST_MAX_DPI', 400))
+    INGEST_MAX_PIXELS = int(os.environ.get('INGEST_MAX_PIXELS', 9_000_000))   # ~A4 à 300 DPI
+    
+    # Uploads par morceaux reprenables (/api/upload-session): gros lots, PDF volumineux
+    UPLOAD_SESSION_MAX_FILES = int(os.environ.get('UPLOAD_SESSION_MAX_FILES', 1000))
+    UPLOAD_SESSION_MAX_FILE_BYTES = int(os.environ.get('UPLOAD_SESSION_MAX_FILE_BYTES', 200 * 1024 * 1024))
+    UPLOAD_CHUNK_MAX_BYTES = int(os.environ.get('UPLOAD_CHUNK_MAX_BYTES', 16 * 1024 * 1024))    # par PUT
+    UPLOAD_SESSION_IDLE_TIMEOUT = int(os.environ.get('UPLOAD_SESSION_IDLE_TIMEOUT', 24 * 3600))  # secondes sans morceau: envoi expiré
+    
+    # /api/v1/extract/cni: analyse en mémoire; True = conserver le fichier reçu dans uploads_temp (débogage)
+    CNI_DEBUG_RETENTION = os.environ.get('CNI_DEBUG_RETENTION', 'false').lower() == 'true'
+    
+    # Nettoyage des fichiers temporaires (uploads_temp + exports JSON de UPLOAD_FOLDER):
+    # TTL par classe depuis le dernier accès, puis éviction LRU au-delà du quota
+    TEMP_JANITOR_ENABLED = os.environ.get('TEMP_JANITOR_ENABLED', 'true').lower() == 'true'
+    TEMP_JANITOR_INTERVAL = int(os.environ.get('TEMP_JANITOR_INTERVAL', 300))          # secondes entre deux passes
+    TEMP_TTL_UPLOAD = int(os.environ.get('TEMP_TTL_UPLOAD', 24 * 3600))                # ocr_*, inv_*, detect_*, cas_* (dépôt par contenu)
+    TEMP_TTL_ENTITE = int(os.environ.get('TEMP_TTL_ENTITE', 7 * 24 * 3600))            # temp_entite_*, temp_template_*
+    TEMP_TTL_DERIVE = int(os.environ.get('TEMP_TTL_DERIVE', 3600))                     # crop_*, cropped_*, _optimizer_crop_*...
+    TEMP_TTL_CNI = int(os.environ.get('TEMP_TTL_CNI', 7 * 24 * 3600))                  # cni_direct_* (rétention de débogage)
+    TEMP_TTL_EXPORT = int(os.environ.get('TEMP_TTL_EXPORT', 3600))                     # export_*.json, facture_*.json
+    TEMP_DISK_QUOTA_BYTES = int(os.environ.get('TEMP_DISK_QUOTA_BYTES', 2 * 1024 * 1024 * 1024))
+    TEMP_SESSION_ACTIVE = int(os.environ.get('TEMP_SESSION_ACTIVE', 2 * 3600))         # fichiers d'une session vue récemment: protégés
+    
     # Tesseract path if needed (windows)
     # TESSERACT_CMD = r'C:\\Program Files\\Tesseract-OCR\\tesseract.exe'
@@ -0,0 +1,5 @@
+"""Configuration pytest: le paquet `app` est importé depuis backend/app_ocr."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,83 @@
+"""Tests des analyses anticipées à l'upload (réclamation, expiration paresseuse)."""
+import threading
+import time
+
+from app.services.analyses_anticipees import AnalysesAnticipees
+
+
+def attendre(condition, delai=5.0):
+    limite = time.monotonic() + delai
+    while not condition():
+        assert time.monotonic() < limite, "condition jamais atteinte"
+        time.sleep(0.01)
+
+
+class Analyse:
+    """Analyse qui occupe son worker jusqu'à être relâchée (ou annulée)."""
+
+    def __init__(self):
+        self.relache = threading.Event()
+        self.executions = []
+
+    def __call__(self, anticipation):
+        self.executions.append(anticipation.cle)
+        anticipation.demarrer()
+        while not self.relache.wait(0.01):
+            anticipation.jeton.verifier()
+
+
+def test_aucun_thread_de_minuterie_par_anticipation():
+    anticipations = AnalysesAnticipees(ttl=60, max_workers=1)
+    analyse = Analyse()
+    avant = threading.active_count()
+    for i in range(50):
+        assert anticipations.lancer(f"cle{i}", analyse)
+    # Le seul thread créé est le worker du pool
+    assert threading.active_count() <= avant + 1
+    analyse.relache.set()
+
+
+def test_reclamation_selon_l_etat():
+    anticipations = AnalysesAnticipees(ttl=60, max_workers=1)
+    analyse = Analyse()
+    anticipations.lancer('en_cours', analyse)
+    anticipations.lancer('en_file', analyse)
+    attendre(lambda: analyse.executions == ['en_cours'])
+
+    assert anticipations.reclamer('en_cours') == 'en_cours'
+    assert anticipations.reclamer('en_file') == 'en_attente'  # Annulée: la requête calcule elle-même
+    assert anticipations.reclamer('inconnue') is None
+    analyse.relache.set()
+    time.sleep(0.1)
+    assert analyse.executions == ['en_cours']
+    assert anticipations.stats()['servies'] == 1 and anticipations.stats()['reprises'] == 1
+
+
+def test_expiration_paresseuse_des_anticipations_non_reclamees():
+    anticipations = AnalysesAnticipees(ttl=0.2, max_workers=1)
+    analyse = Analyse()
+    anticipations.lancer('a', analyse)
+    anticipations.lancer('b', analyse)  # Reste en file derrière 'a'
+    attendre(lambda: analyse.executions == ['a'])
+    time.sleep(0.25)
+
+    stats = anticipations.stats()
+    assert stats['abandonnees'] == 2
+    assert stats['en_attente_de_reclamation'] == {}
+    # 'a' interrompue par son jeton; 'b', échue en file, n'est jamais exécutée
+    time.sleep(0.2)
+    assert analyse.executions == ['a']
+    assert anticipations.reclamer('a') is None
+
+
+def test_anticipation_echue_en_file_non_executee_sans_autre_appel():
+    anticipations = AnalysesAnticipees(ttl=0.1, max_workers=1)
+    analyse = Analyse()
+    anticipations.lancer('a', analyse)
+    anticipations.lancer('b', analyse)
+    attendre(lambda: analyse.executions == ['a'])
+    time.sleep(0.15)
+    analyse.relache.set()  # Le worker se libère: 'b' a dépassé son TTL en file
+    time.sleep(0.2)
+    assert analyse.executions == ['a']
+    assert anticipations.compteurs['abandonnees'] >= 1
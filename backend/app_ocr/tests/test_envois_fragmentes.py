@@ -0,0 +1,78 @@
+"""Tests des envois par morceaux (reprise, concurrence entre process, verrous)."""
+import io
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from app.services.depot_contenu import DepotContenu
+from app.services.envois_fragmentes import DecalageEnvoi, EnvoisFragmentes
+
+TAILLE = 64 * 1024
+
+
+class FluxLent(io.BytesIO):
+    """Corps de requête qui arrive lentement (client lent, réseau)."""
+
+    def read(self, taille=-1):
+        time.sleep(0.02)
+        return super().read(min(taille, 4096))
+
+
+@pytest.fixture
+def envois(tmp_path):
+    return EnvoisFragmentes(str(tmp_path), DepotContenu(str(tmp_path)))
+
+
+def _ecrire_concurrent(dossier, upload_id, resultats):
+    envois = EnvoisFragmentes(dossier, DepotContenu(dossier))
+    envoi = envois.charger(upload_id)
+    try:
+        envois.ecrire(envoi, 0, 0, FluxLent(b'a' * 16384), 16384)
+        resultats.put('ecrit')
+    except DecalageEnvoi as e:
+        resultats.put(e.recu)
+
+
+def test_reprise_a_l_offset_recu(envois):
+    envoi = envois.creer([{'nom': 'doc.pdf', 'taille': 10}])
+    assert envois.ecrire(envoi, 0, 0, io.BytesIO(b'0123'), 4) == (4, None)
+    with pytest.raises(DecalageEnvoi) as erreur:
+        envois.ecrire(envoi, 0, 0, io.BytesIO(b'0123'), 4)
+    assert erreur.value.recu == 4
+    recu, termine = envois.ecrire(envoi, 0, 4, io.BytesIO(b'456789'), 6)
+    assert recu == 10 and termine is not None
+    with open(envois.alias(envoi, 0), 'rb') as f:
+        assert f.read() == b'0123456789'
+
+
+def test_meme_morceau_sur_deux_process_ecrit_une_fois(envois):
+    envoi = envois.creer([{'nom': 'scan.pdf', 'taille': TAILLE}])
+    contexte = multiprocessing.get_context('fork')
+    resultats = contexte.Queue()
+    process = [contexte.Process(target=_ecrire_concurrent, args=(envois.dossier, envoi['upload_id'], resultats))
+               for _ in range(3)]
+    for p in process:
+        p.start()
+    for p in process:
+        p.join(30)
+    issues = sorted((resultats.get(timeout=5) for _ in process), key=str)
+    assert issues == [16384, 16384, 'ecrit']
+    assert envois.recu(envoi, 0) == 16384
+
+
+def test_verrous_liberes_sans_finalisation(envois):
+    envoi = envois.creer([{'nom': 'a.jpg', 'taille': 8}, {'nom': 'b.jpg', 'taille': 8}])
+    envois.ecrire(envoi, 0, 0, io.BytesIO(b'abcd'), 4)
+    with pytest.raises(DecalageEnvoi):
+        envois.ecrire(envoi, 1, 2, io.BytesIO(b'abcd'), 4)
+    # Envoi laissé à l'expiration: aucun verrou conservé en mémoire
+    assert envois._verrous == {}
+
+
+def test_finalisation_supprime_les_fichiers_verrou(envois):
+    envoi = envois.creer([{'nom': 'a.jpg', 'taille': 4}])
+    envois.ecrire(envoi, 0, 0, io.BytesIO(b'abcd'), 4)
+    envois.finaliser(envoi)
+    assert not [nom for nom in os.listdir(envois.dossier) if nom.endswith('.verrou')]
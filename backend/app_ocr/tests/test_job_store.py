@@ -0,0 +1,165 @@
+"""Tests du stockage des jobs batch: reprise des jobs orphelins, fichiers restants, annulation."""
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from app.services.job_store import JobStore, proprietaire_courant
+
+FICHIERS = [('a.jpg', '/tmp/a.jpg'), ('b.jpg', '/tmp/b.jpg'), ('c.jpg', '/tmp/c.jpg')]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.sqlite3'), delai_orphelin=60)
+
+
+def pid_mort():
+    """PID d'un process de cette machine qui vient de se terminer."""
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def changer_proprietaire(store, job_id, proprietaire, age_battement=0):
+    with store._connexion() as conn:
+        conn.execute(
+            "UPDATE jobs SET proprietaire = ?, battement = ? WHERE job_id = ?",
+            (proprietaire, time.time() - age_battement, job_id)
+        )
+
+
+def lire_battement(store, job_id):
+    with store._connexion() as conn:
+        return conn.execute("SELECT battement FROM jobs WHERE job_id = ?", (job_id,)).fetchone()[0]
+
+
+def job_interrompu(store, job_id='job1'):
+    """Job de 3 fichiers: le premier terminé, le deuxième en cours d'analyse."""
+    store.creer(job_id, 'batch', FICHIERS, {'entity': 'cni'}, workers=2)
+    store.demarrer_fichier(job_id, 0, 'a.jpg')
+    store.terminer_fichier(job_id, 0, {'success': True, 'filename': 'a.jpg'})
+    store.demarrer_fichier(job_id, 1, 'b.jpg')
+    return job_id
+
+
+def test_job_du_process_courant_non_reclame(store):
+    job_interrompu(store)
+    assert store.reclamer_orphelins() == []
+
+
+def test_process_mort_de_la_machine_reclame(store):
+    job_id = job_interrompu(store)
+    changer_proprietaire(store, job_id, f"{socket.gethostname()}:{pid_mort()}")
+
+    assert store.reclamer_orphelins() == [job_id]
+    job = store.job(job_id)
+    assert job['status'] == 'running'
+    assert job['en_cours'] == []  # Le fichier interrompu repasse en attente
+    assert store.fichiers_restants(job_id) == [(1, 'b.jpg', '/tmp/b.jpg'), (2, 'c.jpg', '/tmp/c.jpg')]
+    with store._connexion() as conn:
+        assert conn.execute("SELECT proprietaire FROM jobs").fetchone()[0] == proprietaire_courant()
+    # Déjà réclamé: plus rien à reprendre
+    assert store.reclamer_orphelins() == []
+
+
+def test_autre_machine_reclamee_seulement_sans_battement(store):
+    job_id = job_interrompu(store)
+    changer_proprietaire(store, job_id, 'autre-serveur:1234', age_battement=10)
+    assert store.reclamer_orphelins() == []
+
+    changer_proprietaire(store, job_id, 'autre-serveur:1234', age_battement=120)
+    assert store.reclamer_orphelins() == [job_id]
+
+
+def test_process_vivant_avec_battement_non_reclame(store):
+    job_id = job_interrompu(store)
+    # PID 1 existe toujours sur la machine
+    changer_proprietaire(store, job_id, f"{socket.gethostname()}:1", age_battement=10)
+    assert store.reclamer_orphelins() == []
+
+
+def test_process_vivant_sans_battement_recent_non_reclame(store):
+    job_id = job_interrompu(store)
+    # Job en attente (créneau OCR, upload en cours) depuis plus de delai_orphelin: son process vit
+    changer_proprietaire(store, job_id, f"{socket.gethostname()}:{os.getppid()}", age_battement=301)
+    assert store.reclamer_orphelins() == []
+
+
+def test_battre_rafraichit_sans_reprendre_un_job_repris(store, monkeypatch):
+    job_id = job_interrompu(store)
+    changer_proprietaire(store, job_id, proprietaire_courant(), age_battement=120)
+    store.battre(job_id)
+    assert time.time() - lire_battement(store, job_id) < 5
+
+    # Écriture limitée à une toutes les BATTEMENT_TOUTES_LES secondes
+    changer_proprietaire(store, job_id, proprietaire_courant(), age_battement=120)
+    store.battre(job_id)
+    assert time.time() - lire_battement(store, job_id) > 100
+
+    # Job repris par une autre machine: l'ancien exécuteur ne le revendique pas
+    monkeypatch.setattr(store, 'BATTEMENT_TOUTES_LES', 0)
+    changer_proprietaire(store, job_id, 'autre-serveur:1', age_battement=120)
+    store.battre(job_id)
+    assert time.time() - lire_battement(store, job_id) > 100
+
+
+def test_jobs_termines_non_reclames(store):
+    job_id = job_interrompu(store)
+    store.terminer_job(job_id, 'cancelled')
+    changer_proprietaire(store, job_id, f"{socket.gethostname()}:{pid_mort()}")
+    assert store.reclamer_orphelins() == []
+
+
+def test_reprise_continue_la_numerotation_et_garde_les_resultats(store):
+    job_id = job_interrompu(store)
+    changer_proprietaire(store, job_id, 'autre-serveur:1', age_battement=120)
+    store.reclamer_orphelins()
+
+    # Le fichier déjà terminé par l'ancien propriétaire n'est pas recompté
+    assert store.terminer_fichier(job_id, 0, {'success': True, 'filename': 'a.jpg'}) is None
+    for idx, filename, _ in store.fichiers_restants(job_id):
+        store.demarrer_fichier(job_id, idx, filename)
+        store.terminer_fichier(job_id, idx, {'success': idx != 2, 'filename': filename})
+    store.terminer_job(job_id)
+
+    job = store.job(job_id)
+    assert (job['status'], job['completed'], job['reussis'], job['echoues']) == ('done', 3, 2, 1)
+    assert [r['filename'] for r in store.resultats(job_id)] == ['a.jpg', 'b.jpg', 'c.jpg']
+    assert [seq for seq, _ in store.resultats(job_id, offset=1, avec_seq=True)] == [2, 3]
+
+
+def test_annulation_visible_apres_reprise(store):
+    job_id = job_interrompu(store)
+    assert store.demander_annulation(job_id)
+    changer_proprietaire(store, job_id, 'autre-serveur:1', age_battement=120)
+    assert store.reclamer_orphelins() == [job_id]
+    assert store.annulation_demandee(job_id)
+    store.terminer_job(job_id, 'cancelled')
+    assert store.demander_annulation(job_id) is False
+
+
+def _reclamer(chemin_db, depart, fin, resultats):
+    store = JobStore(chemin_db)
+    depart.wait()
+    resultats.put(store.reclamer_orphelins())
+    fin.wait()  # Vivant jusqu'à la fin des autres: son job réclamé ne redevient pas orphelin
+
+
+def test_un_seul_process_reclame_un_job(store):
+    job_id = job_interrompu(store)
+    changer_proprietaire(store, job_id, 'autre-serveur:1', age_battement=3600)
+    contexte = multiprocessing.get_context('fork')
+    resultats = contexte.Queue()
+    depart, fin = contexte.Barrier(4), contexte.Barrier(4)
+    process = [contexte.Process(target=_reclamer, args=(store.chemin_db, depart, fin, resultats)) for _ in range(4)]
+    for p in process:
+        p.start()
+    for p in process:
+        p.join(30)
+    reclames = [resultats.get(timeout=5) for _ in process]
+    assert sorted(reclames) == [[], [], [], [job_id]]
@@ -0,0 +1,192 @@
+"""Tests du nettoyeur des fichiers temporaires (TTL, quota LRU, protections, dépôt par contenu)."""
+import os
+import time
+
+import pytest
+
+from app.services.nettoyage_temporaires import NettoyeurTemporaires, classe_fichier
+
+HEURE = 3600
+
+
+def ecrire(dossier, nom, taille=100, age=0):
+    chemin = os.path.join(dossier, nom)
+    with open(chemin, 'wb') as f:
+        f.write(b'x' * taille)
+    vieillir(chemin, age)
+    return chemin
+
+
+def vieillir(chemin, age):
+    date = time.time() - age
+    os.utime(chemin, (date, date))
+
+
+@pytest.fixture
+def dossier(tmp_path):
+    return str(tmp_path)
+
+
+def nettoyeur(dossier, **options):
+    options.setdefault('age_min', 0)
+    return NettoyeurTemporaires(dossier, **options)
+
+
+def test_classes_fichiers():
+    assert classe_fichier('ocr_1_scan.jpg') == 'upload'
+    assert classe_fichier('crop_ab12.jpg') == 'derive'
+    assert classe_fichier('cas_abcdef.jpg') == 'contenu'
+    assert classe_fichier('jobs.sqlite3-wal') == 'systeme'
+    assert classe_fichier('logo.png') == 'autre'
+
+
+def test_expiration_ttl_par_classe(dossier):
+    ancien = ecrire(dossier, 'crop_ancien.jpg', age=2 * HEURE)
+    recent = ecrire(dossier, 'crop_recent.jpg', age=60)
+    upload = ecrire(dossier, 'ocr_1_scan.jpg', age=2 * HEURE)  # TTL upload: 24 h
+
+    resume = nettoyeur(dossier).passe()
+
+    assert not os.path.exists(ancien)
+    assert os.path.exists(recent)
+    assert os.path.exists(upload)
+    assert resume['supprimes']['ttl'] == {'fichiers': 1, 'octets': 100}
+
+
+def test_fichiers_systeme_et_inconnus_jamais_supprimes(dossier):
+    base = ecrire(dossier, 'jobs.sqlite3', age=30 * 24 * HEURE)
+    inconnu = ecrire(dossier, 'logo.png', taille=10_000, age=30 * 24 * HEURE)
+
+    nettoyeur(dossier, quota_octets=0).passe()
+
+    assert os.path.exists(base)
+    assert os.path.exists(inconnu)
+
+
+def test_age_minimum_protege_les_ecritures_en_cours(dossier):
+    chemin = ecrire(dossier, 'crop_en_cours.jpg', age=10)
+
+    NettoyeurTemporaires(dossier, ttl={'derive': 0}, quota_octets=0, age_min=60).passe()
+
+    assert os.path.exists(chemin)
+
+
+def test_quota_evince_les_moins_recemment_utilises(dossier):
+    plus_ancien = ecrire(dossier, 'ocr_a.jpg', taille=400, age=3 * HEURE)
+    ancien = ecrire(dossier, 'ocr_b.jpg', taille=400, age=2 * HEURE)
+    recent = ecrire(dossier, 'ocr_c.jpg', taille=400, age=HEURE)
+
+    resume = nettoyeur(dossier, quota_octets=900).passe()
+
+    assert not os.path.exists(plus_ancien)
+    assert os.path.exists(ancien)
+    assert os.path.exists(recent)
+    assert resume['supprimes']['quota'] == {'fichiers': 1, 'octets': 400}
+    assert resume['octets_detenus'] == 800
+
+
+def test_toucher_rend_recent_sans_changer_la_date_de_modification(dossier):
+    touche = ecrire(dossier, 'ocr_a.jpg', taille=400, age=3 * HEURE)
+    autre = ecrire(dossier, 'ocr_b.jpg', taille=400, age=2 * HEURE)
+    mtime = os.stat(touche).st_mtime_ns
+
+    n = nettoyeur(dossier, quota_octets=500)
+    n.toucher(touche)
+    n.passe()
+
+    assert os.stat(touche).st_mtime_ns == mtime  # Empreintes mémorisées (inode, mtime) préservées
+    assert os.path.exists(touche)
+    assert not os.path.exists(autre)
+
+
+def test_fichiers_des_jobs_actifs_proteges(dossier):
+    job = ecrire(dossier, 'ocr_job.jpg', age=48 * HEURE)
+    libre = ecrire(dossier, 'ocr_libre.jpg', age=48 * HEURE)
+
+    nettoyeur(dossier, chemins_proteges=lambda: [job]).passe()
+
+    assert os.path.exists(job)
+    assert not os.path.exists(libre)
+
+
+def test_passe_annulee_sans_liste_des_jobs(dossier):
+    chemin = ecrire(dossier, 'ocr_a.jpg', age=48 * HEURE)
+
+    def indisponible():
+        raise RuntimeError("job store verrouillé")
+
+    resume = nettoyeur(dossier, chemins_proteges=indisponible).passe()
+
+    assert os.path.exists(chemin)
+    assert resume['proteges'] is None
+
+
+def test_marques_de_session_partagees_entre_process(dossier):
+    chemin_db = os.path.join(dossier, 'nettoyage.sqlite3')
+    session = ecrire(dossier, 'ocr_session.jpg', age=48 * HEURE)
+    libre = ecrire(dossier, 'ocr_libre.jpg', age=48 * HEURE)
+
+    # Deux workers: la session est vue par le premier, le nettoyage passe dans le second
+    worker_a = nettoyeur(dossier, chemin_db=chemin_db)
+    worker_b = nettoyeur(dossier, chemin_db=chemin_db, quota_octets=0)
+    worker_a.marquer_session(session)
+    worker_b.passe()
+
+    assert os.path.exists(session)
+    assert not os.path.exists(libre)
+
+
+def test_marque_de_session_expiree_ne_protege_plus(dossier):
+    chemin_db = os.path.join(dossier, 'nettoyage.sqlite3')
+    chemin = ecrire(dossier, 'ocr_session.jpg', age=48 * HEURE)
+
+    worker_a = nettoyeur(dossier, chemin_db=chemin_db, fenetre_session=1)
+    worker_a.marquer_session(chemin)
+    time.sleep(1.1)
+    nettoyeur(dossier, chemin_db=chemin_db, fenetre_session=1).passe()
+
+    assert not os.path.exists(chemin)
+
+
+def test_objet_du_depot_conserve_tant_qu_un_alias_existe(dossier):
+    objet = ecrire(dossier, 'cas_abc.jpg', age=48 * HEURE)
+    alias = os.path.join(dossier, 'ocr_1_scan.jpg')
+    os.link(objet, alias)
+    vieillir(objet, 48 * HEURE)
+
+    # Alias protégé (session): l'objet expiré reste
+    nettoyeur(dossier, chemins_proteges=lambda: [alias]).passe()
+    assert os.path.exists(objet)
+
+    # Alias expiré: supprimé d'abord, puis l'objet dans la même passe
+    resume = nettoyeur(dossier).passe()
+    assert not os.path.exists(alias)
+    assert not os.path.exists(objet)
+    assert resume['supprimes']['ttl'] == {'fichiers': 2, 'octets': 100}
+
+
+def test_liens_physiques_comptes_une_fois_dans_le_quota(dossier):
+    objet = ecrire(dossier, 'cas_abc.jpg', taille=600, age=HEURE)
+    for n in range(3):
+        os.link(objet, os.path.join(dossier, f"ocr_{n}_scan.jpg"))
+    vieillir(objet, HEURE)
+
+    resume = nettoyeur(dossier, quota_octets=1000).passe()
+
+    assert resume['supprimes']['quota']['fichiers'] == 0
+    assert resume['octets_detenus'] == 600
+
+
+def test_quota_libere_un_contenu_avec_son_dernier_alias(dossier):
+    objet = ecrire(dossier, 'cas_abc.jpg', taille=600, age=HEURE)
+    alias = os.path.join(dossier, 'ocr_1_scan.jpg')
+    os.link(objet, alias)
+    vieillir(objet, HEURE)
+    recent = ecrire(dossier, 'ocr_2_autre.jpg', taille=600, age=60)
+
+    resume = nettoyeur(dossier, quota_octets=700).passe()
+
+    assert not os.path.exists(alias)
+    assert not os.path.exists(objet)
+    assert os.path.exists(recent)
+    assert resume['supprimes']['quota'] == {'fichiers': 2, 'octets': 600}
@@ -0,0 +1,198 @@
+"""Tests de l'ordonnanceur OCR (réserve interactive, refus 429/503, partage pondéré, annulation)."""
+import threading
+import time
+
+import pytest
+
+from app.services.ordonnanceur import OrdonnanceurOCR, SurchargeOCR
+from app.utils.annulation import AnalyseAnnulee, JetonAnnulation
+
+
+def attendre(condition, delai=5.0):
+    limite = time.monotonic() + delai
+    while not condition():
+        assert time.monotonic() < limite, "condition jamais atteinte"
+        time.sleep(0.01)
+
+
+def en_attente(ordonnanceur, classe):
+    return ordonnanceur.stats()['en_attente'][classe]
+
+
+def lancer(cible, *args):
+    thread = threading.Thread(target=cible, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_reserve_interactive_jamais_prise_par_le_batch():
+    ordonnanceur = OrdonnanceurOCR(capacite=2, reserve_interactive=1)
+    batch = ordonnanceur.acquerir('batch', 'job1')
+    obtenus = []
+    attente = lancer(lambda: obtenus.append(ordonnanceur.acquerir('batch', 'job2')))
+    attendre(lambda: en_attente(ordonnanceur, 'batch') == 1)
+
+    # Le créneau restant est réservé: l'interactif l'obtient sans attendre
+    interactif = ordonnanceur.acquerir('interactive')
+    assert ordonnanceur.stats()['actifs'] == {'interactive': 1, 'batch': 1}
+    ordonnanceur.liberer(interactif)
+    time.sleep(0.1)
+    assert obtenus == []  # Toujours pas de second créneau batch
+
+    ordonnanceur.liberer(batch)
+    attente.join(5)
+    assert len(obtenus) == 1
+    ordonnanceur.liberer(obtenus[0])
+    assert ordonnanceur.stats()['actifs'] == {'interactive': 0, 'batch': 0}
+
+
+def test_interactif_prioritaire_sur_le_batch_en_attente():
+    ordonnanceur = OrdonnanceurOCR(capacite=1, reserve_interactive=0)
+    occupe = ordonnanceur.acquerir('interactive')
+    ordre = []
+
+    def demander(classe, groupe=None):
+        with ordonnanceur.creneau(classe, groupe):
+            ordre.append(classe)
+
+    batch = lancer(demander, 'batch', 'job1')
+    attendre(lambda: en_attente(ordonnanceur, 'batch') == 1)
+    interactif = lancer(demander, 'interactive')
+    attendre(lambda: en_attente(ordonnanceur, 'interactive') == 1)
+    ordonnanceur.liberer(occupe)
+    batch.join(5)
+    interactif.join(5)
+    assert ordre == ['interactive', 'batch']
+
+
+def test_file_interactive_pleine_429_avec_retry_after():
+    ordonnanceur = OrdonnanceurOCR(capacite=1, profondeur_max=1, attente_max=10)
+    occupe = ordonnanceur.acquerir('interactive')
+    servis = []
+
+    def demander():
+        with ordonnanceur.creneau('interactive'):
+            servis.append(True)
+
+    attente = lancer(demander)
+    attendre(lambda: en_attente(ordonnanceur, 'interactive') == 1)
+
+    with pytest.raises(SurchargeOCR) as refus:
+        ordonnanceur.acquerir('interactive')
+    assert refus.value.code == 429
+    assert refus.value.retry_after >= 1
+    assert ordonnanceur.stats()['refus']['file_pleine'] == 1
+
+    # La demande déjà en file n'est pas affectée par le refus
+    ordonnanceur.liberer(occupe)
+    attente.join(5)
+    assert len(servis) == 1
+
+
+def test_attente_max_depassee_503_et_retrait_de_la_file():
+    ordonnanceur = OrdonnanceurOCR(capacite=1, attente_max=0.2)
+    occupe = ordonnanceur.acquerir('interactive')
+    debut = time.monotonic()
+    with pytest.raises(SurchargeOCR) as refus:
+        ordonnanceur.acquerir('interactive')
+    assert time.monotonic() - debut >= 0.2
+    assert refus.value.code == 503
+    assert refus.value.retry_after >= 1
+    stats = ordonnanceur.stats()
+    assert stats['refus']['attente_max'] == 1
+    assert stats['en_attente']['interactive'] == 0
+    ordonnanceur.liberer(occupe)
+
+
+def test_retry_after_suit_la_duree_des_analyses():
+    ordonnanceur = OrdonnanceurOCR(capacite=1, attente_max=0.05)
+    ticket = ordonnanceur.acquerir('interactive')
+    ticket.arrivee -= 7.5  # Analyse de 7,5 secondes
+    ordonnanceur.liberer(ticket)
+    occupe = ordonnanceur.acquerir('interactive')
+    with pytest.raises(SurchargeOCR) as refus:
+        ordonnanceur.acquerir('interactive')
+    assert refus.value.retry_after == 8  # Arrondi supérieur: une analyse de 7,5 s devant, un créneau
+    ordonnanceur.liberer(occupe)
+
+
+def test_partage_pondere_entre_groupes_batch():
+    ordonnanceur = OrdonnanceurOCR(capacite=1, reserve_interactive=0)
+    occupe = ordonnanceur.acquerir('interactive')
+    ordre = []
+
+    def demander(groupe, poids):
+        with ordonnanceur.creneau('batch', groupe, poids):
+            ordre.append(groupe)
+
+    threads = [lancer(demander, 'lourd', 2) for _ in range(6)]
+    attendre(lambda: en_attente(ordonnanceur, 'batch') == 6)
+    threads += [lancer(demander, 'leger', 1) for _ in range(6)]
+    attendre(lambda: en_attente(ordonnanceur, 'batch') == 12)
+    ordonnanceur.liberer(occupe)
+    for thread in threads:
+        thread.join(5)
+
+    assert len(ordre) == 12
+    # Poids 2 contre 1: deux créneaux pour un tant que les deux groupes attendent
+    assert ordre[:9].count('lourd') == 6
+    assert ordre[:9].count('leger') == 3
+    assert ordonnanceur.stats()['groupes_batch'] == {}
+
+
+def test_nouveau_groupe_ne_rattrape_pas_l_historique():
+    ordonnanceur = OrdonnanceurOCR(capacite=1, reserve_interactive=0)
+    for _ in range(5):
+        ordonnanceur.liberer(ordonnanceur.acquerir('batch', 'ancien'))
+    occupe = ordonnanceur.acquerir('batch', 'ancien')
+    ordre = []
+
+    def demander(groupe):
+        with ordonnanceur.creneau('batch', groupe):
+            ordre.append(groupe)
+
+    threads = [lancer(demander, 'ancien') for _ in range(3)]
+    attendre(lambda: en_attente(ordonnanceur, 'batch') == 3)
+    threads += [lancer(demander, 'nouveau') for _ in range(3)]
+    attendre(lambda: en_attente(ordonnanceur, 'batch') == 6)
+    ordonnanceur.liberer(occupe)
+    for thread in threads:
+        thread.join(5)
+    # Alternance, pas trois créneaux d'affilée au nouveau groupe
+    assert ordre[:4].count('nouveau') == 2
+
+
+def test_annulation_pendant_l_attente():
+    ordonnanceur = OrdonnanceurOCR(capacite=1, reserve_interactive=0)
+    occupe = ordonnanceur.acquerir('batch', 'job1')
+    jeton = JetonAnnulation()
+    erreurs = []
+
+    def demander():
+        try:
+            ordonnanceur.acquerir('batch', 'job2', annulation=jeton)
+        except AnalyseAnnulee as e:
+            erreurs.append(e)
+
+    attente = lancer(demander)
+    attendre(lambda: en_attente(ordonnanceur, 'batch') == 1)
+    jeton.annuler('job supprimé')
+    attente.join(5)
+
+    assert len(erreurs) == 1 and str(erreurs[0]) == 'job supprimé'
+    stats = ordonnanceur.stats()
+    assert stats['en_attente']['batch'] == 0
+    assert 'job2' not in stats['groupes_batch']
+    assert stats['accordes']['batch'] == 1
+    ordonnanceur.liberer(occupe)
+    # Le créneau libéré n'est pas attribué à la demande annulée
+    assert ordonnanceur.stats()['actifs'] == {'interactive': 0, 'batch': 0}
+
+
+def test_refus_attente_hors_ordonnanceur():
+    ordonnanceur = OrdonnanceurOCR(capacite=1)
+    occupe = ordonnanceur.acquerir('interactive')
+    refus = ordonnanceur.refus_attente()
+    assert (refus.code, refus.retry_after >= 1) == (503, True)
+    assert ordonnanceur.stats()['refus']['attente_max'] == 1
+    ordonnanceur.liberer(occupe)
@@ -0,0 +1,178 @@
+"""Tests du regroupement des calculs identiques simultanés (SingleFlight)."""
+import threading
+import time
+
+import pytest
+
+from app.utils.annulation import AnalyseAnnulee, JetonAnnulation
+from app.utils.cache_utils import AttenteDepassee, SingleFlight
+
+
+class CalculBloque:
+    """Calcul qui attend d'être relâché (pour avoir des appels simultanés)."""
+
+    def __init__(self, resultat=None, erreur=None):
+        self.resultat = resultat
+        self.erreur = erreur
+        self.appels = 0
+        self.demarre = threading.Event()
+        self.relache = threading.Event()
+
+    def __call__(self, flight=None):
+        self.appels += 1
+        if flight is not None:
+            flight.demarrer()  # Ressources obtenues (créneau OCR)
+        self.demarre.set()
+        self.relache.wait(5)
+        if self.erreur is not None:
+            raise self.erreur
+        return self.resultat
+
+
+def lancer_appels(flight, cle, fonction, nombre):
+    """Lance `nombre` appels simultanés; `issues` reçoit leurs (resultat, coalesce) ou exceptions."""
+    issues = [None] * nombre
+
+    def appeler(i):
+        try:
+            issues[i] = flight.executer(cle, fonction)
+        except BaseException as e:
+            issues[i] = e
+
+    threads = [threading.Thread(target=appeler, args=(i,)) for i in range(nombre)]
+    for thread in threads:
+        thread.start()
+    return threads, issues
+
+
+def attendre_coalescees(flight, nombre):
+    limite = time.monotonic() + 5
+    while flight.stats()['coalescees'] < nombre:
+        assert time.monotonic() < limite
+        time.sleep(0.01)
+
+
+def scenario(calcul, suiveurs):
+    """Un meneur lance le calcul, `suiveurs` appels le rejoignent, puis le calcul se termine."""
+    flight = SingleFlight()
+    meneur, issue_meneur = lancer_appels(flight, 'image:plan', calcul, 1)
+    calcul.demarre.wait(5)
+    threads, issues = lancer_appels(flight, 'image:plan', calcul, suiveurs)
+    attendre_coalescees(flight, suiveurs)
+    calcul.relache.set()
+    for thread in meneur + threads:
+        thread.join(5)
+    return flight, issue_meneur[0], issues
+
+
+def test_appels_simultanes_un_seul_calcul():
+    calcul = CalculBloque(resultat={'texte': 'ok'})
+    flight, meneur, suiveurs = scenario(calcul, 4)
+
+    assert calcul.appels == 1
+    assert meneur == ({'texte': 'ok'}, False)
+    assert suiveurs == [({'texte': 'ok'}, True)] * 4
+    assert suiveurs[0][0] is meneur[0]  # Même objet résultat
+    assert flight.stats() == {'en_cours': 0, 'executions': 1, 'coalescees': 4, 'independantes': 0}
+
+
+def test_exception_partagee_et_non_memorisee():
+    calcul = CalculBloque(erreur=RuntimeError("moteur indisponible"))
+    flight, meneur, suiveurs = scenario(calcul, 2)
+
+    assert calcul.appels == 1
+    assert all(isinstance(e, RuntimeError) for e in [meneur] + suiveurs)
+    # L'échec n'est pas mémorisé: l'appel suivant recalcule
+    assert flight.executer('image:plan', lambda: 42) == (42, False)
+    assert flight.stats()['en_cours'] == 0
+
+
+def test_interruption_propagee_aux_suiveurs():
+    class Interruption(BaseException):
+        pass
+
+    calcul = CalculBloque(erreur=Interruption())
+    flight, meneur, suiveurs = scenario(calcul, 1)
+
+    # Le suiveur ne reste pas bloqué sur un Future jamais résolu
+    assert isinstance(meneur, Interruption) and isinstance(suiveurs[0], Interruption)
+    assert flight.stats()['en_cours'] == 0
+
+
+def test_cles_differentes_et_cle_none_non_regroupees():
+    flight = SingleFlight()
+    assert flight.executer('a', lambda: 1) == (1, False)
+    assert flight.executer('b', lambda: 2) == (2, False)
+    assert flight.executer(None, lambda: 3) == (3, False)
+    assert flight.executer(None, lambda: 4) == (4, False)
+    assert flight.stats() == {'en_cours': 0, 'executions': 2, 'coalescees': 0, 'independantes': 0}
+
+
+def test_appels_successifs_recalculent():
+    flight = SingleFlight()
+    compteur = iter(range(10))
+    assert flight.executer('cle', lambda: next(compteur)) == (0, False)
+    assert flight.executer('cle', lambda: next(compteur)) == (1, False)
+
+
+def mener_en_fond(flight, calcul, prioritaire=False, demarre=False):
+    """Lance un calcul meneur (non prioritaire = batch) qui reste bloqué jusqu'à calcul.relache."""
+    fonction = (lambda: calcul(flight)) if demarre else calcul
+    thread = threading.Thread(target=flight.executer, args=('cle', fonction, prioritaire))
+    thread.start()
+    calcul.demarre.wait(5)
+    return thread
+
+
+def test_prioritaire_ne_rejoint_pas_un_calcul_batch_en_file():
+    flight = SingleFlight()
+    batch = CalculBloque(resultat='batch')
+    thread = mener_en_fond(flight, batch)
+
+    # Le calcul batch attend toujours son créneau: l'interactif calcule lui-même
+    assert flight.executer('cle', lambda: 'interactif', prioritaire=True) == ('interactif', False)
+    assert flight.stats()['independantes'] == 1
+    batch.relache.set()
+    thread.join(5)
+
+
+def test_prioritaire_rejoint_un_calcul_batch_demarre():
+    flight = SingleFlight()
+    batch = CalculBloque(resultat='batch')
+    thread = mener_en_fond(flight, batch, demarre=True)
+    threading.Timer(0.2, batch.relache.set).start()
+    assert flight.executer('cle', lambda: 'interactif', prioritaire=True) == ('batch', True)
+    thread.join(5)
+    assert batch.appels == 1
+
+
+def test_attente_max_seulement_avant_demarrage():
+    flight = SingleFlight()
+    flight.ATTENTE_POLL = 0.02
+    calcul = CalculBloque(resultat='ok')
+    thread = mener_en_fond(flight, calcul, prioritaire=True)
+    with pytest.raises(AttenteDepassee):
+        flight.executer('cle', lambda: 'autre', prioritaire=True, attente_max=0.1)
+    calcul.relache.set()
+    thread.join(5)
+
+    # Calcul démarré: l'attente n'est plus bornée (durée d'exécution, pas de file)
+    calcul = CalculBloque(resultat='long')
+    thread = mener_en_fond(flight, calcul, demarre=True)
+    threading.Timer(0.3, calcul.relache.set).start()
+    assert flight.executer('cle', lambda: 'autre', attente_max=0.1) == ('long', True)
+    thread.join(5)
+
+
+def test_suiveur_annule_libere_sans_attendre_le_calcul():
+    flight = SingleFlight()
+    flight.ATTENTE_POLL = 0.02
+    calcul = CalculBloque(resultat='ok')
+    thread = mener_en_fond(flight, calcul)
+    jeton = JetonAnnulation()
+    threading.Timer(0.1, jeton.annuler, ('client déconnecté',)).start()
+    with pytest.raises(AnalyseAnnulee):
+        flight.executer('cle', lambda: 'autre', annulation=jeton)
+    assert thread.is_alive()  # Le calcul partagé continue pour les autres
+    calcul.relache.set()
+    thread.join(5)
@@ -1,5 +1,5 @@
-from PIL import Image, ImageOps
-import numpy as np
+from PIL import Image
+import math
 import os
 import logging
 
@@ -24,22 +24,56 @@ def get_image_dimensions(image_path):
         return {'width': 0, 'height': 0}
 
 
-def crop_image(source, x, y, width, height, output_path=None):
+# Orientation EXIF -> transposition appliquée par ImageOps.exif_transpose
+_TRANSPOSITIONS_EXIF = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def _cadre_brut(orientation, taille_brute, cadre):
+    """Cadre (left, top, right, bottom) de l'image redressée, exprimé dans l'image brute."""
+    W, H = taille_brute
+    l, t, r, b = cadre
+    return {
+        2: (W - r, t, W - l, b),
+        3: (W - r, H - b, W - l, H - t),
+        4: (l, H - b, r, H - t),
+        5: (t, l, b, r),
+        6: (t, H - r, b, H - l),
+        7: (W - b, H - r, W - t, H - l),
+        8: (W - b, l, W - t, r),
+    }.get(orientation, cadre)
+
+
+def crop_image(source, x, y, width, height, output_path=None, max_size=None):
     """Rogne une partie rectangulaire d'une image.
 
     Extrait exactement la zone définie par le sommet haut-gauche (x, y)
-    et les dimensions (width, height), toutes en pixels.
-    Utilise le slicing numpy pour garantir qu'aucun pixel n'est inventé :
-    seuls les pixels existants dans l'image sont retournés.
+    et les dimensions (width, height), toutes en pixels, dans l'image
+    telle qu'affichée (orientation EXIF appliquée, comme dans Paint).
+    Le cadre est borné aux limites de l'image : aucun pixel n'est inventé.
+
+    Le rognage est fait sur l'image brute, avant l'orientation EXIF : seule
+    la zone extraite est redressée, sans copie de l'image entière.
 
     Args:
-        source (str | PIL.Image.Image): Chemin vers l'image ou objet PIL Image.
+        source (str | file | PIL.Image.Image): Chemin, fichier ouvert en
+            lecture binaire, ou objet PIL Image.
         x (int): Coordonnée X du sommet haut-gauche du cadre (pixels).
         y (int): Coordonnée Y du sommet haut-gauche du cadre (pixels).
         width (int): Largeur du cadre à extraire (pixels).
         height (int): Hauteur du cadre à extraire (pixels).
         output_path (str, optional): Si fourni, sauvegarde l'image rognée
             à ce chemin. Le format est déduit de l'extension.
+        max_size (int, optional): Plus grand côté de l'image rognée ; au-delà
+            elle est réduite. Un JPEG est alors décodé directement à échelle
+            réduite (1/2, 1/4, 1/8) quand la réduction le permet.
 
     Returns:
         PIL.Image.Image: L'image rognée.
@@ -56,24 +90,29 @@ def crop_image(source, x, y, width, height, output_path=None):
         >>> # Ou directement avec output_path
         >>> crop_image("scan.jpg", 100, 50, 400, 200, output_path="extrait.jpg")
     """
-    # --- Ouvrir l'image ---
+    # --- Ouvrir l'image (en-tête seulement : décodage au moment du rognage) ---
     if isinstance(source, str):
         if not os.path.exists(source):
             raise FileNotFoundError(f"Image introuvable : {source}")
         img = Image.open(source)
     elif isinstance(source, Image.Image):
-        img = source.copy()
+        img = source
+    elif hasattr(source, 'read'):
+        img = Image.open(source)
     else:
         raise TypeError(
-            f"source doit être un chemin (str) ou un PIL.Image.Image, "
+            f"source doit être un chemin (str), un fichier ou un PIL.Image.Image, "
             f"reçu : {type(source).__name__}"
         )
 
-    # Appliquer l'orientation EXIF pour que les coordonnées correspondent
-    # à ce que l'utilisateur voit (comme dans Paint)
-    img = ImageOps.exif_transpose(img)
-
-    img_width, img_height = img.size
+    # Coordonnées dans l'image redressée selon l'orientation EXIF
+    orientation = img.getexif().get(0x0112, 1)
+    transposition = _TRANSPOSITIONS_EXIF.get(orientation)
+    taille_brute = img.size
+    if orientation in (5, 6, 7, 8):
+        img_width, img_height = taille_brute[::-1]
+    else:
+        img_width, img_height = taille_brute
 
     # --- Validation des paramètres ---
     if width <= 0 or height <= 0:
@@ -104,20 +143,37 @@ def crop_image(source, x, y, width, height, output_path=None):
             f"effectif ({x},{y})+({actual_w}×{actual_h})"
         )
 
-    # --- Rognage par slicing numpy (jamais de padding) ---
-    arr = np.array(img)
-    cropped_arr = arr[y:bottom, x:right]
-    cropped = Image.fromarray(cropped_arr)
+    taille_finale = (actual_w, actual_h)
+    if max_size and max(actual_w, actual_h) > max_size:
+        facteur = max_size / max(actual_w, actual_h)
+        taille_finale = (max(1, round(actual_w * facteur)), max(1, round(actual_h * facteur)))
+        if img.format == 'JPEG' and not isinstance(source, Image.Image):
+            # Décodage JPEG réduit : l'échelle retenue garde au moins la taille finale
+            img.draft(img.mode, (math.ceil(taille_brute[0] * facteur), math.ceil(taille_brute[1] * facteur)))
+
+    # --- Rognage dans l'image brute (jamais de padding), puis redressement ---
+    cadre = _cadre_brut(orientation, taille_brute, (x, y, right, bottom))
+    echelle = img.size[0] / taille_brute[0]
+    if echelle != 1:
+        cadre = (math.floor(cadre[0] * echelle), math.floor(cadre[1] * echelle),
+                 min(math.ceil(cadre[2] * echelle), img.size[0]), min(math.ceil(cadre[3] * echelle), img.size[1]))
+    cropped = img.crop(cadre)
+    if transposition is not None:
+        cropped = cropped.transpose(transposition)
+    if cropped.size != taille_finale:
+        cropped = cropped.resize(taille_finale, Image.LANCZOS)
 
     logger.info(
         f"Rognage: ({x},{y})+({actual_w}×{actual_h}) "
         f"depuis image {img_width}×{img_height} → résultat {cropped.size[0]}×{cropped.size[1]}"
     )
 
-    # Conversion RGBA → RGB si nécessaire (pour sauvegarde JPEG)
+    # Conversion vers un mode enregistrable si nécessaire (RGBA/palette → JPEG, CMJN → PNG)
     if output_path and output_path.lower().endswith(('.jpg', '.jpeg')):
-        if cropped.mode in ('RGBA', 'P', 'LA'):
+        if cropped.mode not in ('RGB', 'L', 'CMYK'):
             cropped = cropped.convert('RGB')
+    elif output_path and cropped.mode == 'CMYK':
+        cropped = cropped.convert('RGB')
 
     # --- Sauvegarde optionnelle ---
     if output_path:
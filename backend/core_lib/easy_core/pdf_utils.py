@@ -1,10 +1,179 @@
 import pypdfium2 as pdfium
 from PIL import Image
+import numpy as np
 import logging
 import os
+import threading
 
 logger = logging.getLogger(__name__)
 
+# PDFium n'est pas thread-safe (état global de la bibliothèque, même entre documents
+# distincts): tout appel (ouverture, pages, rendu, fermeture) passe par ce verrou.
+_VERROU_PDFIUM = threading.RLock()
+
+DPI_DEFAUT = 300   # Rendu historique (convert_pdf_to_image)
+DPI_MIN = 72
+DPI_MAX = 300      # Jamais plus fin que le rendu historique
+TOLERANCE_FORMAT = 0.10  # Écart de proportions page/référence toléré pour caler la hauteur
+
+
+def dpi_for_height(page_height_pt, target_height, dpi_min=DPI_MIN, dpi_max=DPI_MAX):
+    """DPI donnant une page de target_height pixels de haut (borné à [dpi_min, dpi_max])."""
+    if not page_height_pt or not target_height:
+        return DPI_DEFAUT
+    return max(dpi_min, min(dpi_max, target_height * 72.0 / page_height_pt))
+
+
+def target_height_for_reference(page_size_pt, base_dimensions):
+    """
+    Hauteur cible (pixels) d'une page pour une entité, d'après son image_base_dimensions.
+
+    La hauteur de référence n'est utilisée que si la page a les proportions de l'image
+    de référence (la page EST le document: carte, formulaire pleine page). Une carte
+    posée sur une page A4 garde le DPI par défaut (None).
+    """
+    if not base_dimensions or not page_size_pt:
+        return None
+    ref_w, ref_h = base_dimensions.get('width'), base_dimensions.get('height')
+    page_w, page_h = page_size_pt
+    if not ref_w or not ref_h or not page_w or not page_h:
+        return None
+    if abs((page_w / page_h) / (ref_w / ref_h) - 1) > TOLERANCE_FORMAT:
+        return None
+    return ref_h
+
+
+class PdfPages:
+    """
+    PDF ouvert une seule fois, pages rendues à la demande directement en tableaux numpy
+    (aucun fichier intermédiaire, pas de cycle d'encodage JPEG).
+
+    Args:
+        source: Chemin du PDF ou contenu brut (bytes).
+        dpi: DPI fixe (prioritaire). Défaut: DPI_DEFAUT, ou calculé depuis target_height.
+        target_height: Hauteur de page souhaitée en pixels (DPI adaptatif, borné).
+        base_dimensions: image_base_dimensions d'une entité ({'width', 'height', 'dpi_y'?}):
+                         DPI de la référence s'il est connu, sinon sa hauteur si la page
+                         a les mêmes proportions.
+        grayscale: Rendu en niveaux de gris (tableau HxW) au lieu de BGR (HxWx3).
+
+    Exemple:
+        >>> with PdfPages(pdf_bytes, grayscale=True) as pages:
+        ...     for numero, page in enumerate(pages, 1):
+        ...         traiter(page)
+    """
+
+    def __init__(self, source, dpi=None, target_height=None, base_dimensions=None, grayscale=False):
+        with _VERROU_PDFIUM:
+            self._pdf = pdfium.PdfDocument(source)
+        self.dpi_fixe = dpi
+        self.target_height = target_height
+        self.base_dimensions = base_dimensions or {}
+        self.grayscale = grayscale
+
+    def __len__(self):
+        with _VERROU_PDFIUM:
+            return len(self._pdf)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with _VERROU_PDFIUM:
+            self._pdf.close()
+
+    def page_size(self, index=0):
+        """(largeur, hauteur) de la page en points PDF (1/72 pouce)."""
+        with _VERROU_PDFIUM:
+            page = self._pdf[index]
+            try:
+                return page.get_size()
+            finally:
+                page.close()  # Fermée sous le verrou, pas par le ramasse-miettes d'un autre thread
+
+    def dpi(self, index=0):
+        """DPI de rendu de la page `index`."""
+        if self.dpi_fixe:
+            return self.dpi_fixe
+        if self.target_height:
+            return dpi_for_height(self.page_size(index)[1], self.target_height)
+        if self.base_dimensions.get('dpi_y'):
+            return max(DPI_MIN, min(DPI_MAX, float(self.base_dimensions['dpi_y'])))
+        hauteur = target_height_for_reference(self.page_size(index), self.base_dimensions)
+        if hauteur:
+            return dpi_for_height(self.page_size(index)[1], hauteur)
+        return DPI_DEFAUT
+
+    def render(self, index=0, dpi=None, grayscale=None):
+        """Page `index` en tableau numpy (BGR, ou niveaux de gris si grayscale)."""
+        nb_pages = len(self)
+        if index < 0 or index >= nb_pages:
+            raise IndexError(f"Page {index + 1} hors du PDF ({nb_pages} page(s))")
+        dpi = dpi or self.dpi(index)
+        grayscale = self.grayscale if grayscale is None else grayscale
+        with _VERROU_PDFIUM:
+            page = self._pdf[index]
+            try:
+                bitmap = page.render(scale=dpi / 72, grayscale=grayscale)
+                try:
+                    # Copie contiguë: le tableau ne dépend plus du bitmap pdfium (libéré avec lui)
+                    array = np.array(bitmap.to_numpy())
+                finally:
+                    bitmap.close()
+            finally:
+                page.close()
+        if array.ndim == 3 and array.shape[2] == 4:
+            array = array[..., :3].copy()
+        logger.debug(f"📄 Page {index + 1} rendue à {dpi:.0f} DPI: {array.shape[1]}x{array.shape[0]}px")
+        return array
+
+    def render_pil(self, index=0, dpi=None, grayscale=None):
+        """Page `index` en image PIL (RGB ou L), avec son DPI de rendu dans info['dpi']."""
+        dpi = dpi or self.dpi(index)
+        array = self.render(index, dpi, grayscale)
+        image = Image.fromarray(array if array.ndim == 2 else array[..., ::-1])
+        image.info['dpi'] = (dpi, dpi)
+        return image
+
+    def __iter__(self):
+        """Rendu paresseux: une page à la fois, à la demande."""
+        for index in range(len(self)):
+            yield self.render(index)
+
+
+def render_pdf_array(source, page_index=0, dpi=None, target_height=None, base_dimensions=None, grayscale=False):
+    """Rend une page d'un PDF (chemin ou bytes) en tableau numpy, sans fichier intermédiaire."""
+    with PdfPages(source, dpi, target_height, base_dimensions, grayscale) as pages:
+        if len(pages) < 1:
+            raise ValueError("Le PDF est vide")
+        return pages.render(page_index)
+
+
+def render_pdf_page(source, page_index=0, dpi=None, target_height=None, base_dimensions=None, grayscale=False):
+    """
+    Rend une page d'un PDF en image PIL, en mémoire (aucun fichier écrit).
+    source: chemin du PDF ou contenu brut (bytes).
+    """
+    with PdfPages(source, dpi, target_height, base_dimensions, grayscale) as pages:
+        if len(pages) < 1:
+            raise ValueError("Le PDF est vide")
+        return pages.render_pil(page_index)
+
+
+def save_pdf_page(source, output_path, page_index=0, **options):
+    """
+    Rend une page d'un PDF et l'enregistre sans perte (PNG, compression rapide) avec son DPI.
+    options: dpi, target_height, base_dimensions, grayscale (voir PdfPages).
+    Retourne (output_path, (largeur, hauteur)).
+    """
+    image = render_pdf_page(source, page_index, **options)
+    image.save(output_path, format='PNG', compress_level=1, dpi=image.info['dpi'])
+    return output_path, image.size
+
+
 def convert_pdf_to_image(pdf_path, output_path=None, dpi=300):
     """
     Convertit la première page d'un PDF en image.
@@ -12,17 +181,8 @@ def convert_pdf_to_image(pdf_path, output_path=None, dpi=300):
     Retourne le chemin de l'image sauvegardée.
     """
     try:
-        pdf = pdfium.PdfDocument(pdf_path)
-        if len(pdf) < 1:
-            raise ValueError("Le PDF est vide")
-            
-        # Rendu de la première page
-        page = pdf[0]
-        # Scale = DPI / 72 (72 est la résolution par défaut PDF)
-        scale = dpi / 72
-        bitmap = page.render(scale=scale)
-        pil_image = bitmap.to_pil()
-        
+        pil_image = render_pdf_page(pdf_path, 0, dpi)
+
         if output_path:
             pil_image.save(output_path, format="JPEG", quality=95)
             return output_path
@@ -32,7 +192,7 @@ def convert_pdf_to_image(pdf_path, output_path=None, dpi=300):
             new_path = f"{base}_page1.jpg"
             pil_image.save(new_path, format="JPEG", quality=95)
             return new_path
-            
+
     except Exception as e:
         logger.error(f"Erreur lors de la conversion PDF: {e}")
         raise e
@@ -28,7 +28,7 @@ def decoder_qrcode(image_path, coords=None):
     Détecte et décode les QR codes dans une image ou une zone spécifique.
     
     Args:
-        image_path: Chemin vers l'image
+        image_path: Chemin vers l'image, ou image PIL déjà en mémoire
         coords: [x1, y1, x2, y2] pour une zone spécifique (optionnel)
     
     Returns:
@@ -51,7 +51,7 @@ def decoder_qrcode(image_path, coords=None):
     
     try:
         # Charger l'image
-        img = Image.open(image_path)
+        img = image_path if isinstance(image_path, Image.Image) else Image.open(image_path)
         img_array = np.array(img.convert('RGB'))
         
         # Si des coordonnées sont fournies, extraire la zone
@@ -120,7 +120,7 @@ def decoder_qrcode_opencv(image_path, coords=None):
     Fonctionne uniquement pour les QR codes (pas les codes-barres).
     
     Args:
-        image_path: Chemin vers l'image
+        image_path: Chemin vers l'image, ou image PIL déjà en mémoire
         coords: [x1, y1, x2, y2] pour une zone spécifique (optionnel)
     
     Returns:
@@ -128,12 +128,12 @@ def decoder_qrcode_opencv(image_path, coords=None):
     """
     try:
         # Charger l'image
-        img = cv2.imread(image_path)
+        img = cv2.imread(image_path) if isinstance(image_path, str) else None
         
         if img is None:
-            # Essayer avec PIL puis convertir
-            pil_img = Image.open(image_path)
-            img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
+            # Essayer avec PIL (ou image déjà en mémoire) puis convertir
+            pil_img = image_path if isinstance(image_path, Image.Image) else Image.open(image_path)
+            img = cv2.cvtColor(np.array(pil_img.convert('RGB')), cv2.COLOR_RGB2BGR)
         
         # Si des coordonnées sont fournies, extraire la zone
         if coords:
@@ -188,7 +188,7 @@ def decoder_code_hybride(image_path, coords=None):
     Essaie d'abord pyzbar (plus complet), puis OpenCV en fallback.
     
     Args:
-        image_path: Chemin vers l'image
+        image_path: Chemin vers l'image, ou image PIL déjà en mémoire
         coords: [x1, y1, x2, y2] pour une zone spécifique (optionnel)
     
     Returns:
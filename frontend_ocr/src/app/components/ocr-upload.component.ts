@@ -25,6 +25,7 @@ export class OcrUploadComponent implements OnDestroy {
     private currentImage: HTMLImageElement | null = null;
     private scale = 1;
     private eventSource: EventSource | null = null;
+    private currentJobId: string | null = null;
 
     // Mode toggle: 'single' | 'multi' | 'folder'
     activeMode = signal<'single' | 'multi' | 'folder'>('single');
@@ -292,75 +293,106 @@ export class OcrUploadComponent implements OnDestroy {
         });
     }
 
+    annulerBatch() {
+        if (!this.currentJobId) return;
+        this.ocrService.cancelBatch(this.currentJobId).subscribe({
+            error: (err: any) => this.errorMessage.set('Annulation impossible: ' + (err.error?.error || err.message))
+        });
+    }
+
+    private terminerBatch(data: any, resultats: any[]) {
+        this.batchResults.set({
+            success: true,
+            total: data.total,
+            reussis: data.reussis,
+            echoues: data.echoues,
+            resultats_batch: resultats
+        });
+        if (data.status === 'cancelled') {
+            this.errorMessage.set(`Analyse annulée: ${data.completed}/${data.total} fichier(s) analysé(s)`);
+        }
+        this.isAnalyzing.set(false);
+        this.batchProgress.set(null);
+        this.currentJobId = null;
+    }
+
     private listenToProgress(jobId: string) {
         this.closeEventSource();
+        this.currentJobId = jobId;
         const eventSource = this.ocrService.connectBatchProgress(jobId);
         this.eventSource = eventSource;
+        // Résultats reçus fichier par fichier (événements file_done, dans l'ordre de fin)
+        const resultats: any[] = [];
 
         eventSource.onmessage = (event) => {
             this.ngZone.run(() => {
                 const data = JSON.parse(event.data);
-
                 if (data.error) {
                     this.errorMessage.set('Erreur SSE: ' + data.error);
                     this.isAnalyzing.set(false);
                     this.batchProgress.set(null);
                     this.closeEventSource();
-                    return;
                 }
+            });
+        };
+
+        eventSource.addEventListener('file_done', (event: MessageEvent) => {
+            this.ngZone.run(() => {
+                resultats.push(JSON.parse(event.data).resultat);
+            });
+        });
 
+        eventSource.addEventListener('progress', (event: MessageEvent) => {
+            this.ngZone.run(() => {
+                const data = JSON.parse(event.data);
                 this.batchProgress.set({
                     completed: data.completed,
                     total: data.total,
                     currentFile: data.current_file
                 });
+            });
+        });
 
-                if (data.status === 'done') {
-                    this.batchResults.set({
-                        success: true,
-                        total: data.total,
-                        reussis: data.reussis,
-                        echoues: data.echoues,
-                        resultats_batch: data.resultats_batch
-                    });
-                    this.isAnalyzing.set(false);
-                    this.batchProgress.set(null);
-                    this.closeEventSource();
-                    console.log('✅ Analyse batch async terminée');
-                }
+        eventSource.addEventListener('done', (event: MessageEvent) => {
+            this.ngZone.run(() => {
+                const data = JSON.parse(event.data);
+                this.terminerBatch(data, resultats);
+                this.closeEventSource();
+                console.log(data.status === 'cancelled' ? '🛑 Analyse batch async annulée' : '✅ Analyse batch async terminée');
             });
-        };
+        });
 
         eventSource.onerror = () => {
             this.ngZone.run(() => {
-                // Fallback to polling if SSE fails
-                this.closeEventSource();
-                this.pollBatchResult(jobId);
+                // Le navigateur se reconnecte seul (Last-Event-ID): on ne bascule
+                // sur le polling que si la connexion est définitivement fermée
+                if (eventSource.readyState === EventSource.CLOSED) {
+                    this.closeEventSource();
+                    this.pollBatchResult(jobId, resultats);
+                }
             });
         };
     }
 
-    private pollBatchResult(jobId: string) {
+    private pollBatchResult(jobId: string, resultats: any[] = []) {
+        // Les résultats arrivent par pages (ordre de fin d'analyse): on demande la suite à chaque tick
+        let enAttente = false;
         const interval = setInterval(() => {
-            this.ocrService.getBatchResult(jobId).subscribe({
+            if (enAttente) return;
+            enAttente = true;
+            this.ocrService.getBatchResult(jobId, resultats.length).subscribe({
                 next: (data) => {
+                    enAttente = false;
+                    resultats.push(...(data.resultats_batch || []));
                     this.batchProgress.set({
                         completed: data.completed,
                         total: data.total,
                         currentFile: data.current_file
                     });
 
-                    if (data.status === 'done') {
+                    if ((data.status === 'done' || data.status === 'cancelled') && data.pagination?.next_offset == null) {
                         clearInterval(interval);
-                        this.batchResults.set({
-                            success: true,
-                            total: data.total,
-                            reussis: data.reussis,
-                            echoues: data.echoues,
-                            resultats_batch: data.resultats_batch
-                        });
-                        this.isAnalyzing.set(false);
-                        this.batchProgress.set(null);
+                        this.terminerBatch(data, resultats);
                     }
                 },
                 error: () => {
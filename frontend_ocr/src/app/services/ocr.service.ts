@@ -68,10 +68,17 @@ export class OcrService {
         return new EventSource(`${this.apiUrl}/batch-progress/${jobId}`);
     }
 
+    /**
+     * Annule un job batch (les résultats déjà obtenus sont conservés)
+     */
+    cancelBatch(jobId: string): Observable<any> {
+        return this.http.delete<any>(`${this.apiUrl}/batch/${jobId}`);
+    }
+
     /**
      * Polling fallback: récupère l'état d'un job batch
      */
-    getBatchResult(jobId: string): Observable<any> {
-        return this.http.get<any>(`${this.apiUrl}/batch-result/${jobId}`);
+    getBatchResult(jobId: string, offset = 0): Observable<any> {
+        return this.http.get<any>(`${this.apiUrl}/batch-result/${jobId}`, { params: { offset } });
     }
 }